@@ -9,7 +9,7 @@ Endpoint: GET /api/asset-movements?portfolio_id=<uuid>&asset_id=<uuid>
 """
 
 from flask import Blueprint, request, jsonify
-from db_helper import execute_request
+from db_helper import fetch_all_rows
 from logger import logger
 import traceback
 
@@ -39,74 +39,60 @@ def get_asset_movements(portfolio_id: str, asset_id: str, debug_mode: bool = Fal
         movements = []
 
         # 1. Fetch Transactions (BUY/SELL)
-        res_trans = execute_request('transactions', 'GET', params={
+        transactions = fetch_all_rows('transactions', params={
             'select': 'date,type,quantity,price_eur',
             'portfolio_id': f'eq.{portfolio_id}',
-            'asset_id': f'eq.{asset_id}',
-            'order': 'date.desc'
-        })
+            'asset_id': f'eq.{asset_id}'
+        }, keyset=('date', 'id'))
 
-        if res_trans and res_trans.status_code == 200:
-            transactions = res_trans.json()
-            if debug_mode:
-                logger.debug(f"[MOVEMENTS] Fetched {len(transactions)} transactions")
-
-            for t in transactions:
-                try:
-                    qty = float(t.get('quantity', 0))
-                    price = float(t.get('price_eur', 0))
-                    tx_type = t.get('type', 'BUY')
-
-                    movements.append({
-                        'date': t.get('date'),
-                        'operation': 'Acquisto' if tx_type == 'BUY' else 'Vendita',
-                        'quantity': qty,
-                        'value': round(qty * price, 2)
-                    })
-                except (ValueError, TypeError) as e:
-                    logger.error(f"[MOVEMENTS] Error parsing transaction: {e} | raw={t}")
-                    continue
-        elif res_trans:
-            logger.error(f"[MOVEMENTS] Transactions fetch failed: HTTP {res_trans.status_code}")
-        else:
-            logger.error("[MOVEMENTS] Transactions fetch returned None response")
+        if debug_mode:
+            logger.debug(f"[MOVEMENTS] Fetched {len(transactions)} transactions")
+
+        for t in transactions:
+            try:
+                qty = float(t.get('quantity', 0))
+                price = float(t.get('price_eur', 0))
+                tx_type = t.get('type', 'BUY')
+
+                movements.append({
+                    'date': t.get('date'),
+                    'operation': 'Acquisto' if tx_type == 'BUY' else 'Vendita',
+                    'quantity': qty,
+                    'value': round(qty * price, 2)
+                })
+            except (ValueError, TypeError) as e:
+                logger.error(f"[MOVEMENTS] Error parsing transaction: {e} | raw={t}")
+                continue
 
         # 2. Fetch Dividends/Fees (DIVIDEND/EXPENSE)
-        res_divs = execute_request('dividends', 'GET', params={
+        dividends = fetch_all_rows('dividends', params={
             'select': 'date,type,amount_eur',
             'portfolio_id': f'eq.{portfolio_id}',
-            'asset_id': f'eq.{asset_id}',
-            'order': 'date.desc'
-        })
-
-        if res_divs and res_divs.status_code == 200:
-            dividends = res_divs.json()
-            if debug_mode:
-                logger.debug(f"[MOVEMENTS] Fetched {len(dividends)} dividends/fees")
-
-            for d in dividends:
-                try:
-                    amount = float(d.get('amount_eur', 0))
-                    div_type = d.get('type', 'DIVIDEND')
-
-                    if div_type == 'EXPENSE':
-                        operation = 'Fee'
-                    else:
-                        operation = 'Cedola/Dividendo'
+            'asset_id': f'eq.{asset_id}'
+        }, keyset=('date', 'id'))
 
-                    movements.append({
-                        'date': d.get('date'),
-                        'operation': operation,
-                        'quantity': None,  # No quantity for dividends/fees
-                        'value': round(amount, 2)
-                    })
-                except (ValueError, TypeError) as e:
-                    logger.error(f"[MOVEMENTS] Error parsing dividend: {e} | raw={d}")
-                    continue
-        elif res_divs:
-            logger.error(f"[MOVEMENTS] Dividends fetch failed: HTTP {res_divs.status_code}")
-        else:
-            logger.error("[MOVEMENTS] Dividends fetch returned None response")
+        if debug_mode:
+            logger.debug(f"[MOVEMENTS] Fetched {len(dividends)} dividends/fees")
+
+        for d in dividends:
+            try:
+                amount = float(d.get('amount_eur', 0))
+                div_type = d.get('type', 'DIVIDEND')
+
+                if div_type == 'EXPENSE':
+                    operation = 'Fee'
+                else:
+                    operation = 'Cedola/Dividendo'
+
+                movements.append({
+                    'date': d.get('date'),
+                    'operation': operation,
+                    'quantity': None,  # No quantity for dividends/fees
+                    'value': round(amount, 2)
+                })
+            except (ValueError, TypeError) as e:
+                logger.error(f"[MOVEMENTS] Error parsing dividend: {e} | raw={d}")
+                continue
 
         # 3. Sort by date descending (most recent first)
         movements.sort(key=lambda m: m.get('date') or '', reverse=True)
@@ -147,8 +133,7 @@ def get_portfolio_movements(portfolio_id: str, start_date: str = None, end_date:
         # 1. Fetch Transactions (BUY/SELL) with asset metadata
         trans_params = {
             'select': 'date,type,quantity,price_eur,assets(isin,name,asset_class)',
-            'portfolio_id': f'eq.{portfolio_id}',
-            'order': 'date.desc'
+            'portfolio_id': f'eq.{portfolio_id}'
         }
         if start_date:
             trans_params['date'] = f'gte.{start_date}'
@@ -159,91 +144,78 @@ def get_portfolio_movements(portfolio_id: str, start_date: str = None, end_date:
                 # execute_request doesn't support list for same key natively in a simple dict unless handled. Let's filter in python if DB filter is tricky
                 pass
 
-        res_trans = execute_request('transactions', 'GET', params=trans_params)
+        transactions = fetch_all_rows('transactions', params=trans_params, keyset=('date', 'id'))
+
+        if debug_mode:
+            logger.debug(f"[PORTFOLIO_MOVEMENTS] Fetched {len(transactions)} candidate transactions")
+
+        for t in transactions:
+            t_date = t.get('date', '')
+
+            # Manual date filtering to safely handle 'lte' / 'gte' without DB querystring quirks
+            if start_date and t_date < start_date: continue
+            if end_date and t_date > end_date + "T23:59:59": continue
+
+            try:
+                qty = float(t.get('quantity', 0))
+                price = float(t.get('price_eur', 0))
+                tx_type = t.get('type', 'BUY')
+                asset_data = t.get('assets', {}) or {}
+
+                movements.append({
+                    'date': t_date,
+                    'isin': asset_data.get('isin', ''),
+                    'description': asset_data.get('name', ''),
+                    'asset_class': asset_data.get('asset_class', ''),
+                    'type': 'Acquisto' if tx_type == 'BUY' else 'Vendita',
+                    'quantity': qty,
+                    'value': round(qty * price, 2)
+                })
+            except (ValueError, TypeError) as e:
+                logger.error(f"[PORTFOLIO_MOVEMENTS] Error parsing transaction: {e} | raw={t}")
+                continue
+
+
+        # 2. Fetch Dividends/Fees (DIVIDEND/EXPENSE) if requested
+        if include_dividends:
+            divs_params = {
+                'select': 'date,type,amount_eur,assets(isin,name,asset_class)',
+                'portfolio_id': f'eq.{portfolio_id}'
+            }
+
+            dividends = fetch_all_rows('dividends', params=divs_params, keyset=('date', 'id'))
 
-        if res_trans and res_trans.status_code == 200:
-            transactions = res_trans.json()
             if debug_mode:
-                logger.debug(f"[PORTFOLIO_MOVEMENTS] Fetched {len(transactions)} candidate transactions")
+                logger.debug(f"[PORTFOLIO_MOVEMENTS] Fetched {len(dividends)} candidate dividends")
 
-            for t in transactions:
-                t_date = t.get('date', '')
-                
-                # Manual date filtering to safely handle 'lte' / 'gte' without DB querystring quirks
-                if start_date and t_date < start_date: continue
-                if end_date and t_date > end_date + "T23:59:59": continue
+            for d in dividends:
+                d_date = d.get('date', '')
+
+                if start_date and d_date < start_date: continue
+                if end_date and d_date > end_date + "T23:59:59": continue
 
                 try:
-                    qty = float(t.get('quantity', 0))
-                    price = float(t.get('price_eur', 0))
-                    tx_type = t.get('type', 'BUY')
-                    asset_data = t.get('assets', {}) or {}
+                    amount = float(d.get('amount_eur', 0))
+                    div_type = d.get('type', 'DIVIDEND')
+                    asset_data = d.get('assets', {}) or {}
+
+                    if div_type == 'EXPENSE':
+                        operation = 'Fee'
+                    else:
+                        operation = 'Cedola/Dividendo'
 
                     movements.append({
-                        'date': t_date,
+                        'date': d_date,
                         'isin': asset_data.get('isin', ''),
                         'description': asset_data.get('name', ''),
                         'asset_class': asset_data.get('asset_class', ''),
-                        'type': 'Acquisto' if tx_type == 'BUY' else 'Vendita',
-                        'quantity': qty,
-                        'value': round(qty * price, 2)
+                        'type': operation,
+                        'quantity': None,  # No quantity
+                        'value': round(amount, 2)
                     })
                 except (ValueError, TypeError) as e:
-                    logger.error(f"[PORTFOLIO_MOVEMENTS] Error parsing transaction: {e} | raw={t}")
+                    logger.error(f"[PORTFOLIO_MOVEMENTS] Error parsing dividend: {e} | raw={d}")
                     continue
-        elif res_trans:
-            logger.error(f"[PORTFOLIO_MOVEMENTS] Transactions fetch failed: HTTP {res_trans.status_code}")
-        else:
-            logger.error("[PORTFOLIO_MOVEMENTS] Transactions fetch returned None response")
-
-
-        # 2. Fetch Dividends/Fees (DIVIDEND/EXPENSE) if requested
-        if include_dividends:
-            divs_params = {
-                'select': 'date,type,amount_eur,assets(isin,name,asset_class)',
-                'portfolio_id': f'eq.{portfolio_id}',
-                'order': 'date.desc'
-            }
-
-            res_divs = execute_request('dividends', 'GET', params=divs_params)
-
-            if res_divs and res_divs.status_code == 200:
-                dividends = res_divs.json()
-                if debug_mode:
-                    logger.debug(f"[PORTFOLIO_MOVEMENTS] Fetched {len(dividends)} candidate dividends")
-
-                for d in dividends:
-                    d_date = d.get('date', '')
-                    
-                    if start_date and d_date < start_date: continue
-                    if end_date and d_date > end_date + "T23:59:59": continue
-
-                    try:
-                        amount = float(d.get('amount_eur', 0))
-                        div_type = d.get('type', 'DIVIDEND')
-                        asset_data = d.get('assets', {}) or {}
-
-                        if div_type == 'EXPENSE':
-                            operation = 'Fee'
-                        else:
-                            operation = 'Cedola/Dividendo'
-
-                        movements.append({
-                            'date': d_date,
-                            'isin': asset_data.get('isin', ''),
-                            'description': asset_data.get('name', ''),
-                            'asset_class': asset_data.get('asset_class', ''),
-                            'type': operation,
-                            'quantity': None,  # No quantity
-                            'value': round(amount, 2)
-                        })
-                    except (ValueError, TypeError) as e:
-                        logger.error(f"[PORTFOLIO_MOVEMENTS] Error parsing dividend: {e} | raw={d}")
-                        continue
-            elif res_divs:
-                logger.error(f"[PORTFOLIO_MOVEMENTS] Dividends fetch failed: HTTP {res_divs.status_code}")
-            else:
-                logger.error("[PORTFOLIO_MOVEMENTS] Dividends fetch returned None response")
 
         # 3. Sort by date descending
         movements.sort(key=lambda m: m.get('date') or '', reverse=True)
@@ -1,6 +1,8 @@
 from flask import Blueprint, request, jsonify
 from price_manager import get_price_history
 from db_helper import execute_request
+from result_cache import bump_data_version
+from daily_valuation import invalidate_valuations_for_prices
 from logger import logger
 import traceback
 
@@ -68,8 +70,11 @@ def sync_asset_prices_route():
     Expects: { 
         "isin": "...", 
         "updates": [ {old_date, old_source, new_date, new_source, new_price} ],
-        "deletions": [ {date, source} ] 
+        "deletions": [ {date, source} ],
+        "portfolio_id": "..." (optional, view of the returned head of history)
     }
+    The whole edit set is applied by the RPC apply_price_edits in one transaction
+    (deletes, upserts and trend recalculation); returns the new head of history.
     """
     try:
         data = request.json
@@ -80,18 +85,12 @@ def sync_asset_prices_route():
         if not isin:
             return jsonify(error="Parametro ISIN mancante"), 400
 
-        from db_helper import delete_table, upsert_table
-        
-        # 1. Process Deletions
-        for d in deletions:
-            date = d.get('date')
-            source = d.get('source')
-            if date and source:
-                success = delete_table('asset_prices', {'isin': isin, 'date': date, 'source': source})
-                if not success:
-                    logger.warning(f"[PRICES_SYNC] Failed to delete: {isin} {date} {source}")
-
-        # 2. Process Updates
+        # 1. Eliminazioni esplicite
+        to_delete = [{'date': d['date'], 'source': d['source']}
+                     for d in deletions if d.get('date') and d.get('source')]
+
+        # 2. Modifiche: se cambiano data o fonte (chiave) la vecchia riga va eliminata
+        to_upsert = []
         for u in updates:
             old_date = u.get('old_date')
             old_source = u.get('old_source')
@@ -102,23 +101,42 @@ def sync_asset_prices_route():
             if not all([old_date, old_source, new_date, new_source, new_price is not None]):
                 continue
 
-            # If date or source changed, we must delete the old record first (PK change)
             if old_date != new_date or old_source != new_source:
-                delete_table('asset_prices', {'isin': isin, 'date': old_date, 'source': old_source})
-            
-            # Upsert the new data
-            upsert_table('asset_prices', {
-                'isin': isin,
-                'date': new_date,
-                'source': new_source,
-                'price': float(new_price)
-            }, on_conflict='isin, date, source')
-
-        # 3. Ricalcola il trend dell'asset dopo le modifiche
-        from price_manager import update_asset_trend
-        update_asset_trend(isin)
-
-        return jsonify(message="Sincronizzazione completata con successo")
+                to_delete.append({'date': old_date, 'source': old_source})
+            to_upsert.append({'date': new_date, 'source': new_source, 'price': float(new_price)})
+
+        # 3. Una sola chiamata: eliminazioni + upsert + ricalcolo del trend lato database
+        res = execute_request('rpc/apply_price_edits', 'POST', body={
+            'p_isin': isin,
+            'p_deletions': to_delete,
+            'p_upserts': to_upsert,
+            'p_portfolio_id': data.get('portfolio_id')
+        })
+        if not res or res.status_code != 200:
+            logger.error(f"[PRICES_SYNC] apply_price_edits failed for {isin}: "
+                         f"{res.status_code if res is not None else 'no response'} - {res.text if res is not None else ''}")
+            return jsonify(error="Errore nel salvataggio dei prezzi"), 500
+        result = res.json() or {}
+        logger.info(f"[PRICES_SYNC] {isin}: {result.get('deleted', 0)} deleted, {result.get('upserted', 0)} upserted")
+
+        # 4. I prezzi sono condivisi: invalida i risultati in cache di tutti i portafogli
+        bump_data_version()
+
+        # 5. Ricalcolo della serie giornaliera dei portafogli che detengono l'asset
+        touched_dates = [d.get('date') for d in deletions] + \
+                        [u.get(k) for u in updates for k in ('old_date', 'new_date')]
+        touched_dates = [d for d in touched_dates if d]
+        if touched_dates:
+            try:
+                invalidate_valuations_for_prices({isin: min(touched_dates)})
+            except Exception as e_val:
+                logger.error(f"[PRICES_SYNC] Daily valuations refresh failed: {e_val}")
+
+        return jsonify(message="Sincronizzazione completata con successo",
+                       deleted=result.get('deleted', 0),
+                       upserted=result.get('upserted', 0),
+                       trend=result.get('trend'),
+                       head=result.get('head', []))
 
     except Exception as e:
         logger.error(f"[PRICES_SYNC] Route error: {e}")
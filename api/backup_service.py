@@ -1,7 +1,7 @@
 import json
 import io
 from datetime import datetime
-from db_helper import execute_request, upsert_table, query_table
+from db_helper import execute_request, upsert_table, query_table, fetch_all_rows, execute_batch
 from logger import logger
 from price_manager import get_latest_prices_batch
 from finance import xirr, get_tiered_mwr
@@ -22,41 +22,36 @@ def create_backup_payload(portfolio_id):
     }
     """
     try:
-        # 1. Fetch Portfolio
-        res_p = execute_request('portfolios', 'GET', params={'id': f'eq.{portfolio_id}', 'select': '*'})
-        if not res_p or res_p.status_code != 200:
-            raise Exception("Portfolio not found")
-        portfolio = res_p.json()[0]
-
-        # 2. Fetch Dependent Data
+        # 1-3. Portfolio, dati dipendenti e app_config sono indipendenti: query in parallelo.
+        # Tabelle potenzialmente grandi: lettura paginata completa
         t_params = {'portfolio_id': f'eq.{portfolio_id}', 'select': '*, assets(isin, name, currency, asset_class)'}
-        res_t = execute_request('transactions', 'GET', params=t_params)
-        transactions = res_t.json() if res_t and res_t.status_code == 200 else []
-
         d_params = {'portfolio_id': f'eq.{portfolio_id}', 'select': '*, assets(isin)'}
-        res_d = execute_request('dividends', 'GET', params=d_params)
-        dividends = res_d.json() if res_d and res_d.status_code == 200 else []
-
         s_params = {'portfolio_id': f'eq.{portfolio_id}'}
-        res_s = execute_request('snapshots', 'GET', params=s_params)
-        snapshots = res_s.json() if res_s and res_s.status_code == 200 else []
-
         n_params = {'portfolio_id': f'eq.{portfolio_id}', 'select': '*, assets(isin)'}
-        res_n = execute_request('asset_notes', 'GET', params=n_params)
-        notes = res_n.json() if res_n and res_n.status_code == 200 else []
-
         set_params = {'portfolio_id': f'eq.{portfolio_id}', 'select': '*, assets(isin)'}
-        res_set = execute_request('portfolio_asset_settings', 'GET', params=set_params)
+
+        res_p, transactions, dividends, snapshots, res_n, res_set, res_config = execute_batch([
+            {'endpoint': 'portfolios', 'params': {'id': f'eq.{portfolio_id}', 'select': '*'}},
+            lambda: fetch_all_rows('transactions', params=t_params, keyset=('date', 'id')),
+            lambda: fetch_all_rows('dividends', params=d_params, keyset=('date', 'id')),
+            lambda: fetch_all_rows('snapshots', params=s_params, keyset=('id',)),
+            {'endpoint': 'asset_notes', 'params': n_params},
+            {'endpoint': 'portfolio_asset_settings', 'params': set_params},
+            # UI & Global Settings: fetch all and filter by key pattern
+            {'endpoint': 'app_config', 'params': {'select': '*'}}
+        ])
+
+        if not res_p or res_p.status_code != 200:
+            raise Exception("Portfolio not found")
+        portfolio = res_p.json()[0]
+
+        notes = res_n.json() if res_n and res_n.status_code == 200 else []
         settings = res_set.json() if res_set and res_set.status_code == 200 else []
 
-        # 3. Fetch UI & Global Settings (app_config)
         # We want:
         # - memory_settings_{user_id}_{portfolio_id}
         # - openai_config
         # - asset_variation_threshold_{portfolio_id} (if exists) or global thresholds
-        
-        # We'll fetch all and filter by key pattern
-        res_config = execute_request('app_config', 'GET', params={'select': '*'})
         all_config = res_config.json() if res_config and res_config.status_code == 200 else []
         
         ui_config = []
@@ -92,58 +87,35 @@ def create_backup_payload(portfolio_id):
             if s.get('assets') and s['assets'].get('isin'): isins.add(s['assets']['isin'])
         
         prices = []
-        if isins:
-            # We want ALL history for these ISINs
-            # Filter by isin IN (...)
-            in_filter = f"in.({','.join(isins)})"
-            # We assume execute_request can handle this or we might need batching if too many assets.
-            # safe batching 
-            isin_list = list(isins)
-            batch_size = 30 # Reduced to prevent URL overly long
-            for i in range(0, len(isin_list), batch_size):
-                batch = isin_list[i:i+batch_size]
-                p_filter = f"in.({','.join(batch)})"
-                
-                # [FIX] Pagination Loop
-                offset = 0
-                limit = 1000
-                while True:
-                    # Order by date asc to be clean
-                    res_prices = execute_request('asset_prices', 'GET', params={
-                        'isin': p_filter, 
-                        'order': 'date.asc',
-                        'limit': limit,
-                        'offset': offset
-                    })
-                    
-                    if not res_prices or res_prices.status_code != 200:
-                        logger.error(f"BACKUP: Failed to fetch prices batch offset {offset}")
-                        break
-                    
-                    batch_data = res_prices.json()
-                    if not batch_data:
-                        break
-                        
-                    prices.extend(batch_data)
-                    
-                    if len(batch_data) < limit:
-                        break # End of data for this batch
-                        
-                    offset += limit
-        
-        # 4b. [NEW] Fetch Full Asset Details (Metadata, Trends, Sector, etc.)
         assets_full = []
         if isins:
+            # We want ALL history for these ISINs.
+            # Batch per ISIN (URL corti); i batch di prezzi e di asset partono tutti in parallelo.
             isin_list = list(isins)
+            batch_size = 30 # Reduced to prevent URL overly long
             asset_batch_size = 50
-            for i in range(0, len(isin_list), asset_batch_size):
-                batch = isin_list[i:i+asset_batch_size]
-                in_filter = f"in.({','.join(batch)})"
-                res_assets = execute_request('assets', 'GET', params={'isin': in_filter, 'select': '*'})
+            price_batches = [isin_list[i:i+batch_size] for i in range(0, len(isin_list), batch_size)]
+            asset_batches = [isin_list[i:i+asset_batch_size] for i in range(0, len(isin_list), asset_batch_size)]
+
+            # Lettura paginata completa: un errore interrompe il backup invece di salvarlo troncato
+            price_queries = [
+                (lambda b=batch: fetch_all_rows('asset_prices', params={'isin': f"in.({','.join(b)})"}, keyset=('date', 'id')))
+                for batch in price_batches
+            ]
+            # 4b. [NEW] Full Asset Details (Metadata, Trends, Sector, etc.)
+            asset_queries = [
+                {'endpoint': 'assets', 'params': {'isin': f"in.({','.join(batch)})", 'select': '*'}}
+                for batch in asset_batches
+            ]
+            results = execute_batch(price_queries + asset_queries)
+
+            for rows in results[:len(price_queries)]:
+                prices.extend(rows)
+            for i, res_assets in enumerate(results[len(price_queries):]):
                 if res_assets and res_assets.status_code == 200:
                     assets_full.extend(res_assets.json())
                 else:
-                    logger.error(f"BACKUP: Failed to fetch assets batch {i}")
+                    logger.error(f"BACKUP: Failed to fetch assets batch {i * asset_batch_size}")
 
         # 5. Generate Report (Summary)
         report = generate_backup_report(portfolio, transactions, dividends, snapshots)
@@ -173,7 +145,7 @@ def create_backup_payload(portfolio_id):
         logger.error(f"BACKUP CREATE FAILED: {e}")
         raise e
 
-from dashboard import calculate_portfolio_summary
+from dashboard import get_portfolio_summary_cached
 
 def generate_backup_report(portfolio, transactions, dividends, snapshots):
     """
@@ -183,7 +155,7 @@ def generate_backup_report(portfolio, transactions, dividends, snapshots):
     portfolio_id = portfolio.get('id')
     
     # Call the exact same logic used by the dashboard
-    summary = calculate_portfolio_summary(portfolio_id)
+    summary = get_portfolio_summary_cached(portfolio_id)
     
     data = {
         "portfolio_name": portfolio.get('name'),
@@ -531,6 +503,10 @@ def restore_backup(data_json, new_name, user_id=None):
                 
                 upsert_table('asset_prices', chunk, on_conflict='isin, date, source')
 
+        # Viste materializzate (holdings, dividendi, statistiche) del nuovo portafoglio
+        from mv_refresh import request_refresh
+        request_refresh('transactions', 'dividends')
+
         return {"success": True, "new_portfolio_id": new_pid}
 
     except Exception as e:
@@ -11,10 +11,12 @@ API principale:
 - analyze_certificate(isin, force_refresh=False): cache-first; se non in cache estrae
   dal web (LLM + web_search) e arricchisce con prezzi live; calcola Worst-Of.
 - get_enriched_cached_analysis(isin): legge dalla cache DB e aggiorna solo i prezzi live.
-- get_live_price(ticker): prezzo live via Yahoo Finance.
+- get_live_price(ticker) / get_live_prices(tickers): prezzi live via Yahoo Finance,
+  con cache TTL per ticker e fetch concorrente (provider sostituibile per i test).
 """
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from typing import Optional
 
@@ -24,6 +26,7 @@ from openai import OpenAI
 from logger import logger
 import cert_db as database
 from cert_extractor import extract_certificate_via_web
+from result_cache import TTLCache
 
 
 # ==============================================================================
@@ -73,14 +76,26 @@ Esempio:
 
 
 # ==============================================================================
-# RECUPERO PREZZI (Yahoo Finance)
+# RECUPERO PREZZI (servizio quotazioni)
 # ==============================================================================
+# Cache per ticker con TTL breve + deduplica dei ticker + fetch concorrente su pool
+# limitato: /api/certificates con N certificati x M sottostanti fa al più una
+# chiamata Yahoo per ticker distinto, in parallelo, e nessuna entro il TTL.
 
-def get_live_price(ticker):
-    """Prezzo live per un ticker. Ritorna float arrotondato o None (degrada con grazia
+QUOTE_CACHE_TTL = int(os.environ.get("CERT_QUOTE_CACHE_TTL", 60))
+QUOTE_WORKERS = int(os.environ.get("CERT_QUOTE_WORKERS", 8))
+
+quote_cache = TTLCache(
+    "cert_quotes",
+    maxsize=int(os.environ.get("CERT_QUOTE_CACHE_MAXSIZE", 1024)),
+    ttl=QUOTE_CACHE_TTL
+)
+_quote_executor = ThreadPoolExecutor(max_workers=QUOTE_WORKERS, thread_name_prefix="cert-quote")
+
+
+def yahoo_quote_provider(ticker):
+    """Prezzo live da Yahoo Finance. Ritorna float arrotondato o None (degrada con grazia
     in caso di errore/rate-limit/ticker errato, senza propagare eccezioni)."""
-    if not ticker:
-        return None
     logger.info(f"[YFinance] Recupero prezzo per {ticker}...")
     try:
         asset = yf.Ticker(ticker)
@@ -111,6 +126,70 @@ def get_live_price(ticker):
         return None
 
 
+class StubQuoteProvider:
+    """Provider offline per i test: prezzi fissi da dizionario, conta le chiamate."""
+
+    def __init__(self, prices=None):
+        self.prices = dict(prices or {})
+        self.calls = []
+
+    def __call__(self, ticker):
+        self.calls.append(ticker)
+        return self.prices.get(ticker)
+
+
+_quote_provider = yahoo_quote_provider
+
+
+def set_quote_provider(provider):
+    """Sostituisce il provider (callable ticker -> prezzo|None) e svuota la cache.
+    Ritorna il provider precedente."""
+    global _quote_provider
+    previous, _quote_provider = _quote_provider, provider
+    quote_cache.clear()
+    return previous
+
+
+def _fetch_quote(ticker):
+    try:
+        return _quote_provider(ticker)
+    except Exception as e:
+        logger.error(f"[Quotes] Errore provider per {ticker}: {e}")
+        return None
+
+
+def get_live_prices(tickers):
+    """Prezzi live per più ticker: {ticker: prezzo|None}. Ticker duplicati/vuoti
+    vengono ignorati; i mancanti in cache sono recuperati in parallelo.
+    Anche i prezzi non trovati (None) restano in cache per il TTL, così un ticker
+    errato non viene ritentato a ogni richiesta."""
+    prices = {}
+    missing = []
+    for ticker in dict.fromkeys(t for t in tickers if t):
+        cached = quote_cache.get(ticker)
+        if cached is not None:
+            prices[ticker] = cached[0]
+        else:
+            missing.append(ticker)
+
+    if missing:
+        if len(missing) == 1:
+            fetched = [_fetch_quote(missing[0])]
+        else:
+            fetched = list(_quote_executor.map(_fetch_quote, missing))
+        for ticker, price in zip(missing, fetched):
+            quote_cache.set(ticker, (price,))
+            prices[ticker] = price
+    return prices
+
+
+def get_live_price(ticker):
+    """Prezzo live per un ticker (via cache/servizio quotazioni). Ritorna float o None."""
+    if not ticker:
+        return None
+    return get_live_prices([ticker]).get(ticker)
+
+
 # ==============================================================================
 # UTILITY
 # ==============================================================================
@@ -149,11 +228,12 @@ def get_enriched_cached_analysis(isin):
     logger.info(f"[Cache] Dati trovati nel DB per {isin}. Recupero solo prezzi live.")
     cert = cached['certificate']
     underlyings_db = cached['underlyings']
+    live_prices = get_live_prices([u.get('corrected_ticker') or u.get('original_ticker') for u in underlyings_db])
 
     processed_underlyings = []
     for u in underlyings_db:
         ticker_to_use = u.get('corrected_ticker') or u.get('original_ticker')
-        current = get_live_price(ticker_to_use)
+        current = live_prices.get(ticker_to_use)
 
         barrier_abs = float(u['barrier_abs']) if u.get('barrier_abs') else 0.0
         if current and current > 0 and barrier_abs > 0:
@@ -230,6 +310,7 @@ def analyze_certificate(isin, force_refresh=False):
     total_cost = cost
     underlyings = []
     logger.info(f"[Market] Arricchimento dati per {len(llm_data.get('underlyings', []))} sottostanti")
+    live_prices = get_live_prices([u.get('ticker') for u in llm_data.get('underlyings', []) if u.get('strike')])
 
     for u in llm_data.get('underlyings', []):
         name = u.get('name', 'N/A')
@@ -237,7 +318,7 @@ def analyze_certificate(isin, force_refresh=False):
         strike = u.get('strike')
 
         if ticker and strike:
-            current = get_live_price(ticker)
+            current = live_prices.get(ticker)
 
             if not current:
                 logger.warning(f"[Market] Ticker {ticker} fallito. Fallback AI per {name}")
@@ -158,26 +158,40 @@ def delete_certificate(isin):
     return True
 
 
-def get_all_certificates():
-    """Ritorna tutti i certificati con i relativi sottostanti, ordinati per
-    last_updated desc. Forma: [{'certificate': {...}, 'underlyings': [...]}].
-    Aggiunge l'alias 'barrier' (= barrier_abs) per compatibilità frontend."""
+CERTIFICATES_PAGE_SIZE = 200
+CERTIFICATES_MAX_PAGE = 1000     # Limite massimo di ?limit= su /api/certificates
+
+
+def _fetch_certificates_page(portfolio_id=None, limit=None, offset=0):
+    """Una chiamata a rpc/certificates_with_underlyings (certificati + sottostanti annidati)."""
+    params = {}
+    if limit is not None:
+        params = {'limit': limit, 'offset': offset}
     resp = execute_request(
-        'certificates', 'GET',
-        params={'select': '*', 'order': 'last_updated.desc'},
+        'rpc/certificates_with_underlyings', 'POST',
+        params=params, body={'p_portfolio_id': portfolio_id},
     )
-    certs = resp.json() if (resp is not None and resp.status_code == 200) else []
-    if not certs:
-        return []
-
-    all_underlyings = query_table('underlyings', '*') or []
-    by_isin = {}
-    for u in all_underlyings:
-        u_enriched = dict(u)
-        u_enriched['barrier'] = u.get('barrier_abs')
-        by_isin.setdefault(u['isin'], []).append(u_enriched)
-
-    return [
-        {"certificate": c, "underlyings": by_isin.get(c['isin'], [])}
-        for c in certs
-    ]
+    if resp is None or resp.status_code != 200:
+        status = resp.status_code if resp is not None else 'no response'
+        raise CertDatabaseError(f"Lettura certificati fallita ({status})")
+    return resp.json() or []
+
+
+def get_all_certificates(portfolio_id=None):
+    """Ritorna tutti i certificati con i relativi sottostanti, ordinati per
+    last_updated desc. Forma: [{'certificate': {...}, 'underlyings': [...]}].
+    I sottostanti includono l'alias 'barrier' (= barrier_abs) per compatibilità frontend.
+    Con portfolio_id solo i certificati con transazioni in quel portafoglio.
+    Una sola round trip (join lato DB)."""
+    return _fetch_certificates_page(portfolio_id)
+
+
+def get_certificates_page(portfolio_id=None, limit=CERTIFICATES_PAGE_SIZE, offset=0):
+    """Variante paginata di get_all_certificates per basi dati certificati grandi
+    (GET /api/certificates?limit=&offset=): al più `limit` voci da `offset` nello stesso
+    ordine. Ritorna (voci, next_offset) con next_offset None sull'ultima pagina."""
+    # Una voce in più per sapere se esiste la pagina successiva
+    rows = _fetch_certificates_page(portfolio_id, limit=limit + 1, offset=offset)
+    if len(rows) > limit:
+        return rows[:limit], offset + limit
+    return rows, None
@@ -10,22 +10,28 @@ from flask import Blueprint, request, jsonify
 
 from logger import logger
 import cert_db
-from cert_analyzer import analyze_certificate, get_live_price
+from cert_analyzer import analyze_certificate, get_live_price, get_live_prices
+from job_queue import submit_job
 
 certificates_bp = Blueprint('certificates', __name__)
 
 
-def _enrich_underlyings(underlyings):
+def _underlying_ticker(u):
+    return u.get('corrected_ticker') or u.get('original_ticker')
+
+
+def _enrich_underlyings(underlyings, live_prices):
     """Arricchisce ogni sottostante con prezzo live (`current`) e distanza % dalla
-    barriera (`dist`, segno +/-), recuperando i prezzi una sola volta per ticker.
-    Ritorna (lista_arricchita, worst_dist) dove worst_dist è la distanza minima
-    (None se nessun prezzo disponibile). Stessa formula di get_enriched_cached_analysis."""
+    barriera (`dist`, segno +/-), usando i prezzi già recuperati (live_prices, un
+    valore per ticker). Ritorna (lista_arricchita, worst_dist) dove worst_dist è la
+    distanza minima (None se nessun prezzo disponibile). Stessa formula di
+    get_enriched_cached_analysis."""
     enriched = []
     worst = None
     for u in underlyings:
-        ticker = u.get('corrected_ticker') or u.get('original_ticker')
+        ticker = _underlying_ticker(u)
         barrier_abs = u.get('barrier_abs') or u.get('barrier')
-        current = get_live_price(ticker)
+        current = live_prices.get(ticker)
         dist = None
         if current and current > 0 and barrier_abs:
             try:
@@ -42,17 +48,37 @@ def _enrich_underlyings(underlyings):
 def list_certificates():
     """Elenca tutti i certificati in DB (master data globale). Ogni voce è arricchita
     con la distanza Worst-Of live (best-effort). Query param opzionale ?live=false per
-    saltare il recupero prezzi (lista più veloce)."""
+    saltare il recupero prezzi (lista più veloce); ?portfolio_id=<uuid> per limitare
+    la lista ai certificati presenti nel portafoglio; ?limit=<n>&offset=<m> per una
+    sola pagina (prezzi live solo per i suoi sottostanti), con next_offset nella risposta."""
     try:
         include_live = request.args.get('live', 'true').lower() != 'false'
-        certs = cert_db.get_all_certificates()
+        portfolio_id = request.args.get('portfolio_id')
+        paginated = request.args.get('limit') is not None
+        next_offset = None
+        if paginated:
+            try:
+                limit = int(request.args['limit'])
+                offset = int(request.args.get('offset', 0))
+            except ValueError:
+                return jsonify(error="limit e offset devono essere interi"), 400
+            if not (1 <= limit <= cert_db.CERTIFICATES_MAX_PAGE) or offset < 0:
+                return jsonify(error=f"limit tra 1 e {cert_db.CERTIFICATES_MAX_PAGE}, offset >= 0"), 400
+            certs, next_offset = cert_db.get_certificates_page(portfolio_id, limit=limit, offset=offset)
+        else:
+            certs = cert_db.get_all_certificates(portfolio_id=portfolio_id)
+
+        # Prezzi di tutti i ticker distinti in un solo passaggio (cache + fetch parallelo)
+        live_prices = {}
+        if include_live:
+            live_prices = get_live_prices([_underlying_ticker(u) for e in certs for u in e['underlyings']])
 
         result = []
         for entry in certs:
             cert = entry['certificate']
             underlyings = entry['underlyings']
             if include_live:
-                underlyings, worst_dist = _enrich_underlyings(underlyings)
+                underlyings, worst_dist = _enrich_underlyings(underlyings, live_prices)
             else:
                 worst_dist = None
             result.append({
@@ -62,18 +88,34 @@ def list_certificates():
                 "worst_dist": worst_dist,
             })
 
+        if paginated:
+            return jsonify(certificates=result, next_offset=next_offset)
         return jsonify(certificates=result)
     except Exception as e:
         logger.error(f"CERT LIST ERROR: {e}")
         return jsonify(error=str(e)), 500
 
 
+def _refresh_certificate_job(isin):
+    """Ri-analisi eseguita da job_queue: un errore LLM fa fallire il job."""
+    result = analyze_certificate(isin, force_refresh=True)
+    if result.get('error'):
+        raise RuntimeError(result['error'])
+    cert_db.save_analysis(result)
+    result['from_cache'] = False
+    return result
+
+
 @certificates_bp.route('/api/certificates/<isin>/refresh', methods=['POST', 'OPTIONS'])
 def refresh_certificate(isin):
-    """Forza la ri-analisi dal web (LLM) e salva il risultato in DB."""
+    """Forza la ri-analisi dal web (LLM) e salva il risultato in DB.
+    Con ?async=1 accoda un job (stato su /api/jobs/<job_id>) e risponde subito 202."""
     if request.method == 'OPTIONS':
         return jsonify(status="ok"), 200
     try:
+        if request.args.get('async') in ('1', 'true'):
+            job_id = submit_job('cert_refresh', _refresh_certificate_job, isin, dedup_key=isin)
+            return jsonify(job_id=job_id), 202
         result = analyze_certificate(isin, force_refresh=True)
         if result.get('error'):
             return jsonify(result), 502
@@ -0,0 +1,349 @@
+"""
+Daily Valuation Store.
+
+Serie storica giornaliera persistita (portfolio_daily_valuations) con quantità,
+prezzo, valore di mercato, capitale netto investito e dividendi cumulati per
+ogni (portafoglio, asset, giorno) in cui la posizione è aperta.
+
+Il job ricostruisce la serie in modo incrementale a partire dalla prima data
+interessata da una modifica (sync, modifica prezzi), come job di job_queue.
+I lettori (storico dashboard, report) leggono valore di mercato, quantità, capitale
+netto e dividendi cumulati solo alle date che servono (get_valuations); se la serie
+non copre l'intervallo richiesto ritornano None e il chiamante ripiega sul calcolo al volo.
+I flussi di cassa datati per l'MWR restano letti dalle transazioni.
+"""
+
+import logging
+import threading
+from datetime import datetime, timedelta
+from db_helper import execute_request, upsert_table, delete_table, fetch_all
+from job_queue import submit_job
+from price_manager import get_price_matrix
+
+logger = logging.getLogger("perix_monitor")
+
+# --- PARAMETRI CONFIGURABILI ---
+VALUATION_TABLE = 'portfolio_daily_valuations'
+VALUATION_STATE_TABLE = 'portfolio_valuation_state'
+VALUATION_WRITE_CHUNK = 1000      # Righe per singolo upsert
+VALUATION_JOB_KIND = 'valuation_rebuild'
+VALUATION_COLUMNS = ('quantity', 'price', 'market_value', 'net_invested', 'cumulative_dividends')
+MIN_OPEN_QTY = 0.0001             # Stessa soglia usata da dashboard/report
+
+
+def _to_day(value):
+    """Converte una data (str ISO / date / datetime) in datetime a mezzanotte."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    elif not isinstance(value, datetime):
+        value = datetime(value.year, value.month, value.day)
+    return value.replace(tzinfo=None, hour=0, minute=0, second=0, microsecond=0)
+
+
+def _earliest(a, b):
+    """Data più vecchia tra due; None significa 'ricalcolo completo' e prevale."""
+    if a is None or b is None:
+        return None
+    return min(a, b)
+
+
+def _set_valid_through(portfolio_id, valid_through):
+    return upsert_table(VALUATION_STATE_TABLE, {
+        'portfolio_id': portfolio_id,
+        'valid_through': valid_through.strftime('%Y-%m-%d') if valid_through else None,
+        'updated_at': datetime.now().isoformat()
+    }, on_conflict='portfolio_id')
+
+
+def _get_valid_through(portfolio_id):
+    """Ritorna (has_state, valid_through) dallo stato del job."""
+    res = execute_request(VALUATION_STATE_TABLE, 'GET', params={
+        'select': 'valid_through',
+        'portfolio_id': f'eq.{portfolio_id}'
+    })
+    rows = res.json() if (res and res.status_code == 200) else []
+    if not rows:
+        return False, None
+    return True, _to_day(rows[0].get('valid_through'))
+
+
+def rebuild_daily_valuations(portfolio_id, from_date=None):
+    """
+    Ricalcola le valutazioni giornaliere di un portafoglio da from_date in avanti.
+
+    Le transazioni vengono sempre rilette per intero (servono quantità e capitale
+    investito alla data di partenza, costo trascurabile); i prezzi interpolati
+    vengono scaricati solo da from_date. Per gli asset senza prezzi nella finestra
+    si riparte dal prezzo salvato il giorno precedente (LOCF).
+
+    Args:
+        portfolio_id (str): ID del portafoglio.
+        from_date (str|datetime, optional): Prima data interessata. None = ricalcolo completo.
+
+    Returns:
+        dict: Statistiche { 'portfolio_id', 'from_date', 'to_date', 'rows_written', 'assets' }
+    """
+    t0 = datetime.now()
+    stats = {'portfolio_id': portfolio_id, 'from_date': None, 'to_date': None, 'rows_written': 0, 'assets': 0}
+
+    transactions = [row for page in fetch_all('transactions', params={
+        'select': 'quantity,type,price_eur,date,assets(id,isin)',
+        'portfolio_id': f'eq.{portfolio_id}'
+    }, keyset=('date', 'id')) for row in page]
+
+    if not transactions:
+        delete_table(VALUATION_TABLE, {'portfolio_id': portfolio_id})
+        _set_valid_through(portfolio_id, _to_day(datetime.now()))
+        return stats
+
+    dividends = [row for page in fetch_all('dividends', params={
+        'select': 'asset_id,amount_eur,date',
+        'portfolio_id': f'eq.{portfolio_id}'
+    }, keyset=('date', 'id')) for row in page]
+
+    aid_to_isin = {t['assets']['id']: t['assets']['isin'] for t in transactions}
+    all_isins = list(set(aid_to_isin.values()))
+
+    start = _to_day(transactions[0]['date'])
+    end = max(_to_day(datetime.now()), _to_day(transactions[-1]['date']))
+    from_day = max(_to_day(from_date), start) if from_date else start
+    stats.update(from_date=from_day.strftime('%Y-%m-%d'), to_date=end.strftime('%Y-%m-%d'), assets=len(all_isins))
+
+    # I lettori ripiegano sul calcolo al volo finché il ricalcolo non è completo
+    _set_valid_through(portfolio_id, from_day - timedelta(days=1) if from_day > start else None)
+
+    # Prezzi interpolati solo dalla finestra da ricalcolare
+    price_matrix = get_price_matrix(all_isins, min_date=from_day, max_date=end, portfolio_id=portfolio_id)
+
+    # Prezzo di partenza (LOCF) per gli asset senza prezzi nella finestra
+    seed_prices = {}
+    if from_day > start:
+        res_seed = execute_request(VALUATION_TABLE, 'GET', params={
+            'select': 'isin,price',
+            'portfolio_id': f'eq.{portfolio_id}',
+            'date': f"eq.{(from_day - timedelta(days=1)).strftime('%Y-%m-%d')}"
+        })
+        if res_seed and res_seed.status_code == 200:
+            seed_prices = {r['isin']: float(r['price']) for r in res_seed.json()}
+
+    # Replay giornaliero: stessa logica di accumulo di dashboard/report
+    holdings = {}  # isin -> {'qty', 'net_invested', 'dividends'}
+    rows = []
+    t_idx, d_idx = 0, 0
+    day = start
+    while day <= end:
+        while t_idx < len(transactions) and _to_day(transactions[t_idx]['date']) <= day:
+            t = transactions[t_idx]
+            h = holdings.setdefault(t['assets']['isin'], {'qty': 0.0, 'net_invested': 0.0, 'dividends': 0.0})
+            qty = float(t['quantity'])
+            val = qty * float(t['price_eur'])
+            if t['type'] == 'BUY':
+                h['qty'] += qty
+                h['net_invested'] += val
+            else:
+                h['qty'] -= qty
+                h['net_invested'] -= val
+            t_idx += 1
+
+        while d_idx < len(dividends) and _to_day(dividends[d_idx]['date']) <= day:
+            d = dividends[d_idx]
+            isin = aid_to_isin.get(d['asset_id'])
+            if isin:
+                # Come lo storico dashboard: conta anche i dividendi precedenti alla prima transazione
+                h = holdings.setdefault(isin, {'qty': 0.0, 'net_invested': 0.0, 'dividends': 0.0})
+                h['dividends'] += float(d['amount_eur'])
+            d_idx += 1
+
+        if day >= from_day:
+            day_str = day.strftime('%Y-%m-%d')
+            day_prices = price_matrix.prices_on(day)
+            for isin, h in holdings.items():
+                if h['qty'] <= MIN_OPEN_QTY:
+                    continue
+                row = price_matrix.row_index.get(isin)
+                price = (float(day_prices[row]) if row is not None else 0) or seed_prices.get(isin, 0)
+                rows.append({
+                    'portfolio_id': portfolio_id,
+                    'isin': isin,
+                    'date': day_str,
+                    'quantity': h['qty'],
+                    'price': price,
+                    'market_value': h['qty'] * price,
+                    'net_invested': h['net_invested'],
+                    'cumulative_dividends': h['dividends']
+                })
+        day += timedelta(days=1)
+
+    # Sostituisce la finestra ricalcolata (gestisce anche posizioni chiuse/rimosse)
+    if not delete_table(VALUATION_TABLE, {'portfolio_id': portfolio_id, 'date.gte': from_day.strftime('%Y-%m-%d')}):
+        raise RuntimeError(f"Impossibile cancellare le valutazioni del portafoglio {portfolio_id}")
+
+    for i in range(0, len(rows), VALUATION_WRITE_CHUNK):
+        chunk = rows[i:i + VALUATION_WRITE_CHUNK]
+        if not upsert_table(VALUATION_TABLE, chunk, on_conflict='portfolio_id,isin,date'):
+            raise RuntimeError(f"Scrittura valutazioni fallita per {portfolio_id} (righe {i}-{i + len(chunk)})")
+        stats['rows_written'] += len(chunk)
+
+    # Se nel frattempo è arrivata un'altra invalidazione, lo stato resta arretrato
+    with _jobs_lock:
+        superseded = portfolio_id in _pending
+    if not superseded:
+        _set_valid_through(portfolio_id, end)
+
+    logger.info(f"VALUATIONS: Portfolio {portfolio_id} ricalcolato dal {stats['from_date']}: "
+                f"{stats['rows_written']} righe in {(datetime.now() - t0).total_seconds():.2f}s")
+    return stats
+
+
+# --- Job in background (job_queue) ---
+# Un solo job per portafoglio; le invalidazioni arrivate durante un ricalcolo
+# vengono unite (data più vecchia) ed eseguite subito dopo dallo stesso job.
+# Se il job si interrompe (es. processo congelato o riavviato) lo stato resta arretrato:
+# i lettori ripiegano sul calcolo al volo e lo rimettono in coda.
+_jobs_lock = threading.Lock()
+_pending = {}    # portfolio_id -> from_date (None = completo)
+_running = set()
+
+
+def _run_rebuild_jobs(portfolio_id):
+    runs, errors = [], []
+    while True:
+        with _jobs_lock:
+            if portfolio_id not in _pending:
+                _running.discard(portfolio_id)
+                break
+            from_date = _pending.pop(portfolio_id)
+        try:
+            runs.append(rebuild_daily_valuations(portfolio_id, from_date))
+        except Exception as e:
+            logger.error(f"VALUATIONS: Ricalcolo fallito per {portfolio_id}: {e}")
+            errors.append(str(e))
+    if errors:
+        raise RuntimeError("; ".join(errors))
+    return runs
+
+
+def schedule_rebuild(portfolio_id, from_date=None):
+    """
+    Accoda il ricalcolo di un portafoglio su job_queue.
+    Ritorna il job_id, o None se la richiesta è stata unita a un ricalcolo già in corso.
+    """
+    from_date = _to_day(from_date)
+    with _jobs_lock:
+        if portfolio_id in _pending:
+            _pending[portfolio_id] = _earliest(_pending[portfolio_id], from_date)
+        else:
+            _pending[portfolio_id] = from_date
+        if portfolio_id in _running:
+            return None
+        _running.add(portfolio_id)
+    try:
+        return submit_job(VALUATION_JOB_KIND, _run_rebuild_jobs, portfolio_id)
+    except Exception:
+        with _jobs_lock:
+            _running.discard(portfolio_id)
+        raise
+
+
+def invalidate_valuations(portfolio_id, from_date=None):
+    """
+    Marca come non valide le valutazioni da from_date in avanti e accoda il ricalcolo.
+    Lo stato viene arretrato subito, così i lettori non vedono dati vecchi nel frattempo.
+    """
+    from_date = _to_day(from_date)
+    try:
+        has_state, valid_through = _get_valid_through(portfolio_id)
+        if has_state:
+            new_valid = from_date - timedelta(days=1) if from_date else None
+            if valid_through and new_valid and valid_through < new_valid:
+                new_valid = valid_through
+            _set_valid_through(portfolio_id, new_valid)
+    except Exception as e:
+        logger.error(f"VALUATIONS: Invalidazione fallita per {portfolio_id}: {e}")
+    schedule_rebuild(portfolio_id, from_date)
+
+
+def invalidate_valuations_for_prices(changes, skip_portfolios=()):
+    """
+    Invalida i portafogli che detengono asset con prezzi modificati.
+
+    Args:
+        changes (dict): {isin: prima data modificata}
+        skip_portfolios (iterable): portafogli già invalidati dal chiamante
+    """
+    if not changes:
+        return
+    # Un solo valore JSONB per tutti i portafogli: nessun troncamento a max_rows
+    res = execute_request('rpc/portfolios_holding_isins', 'POST', body={'p_isins': list(changes.keys())})
+    if not res or res.status_code != 200:
+        logger.error(f"VALUATIONS: Lettura portafogli per prezzi modificati fallita: {res.status_code if res else 'n/a'}")
+        return
+
+    affected = {}
+    for pid, isins in (res.json() or {}).items():
+        if pid in skip_portfolios:
+            continue
+        affected[pid] = min(_to_day(changes[isin]) for isin in isins)
+
+    for pid, from_date in affected.items():
+        invalidate_valuations(pid, from_date)
+
+
+def invalidate_valuations_after_sync(portfolio_id, transactions=(), dividends=(), prices=()):
+    """Invalida le valutazioni dopo /api/sync dalla prima data toccata da transazioni, dividendi o prezzi."""
+    dates = [_to_day(x['date']) for x in list(transactions) + list(dividends) + list(prices) if x.get('date')]
+    if not dates:
+        return
+    invalidate_valuations(portfolio_id, min(dates))
+
+    price_changes = {}
+    for p in prices:
+        if p.get('isin') and p.get('date'):
+            d = _to_day(p['date'])
+            price_changes[p['isin']] = min(price_changes.get(p['isin'], d), d)
+    invalidate_valuations_for_prices(price_changes, skip_portfolios={portfolio_id})
+
+
+def get_valuations(portfolio_id, isins, dates):
+    """
+    Legge dalla serie persistita le valutazioni per le date richieste.
+
+    Args:
+        portfolio_id (str): ID del portafoglio.
+        isins (list): ISIN da leggere.
+        dates (list): Date richieste ('YYYY-MM-DD' o datetime).
+
+    Returns:
+        dict|None: {isin: {'YYYY-MM-DD': {quantity, price, market_value, net_invested,
+                   cumulative_dividends}}} solo nei giorni con posizione aperta, oppure None
+                   se la serie non copre le date (il chiamante ripiega sul calcolo al volo).
+    """
+    if not isins or not dates:
+        return {}
+
+    date_strs = sorted({d.strftime('%Y-%m-%d') if hasattr(d, 'strftime') else str(d)[:10] for d in dates})
+    try:
+        has_state, valid_through = _get_valid_through(portfolio_id)
+        if not has_state or valid_through is None or valid_through < _to_day(date_strs[-1]):
+            # Serie mancante o non aggiornata: la (ri)costruisce in background
+            stale = valid_through is None or valid_through < _to_day(datetime.now())
+            if stale and portfolio_id not in _running:
+                schedule_rebuild(portfolio_id, valid_through + timedelta(days=1) if valid_through else None)
+            return None
+
+        valuations = {}
+        for page in fetch_all(VALUATION_TABLE, params={
+            'select': 'isin,date,' + ','.join(VALUATION_COLUMNS),
+            'portfolio_id': f'eq.{portfolio_id}',
+            'isin': f"in.({','.join(set(isins))})",
+            'date': f"in.({','.join(date_strs)})"
+        }, keyset=('isin', 'date')):
+            for r in page:
+                valuations.setdefault(r['isin'], {})[r['date']] = {c: float(r[c] or 0) for c in VALUATION_COLUMNS}
+        return valuations
+
+    except Exception as e:
+        logger.error(f"VALUATIONS: Lettura fallita per {portfolio_id}: {e}")
+        return None
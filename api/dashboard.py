@@ -3,26 +3,134 @@ from flask import jsonify, request
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-from db_helper import execute_request
-from finance import xirr
-from price_manager import get_price_history, get_interpolated_price_history, get_latest_prices_batch, get_interpolated_price_history_batch
+from db_helper import execute_request, execute_batch, fetch_all_rows
+from finance import CashFlowAccumulator, deannualize_xirr, annualize_simple_return
+from price_manager import get_price_history, get_interpolated_price_history, get_latest_prices_batch, get_price_matrix
 from logger import logger
+from result_cache import summary_cache, get_data_version
+from daily_valuation import get_valuations
+from holdings import get_holdings_snapshot
 import traceback
 
+def _to_cf_date(date_str):
+    try:
+        return datetime.fromisoformat(date_str.replace('Z', '+00:00')).replace(tzinfo=None)
+    except:
+        return datetime.now()
+
+def _holdings_from_snapshot(snapshot_rows, transactions):
+    """
+    Holdings e totali dalla vista portfolio_holdings (qty e capitale netto investito per asset);
+    le transazioni (senza join su assets) servono solo per i flussi di cassa XIRR e il lordo investito.
+    """
+    holdings = {}
+    total_invested = 0
+    for row in snapshot_rows:
+        holdings[row['isin']] = {
+            "qty": row['qty'],
+            "cost": 0,
+            "name": row['name'],
+            "asset_class": row.get('asset_class'),
+            "last_trend_variation": row.get('last_trend_variation'),
+            "isin": row['isin'],
+            "id": row['asset_id']
+        }
+        total_invested += row['net_invested']
+
+    id_to_isin = {row['asset_id']: row['isin'] for row in snapshot_rows}
+    cash_flows = []
+    gross_invested = 0
+    for t in transactions:
+        isin = id_to_isin.get(t['asset_id'])
+        if isin is None:
+            continue
+        amount = t['quantity'] * t['price_eur']
+        if t['type'] == 'BUY':
+            holdings[isin]["cost"] += amount
+            gross_invested += amount
+            cash_flows.append({"date": _to_cf_date(t['date']), "amount": -amount})
+        else:
+            cash_flows.append({"date": _to_cf_date(t['date']), "amount": amount})
+    return holdings, cash_flows, total_invested, gross_invested
+
+def _holdings_from_transactions(transactions):
+    """Holdings e totali ricostruiti dalle transazioni con i dati asset (percorso di ripiego)."""
+    holdings = {} # isin -> {qty, cost, asset_name}
+    cash_flows = [] # Per XIRR: [(date, amount)]
+    
+    total_invested = 0
+    gross_invested = 0
+    
+    for t in transactions:
+        isin = t['assets']['isin']
+        name = t['assets']['name']
+        qty = t['quantity']
+        price = t['price_eur']
+        date_str = t['date']
+        is_buy = t['type'] == 'BUY'
+        
+        # Aggiorna Holdings
+        if isin not in holdings:
+            holdings[isin] = {
+                "qty": 0, 
+                "cost": 0, 
+                "name": name, 
+                "asset_class": t['assets'].get('asset_class'),
+                "last_trend_variation": t['assets'].get('last_trend_variation'),
+                "isin": isin,
+                "id": t['assets']['id'] 
+            }
+        
+        if is_buy:
+            holdings[isin]["qty"] += qty
+            holdings[isin]["cost"] += (qty * price)
+            
+            try:
+                clean_date = date_str.replace('Z', '+00:00')
+                cf_date = datetime.fromisoformat(clean_date).replace(tzinfo=None)
+            except:
+                cf_date = datetime.now()
+
+            cash_flows.append({"date": cf_date, "amount": -(qty * price)})
+            total_invested += (qty * price)
+            gross_invested += (qty * price)
+        else:
+            holdings[isin]["qty"] -= qty
+            try:
+                clean_date = date_str.replace('Z', '+00:00')
+                cf_date = datetime.fromisoformat(clean_date).replace(tzinfo=None)
+            except:
+                cf_date = datetime.now()
+
+            cash_flows.append({"date": cf_date, "amount": (qty * price)})
+            total_invested -= (qty * price)
+
+    return holdings, cash_flows, total_invested, gross_invested
+
 def calculate_portfolio_summary(portfolio_id, assets_filter=None, mwr_t1=30, mwr_t2=365, xirr_mode='standard'):
     """
     Core logic to calculate portfolio summary metrics.
     Extracted for reuse in other modules (e.g. backup_service).
     """
     try:
-        # 1. Recupera Transazioni
-        res_trans = execute_request('transactions', 'GET', params={
-            'select': '*,assets(id,isin,name,asset_class,last_trend_variation)',
-            'portfolio_id': f'eq.{portfolio_id}'
-        })
-        transactions = res_trans.json() if (res_trans and res_trans.status_code == 200) else []
-        
-        # Filtra per asset specifici se richiesto
+        # 1. Recupera Holdings (vista portfolio_holdings), Transazioni, Dividendi e Colori in parallelo.
+        # Le transazioni senza join su assets: i metadati asset arrivano dallo snapshot.
+        # Transazioni e dividendi paginati (fetch_all_rows): i flussi XIRR devono essere
+        # completi quanto le quantità della vista.
+        snapshot, transactions, dividends, res_colors = execute_batch([
+            lambda: get_holdings_snapshot(portfolio_id),
+            lambda: fetch_all_rows('transactions', params={
+                'select': 'asset_id,quantity,price_eur,type,date',
+                'portfolio_id': f'eq.{portfolio_id}'
+            }, keyset=('date', 'id')),
+            lambda: fetch_all_rows('dividends', params={'portfolio_id': f'eq.{portfolio_id}'}, keyset=('date', 'id')),
+            {'endpoint': 'portfolio_asset_settings', 'params': {
+                'select': 'asset_id,color',
+                'portfolio_id': f'eq.{portfolio_id}'
+            }}
+        ])
+
+        selected_isins = None
         if assets_filter is not None:
             if assets_filter == "":
                  selected_isins = set()
@@ -30,9 +138,26 @@ def calculate_portfolio_summary(portfolio_id, assets_filter=None, mwr_t1=30, mwr
                  selected_isins = set(assets_filter.split(','))
             else: # Assume set or list
                  selected_isins = set(assets_filter)
-            transactions = [t for t in transactions if t['assets']['isin'] in selected_isins]
-        
-        if not transactions:
+
+        if snapshot is not None:
+            snapshot_rows = [row for isin, row in snapshot.items() if selected_isins is None or isin in selected_isins]
+        else:
+            # Vista non allineata: ricostruzione completa dalle transazioni con i dati asset
+            transactions = fetch_all_rows('transactions', params={
+                'select': '*,assets(id,isin,name,asset_class,last_trend_variation)',
+                'portfolio_id': f'eq.{portfolio_id}'
+            }, keyset=('date', 'id'))
+            # Filtra per asset specifici se richiesto
+            if selected_isins is not None:
+                transactions = [t for t in transactions if t['assets']['isin'] in selected_isins]
+
+        # 2. Calcola Posizioni (Holdings) Correnti
+        if snapshot is not None:
+            holdings, cash_flows, total_invested, gross_invested = _holdings_from_snapshot(snapshot_rows, transactions)
+        else:
+            holdings, cash_flows, total_invested, gross_invested = _holdings_from_transactions(transactions)
+
+        if not holdings:
             return {
                 "total_value": 0,
                 "total_invested": 0,
@@ -42,66 +167,10 @@ def calculate_portfolio_summary(portfolio_id, assets_filter=None, mwr_t1=30, mwr
                 "allocation": []
             }
 
-        # 2. Calcola Posizioni (Holdings) Correnti
-        holdings = {} # isin -> {qty, cost, asset_name}
-        cash_flows = [] # Per XIRR: [(date, amount)]
-        
-        total_invested = 0
-        gross_invested = 0
-        
-        for t in transactions:
-            isin = t['assets']['isin']
-            name = t['assets']['name']
-            qty = t['quantity']
-            price = t['price_eur']
-            date_str = t['date']
-            is_buy = t['type'] == 'BUY'
-            
-            # Aggiorna Holdings
-            if isin not in holdings:
-                holdings[isin] = {
-                    "qty": 0, 
-                    "cost": 0, 
-                    "name": name, 
-                    "asset_class": t['assets'].get('asset_class'),
-                    "last_trend_variation": t['assets'].get('last_trend_variation'),
-                    "isin": isin,
-                    "id": t['assets']['id'] 
-                }
-            
-            if is_buy:
-                holdings[isin]["qty"] += qty
-                holdings[isin]["cost"] += (qty * price)
-                
-                try:
-                    clean_date = date_str.replace('Z', '+00:00')
-                    cf_date = datetime.fromisoformat(clean_date).replace(tzinfo=None)
-                except:
-                    cf_date = datetime.now()
-
-                cash_flows.append({"date": cf_date, "amount": -(qty * price)})
-                total_invested += (qty * price)
-                gross_invested += (qty * price)
-            else:
-                holdings[isin]["qty"] -= qty
-                try:
-                    clean_date = date_str.replace('Z', '+00:00')
-                    cf_date = datetime.fromisoformat(clean_date).replace(tzinfo=None)
-                except:
-                    cf_date = datetime.now()
-
-                cash_flows.append({"date": cf_date, "amount": (qty * price)})
-                total_invested -= (qty * price)
-
-        # --- 2b. Recupera Dividendi ---
-        res_div = execute_request('dividends', 'GET', params={
-            'portfolio_id': f'eq.{portfolio_id}'
-        })
-        dividends = res_div.json() if (res_div and res_div.status_code == 200) else []
-        
+        # --- 2b. Dividendi (già recuperati al punto 1) ---
         if assets_filter is not None:
-            # transactions was already filtered above, so we can extract the valid asset_ids
-            selected_asset_ids = set([t['assets']['id'] for t in transactions])
+            # holdings was already filtered above, so we can extract the valid asset_ids
+            selected_asset_ids = set([h['id'] for h in holdings.values()])
             dividends = [d for d in dividends if d.get('asset_id') in selected_asset_ids]
             
         total_dividends = 0
@@ -167,18 +236,9 @@ def calculate_portfolio_summary(portfolio_id, assets_filter=None, mwr_t1=30, mwr
 
         mwr_value, mwr_type = get_tiered_mwr(cash_flows, current_total_value, t1=mwr_t1, t2=mwr_t2, end_date=max_date, xirr_mode=xirr_mode)
 
-        # 5. Recupera Colori (Batch)
-        asset_ids = [item['asset_id'] for item in allocation_data if item.get('asset_id')]
-        color_map = {}
-        if asset_ids:
-             in_filter = f"in.({','.join(asset_ids)})"
-             res_colors = execute_request('portfolio_asset_settings', 'GET', params={
-                 'select': 'asset_id,color',
-                 'portfolio_id': f'eq.{portfolio_id}',
-                 'asset_id': in_filter
-             })
-             rows = res_colors.json() if (res_colors and res_colors.status_code == 200) else []
-             color_map = {row['asset_id']: row['color'] for row in rows}
+        # 5. Colori (recuperati al punto 1 per tutto il portafoglio)
+        rows = res_colors.json() if (res_colors and res_colors.status_code == 200) else []
+        color_map = {row['asset_id']: row['color'] for row in rows}
 
         for item in allocation_data:
             aid = item.get('asset_id')
@@ -205,6 +265,35 @@ def calculate_portfolio_summary(portfolio_id, assets_filter=None, mwr_t1=30, mwr
         logger.error(traceback.format_exc())
         raise e
 
+def get_portfolio_summary_cached(portfolio_id, assets_filter=None, mwr_t1=30, mwr_t2=365, xirr_mode='standard'):
+    """
+    Come calculate_portfolio_summary, ma servito dalla cache di processo quando
+    i dati del portafoglio non sono cambiati (vedi result_cache.bump_data_version).
+    """
+    # Normalizza il filtro asset per la chiave (None = tutti, "" = nessuno)
+    if assets_filter is None:
+        filter_key = None
+    elif isinstance(assets_filter, str):
+        filter_key = tuple(sorted(set(assets_filter.split(',')))) if assets_filter else ()
+    else:
+        filter_key = tuple(sorted(set(assets_filter)))
+
+    cache_key = (portfolio_id, filter_key, mwr_t1, mwr_t2, xirr_mode, get_data_version(portfolio_id))
+
+    summary = summary_cache.get(cache_key)
+    if summary is not None:
+        return summary
+
+    summary = calculate_portfolio_summary(
+        portfolio_id,
+        assets_filter=assets_filter,
+        mwr_t1=mwr_t1,
+        mwr_t2=mwr_t2,
+        xirr_mode=xirr_mode
+    )
+    summary_cache.set(cache_key, summary)
+    return summary
+
 def register_dashboard_routes(app):
     
     @app.route('/api/dashboard/summary', methods=['GET'])
@@ -221,16 +310,18 @@ def register_dashboard_routes(app):
             mwr_t2 = int(request.args.get('mwr_t2', 365))
             xirr_mode = request.args.get('xirr_mode', 'standard')
 
-            summary = calculate_portfolio_summary(
+            hits_before = summary_cache.hits
+            summary = get_portfolio_summary_cached(
                 portfolio_id, 
                 assets_filter=assets_param,
                 mwr_t1=mwr_t1,
                 mwr_t2=mwr_t2,
                 xirr_mode=xirr_mode
             )
+            cache_status = "HIT" if summary_cache.hits > hits_before else "MISS"
 
             t_end = datetime.now()
-            logger.info(f"[DASHBOARD_SUMMARY] Completato in {(t_end - t_start).total_seconds():.2f}s")
+            logger.info(f"[DASHBOARD_SUMMARY] Completato in {(t_end - t_start).total_seconds():.2f}s (cache {cache_status})")
             return jsonify(summary)
 
         except Exception as e:
@@ -247,27 +338,26 @@ def register_dashboard_routes(app):
             if not portfolio_id:
                 return jsonify(error="Missing portfolio_id"), 400
 
+            mwr_t1 = int(request.args.get('mwr_t1', 30))
+            mwr_t2 = int(request.args.get('mwr_t2', 365))
+            xirr_mode = request.args.get('xirr_mode', 'standard')
+
             # supabase = get_supabase_client() -> Removed
             
             # 1. Recupera Transazioni con metadati
             # res_trans = supabase.table('transactions').select("*, assets(id, isin, name, asset_class, metadata)").eq('portfolio_id', portfolio_id).order('date').execute()
-            res_trans = execute_request('transactions', 'GET', params={
+            transactions = fetch_all_rows('transactions', params={
                 'select': '*,assets(id,isin,name,asset_class,metadata)',
-                'portfolio_id': f'eq.{portfolio_id}',
-                'order': 'date.asc'
-            })
-            
-            transactions = res_trans.json() if (res_trans and res_trans.status_code == 200) else []
+                'portfolio_id': f'eq.{portfolio_id}'
+            }, keyset=('date', 'id'))
             
             if not transactions:
                 return jsonify(history=[], assets=[])
 
             # 1b. Recupera Dividendi per lo storico
-            res_div = execute_request('dividends', 'GET', params={
-                'portfolio_id': f'eq.{portfolio_id}',
-                'order': 'date.asc'
-            })
-            portfolio_dividends = res_div.json() if (res_div and res_div.status_code == 200) else []
+            portfolio_dividends = fetch_all_rows('dividends', params={
+                'portfolio_id': f'eq.{portfolio_id}'
+            }, keyset=('date', 'id'))
 
             # Filtro asset opzionale
             assets_param = request.args.get('assets')
@@ -373,13 +463,24 @@ def register_dashboard_routes(app):
             if not check_points or (end_date - check_points[-1]).days >= 1:
                 check_points.append(end_date)
 
-            # --- OTTIMIZZAZIONE BATCH PER PREZZI ---
-            # Recuperiamo la storia interpolata per TUTTI gli asset in una volta
+            # --- OTTIMIZZAZIONE BATCH PER VALUTAZIONI ---
+            # Valore di mercato, capitale netto e dividendi ai soli checkpoint dalla serie giornaliera
+            # persistita (portfolio_daily_valuations): nessuna rivalutazione delle posizioni.
+            # Se la serie non copre il periodo ripieghiamo sulla storia interpolata di TUTTI gli asset
+            # (PriceMatrix: i prezzi ai checkpoint si leggono in un solo fancy-index).
+            # Le transazioni servono comunque per i flussi datati dell'XIRR.
             t2_pre_batch = datetime.now()
             
-            global_price_map = get_interpolated_price_history_batch(all_isins, min_date=start_date, max_date=end_date, portfolio_id=portfolio_id)
+            valuations = get_valuations(portfolio_id, all_isins, check_points)
+            cp_prices = None
+            price_source = "daily_valuations"
+            if valuations is None:
+                global_price_map = get_price_matrix(all_isins, min_date=start_date, max_date=end_date, portfolio_id=portfolio_id)
+                price_source = "interpolazione"
+                # Prezzi (asset x checkpoint) già allineati ai checkpoint
+                cp_prices = global_price_map.lookup(all_isins, check_points).tolist()
             
-            logger.info(f"[DASHBOARD_HISTORY] Batch Price Fetch completed in {(datetime.now() - t2_pre_batch).total_seconds():.2f}s")
+            logger.info(f"[DASHBOARD_HISTORY] Batch Price Fetch ({price_source}) completed in {(datetime.now() - t2_pre_batch).total_seconds():.2f}s")
             
             # 3. Calcolo MWR History per Asset
             assets_history = []
@@ -387,31 +488,32 @@ def register_dashboard_routes(app):
             t2 = datetime.now()
             logger.info(f"[DASHBOARD_HISTORY] Processing {len(all_isins)} assets...")
             
-            for isin in all_isins:
+            for isin_idx, isin in enumerate(all_isins):
                 sample_t = next((t for t in transactions if t['assets']['isin'] == isin), None)
                 asset_name = get_asset_name(sample_t) if sample_t else isin
                 
-                # Usa la mappa globale batch
-                price_map = global_price_map.get(isin, {})
+                # Valutazioni persistite (o riga della matrice prezzi) ai checkpoint per questo asset
+                asset_valuations = valuations.get(isin, {}) if valuations is not None else None
+                asset_cp_prices = cp_prices[isin_idx] if cp_prices is not None else None
                 
                 # Filtra transazioni per questo asset
                 asset_trans = [t for t in transactions if t['assets']['isin'] == isin]
                 
                 mwr_series = []
-                current_cash_flows = []
+                flows_acc = CashFlowAccumulator()
                 transaction_idx = 0
                 current_qty = 0.0
                 net_invested_for_pnl = 0.0
                 current_avg_cost = 0.0
                 
-                last_xirr_guess = 0.1 
+                pending_points = []
                 
                 # Dividendi per questo asset
                 asset_dividends = [d for d in portfolio_dividends if d['asset_id'] == sample_t['assets']['id']]
                 dividend_idx = 0
                 total_asset_dividends_acc = 0.0
                 
-                for cp in check_points:
+                for cp_idx, cp in enumerate(check_points):
                     cp_str = cp.strftime('%Y-%m-%d')
                     
                     # 1. Aggiungi cashflows fino a cp
@@ -438,11 +540,11 @@ def register_dashboard_routes(app):
                                 current_avg_cost = total_cost / new_total_qty
                             
                             current_qty += qty
-                            current_cash_flows.append({"date": t_date, "amount": -val})
+                            flows_acc.add(t_date, -val)
                             net_invested_for_pnl += val
                         else:
                             current_qty -= qty
-                            current_cash_flows.append({"date": t_date, "amount": val})
+                            flows_acc.add(t_date, val)
                             net_invested_for_pnl -= val
                         
                         transaction_idx += 1
@@ -461,13 +563,19 @@ def register_dashboard_routes(app):
                         
                         amount = float(d['amount_eur'])
                         total_asset_dividends_acc += amount
-                        current_cash_flows.append({"date": d_date, "amount": amount})
+                        flows_acc.add(d_date, amount, is_dividend=True)
                         dividend_idx += 1
                             
                     # 2. Valutazione al CP
-                    if current_qty > 0.0001:
+                    if asset_valuations is not None:
+                        # Riga persistita solo con posizione aperta
+                        v = asset_valuations.get(cp_str)
+                        if not v or v['market_value'] == 0: continue
+                        current_val = v['market_value']
+                        pnl_at_cp = (current_val - v['net_invested']) + v['cumulative_dividends']
+                    elif current_qty > 0.0001:
                         # O(1) Lookup
-                        price_at_cp = price_map.get(cp_str, 0)
+                        price_at_cp = asset_cp_prices[cp_idx]
                         
                         if price_at_cp == 0 and current_avg_cost > 0:
                              price_at_cp = 0
@@ -476,72 +584,82 @@ def register_dashboard_routes(app):
 
                         current_val = current_qty * price_at_cp
                         pnl_at_cp = (current_val - net_invested_for_pnl) + total_asset_dividends_acc
-                        
-                        calc_flows = current_cash_flows + [{"date": cp, "amount": current_val}]
-                        
-                        first_d = current_cash_flows[0]['date'] if current_cash_flows else cp
-                        dur_days = (cp - first_d).days
-                        
-                        mwr_t1 = int(request.args.get('mwr_t1', 30))
-                        mwr_t2 = int(request.args.get('mwr_t2', 365))
+                    else:
+                        continue
+
+                    first_d = flows_acc.first_date or cp
+
+                    # [PERF] XIRR rinviato: tutti i checkpoint dell'asset vengono risolti
+                    # insieme con xirr_batch al termine del loop.
+                    flows_acc.checkpoint(cp, current_val)
+                    pending_points.append({
+                        "date": cp_str,
+                        "dur_days": (cp - first_d).days,
+                        "current_val": current_val,
+                        "pnl": pnl_at_cp,
+                        "net_in": flows_acc.net_invested
+                    })
 
-                        try:
-                            # 1. Tentativo XIRR Standard
-                            val = xirr(calc_flows, guess=last_xirr_guess)
-                            
-                            final_val = 0.0
-                            is_valid_xirr = False
-                            
-                            # 2. Validazione Convergenza
-                            if val is not None and abs(val) <= 10.0: # Max 1000%
-                                last_xirr_guess = max(-0.99, min(val, 10.0))
-                                final_val = val
-                                is_valid_xirr = True
-                                
-                                # Tier Logic con XIRR valido
-                                if dur_days < mwr_t1:
-                                     # Tier 1 Override (Simple Return)
-                                     pass # Gestito sotto uniformemente
-                                elif dur_days < mwr_t2:
-                                    from finance import deannualize_xirr
-                                    final_val = deannualize_xirr(val, dur_days)
-                                # else: Keep annualized val
-                            
-                            # 3. Determinazione Valore Finale (XIRR Tiered o Fallback)
-                            # Se XIRR non valido O siamo in Tier 1 -> Usa Simple Return
-                            use_simple_return = (not is_valid_xirr) or (dur_days < mwr_t1)
-                            
-                            if use_simple_return:
-                                # Calcolo Simple Return robusto (Net Invested: Buys + Sells + Divs)
-                                net_in = sum(-f['amount'] for f in current_cash_flows)
-                                if net_in > 0:
-                                     simple_ret = (current_val - net_in) / net_in
-                                     
-                                     # Annualizza se Tier 3
-                                     if dur_days >= mwr_t2:
-                                         from finance import annualize_simple_return
-                                         final_val = annualize_simple_return(simple_ret, dur_days)
-                                     else:
-                                         final_val = simple_ret
-                                else:
-                                     final_val = 0.0
-
-                            # 4. Clamp Rigoroso (±500%) per evitare distruzione grafico
-                            final_val = max(-5.0, min(final_val, 5.0))
-                            
-                            # DIAGNOSTICA ASSET - Se valore tocca il clamp o esce (impossibile con max/min ma utile per tracciare)
-                            if abs(final_val) >= 4.9:
-                                logger.warning(f"[ASSET_DIAG] CLAMP HIT/FAIL {isin} date={cp_str} val={val} final={final_val}")
-
-                            mwr_series.append({
-                                "date": cp_str,
-                                "value": round(final_val * 100, 2),
-                                "pnl": round(pnl_at_cp, 2),
-                                "market_value": round(current_val, 2)
-                            })
-                        except Exception as e:
-                            # In caso di errore catastrofico, salta il punto ma non crashare
-                            pass
+                # 3. XIRR vettoriale su tutti i checkpoint dell'asset (una sola chiamata)
+                xirr_values = flows_acc.solve_checkpoints()
+
+                for point, raw_val in zip(pending_points, xirr_values):
+                    cp_str = point['date']
+                    dur_days = point['dur_days']
+                    current_val = point['current_val']
+                    val = None if np.isnan(raw_val) else float(raw_val)
+
+                    try:
+                        final_val = 0.0
+                        is_valid_xirr = False
+
+                        # Validazione Convergenza
+                        if val is not None and abs(val) <= 10.0: # Max 1000%
+                            final_val = val
+                            is_valid_xirr = True
+
+                            # Tier Logic con XIRR valido
+                            if dur_days < mwr_t1:
+                                 # Tier 1 Override (Simple Return)
+                                 pass # Gestito sotto uniformemente
+                            elif dur_days < mwr_t2:
+                                final_val = deannualize_xirr(val, dur_days)
+                            # else: Keep annualized val
+
+                        # Determinazione Valore Finale (XIRR Tiered o Fallback)
+                        # Se XIRR non valido O siamo in Tier 1 -> Usa Simple Return
+                        use_simple_return = (not is_valid_xirr) or (dur_days < mwr_t1)
+
+                        if use_simple_return:
+                            # Calcolo Simple Return robusto (Net Invested: Buys + Sells + Divs)
+                            net_in = point['net_in']
+                            if net_in > 0:
+                                 simple_ret = (current_val - net_in) / net_in
+
+                                 # Annualizza se Tier 3
+                                 if dur_days >= mwr_t2:
+                                     final_val = annualize_simple_return(simple_ret, dur_days)
+                                 else:
+                                     final_val = simple_ret
+                            else:
+                                 final_val = 0.0
+
+                        # Clamp Rigoroso (±500%) per evitare distruzione grafico
+                        final_val = max(-5.0, min(final_val, 5.0))
+
+                        # DIAGNOSTICA ASSET - Se valore tocca il clamp o esce (impossibile con max/min ma utile per tracciare)
+                        if abs(final_val) >= 4.9:
+                            logger.warning(f"[ASSET_DIAG] CLAMP HIT/FAIL {isin} date={cp_str} val={val} final={final_val}")
+
+                        mwr_series.append({
+                            "date": cp_str,
+                            "value": round(final_val * 100, 2),
+                            "pnl": round(point['pnl'], 2),
+                            "market_value": round(current_val, 2)
+                        })
+                    except Exception as e:
+                        # In caso di errore catastrofico, salta il punto ma non crashare
+                        pass
 
                 if mwr_series:
                     # Recupera ID per colore (ottimizzabile con batch colors se volessimo)
@@ -587,28 +705,28 @@ def register_dashboard_routes(app):
             # 4. Calcolo Storia Ptf (Ponderata)
             portfolio_series = []
             
-            # global_price_map è già popolato per tutti gli assets! -> OTTIMO.
+            # Valutazioni persistite (o cp_prices) già pronte per tutti gli asset
+            isin_rows = {isin: i for i, isin in enumerate(all_isins)}
             
             # Filter dividends by selected assets if subset is active
             if selected_asset_ids:
                 portfolio_dividends = [d for d in portfolio_dividends if d['asset_id'] in selected_asset_ids]
             
-            current_port_cash_flows = []
+            port_flows_acc = CashFlowAccumulator()
             transaction_idx_p = 0
             
             current_port_holdings_map = {} 
-            last_port_xirr = 0.1
+            port_pending = []
 
             # Contatori diagnostici per riepilogo finale
             diag_counts = {"T1_SIMPLE": 0, "T2_DEANN": 0, "T3_ANNUAL": 0, "EXTREME": 0, "XIRR_NONE": 0, "XIRR_EXC": 0, "SKIPPED": 0}
 
-            for cp in check_points:
+            for cp_idx, cp in enumerate(check_points):
                 cp_str = cp.strftime('%Y-%m-%d')
                 
                 # 0. Global Portfolio Dividends Tracker
                 if 'port_dividend_idx' not in locals():
                     port_dividend_idx = 0
-                    total_port_dividends_acc = 0.0
 
                 # 1. Update Cashflows & Holdings
                 while transaction_idx_p < len(transactions): 
@@ -635,10 +753,10 @@ def register_dashboard_routes(app):
                             curr_h['avg_cost'] = total_cost_h / new_qty_h
                         
                         curr_h['qty'] += qty
-                        current_port_cash_flows.append({"date": t_date, "amount": -val})
+                        port_flows_acc.add(t_date, -val)
                     else:
                         curr_h['qty'] -= qty
-                        current_port_cash_flows.append({"date": t_date, "amount": val})
+                        port_flows_acc.add(t_date, val)
                     
                     transaction_idx_p += 1
 
@@ -649,143 +767,150 @@ def register_dashboard_routes(app):
                     if d_date > cp:
                         break
                     
-                    amount = float(d['amount_eur'])
-                    total_port_dividends_acc += amount
-                    current_port_cash_flows.append({"date": d_date, "amount": amount})
+                    port_flows_acc.add(d_date, float(d['amount_eur']), is_dividend=True)
                     port_dividend_idx += 1
 
                 # 2. Calcolo Valore Portafoglio al CP
                 port_value_at_cp = 0
-                for isin, data in current_port_holdings_map.items():
-                    qty = data['qty']
-                    if qty <= 0.0001: continue
-                    
-                    # O(1) Lookup
-                    price = global_price_map.get(isin, {}).get(cp_str, 0)
-                    
-                    if price == 0 and data['avg_cost'] > 0:
-                         price = 0
+                if valuations is not None:
+                    # Somma dei valori di mercato persistiti delle posizioni aperte
+                    for isin in current_port_holdings_map:
+                        v = valuations.get(isin, {}).get(cp_str)
+                        if v:
+                            port_value_at_cp += v['market_value']
+                else:
+                    for isin, data in current_port_holdings_map.items():
+                        qty = data['qty']
+                        if qty <= 0.0001: continue
+                        
+                        # O(1) Lookup
+                        price = cp_prices[isin_rows[isin]][cp_idx]
+                        
+                        if price == 0 and data['avg_cost'] > 0:
+                             price = 0
 
-                    port_value_at_cp += (qty * price)
+                        port_value_at_cp += (qty * price)
                 
                 if port_value_at_cp > 0:
-                    calc_flows = current_port_cash_flows + [{"date": cp, "amount": port_value_at_cp}]
-                    
-                    start_d = current_port_cash_flows[0]['date'] if current_port_cash_flows else cp
-                    dur_days = (cp - start_d).days
-                    
-                    mwr_t1 = int(request.args.get('mwr_t1', 30))
-                    mwr_t2 = int(request.args.get('mwr_t2', 365))
+                    start_d = port_flows_acc.first_date or cp
+
+                    # [PERF] XIRR rinviato: risolto con xirr_batch su tutti i checkpoint.
+                    # Totali letti dall'accumulatore in O(1) invece di risommare la lista.
+                    port_flows_acc.checkpoint(cp, port_value_at_cp)
+                    port_pending.append({
+                        "date": cp_str,
+                        "n_flows": port_flows_acc.count + 1,
+                        "dur_days": (cp - start_d).days,
+                        "port_val": port_value_at_cp,
+                        "net_in": port_flows_acc.net_invested,
+                        "net_in_buy": port_flows_acc.total_buys,
+                        "divs_acc": port_flows_acc.total_dividends,
+                        # P&L Globale Storico: (Valore Corrente) + Sum(Vendite + Cedole - Acquisti)
+                        "pnl": port_value_at_cp + port_flows_acc.flow_sum
+                    })
+                else:
+                    diag_counts["SKIPPED"] += 1
 
-                    final_mwr = 0.0
-                    calculated = False
-                    
-                    # Parametro xirr_mode: 'standard' (default con fallback) o 'multi_guess' (prova multipli guess)
-                    xirr_mode = request.args.get('xirr_mode', 'standard')
+            # Parametro xirr_mode: 'standard' (default, vettoriale con fallback bracketed)
+            # o 'multi_guess' (alias storico, ora risolto dal solver bracketed a passata singola)
+            solve_method = 'bracketed' if xirr_mode in ('multi_guess', 'bracketed') else 'batch'
+            port_xirr_values = [
+                None if np.isnan(v) else float(v)
+                for v in port_flows_acc.solve_checkpoints(method=solve_method)
+            ]
 
-                    try:
-                        if xirr_mode == 'multi_guess':
-                            from finance import xirr_multi_guess
-                            val = xirr_multi_guess(calc_flows)
-                        else:
-                            val = xirr(calc_flows, guess=last_port_xirr)
-                        
-                        xirr_converged = val is not None and abs(val) <= 10.0  # < 1000%
-                        
-                        if xirr_converged:
-                            # XIRR convergita ragionevolmente → usa tiering normale
-                            last_port_xirr = max(-0.99, min(val, 10.0))
-                            final_mwr = val
-                            
-                            # Tier 1: Simple Return Override
-                            if dur_days < mwr_t1:
-                                net_in = sum(-f['amount'] for f in current_port_cash_flows)
-                                if net_in > 0:
-                                    final_mwr = (port_value_at_cp - net_in) / net_in
-                                else:
-                                    final_mwr = 0.0
-                                tier_name = "T1_SIMPLE"
-                                diag_counts["T1_SIMPLE"] += 1
-                            
-                            # Tier 2: Deannualize
-                            elif dur_days < mwr_t2:
-                                from finance import deannualize_xirr
-                                final_mwr = deannualize_xirr(val, dur_days)
-                                tier_name = "T2_DEANN"
-                                diag_counts["T2_DEANN"] += 1
-                            
-                            # Tier 3: Annualized XIRR (val unchanged)
-                            else:
-                                tier_name = "T3_ANNUAL"
-                                diag_counts["T3_ANNUAL"] += 1
-                            
-                            calculated = True
-                        else:
-                            # XIRR non convergita → Fallback a Simple Return
-                            # Usa il capitale netto investito (Buys + Sells + Dividendi)
-                            net_in = sum(-f['amount'] for f in current_port_cash_flows)
+            for point, val in zip(port_pending, port_xirr_values):
+                cp_str = point['date']
+                dur_days = point['dur_days']
+                port_value_at_cp = point['port_val']
+                net_in = point['net_in']
+
+                final_mwr = 0.0
+                calculated = False
+
+                try:
+                    xirr_converged = val is not None and abs(val) <= 10.0  # < 1000%
+
+                    if xirr_converged:
+                        # XIRR convergita ragionevolmente → usa tiering normale
+                        final_mwr = val
+
+                        # Tier 1: Simple Return Override
+                        if dur_days < mwr_t1:
                             if net_in > 0:
-                                simple_ret = (port_value_at_cp - net_in) / net_in
-                                
-                                # Se siamo in Tier 3, annualizziamo il Simple Return per coerenza con la card
-                                if dur_days >= mwr_t2:
-                                    from finance import annualize_simple_return
-                                    final_mwr = annualize_simple_return(simple_ret, dur_days)
-                                    tier_name = "FALLBACK_ANNUAL"
-                                else:
-                                    final_mwr = simple_ret
-                                    tier_name = "FALLBACK_SIMPLE"
+                                final_mwr = (port_value_at_cp - net_in) / net_in
                             else:
                                 final_mwr = 0.0
+                            tier_name = "T1_SIMPLE"
+                            diag_counts["T1_SIMPLE"] += 1
+
+                        # Tier 2: Deannualize
+                        elif dur_days < mwr_t2:
+                            final_mwr = deannualize_xirr(val, dur_days)
+                            tier_name = "T2_DEANN"
+                            diag_counts["T2_DEANN"] += 1
+
+                        # Tier 3: Annualized XIRR (val unchanged)
+                        else:
+                            tier_name = "T3_ANNUAL"
+                            diag_counts["T3_ANNUAL"] += 1
+
+                        calculated = True
+                    else:
+                        # XIRR non convergita → Fallback a Simple Return
+                        # Usa il capitale netto investito (Buys + Sells + Dividendi)
+                        if net_in > 0:
+                            simple_ret = (port_value_at_cp - net_in) / net_in
+
+                            # Se siamo in Tier 3, annualizziamo il Simple Return per coerenza con la card
+                            if dur_days >= mwr_t2:
+                                final_mwr = annualize_simple_return(simple_ret, dur_days)
+                                tier_name = "FALLBACK_ANNUAL"
+                            else:
+                                final_mwr = simple_ret
                                 tier_name = "FALLBACK_SIMPLE"
-                            
-                            diag_counts["FALLBACK"] = diag_counts.get("FALLBACK", 0) + 1
-                            calculated = True
-                        
-                        # --- LOGGING DIAGNOSTICO ---
-                        if calculated:
-                            is_extreme = abs(final_mwr) > 1.0
-                            if is_extreme:
-                                diag_counts["EXTREME"] += 1
-                            
-                            diag_net_in_buy = sum(-f['amount'] for f in current_port_cash_flows if f['amount'] < 0)
-                            diag_net_in_all = sum(-f['amount'] for f in current_port_cash_flows)
-                            diag_divs = total_port_dividends_acc
-                            
-                            xirr_raw_str = f"{val:.6f} ({val*100:.2f}%)" if val is not None else "None"
-                            log_level = logger.warning if (is_extreme or not xirr_converged) else logger.info
-                            log_level(
-                                f"[MWR_DIAG] {'⚠️EXTREME' if is_extreme else 'OK'} "
-                                f"date={cp_str} | tier={tier_name} | mode={xirr_mode} | dur={dur_days}d | "
-                                f"xirr_raw={xirr_raw_str} | converged={xirr_converged} | "
-                                f"final_mwr={final_mwr:.6f} ({final_mwr*100:.2f}%) | "
-                                f"flows={len(calc_flows)} | "
-                                f"port_val={port_value_at_cp:.2f} | "
-                                f"net_in_buy={diag_net_in_buy:.2f} | "
-                                f"net_in_all={diag_net_in_all:.2f} | "
-                                f"divs_acc={diag_divs:.2f}"
-                            )
-                        
-                    except Exception as e:
-                        diag_counts["XIRR_EXC"] += 1
-                        logger.warning(f"[MWR_DIAG] XIRR_EXCEPTION at {cp_str} | dur={dur_days}d | mode={xirr_mode} | error={e}")
-                        pass
-                    
-                    if calculated:
-                        # Clamp ragionevole: ±500%
-                        final_mwr = max(-5.0, min(final_mwr, 5.0))
-                        
-                        # Calcolo P&L Globale Storico: (Valore Corrente) + Sum(Vendite + Cedole - Acquisti)
-                        port_pnl_at_cp = port_value_at_cp + sum(f['amount'] for f in current_port_cash_flows)
+                        else:
+                            final_mwr = 0.0
+                            tier_name = "FALLBACK_SIMPLE"
 
-                        portfolio_series.append({
-                            "date": cp_str,
-                            "value": round(final_mwr * 100, 2),
-                            "market_value": round(port_value_at_cp, 2),
-                            "pnl": round(port_pnl_at_cp, 2)
-                        })
-                else:
-                    diag_counts["SKIPPED"] += 1
+                        diag_counts["FALLBACK"] = diag_counts.get("FALLBACK", 0) + 1
+                        calculated = True
+
+                    # --- LOGGING DIAGNOSTICO ---
+                    if calculated:
+                        is_extreme = abs(final_mwr) > 1.0
+                        if is_extreme:
+                            diag_counts["EXTREME"] += 1
+
+                        xirr_raw_str = f"{val:.6f} ({val*100:.2f}%)" if val is not None else "None"
+                        log_level = logger.warning if (is_extreme or not xirr_converged) else logger.info
+                        log_level(
+                            f"[MWR_DIAG] {'⚠️EXTREME' if is_extreme else 'OK'} "
+                            f"date={cp_str} | tier={tier_name} | mode={xirr_mode} | dur={dur_days}d | "
+                            f"xirr_raw={xirr_raw_str} | converged={xirr_converged} | "
+                            f"final_mwr={final_mwr:.6f} ({final_mwr*100:.2f}%) | "
+                            f"flows={point['n_flows']} | "
+                            f"port_val={port_value_at_cp:.2f} | "
+                            f"net_in_buy={point['net_in_buy']:.2f} | "
+                            f"net_in_all={net_in:.2f} | "
+                            f"divs_acc={point['divs_acc']:.2f}"
+                        )
+
+                except Exception as e:
+                    diag_counts["XIRR_EXC"] += 1
+                    logger.warning(f"[MWR_DIAG] XIRR_EXCEPTION at {cp_str} | dur={dur_days}d | mode={xirr_mode} | error={e}")
+                    pass
+
+                if calculated:
+                    # Clamp ragionevole: ±500%
+                    final_mwr = max(-5.0, min(final_mwr, 5.0))
+
+                    portfolio_series.append({
+                        "date": cp_str,
+                        "value": round(final_mwr * 100, 2),
+                        "market_value": round(port_value_at_cp, 2),
+                        "pnl": round(point['pnl'], 2)
+                    })
             
             # --- RIEPILOGO DIAGNOSTICO ---
             fallback_count = diag_counts.get("FALLBACK", 0)
@@ -1,7 +1,9 @@
 import logging
+import numpy as np
 import pandas as pd
 from datetime import datetime, timedelta
-from db_helper import execute_request, delete_table
+from db_helper import execute_request, delete_table, fetch_all
+from price_manager import PriceMatrix
 
 logger = logging.getLogger("perix_monitor")
 
@@ -20,9 +22,9 @@ def compact_prices(isin=None, dry_run=True):
         dry_run (bool): Se True, non cancella nulla ma logga cosa farebbe.
     
     Returns:
-        dict: Statistiche { 'total_rows': N, 'deleted_rows': M, 'details': [...] }
+        dict: Statistiche { 'total_rows': N, 'deleted_rows': M, 'max_locf_error_pct': E, 'details': [...] }
     """
-    stats = {'total_rows': 0, 'deleted_rows': 0, 'details': []}
+    stats = {'total_rows': 0, 'deleted_rows': 0, 'max_locf_error_pct': 0.0, 'details': []}
     
     # 1. Identifica gli ISIN da processare
     isins_to_process = []
@@ -44,49 +46,26 @@ def compact_prices(isin=None, dry_run=True):
     for current_isin in isins_to_process:
         try:
             # 2. Fetch Dati
-            # Prezzi (> 10k rows might need pagination, but max limit usually 1000. Set explicit high limit)
-            res_p = execute_request('asset_prices', 'GET', params={
+            # Prezzi: lettura paginata completa (una GET singola tronca al max-rows del server)
+            prices_data = []
+            for page in fetch_all('asset_prices', params={
                 'select': 'id,date,price',
-                'isin': f'eq.{current_isin}',
-                'order': 'date.asc',
-                'limit': '10000' 
-            })
-            if not res_p or res_p.status_code != 200:
-                continue
-                
-            prices_data = res_p.json()
+                'isin': f'eq.{current_isin}'
+            }, keyset=('date', 'id')):
+                prices_data.extend(page)
             if not prices_data:
                 continue
 
             # Eventi protetti (Transazioni / Dividendi -> Date da NON cancellare)
-            res_t = execute_request('transactions', 'GET', params={
-                'select': 'date',
-                'assets.isin': f'eq.{current_isin}',
-                'assets': 'not.is.null' # hint for join
-            }) # Note: Join syntax depends on setup, simplified:
-            # Actually easier: fetch transactions by asset_id? No we have ISIN.
-            # Let's filter by ISIN if possible or assume we need asset_id linkage.
-            # Workaround: Fetch asset_id first or use inner join syntax:
-            res_t = execute_request('transactions', 'GET', params={
-                'select': 'date,assets!inner(isin)',
-                'assets.isin': f'eq.{current_isin}'
-            })
-            
-            res_d = execute_request('dividends', 'GET', params={
-                'select': 'date,assets!inner(isin)',
-                'assets.isin': f'eq.{current_isin}'
-            })
-
             protected_dates = set()
-            if res_t and res_t.status_code == 200:
-                for t in res_t.json():
-                    d_str = t.get('date', '')[:10]
-                    if d_str: protected_dates.add(d_str)
-            
-            if res_d and res_d.status_code == 200:
-                for d in res_d.json():
-                    d_str = d.get('date', '')[:10]
-                    if d_str: protected_dates.add(d_str)
+            for table in ('transactions', 'dividends'):
+                for page in fetch_all(table, params={
+                    'select': 'date,assets!inner(isin)',
+                    'assets.isin': f'eq.{current_isin}'
+                }, keyset=('date', 'id')):
+                    for row in page:
+                        d_str = row.get('date', '')[:10]
+                        if d_str: protected_dates.add(d_str)
 
             # 3. Elaborazione Pandas
             df = pd.DataFrame(prices_data)
@@ -164,10 +143,21 @@ def compact_prices(isin=None, dry_run=True):
             rows_to_delete = df[~df['keep']]
             ids_to_delete = rows_to_delete['id'].tolist()
             count = len(ids_to_delete)
+
+            # 5. Verifica LOCF: scarto massimo tra la serie giornaliera ricostruita dai soli
+            # punti mantenuti e quella originale (stesse PriceMatrix usate da grafici e report)
+            last_day = df['date'].iloc[-1]
+            full_series = PriceMatrix.from_observations([current_isin] * total, df['date'], df['price'], end=last_day).values[0]
+            kept = df[df['keep']]
+            kept_series = PriceMatrix.from_observations([current_isin] * len(kept), kept['date'], kept['price'],
+                                                        start=df['date'].iloc[0], end=last_day).values[0]
+            priced = full_series > 0
+            max_err_pct = float(np.max(np.abs(kept_series[priced] - full_series[priced]) / full_series[priced]) * 100) if priced.any() else 0.0
             
             stats['total_rows'] += total
             stats['deleted_rows'] += count
-            stats['details'].append(f"{current_isin}: {total} -> {total-count} (Removed {count})")
+            stats['max_locf_error_pct'] = max(stats['max_locf_error_pct'], round(max_err_pct, 3))
+            stats['details'].append(f"{current_isin}: {total} -> {total-count} (Removed {count}, max LOCF err {max_err_pct:.2f}%)")
             
             if count > 0 and not dry_run:
                 # Batch delete (chunks of 100 to be safe with URL length?)
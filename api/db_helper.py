@@ -12,22 +12,103 @@ Works for both:
 import os
 import requests
 import json
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 from urllib3.util.retry import Retry
 from requests.adapters import HTTPAdapter
 try:
     from api.logger import logger
+    from api import pg_backend
 except ImportError:
     from logger import logger
+    import pg_backend
+
+# --- Backend ---
+# 'rest' (default): PostgREST via HTTP. 'postgres': connessione diretta a
+# DATABASE_URL (richiede psycopg2) per le query traducibili, con ricaduta
+# automatica su PostgREST per la sintassi non supportata (vedi pg_backend.py).
+DB_BACKEND = os.environ.get("DB_BACKEND", "rest").lower()
+
+def use_pg_backend() -> bool:
+    return DB_BACKEND == "postgres" and pg_backend.is_available()
+
+# --- Connection Pool ---
+# Sessione HTTP persistente (keep-alive) con retry automatico su errori transient.
+# Dimensioni del pool configurabili: pool_maxsize deve coprire i thread che fanno
+# richieste in parallelo (worker WSGI + fan-out), altrimenti urllib3 scarta le
+# connessioni in eccesso e ne riapre di nuove (nuovo handshake TLS).
+POOL_CONNECTIONS = int(os.environ.get("DB_POOL_CONNECTIONS", 10))   # Host distinti in cache
+POOL_MAXSIZE = int(os.environ.get("DB_POOL_MAXSIZE", 20))           # Connessioni riusabili per host
+# Con un server WSGI a thread fissi (gunicorn gthread, waitress) si può usare una
+# sessione (e un pool) per thread, evitando la contesa sul pool condiviso
+SESSION_PER_THREAD = os.environ.get("DB_SESSION_PER_THREAD", "false").lower() in ("1", "true", "yes")
 
-# Sessione HTTP persistente con retry automatico su errori transient
-_session = requests.Session()
 _retry = Retry(
     total=3,
     backoff_factor=0.3,
     status_forcelist=[429, 500, 502, 503, 504]
 )
-_session.mount("http://", HTTPAdapter(max_retries=_retry))
-_session.mount("https://", HTTPAdapter(max_retries=_retry))
+_sessions_lock = threading.Lock()
+_all_sessions = weakref.WeakSet()  # Per le statistiche; le sessioni dei thread terminati escono da sole
+_thread_local = threading.local()
+
+def _build_session() -> requests.Session:
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE, max_retries=_retry)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    # Risposte compresse: i payload JSON di PostgREST si riducono di 5-10x
+    session.headers.update({"Accept-Encoding": "gzip, deflate", "Connection": "keep-alive"})
+    with _sessions_lock:
+        _all_sessions.add(session)
+    return session
+
+_session = _build_session()
+
+def get_session() -> requests.Session:
+    """
+    Returns the pooled HTTP session to use for every outgoing request
+    (PostgREST, GoTrue admin API, ...). Shared by default, per-thread if
+    DB_SESSION_PER_THREAD is enabled.
+    """
+    if not SESSION_PER_THREAD:
+        return _session
+    session = getattr(_thread_local, 'session', None)
+    if session is None:
+        session = _build_session()
+        _thread_local.session = session
+    return session
+
+def get_pool_stats() -> dict:
+    """Connection pool utilisation per host, summed over all sessions."""
+    hosts = {}
+    with _sessions_lock:
+        sessions = list(_all_sessions)
+    adapters = {id(a): a for s in sessions for a in s.adapters.values()}
+    for adapter in adapters.values():
+        manager = adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            h = hosts.setdefault(f"{pool.scheme}://{pool.host}:{pool.port}", {
+                "pools": 0, "connections_opened": 0, "requests": 0, "idle_connections": 0, "maxsize": 0
+            })
+            h["pools"] += 1
+            h["connections_opened"] += pool.num_connections
+            h["requests"] += pool.num_requests
+            # La coda di urllib3 è pre-riempita con None: contano solo le connessioni reali
+            h["idle_connections"] += sum(1 for c in list(pool.pool.queue) if c is not None) if pool.pool is not None else 0
+            h["maxsize"] += pool.pool.maxsize if pool.pool is not None else 0
+    return {
+        "pool_connections": POOL_CONNECTIONS,
+        "pool_maxsize": POOL_MAXSIZE,
+        "session_per_thread": SESSION_PER_THREAD,
+        "sessions": len(sessions),
+        "hosts": hosts
+    }
 
 def get_supabase_credentials():
     """Returns (url, service_key) tuple."""
@@ -52,7 +133,7 @@ def get_config(key: str, default=None):
             "Content-Type": "application/json"
         }
         
-        response = _session.get(
+        response = get_session().get(
             f"{rest_url}?key=eq.{key}&select=value",
             headers=headers,
             timeout=10
@@ -88,7 +169,7 @@ def set_config(key: str, value: dict) -> bool:
             "Prefer": "resolution=merge-duplicates,return=representation"
         }
         
-        response = _session.post(
+        response = get_session().post(
             rest_url,
             headers=headers,
             json={"key": key, "value": value},
@@ -111,6 +192,18 @@ def query_table(table: str, select: str = "*", filters: dict = None) -> list:
     filters: dict of {column: value} for eq filters
     Returns list of results or empty list on error.
     """
+    if use_pg_backend():
+        params = {'select': select}
+        params.update({col: f"eq.{val}" for col, val in (filters or {}).items()})
+        try:
+            response = pg_backend.execute_request(table, 'GET', params=params)
+            if response.status_code == 200:
+                return response.json()
+            logger.error(f"DB_HELPER query_table error: {response.text}")
+            return []
+        except pg_backend.UnsupportedQuery:
+            pass
+
     url, service_key = get_supabase_credentials()
     if not url or not service_key:
         return []
@@ -129,7 +222,7 @@ def query_table(table: str, select: str = "*", filters: dict = None) -> list:
             for col, val in filters.items():
                 params += f"&{col}=eq.{val}"
         
-        response = _session.get(
+        response = get_session().get(
             f"{rest_url}{params}",
             headers=headers,
             timeout=10
@@ -150,6 +243,17 @@ def upsert_table(table: str, data: dict, on_conflict: str = None) -> bool:
     Generic upsert function for any table.
     Returns True on success, False on failure.
     """
+    if use_pg_backend():
+        try:
+            response = pg_backend.execute_request(table, 'POST', params={'on_conflict': on_conflict} if on_conflict else None,
+                                                  body=data, headers={"Prefer": "resolution=merge-duplicates"})
+            if response.status_code in [200, 201]:
+                return True
+            logger.error(f"DB_HELPER upsert_table error: {response.text}")
+            return False
+        except pg_backend.UnsupportedQuery:
+            pass
+
     url, service_key = get_supabase_credentials()
     if not url or not service_key:
         return False
@@ -168,7 +272,7 @@ def upsert_table(table: str, data: dict, on_conflict: str = None) -> bool:
             "Prefer": prefer
         }
         
-        response = _session.post(
+        response = get_session().post(
             rest_url,
             headers=headers,
             json=data,
@@ -197,8 +301,15 @@ def execute_request(endpoint: str, method: str = 'GET', params: dict = None, bod
         headers: Additional headers (merged with auth headers)
         
     Returns:
-        requests.Response object or None on auth failure
+        requests.Response object (pg_backend.PgResponse with DB_BACKEND=postgres)
+        or None on auth failure
     """
+    if use_pg_backend():
+        try:
+            return pg_backend.execute_request(endpoint, method, params=params, body=body, headers=headers)
+        except pg_backend.UnsupportedQuery:
+            pass  # Sintassi PostgREST non traducibile: passa dall'API REST
+
     url, service_key = get_supabase_credentials()
     if not url or not service_key:
         logger.error("DB_HELPER: Missing credentials for execute_request")
@@ -216,7 +327,7 @@ def execute_request(endpoint: str, method: str = 'GET', params: dict = None, bod
         if headers:
             req_headers.update(headers)
             
-        return _session.request(
+        return get_session().request(
             method=method,
             url=full_url,
             params=params,
@@ -228,6 +339,311 @@ def execute_request(endpoint: str, method: str = 'GET', params: dict = None, bod
         logger.error(f"DB_HELPER execute_request error [{method} {endpoint}]: {e}")
         return None
 
+DEFAULT_PAGE_SIZE = 1000  # Allineato al max-rows di default di PostgREST/Supabase
+
+def _keyset_filter(keyset, last_row):
+    """
+    Builds the PostgREST 'or' filter for (c1, c2, ...) > (v1, v2, ...):
+    (c1.gt.v1,and(c1.eq.v1,c2.gt.v2),...)
+    """
+    clauses = []
+    for i, col in enumerate(keyset):
+        parts = [f"{c}.eq.{last_row[c]}" for c in keyset[:i]] + [f"{col}.gt.{last_row[col]}"]
+        clauses.append(parts[0] if len(parts) == 1 else f"and({','.join(parts)})")
+    return f"({','.join(clauses)})"
+
+def fetch_all(table: str, params: dict = None, page_size: int = DEFAULT_PAGE_SIZE, keyset: tuple = None, prefetch: bool = False):
+    """
+    Generator that reads a whole PostgREST result set page by page.
+
+    A single GET silently stops at the server max-rows limit; this keeps
+    requesting pages until a short page arrives and yields each page (list of rows).
+    With DB_BACKEND=postgres the pages are streamed from a server-side cursor instead.
+
+    Args:
+        table: Table/view name.
+        params: Query parameters (select, filters, order) as for execute_request.
+        page_size: Rows per request (should not exceed the server max-rows).
+        keyset: Optional unique ordered columns, e.g. ('date', 'id'). Uses keyset
+                pagination (stable under concurrent inserts, no deep OFFSET scans)
+                instead of Range headers. Overrides 'order'; not combinable with an 'or' filter.
+        prefetch: If True, the next page is requested in a background thread while
+                  the caller processes the current one.
+
+    Raises:
+        RuntimeError: if a page request fails (results would be incomplete).
+    """
+    base_params = dict(params or {})
+    if keyset:
+        base_params['order'] = ','.join(f"{c}.asc" for c in keyset)
+        select = base_params.get('select')
+        selected = [c.strip() for c in select.split(',')] if select else ['*']
+        if '*' not in selected:
+            missing = [c for c in keyset if c not in selected]
+            if missing:
+                base_params['select'] = ','.join([select] + missing)
+
+    if use_pg_backend():
+        # Cursore lato server: una sola query, le pagine arrivano in streaming
+        stream = pg_backend.stream_query(table, base_params, page_size=page_size)
+        try:
+            first = next(stream, None)
+        except pg_backend.UnsupportedQuery:
+            stream = None
+        if stream is not None:
+            if first:
+                yield first
+                yield from stream
+            return
+
+    def fetch_page(offset, last_row):
+        page_params = dict(base_params)
+        headers = None
+        if keyset:
+            page_params['limit'] = page_size
+            if last_row is not None:
+                page_params['or'] = _keyset_filter(keyset, last_row)
+        else:
+            headers = {"Range-Unit": "items", "Range": f"{offset}-{offset + page_size - 1}"}
+
+        resp = execute_request(table, 'GET', params=page_params, headers=headers)
+        if resp is None or resp.status_code not in [200, 206]:
+            status = resp.status_code if resp is not None else 'no response'
+            logger.error(f"DB_HELPER fetch_all error for '{table}' at offset {offset}: {status}")
+            raise RuntimeError(f"fetch_all failed for '{table}' ({status})")
+        return resp.json()
+
+    if not prefetch:
+        offset, last_row = 0, None
+        while True:
+            page = fetch_page(offset, last_row)
+            if page:
+                yield page
+            if len(page) < page_size:
+                return
+            offset += len(page)
+            last_row = page[-1]
+
+    # Prefetch: un worker dedicato richiede la pagina successiva in parallelo
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        future = executor.submit(fetch_page, 0, None)
+        offset = 0
+        while True:
+            page = future.result()
+            if len(page) < page_size:
+                if page:
+                    yield page
+                return
+            offset += len(page)
+            future = executor.submit(fetch_page, offset, page[-1])
+            yield page
+
+# Pool limitato per eseguire in parallelo query indipendenti (fan-out), usa il pool HTTP di get_session()
+FANOUT_WORKERS = int(os.environ.get("DB_FANOUT_WORKERS", 8))
+_fanout_executor = None
+_fanout_lock = threading.Lock()
+_fanout_local = threading.local()
+
+def _get_fanout_executor():
+    global _fanout_executor
+    with _fanout_lock:
+        if _fanout_executor is None:
+            _fanout_executor = ThreadPoolExecutor(max_workers=FANOUT_WORKERS, thread_name_prefix="db_fanout")
+        return _fanout_executor
+
+def _run_fanout_item(item):
+    _fanout_local.active = True
+    try:
+        if callable(item):
+            return item()
+        return execute_request(**item)
+    finally:
+        _fanout_local.active = False
+
+def execute_batch(queries: list) -> list:
+    """
+    Runs independent queries concurrently on a bounded thread pool and returns
+    the results in the same order as the input.
+
+    Each query is either a dict of execute_request keyword arguments
+    (e.g. {'endpoint': 'dividends', 'params': {...}}) -> requests.Response or None,
+    or a zero-argument callable (e.g. a fetch_all based reader) -> its return value.
+    Exceptions raised by a callable are re-raised to the caller, as if run sequentially.
+
+    Request latency becomes that of the slowest query instead of the sum.
+    Nested calls from inside a pool worker run sequentially to avoid pool starvation.
+    """
+    if len(queries) <= 1 or getattr(_fanout_local, 'active', False):
+        return [item() if callable(item) else execute_request(**item) for item in queries]
+
+    executor = _get_fanout_executor()
+    futures = [executor.submit(_run_fanout_item, item) for item in queries]
+    return [f.result() for f in futures]
+
+# --- Scrittura bulk ---
+# Le scritture grandi (/api/sync, ricostruzioni storiche) vengono spezzate in chunk
+# per numero di righe e dimensione del JSON, inviati in parallelo sul pool HTTP
+# condiviso con concorrenza limitata e ritentati singolarmente se falliscono.
+BULK_CHUNK_ROWS = int(os.environ.get("DB_BULK_CHUNK_ROWS", 500))
+BULK_MAX_BYTES = int(os.environ.get("DB_BULK_MAX_BYTES", 1_000_000))   # Sotto il limite di body di PostgREST/proxy
+BULK_WORKERS = int(os.environ.get("DB_BULK_WORKERS", 4))
+BULK_RETRIES = int(os.environ.get("DB_BULK_RETRIES", 2))
+BULK_BACKOFF = float(os.environ.get("DB_BULK_BACKOFF", 0.5))           # Secondi, raddoppia a ogni tentativo
+BULK_TIMEOUT = int(os.environ.get("DB_BULK_TIMEOUT", 30))
+_BULK_RETRY_STATUSES = {408, 429, 500, 502, 503, 504}
+_bulk_executor = None
+
+def _get_bulk_executor():
+    global _bulk_executor
+    with _fanout_lock:
+        if _bulk_executor is None:
+            _bulk_executor = ThreadPoolExecutor(max_workers=BULK_WORKERS, thread_name_prefix="db_bulk")
+        return _bulk_executor
+
+def _chunk_rows(rows: list, chunk_size: int, max_bytes: int) -> list:
+    """Splits rows into chunks of at most chunk_size rows and (about) max_bytes of JSON."""
+    chunks, current, current_bytes = [], [], 0
+    for row in rows:
+        row_bytes = len(json.dumps(row, default=str)) + 1
+        if current and (len(current) >= chunk_size or current_bytes + row_bytes > max_bytes):
+            chunks.append(current)
+            current, current_bytes = [], 0
+        current.append(row)
+        current_bytes += row_bytes
+    if current:
+        chunks.append(current)
+    return chunks
+
+def _dedup_on_conflict(rows: list, on_conflict: str) -> list:
+    """
+    Keeps only the last row for each conflict key: Postgres rejects an upsert that
+    touches the same row twice, and across parallel chunks the winner would be random.
+    """
+    cols = [c.strip() for c in on_conflict.split(',') if c.strip()]
+    if not cols or any(not all(c in row for c in cols) for row in rows):
+        return rows
+    latest = {}
+    for row in rows:
+        latest[tuple(row[c] for c in cols)] = row
+    return list(latest.values())
+
+def _write_chunk(table: str, chunk: list, on_conflict: str = None):
+    """Single upsert POST for one chunk. Returns (status_code, error_text); status 0 = no response."""
+    params = {'on_conflict': on_conflict} if on_conflict else None
+    headers = {"Prefer": "resolution=merge-duplicates,return=minimal"}
+    if use_pg_backend():
+        try:
+            response = pg_backend.execute_request(table, 'POST', params=params, body=chunk, headers=headers)
+            return response.status_code, (None if response.status_code in [200, 201, 204] else response.text)
+        except pg_backend.UnsupportedQuery:
+            pass
+
+    url, service_key = get_supabase_credentials()
+    if not url or not service_key:
+        return 0, "Missing credentials"
+    headers.update({
+        "apikey": service_key,
+        "Authorization": f"Bearer {service_key}",
+        "Content-Type": "application/json"
+    })
+    response = get_session().post(f"{url}/rest/v1/{table}", params=params, headers=headers,
+                                  json=chunk, timeout=BULK_TIMEOUT)
+    return response.status_code, (None if response.status_code in [200, 201, 204] else response.text)
+
+def _write_chunk_with_retry(table: str, index: int, chunk: list, on_conflict: str, retries: int) -> dict:
+    result = {'chunk': index, 'rows': len(chunk), 'ok': False, 'status': None, 'attempts': 0, 'error': None}
+    for attempt in range(retries + 1):
+        result['attempts'] = attempt + 1
+        retryable = False
+        try:
+            status, error = _write_chunk(table, chunk, on_conflict)
+            result.update(status=status, error=error, ok=error is None)
+            # Un 5xx del gateway può arrivare dopo il commit: senza chiave di conflitto
+            # ritentare duplicherebbe le righe
+            retryable = bool(on_conflict) and status in _BULK_RETRY_STATUSES
+        except requests.exceptions.ConnectionError as e:
+            # Connessione non riuscita: nessuna scrittura avvenuta, si può ritentare
+            result.update(status=None, error=str(e))
+            retryable = True
+        except requests.exceptions.Timeout as e:
+            # Timeout in lettura: il chunk potrebbe essere stato scritto, si ritenta solo se l'upsert è idempotente
+            result.update(status=None, error=str(e))
+            retryable = bool(on_conflict)
+        except Exception as e:
+            result.update(status=None, error=str(e))
+        if result['ok'] or not retryable or attempt == retries:
+            break
+        delay = BULK_BACKOFF * (2 ** attempt)
+        logger.warning(f"DB_HELPER bulk_upsert '{table}' chunk {index}: {result['error'] or result['status']}, retry {attempt + 1}/{retries} in {delay:.1f}s")
+        time.sleep(delay)
+    if not result['ok']:
+        logger.error(f"DB_HELPER bulk_upsert '{table}' chunk {index} ({len(chunk)} rows) failed: HTTP {result['status']} - {result['error']}")
+    return result
+
+def bulk_upsert(table: str, rows: list, on_conflict: str = None, chunk_size: int = None,
+                max_bytes: int = None, workers: int = None, retries: int = None,
+                atomic: bool = False) -> list:
+    """
+    Upserts many rows in chunks, pipelined over the pooled HTTP session.
+
+    Rows are split by count (chunk_size) and serialized size (max_bytes); the
+    chunks are written concurrently (at most `workers` in flight, bounded by
+    the BULK_WORKERS pool) and each failed chunk is retried with backoff on connection
+    errors and, for idempotent upserts (on_conflict), on transient HTTP statuses
+    and read timeouts. With on_conflict, rows sharing the same conflict key are
+    collapsed first (last one wins).
+
+    atomic=True sends every row in a single request (one statement, all or nothing),
+    for plain inserts that cannot be safely replayed or partially applied.
+
+    Returns:
+        list: one dict per chunk, in input order:
+              {'chunk', 'rows', 'ok', 'status', 'attempts', 'error'}.
+              An empty list when there is nothing to write.
+    """
+    if isinstance(rows, dict):
+        rows = [rows]
+    if not rows:
+        return []
+    if on_conflict:
+        rows = _dedup_on_conflict(rows, on_conflict)
+    retries = BULK_RETRIES if retries is None else retries
+    if atomic:
+        chunks = [rows]
+    else:
+        chunks = _chunk_rows(rows, chunk_size or BULK_CHUNK_ROWS, max_bytes or BULK_MAX_BYTES)
+
+    t0 = time.time()
+    if len(chunks) == 1:
+        results = [_write_chunk_with_retry(table, 0, chunks[0], on_conflict, retries)]
+    else:
+        # Finestra scorrevole: al massimo `workers` chunk in volo, il successivo parte appena uno termina
+        window = max(1, workers or BULK_WORKERS)
+        executor = _get_bulk_executor()
+        results = [None] * len(chunks)
+        in_flight = {}
+        for i, chunk in enumerate(chunks):
+            if len(in_flight) >= window:
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for f in done:
+                    results[in_flight.pop(f)] = f.result()
+            in_flight[executor.submit(_write_chunk_with_retry, table, i, chunk, on_conflict, retries)] = i
+        for f, i in in_flight.items():
+            results[i] = f.result()
+
+    failed = sum(1 for r in results if not r['ok'])
+    logger.info(f"DB_HELPER bulk_upsert '{table}': {len(rows)} rows in {len(chunks)} chunks "
+                f"({failed} failed) in {time.time() - t0:.2f}s")
+    return results
+
+def bulk_failed_rows(results: list) -> int:
+    """Number of rows in the failed chunks of a bulk_upsert result."""
+    return sum(r['rows'] for r in results if not r['ok'])
+
+def fetch_all_rows(table: str, params: dict = None, page_size: int = DEFAULT_PAGE_SIZE, keyset: tuple = None) -> list:
+    """Convenience wrapper: complete result set of fetch_all as a single list."""
+    return [row for page in fetch_all(table, params=params, page_size=page_size, keyset=keyset) for row in page]
+
 def update_table(table: str, data: dict, filters: dict) -> bool:
     """
     Generic update function.
@@ -70,6 +70,9 @@ def xirr_multi_guess(transactions, guesses=None):
     Newton-Raphson può convergere a soluzioni diverse a seconda del guess iniziale.
     Questa funzione prova più punti di partenza e seleziona quello col NPV residuo minore.
     
+    NOTA: mantenuta per compatibilità e per confronto (vedi tests/benchmark_xirr.py);
+    xirr_mode='multi_guess' usa ora xirr_bracketed, che converge in un'unica passata.
+    
     Returns:
         float or None: XIRR convergente migliore, o None se nessun guess converge.
     """
@@ -107,6 +110,404 @@ def xirr_multi_guess(transactions, guesses=None):
     
     return best_rate
 
+# Griglia di tassi usata per cercare un intervallo con cambio di segno dell'NPV
+# (fallback bracketed per le righe in cui Newton non converge).
+XIRR_BRACKET_GRID = np.array([
+    -0.99, -0.9, -0.75, -0.5, -0.25, -0.1, 0.0, 0.05, 0.1,
+    0.2, 0.35, 0.5, 0.75, 1.0, 2.0, 3.5, 5.0, 7.5, 10.0
+])
+
+def pack_cash_flows(series):
+    """
+    Impacchetta più serie di cash flow (liste di dict 'date'/'amount', come per xirr)
+    in matrici NumPy allineate, pronte per xirr_batch.
+
+    Le righe più corte vengono riempite con amount=NaN e date=NaT (padding).
+
+    Returns:
+        (flows_matrix, dates_matrix): float64 e datetime64[s], shape (n_serie, max_flussi).
+    """
+    n_rows = len(series)
+    width = max((len(s) for s in series), default=0)
+
+    flows = np.full((n_rows, width), np.nan)
+    dates = np.full((n_rows, width), np.datetime64('NaT'), dtype='datetime64[s]')
+
+    for i, s in enumerate(series):
+        if not s:
+            continue
+        flows[i, :len(s)] = [f['amount'] for f in s]
+        dates[i, :len(s)] = [f['date'] for f in s]
+
+    return flows, dates
+
+def _npv_and_derivative(rates, amounts, years):
+    """NPV e derivata rispetto al tasso, calcolati riga per riga (vettoriale)."""
+    discount = np.exp(-years * np.log1p(rates)[:, None])
+    npv = np.sum(amounts * discount, axis=1)
+    deriv = -np.sum(amounts * years * discount, axis=1) / (1 + rates)
+    return npv, deriv
+
+def _bracketed_bisection(amounts, years, guesses, tol=1e-6, max_iter=100):
+    """
+    Fallback vettoriale: per ogni riga cerca sulla XIRR_BRACKET_GRID l'intervallo
+    con cambio di segno dell'NPV più vicino al guess e lo restringe per bisezione.
+    Le righe senza cambio di segno restituiscono NaN.
+    """
+    n_rows = amounts.shape[0]
+    grid = XIRR_BRACKET_GRID
+
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        # NPV su tutta la griglia: shape (righe, punti griglia)
+        npv_grid = np.stack(
+            [_npv_and_derivative(np.full(n_rows, g), amounts, years)[0] for g in grid],
+            axis=1
+        )
+
+    sign_change = (npv_grid[:, :-1] * npv_grid[:, 1:] <= 0) & \
+        np.isfinite(npv_grid[:, :-1]) & np.isfinite(npv_grid[:, 1:])
+    has_bracket = sign_change.any(axis=1)
+
+    result = np.full(n_rows, np.nan)
+    if not has_bracket.any():
+        return result
+
+    # Tra gli intervalli validi scegli quello col punto medio più vicino al guess
+    mids = (grid[:-1] + grid[1:]) / 2.0
+    distance = np.where(sign_change, np.abs(mids[None, :] - guesses[:, None]), np.inf)
+    idx = np.argmin(distance, axis=1)
+
+    rows = np.nonzero(has_bracket)[0]
+    lo = grid[idx[rows]].astype(float)
+    hi = grid[idx[rows] + 1].astype(float)
+    f_lo = npv_grid[rows, idx[rows]]
+    a, y = amounts[rows], years[rows]
+
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for _ in range(max_iter):
+            mid = (lo + hi) / 2.0
+            f_mid = _npv_and_derivative(mid, a, y)[0]
+            left = f_lo * f_mid <= 0
+            hi = np.where(left, mid, hi)
+            lo = np.where(left, lo, mid)
+            f_lo = np.where(left, f_lo, f_mid)
+            if np.all(hi - lo < tol):
+                break
+
+    result[rows] = (lo + hi) / 2.0
+    return result
+
+def xirr_batch(flows_matrix, dates_matrix, guesses=None, max_iter=100, tol=1e-6):
+    """
+    Calcola XIRR per molte serie di cash flow in un'unica passata vettoriale.
+
+    Ogni riga è un problema indipendente (es. un checkpoint dello storico MWR).
+    Newton-Raphson viene eseguito in parallelo su tutte le righe; le righe che non
+    convergono (o che escono da ±1000%) passano a un fallback bracketed (bisezione).
+
+    Args:
+        flows_matrix: array 2-D (righe × flussi) degli importi, stessa convenzione di xirr.
+                      Le celle di padding sono NaN.
+        dates_matrix: array 2-D delle date (datetime64, o numerico in giorni).
+                      Le celle di padding sono NaT/NaN.
+        guesses: guess iniziale per riga (scalare o array). Default 0.1.
+
+    Returns:
+        np.ndarray: XIRR annualizzato per riga. 0.0 se la riga non ha cambio di segno
+                    (come xirr), NaN se nessun metodo converge.
+    """
+    amounts = np.atleast_2d(np.asarray(flows_matrix, dtype=float))
+    dates = np.atleast_2d(np.asarray(dates_matrix))
+    n_rows = amounts.shape[0]
+
+    if n_rows == 0:
+        return np.zeros(0)
+
+    # Date -> giorni (float), NaT/NaN come padding
+    if np.issubdtype(dates.dtype, np.datetime64):
+        secs = dates.astype('datetime64[s]')
+        days = np.where(np.isnat(secs), np.nan, secs.astype('int64') / 86400.0)
+    else:
+        days = dates.astype(float)
+
+    valid = np.isfinite(amounts) & np.isfinite(days)
+    amounts = np.where(valid, amounts, 0.0)
+
+    # Frazione di anni dalla prima data della riga (giorni interi, come timedelta.days)
+    row_min = np.min(np.where(valid, days, np.inf), axis=1)
+    row_min = np.where(np.isfinite(row_min), row_min, 0.0)
+    years = np.where(valid, np.floor(days - row_min[:, None]) / 365.0, 0.0)
+
+    if guesses is None:
+        guesses = 0.1
+    guesses = np.broadcast_to(np.asarray(guesses, dtype=float), (n_rows,)).copy()
+
+    # Controllo cambio segno (righe senza entrate e uscite -> 0.0, come xirr)
+    solvable = np.any(amounts > 0, axis=1) & np.any(amounts < 0, axis=1)
+    result = np.zeros(n_rows)
+
+    rates = guesses.copy()
+    converged = np.zeros(n_rows, dtype=bool)
+    flat_rows = np.zeros(n_rows, dtype=bool)
+    active = solvable.copy()
+
+    # Metodo Newton-Raphson vettoriale
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        for _ in range(max_iter):
+            if not active.any():
+                break
+            idx = np.nonzero(active)[0]
+            r = np.where(rates[idx] <= -1.0, -0.99 + 1e-9, rates[idx])  # Bounce back
+
+            npv, deriv = _npv_and_derivative(r, amounts[idx], years[idx])
+            finite = np.isfinite(npv) & np.isfinite(deriv)
+            # Derivata nulla (es. tutti i flussi nello stesso giorno): come xirr, si tiene il tasso corrente
+            flat = finite & (np.abs(deriv) < 1e-9)
+            ok = finite & ~flat
+
+            new_r = np.where(ok, r - npv / np.where(ok, deriv, 1.0), np.where(flat, r, np.nan))
+            done = flat | (ok & (np.abs(new_r - r) < tol))
+
+            rates[idx] = new_r
+            converged[idx[done]] = True
+            flat_rows[idx[flat]] = True
+            # Le righe non finite escono subito e passano al fallback
+            active[idx[done | ~finite]] = False
+
+    newton_ok = converged & np.isfinite(rates) & (np.abs(rates) <= 10.0)
+
+    # Passo < tol non basta vicino a r=-1 (derivata enorme): verifica anche l'NPV residuo
+    check = newton_ok & ~flat_rows
+    if check.any():
+        with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+            residual = _npv_and_derivative(rates[check], amounts[check], years[check])[0]
+        scale = np.maximum(np.sum(np.abs(amounts[check]), axis=1), 1.0)
+        newton_ok[np.nonzero(check)[0][~(np.abs(residual) <= 1e-4 * scale)]] = False
+
+    result[newton_ok] = rates[newton_ok]
+
+    # Fallback bracketed per le righe risolvibili ma non convergenti
+    retry = solvable & ~newton_ok
+    if retry.any():
+        result[retry] = _bracketed_bisection(amounts[retry], years[retry], guesses[retry], tol=tol)
+
+    return result
+
+def _find_bracket(amounts, years, guess):
+    """
+    Cerca sulla XIRR_BRACKET_GRID l'intervallo con cambio di segno dell'NPV
+    più vicino al guess. Restituisce (lo, hi, npv_lo, npv_hi) o None.
+    """
+    grid = XIRR_BRACKET_GRID
+    with np.errstate(over='ignore', invalid='ignore', divide='ignore'):
+        npv_grid = _npv_and_derivative(
+            grid,
+            np.broadcast_to(amounts, (len(grid), len(amounts))),
+            np.broadcast_to(years, (len(grid), len(years)))
+        )[0]
+
+    finite = np.isfinite(npv_grid)
+    sign_change = (npv_grid[:-1] * npv_grid[1:] <= 0) & finite[:-1] & finite[1:]
+    if not sign_change.any():
+        return None
+
+    mids = (grid[:-1] + grid[1:]) / 2.0
+    i = int(np.argmin(np.where(sign_change, np.abs(mids - guess), np.inf)))
+    return grid[i], grid[i + 1], npv_grid[i], npv_grid[i + 1]
+
+def _xirr_bracketed_arrays(amounts, years, guess=0.1, tol=1e-6, max_iter=100):
+    """
+    Nucleo di xirr_bracketed su array già preparati (importi, frazioni di anno).
+    Newton-Raphson protetto: se il passo esce dall'intervallo o non riduce
+    abbastanza l'errore si esegue un passo di bisezione. Restituisce (rate, iterazioni).
+    """
+    # Flussi tutti nello stesso giorno: NPV indipendente dal tasso, come xirr si tiene il guess
+    if not np.any(years):
+        return float(guess), 0
+
+    bracket = _find_bracket(amounts, years, guess)
+    if bracket is None:
+        return None, 0
+
+    lo, hi, f_lo, f_hi = bracket
+    if f_lo == 0:
+        return float(lo), 0
+    if f_hi == 0:
+        return float(hi), 0
+
+    # Orienta l'intervallo in modo che npv(x_neg) < 0 < npv(x_pos)
+    x_neg, x_pos = (lo, hi) if f_lo < 0 else (hi, lo)
+
+    rate = guess if lo < guess < hi else (lo + hi) / 2.0
+    dx_old = dx = hi - lo
+
+    def evaluate(r):
+        npv, deriv = _npv_and_derivative(np.array([r]), amounts[None, :], years[None, :])
+        return float(npv[0]), float(deriv[0])
+
+    f, df = evaluate(rate)
+
+    for iteration in range(1, max_iter + 1):
+        newton_out_of_range = ((rate - x_pos) * df - f) * ((rate - x_neg) * df - f) > 0
+        newton_too_slow = abs(2.0 * f) > abs(dx_old * df)
+
+        if newton_out_of_range or newton_too_slow:
+            # Passo di bisezione
+            dx_old = dx
+            dx = 0.5 * (x_pos - x_neg)
+            rate = x_neg + dx
+        else:
+            # Passo di Newton
+            dx_old = dx
+            dx = f / df
+            rate -= dx
+
+        if abs(dx) < tol:
+            return float(rate), iteration
+
+        f, df = evaluate(rate)
+        if f < 0:
+            x_neg = rate
+        else:
+            x_pos = rate
+
+    return float(rate), max_iter
+
+def xirr_bracketed(transactions, guess=0.1, tol=1e-6, max_iter=100, return_iterations=False):
+    """
+    Calcola XIRR con convergenza garantita in un'unica passata.
+
+    Individua un intervallo con cambio di segno dell'NPV (tra -99% e +1000%) e vi applica
+    Newton-Raphson protetto da bisezione: il passo di Newton viene usato quando resta
+    nell'intervallo, altrimenti si dimezza l'intervallo. Sostituisce i tentativi ripetuti
+    di xirr_multi_guess.
+
+    Args:
+        transactions: lista di dict con 'date' (datetime) e 'amount' (float), come per xirr.
+        return_iterations: se True restituisce (rate, iterazioni).
+
+    Returns:
+        float or None: XIRR annualizzato, o None se non esiste una radice nell'intervallo.
+    """
+    amounts = np.array([t['amount'] for t in transactions], dtype=float)
+
+    if len(amounts) == 0 or np.all(amounts >= 0) or np.all(amounts <= 0):
+        rate, iterations = None, 0
+    else:
+        dates = [t['date'] for t in transactions]
+        min_date = min(dates)
+        years = np.array([(d - min_date).days / 365.0 for d in dates])
+        rate, iterations = _xirr_bracketed_arrays(amounts, years, guess, tol, max_iter)
+
+    if return_iterations:
+        return rate, iterations
+    return rate
+
+class CashFlowAccumulator:
+    """
+    Accumulatore incrementale di cash flow per le serie storiche MWR.
+
+    Mantiene importi e date in array NumPy (append-only) insieme ai totali correnti,
+    così ad ogni checkpoint si aggiungono solo i nuovi flussi invece di ricostruire
+    e risommare l'intera lista. I checkpoint registrati vengono poi risolti tutti
+    insieme con xirr_batch.
+    """
+    def __init__(self, capacity=64):
+        self._amounts = np.empty(capacity)
+        self._days = np.empty(capacity)  # Giorni (frazionari) dal primo flusso
+        self._checkpoints = []  # (n_flussi, giorni, valore finale)
+
+        self.count = 0
+        self.first_date = None
+        self.net_invested = 0.0     # sum(-amount): acquisti - vendite - dividendi
+        self.total_buys = 0.0       # sum(-amount) dei soli flussi in uscita
+        self.total_dividends = 0.0
+
+    def _offset_days(self, date):
+        return (date - self.first_date).total_seconds() / 86400.0
+
+    def add(self, date, amount, is_dividend=False):
+        """Aggiunge un flusso (stessa convenzione di segno di xirr) e aggiorna i totali."""
+        if self.first_date is None:
+            self.first_date = date
+
+        if self.count == len(self._amounts):
+            self._amounts = np.resize(self._amounts, 2 * self.count)
+            self._days = np.resize(self._days, 2 * self.count)
+
+        self._amounts[self.count] = amount
+        self._days[self.count] = self._offset_days(date)
+        self.count += 1
+
+        self.net_invested -= amount
+        if amount < 0:
+            self.total_buys -= amount
+        if is_dividend:
+            self.total_dividends += amount
+
+    @property
+    def flow_sum(self):
+        """Somma algebrica dei flussi (vendite + cedole - acquisti)."""
+        return -self.net_invested
+
+    def checkpoint(self, date, value):
+        """Registra un checkpoint: flussi fin qui + valore corrente come flusso finale."""
+        if self.first_date is None:
+            self.first_date = date
+        self._checkpoints.append((self.count, self._offset_days(date), value))
+
+    def checkpoint_matrices(self):
+        """
+        Costruisce le matrici (flussi, giorni) di tutti i checkpoint registrati.
+        La riga k contiene i primi n_k flussi seguiti dal valore finale del checkpoint.
+        """
+        if not self._checkpoints:
+            return np.empty((0, 0)), np.empty((0, 0))
+
+        counts = np.array([c[0] for c in self._checkpoints])
+        width = int(counts.max()) + 1
+
+        base_amounts = np.full(width, np.nan)
+        base_days = np.full(width, np.nan)
+        base_amounts[:self.count] = self._amounts[:self.count]
+        base_days[:self.count] = self._days[:self.count]
+
+        in_flow = np.arange(width)[None, :] < counts[:, None]
+        flows = np.where(in_flow, base_amounts[None, :], np.nan)
+        days = np.where(in_flow, base_days[None, :], np.nan)
+
+        rows = np.arange(len(counts))
+        flows[rows, counts] = [c[2] for c in self._checkpoints]
+        days[rows, counts] = [c[1] for c in self._checkpoints]
+        return flows, days
+
+    def solve_checkpoints(self, guesses=None, method='batch'):
+        """
+        XIRR di tutti i checkpoint registrati.
+        method='batch': un'unica chiamata a xirr_batch (NaN se non converge).
+        method='bracketed': xirr_bracketed riga per riga (NaN se nessuna radice).
+        """
+        if not self._checkpoints:
+            return np.zeros(0)
+        flows, days = self.checkpoint_matrices()
+
+        if method != 'bracketed':
+            return xirr_batch(flows, days, guesses)
+
+        result = np.full(len(flows), np.nan)
+        for i, (row_flows, row_days) in enumerate(zip(flows, days)):
+            valid = np.isfinite(row_flows)
+            amounts = row_flows[valid]
+            if not (np.any(amounts > 0) and np.any(amounts < 0)):
+                continue
+            row_days = row_days[valid]
+            years = np.floor(row_days - row_days.min()) / 365.0
+            guess = 0.1 if guesses is None else float(np.broadcast_to(guesses, (len(flows),))[i])
+            rate, _ = _xirr_bracketed_arrays(amounts, years, guess)
+            if rate is not None:
+                result[i] = rate
+        return result
+
 def deannualize_xirr(annual_xirr, days):
     """
     Converte XIRR annualizzato in rendimento di periodo per numero di giorni.
@@ -170,14 +571,16 @@ def get_tiered_mwr(cash_flows, current_value, t1=30, t2=365, end_date=None, xirr
 
     # --- Tier 2 & 3: Base XIRR ---
     # Try preferred mode
-    if xirr_mode == 'multi_guess':
-        xirr_val = xirr_multi_guess(calc_flows)
+    # 'multi_guess' è mantenuto come alias: i tentativi multipli sono sostituiti
+    # dal solver bracketed, che converge in un'unica passata.
+    if xirr_mode in ('multi_guess', 'bracketed'):
+        xirr_val = xirr_bracketed(calc_flows)
     else:
-        xirr_val = xirr(calc_flows)
-    
-    # Fallback to multi_guess if standard failed and not already in multi_guess
-    if xirr_mode == 'standard' and (xirr_val is None or abs(xirr_val) > 10.0):
-        xirr_val = xirr_multi_guess(calc_flows)
+        # xirr_batch include già il fallback bracketed per i casi non convergenti
+        flows_m, dates_m = pack_cash_flows([calc_flows])
+        xirr_val = float(xirr_batch(flows_m, dates_m)[0])
+        if np.isnan(xirr_val):
+            xirr_val = None
 
     # Final Fallback to Simple Return if everything failed
     if xirr_val is None or abs(xirr_val) > 10.0:
@@ -0,0 +1,90 @@
+"""
+Holdings Snapshot.
+
+Quantità nette e capitale netto investito per asset letti dalla vista materializzata
+portfolio_holdings (RPC portfolio_holdings_snapshot) invece di scaricare e sommare
+tutte le transazioni del portafoglio: il costo non dipende più dal numero di transazioni.
+
+Coerenza: la RPC segnala se il portafoglio è stato modificato dopo l'ultimo refresh
+della vista (fresh=false). In lettura "fresh" (default), se la vista è vecchia o la RPC
+non è disponibile, i lettori ritornano None e il chiamante ripiega subito sul calcolo
+dalle transazioni: nessuna attesa del refresh nel percorso della richiesta.
+In lettura "best-effort" (fresh=False) si usano le righe della vista così come sono.
+Una vista trovata vecchia viene rimessa in coda di refresh (worker di mv_refresh).
+"""
+
+import logging
+from db_helper import execute_request, fetch_all_rows
+from mv_refresh import request_refresh
+
+logger = logging.getLogger("perix_monitor")
+
+
+def get_holdings_snapshot(portfolio_id, fresh=True):
+    """
+    Holdings del portafoglio dalla vista: {isin: {asset_id, isin, name, asset_class,
+    last_trend_variation, qty, net_invested, num_transactions, last_transaction_date}}
+    (anche le posizioni chiuse, qty = 0). None se la vista non è leggibile o,
+    con fresh=True, non è allineata alle transazioni.
+    """
+    try:
+        res = execute_request('rpc/portfolio_holdings_snapshot', 'POST', body={'p_portfolio_id': portfolio_id})
+        if not res or res.status_code != 200:
+            logger.warning(f"HOLDINGS: Snapshot unavailable for {portfolio_id} "
+                           f"(HTTP {res.status_code if res is not None else 'n/a'}), using transactions")
+            return None
+        data = res.json() or {}
+        if not data.get('fresh'):
+            request_refresh('transactions')
+            if fresh:
+                logger.info(f"HOLDINGS: portfolio_holdings stale for {portfolio_id}, using transactions")
+                return None
+            logger.info(f"HOLDINGS: portfolio_holdings stale for {portfolio_id}, serving it (best-effort)")
+        snapshot = {}
+        for row in data.get('rows') or []:
+            row['qty'] = float(row.get('qty') or 0)
+            row['net_invested'] = float(row.get('net_invested') or 0)
+            snapshot[row['isin']] = row
+        return snapshot
+    except Exception as e:
+        logger.error(f"HOLDINGS: Snapshot read failed for {portfolio_id}: {e}")
+        return None
+
+
+def _net_quantities_from_transactions(portfolio_id):
+    """Ricostruzione completa dalle transazioni (percorso di ripiego)."""
+    holdings_map = {}
+    try:
+        # Paginato: una sola GET si ferma a max_rows e troncherebbe le quantità
+        tx_data = fetch_all_rows('transactions', params={
+            'select': 'quantity,type,assets(isin)',
+            'portfolio_id': f'eq.{portfolio_id}'
+        }, keyset=('date', 'id'))
+    except RuntimeError as e:
+        logger.error(f"HOLDINGS: Transactions fetch failed: {e}")
+        return holdings_map
+
+    for t in tx_data:
+        asset = t.get('assets')
+        if not asset or not asset.get('isin'):
+            continue
+        isin = asset['isin']
+        qty = float(t.get('quantity', 0))
+        if t.get('type') == 'BUY':
+            holdings_map[isin] = round(holdings_map.get(isin, 0.0) + qty, 2)
+        elif t.get('type') == 'SELL':
+            holdings_map[isin] = round(holdings_map.get(isin, 0.0) - qty, 2)
+    logger.info(f"HOLDINGS: Calculated holdings for {len(holdings_map)} assets from {len(tx_data)} transactions.")
+    return holdings_map
+
+
+def get_net_quantities(portfolio_id):
+    """
+    Quantità nette per ISIN ({isin: qty}, arrotondate a 2 decimali come la validazione
+    ingest), dalla vista se allineata, altrimenti dalle transazioni.
+    """
+    snapshot = get_holdings_snapshot(portfolio_id)
+    if snapshot is None:
+        return _net_quantities_from_transactions(portfolio_id)
+    logger.info(f"HOLDINGS: Net quantities for {len(snapshot)} assets from portfolio_holdings.")
+    return {isin: round(row['qty'], 2) for isin, row in snapshot.items()}
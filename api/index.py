@@ -84,7 +84,10 @@ def hello():
 
 # from supabase_client import get_supabase_client, get_or_create_default_portfolio
 # REPLACED BY DB HELPER
-from db_helper import execute_request, query_table, upsert_table, update_table, delete_table
+from db_helper import execute_request, query_table, upsert_table, update_table, delete_table, get_session
+from result_cache import bump_data_version
+from daily_valuation import invalidate_valuations, invalidate_valuations_after_sync
+from mv_refresh import request_refresh
 
 def check_debug_mode(portfolio_id):
     """Check if file logging is enabled for the portfolio owner."""
@@ -111,7 +114,7 @@ def sync_transactions():
          return jsonify(status="ok"), 200
     try:
         from logger import configure_file_logging, log_audit
-        from db_helper import upsert_table, execute_request, update_table
+        from db_helper import execute_request, bulk_upsert, bulk_failed_rows
         data = request.json
         changes = data.get('changes', [])
         portfolio_id = data.get('portfolio_id')
@@ -143,9 +146,9 @@ def sync_transactions():
             try:
                 # Update upload_date to NOW just to be precise on confirm
                 snapshot['upload_date'] = datetime.now().isoformat()
-                # supabase.table('snapshots').insert(snapshot).execute()
-                upsert_table('snapshots', snapshot)
-                if debug_mode: logger.debug(f"SYNC: Snapshot records saved.")
+                if bulk_failed_rows(bulk_upsert('snapshots', [snapshot])):
+                    logger.error("SYNC: Snapshot save failed")
+                elif debug_mode: logger.debug(f"SYNC: Snapshot records saved.")
             except Exception as e:
                  logger.error(f"SYNC: Snapshot save failed: {e}")
 
@@ -181,92 +184,84 @@ def sync_transactions():
                      
                      if valid_dividends:
                          # Upsert based on unique constraint (portfolio, asset, date, type)
-                         upsert_table('dividends', valid_dividends, on_conflict='portfolio_id, asset_id, date, type')
-                         if debug_mode: logger.debug(f"SYNC: Saved {len(valid_dividends)} dividends.")
+                         failed_divs = bulk_failed_rows(bulk_upsert('dividends', valid_dividends, on_conflict='portfolio_id, asset_id, date, type'))
+                         if failed_divs:
+                             logger.error(f"SYNC: Failed to save {failed_divs} of {len(valid_dividends)} dividends")
+                         if debug_mode: logger.debug(f"SYNC: Saved {len(valid_dividends) - failed_divs} dividends.")
             except Exception as e:
                  logger.error(f"SYNC: Dividend save failed: {e}")
 
 
         # --- 3. Handle Transactions (If present) ---
         valid_transactions = []
+        transaction_prices = []
+        count_assets_updated = 0
+        enrichment_batch_id = None
         if changes:
              # 3a. Collect all unique ISINs to process
             target_isins = {item.get('isin') for item in changes if item.get('quantity_change') and item.get('isin')}
             if target_isins:
                 # 3b. Batch Fetch existing assets
-                # res_assets = supabase.table('assets').select("id, isin").in_('isin', list(target_isins)).execute()
-                in_filter = f"in.({','.join(target_isins)})"
-                res_assets = execute_request('assets', 'GET', params={'select': 'id,isin', 'isin': in_filter})
-                
-                asset_map = {}
-                if res_assets and res_assets.status_code == 200:
-                    asset_map = {row['isin']: row['id'] for row in res_assets.json()}
-                
-                # Ensure existing assets have colors too (backfill)
-                exist_ids = list(asset_map.values())
-                if exist_ids:
-                     assign_colors(portfolio_id, exist_ids)
-
-                # [NEW] Backfill Asset Type for EXISTING assets
-                # If the file provides asset_type, we should update the metadata even if asset exists.
+                # Backfill proposals from the file: Asset Type (metadata + asset_class) and Description (name)
                 isin_to_type = {}
+                isin_to_desc = {}
                 for item in changes:
                     if item.get('isin') and item.get('asset_type_proposal'):
                         isin_to_type[item['isin']] = str(item['asset_type_proposal']).strip()
+                    if item.get('isin') and item.get('excel_description'):
+                        isin_to_desc[item['isin']] = str(item['excel_description']).strip()
                 
                 if debug_mode:
                     logger.debug(f"SYNC DEBUG: Found {len(isin_to_type)} asset type proposals in payload.")
+
+                # Single fetch with every column needed by the asset map and the backfill diff
+                fetch_isins = target_isins | set(isin_to_type) | set(isin_to_desc)
+                in_filter = f"in.({','.join(fetch_isins)})"
+                res_assets = execute_request('assets', 'GET', params={'select': 'id,isin,name,asset_class,metadata', 'isin': in_filter})
                 
-                if isin_to_type:
-                    # We need to fetch current metadata for these assets to merge
-                    # existing_assets_data = supabase.table('assets').select("id, isin, metadata").in_('isin', list(isin_to_type.keys())).execute()
-                    in_filter_type = f"in.({','.join(isin_to_type.keys())})"
-                    existing_assets_data = execute_request('assets', 'GET', params={'select': 'id,isin,metadata', 'isin': in_filter_type})
-                    
-                    if existing_assets_data and existing_assets_data.status_code == 200:
-                        rows = existing_assets_data.json()
-                        for row in rows:
-                            isin = row['isin']
-                            new_type = isin_to_type.get(isin)
-                            if new_type:
-                                current_meta = row.get('metadata') or {}
-                                if not isinstance(current_meta, dict):
-                                    current_meta = {}
-                                
-                                # Check if update is needed
-                                current_meta['assetType'] = new_type
-                                if debug_mode: logger.debug(f"SYNC: Backfilling Asset Type for {isin} -> {new_type}")
-                                # Update both metadata and asset_class column for consistency
-                                # supabase.table('assets').update({...}).eq('id', row['id']).execute()
-                                update_table('assets', {
-                                    "metadata": current_meta,
-                                    "asset_class": new_type
-                                }, filters={'id': row['id']})
-                        
-                        # [NEW] Update Asset Names (Description) for EXISTING assets
-                        # If Excel has a better/new description, update the global asset name.
-                        isin_to_desc = {}
-                        for item in changes:
-                            if item.get('isin') and item.get('excel_description'):
-                                isin_to_desc[item['isin']] = str(item['excel_description']).strip()
-                        
-                        if isin_to_desc:
-                             # Re-using existing_assets_data if possible or fetch again. 
-                             # We can just iterate the same rows since we fetched 'id' and 'isin' (and 'name' if we add it to select)
-                             in_filter_desc = f"in.({','.join(isin_to_desc.keys())})"
-                             existing_assets_names = execute_request('assets', 'GET', params={'select': 'id,isin,name', 'isin': in_filter_desc})
-                             
-                             if existing_assets_names and existing_assets_names.status_code == 200:
-                                 rows = existing_assets_names.json()
-                                 for row in rows:
-                                     isin = row['isin']
-                                     new_name = isin_to_desc.get(isin)
-                                     current_name = row.get('name')
-                                     
-                                     # Update if different and new name is valid
-                                     if new_name and new_name != current_name and len(new_name) > 2:
-                                         if debug_mode: logger.debug(f"SYNC: Updating Asset Name for {isin}: '{current_name}' -> '{new_name}'")
-                                         update_table('assets', {"name": new_name}, {'id': row['id']})
+                existing_rows = res_assets.json() if (res_assets and res_assets.status_code == 200) else []
+                asset_map = {row['isin']: row['id'] for row in existing_rows if row['isin'] in target_isins}
+                
+                # Ensure existing assets have colors too (backfill)
+                exist_ids = list(asset_map.values())
+                if exist_ids:
+                     assign_colors(portfolio_id, exist_ids)
+
+                # [NEW] Backfill Asset Type / Name for EXISTING assets
+                # Diff in memory, then one bulk upsert (on_conflict=id) of the changed rows only.
+                assets_to_update = []
+                for row in existing_rows:
+                    isin = row['isin']
+                    current_meta = row.get('metadata') if isinstance(row.get('metadata'), dict) else {}
+                    new_row = {
+                        "id": row['id'],
+                        "isin": isin,
+                        "name": row.get('name'),
+                        "asset_class": row.get('asset_class'),
+                        "metadata": row.get('metadata')
+                    }
+                    new_type = isin_to_type.get(isin)
+                    if new_type and (current_meta.get('assetType') != new_type or row.get('asset_class') != new_type):
+                        if debug_mode: logger.debug(f"SYNC: Backfilling Asset Type for {isin} -> {new_type}")
+                        # Update both metadata and asset_class column for consistency
+                        new_row["metadata"] = {**current_meta, 'assetType': new_type}
+                        new_row["asset_class"] = new_type
+
+                    # If Excel has a better/new description, update the global asset name.
+                    new_name = isin_to_desc.get(isin)
+                    if new_name and new_name != row.get('name') and len(new_name) > 2:
+                        if debug_mode: logger.debug(f"SYNC: Updating Asset Name for {isin}: '{row.get('name')}' -> '{new_name}'")
+                        new_row["name"] = new_name
+
+                    if new_row["name"] != row.get('name') or new_row["asset_class"] != row.get('asset_class') or new_row["metadata"] != row.get('metadata'):
+                        assets_to_update.append(new_row)
+
+                if assets_to_update:
+                    failed_assets = bulk_failed_rows(bulk_upsert('assets', assets_to_update, on_conflict='id'))
+                    count_assets_updated = len(assets_to_update) - failed_assets
+                    if failed_assets:
+                        logger.error(f"SYNC: Failed to backfill {failed_assets} of {len(assets_to_update)} assets")
+                logger.info(f"SYNC: Asset backfill wrote {count_assets_updated} of {len(existing_rows)} existing assets (bulk upsert).")
                 
                 # 3c. Identify and Create missing assets
                 missing_isins = target_isins - set(asset_map.keys())
@@ -310,41 +305,13 @@ def sync_transactions():
                             except Exception as e:
                                 logger.error(f"SYNC: Color assignment failed for {row['isin']}: {e}")
                             
-                            # Fetch LLM info for new asset and update metadata (if enabled)
-                            if enable_ai_lookup:
-                                from llm_asset_info import fetch_asset_info_from_llm
-                                llm_result = fetch_asset_info_from_llm(row['isin'])
-                                if llm_result:
-                                    try:
-                                        if llm_result.get('response_type') == 'json':
-                                            # Save structured JSON to metadata column
-                                            # [FIX] Merge with existing metadata if present (like assetType)
-                                            current_meta = row.get('metadata') or {}
-                                            if not isinstance(current_meta, dict):
-                                                current_meta = {}
-                                            
-                                            # Merge LLM data into current metadata
-                                            new_meta = {**current_meta, **llm_result['data']}
-                                            
-                                            # Merge LLM data into current metadata
-                                            new_meta = {**current_meta, **llm_result['data']}
-                                            
-                                            update_table('assets', {
-                                                "metadata": new_meta,
-                                                "metadata_text": None
-                                            }, {'id': row['id']})
-                                            if debug_mode: logger.debug(f"SYNC: Updated asset {row['isin']} with LLM JSON metadata")
-                                        elif llm_result.get('response_type') == 'text':
-                                            # Save text/markdown to metadata_text column
-                                            update_table('assets', {
-                                                "metadata": None,
-                                                "metadata_text": llm_result['data']
-                                            }, {'id': row['id']})
-                                            if debug_mode: logger.debug(f"SYNC: Updated asset {row['isin']} with LLM text/markdown metadata")
-                                    except Exception as llm_err:
-                                        logger.error(f"SYNC: Failed to save LLM metadata for {row['isin']}: {llm_err}")
-                            else:
+                            if not enable_ai_lookup:
                                 if debug_mode: logger.debug(f"SYNC: AI lookup disabled, skipping LLM metadata for {row['isin']}")
+
+                        # LLM info for new assets: queued in background, results saved as each one completes
+                        if enable_ai_lookup:
+                            from llm_enrichment import enqueue_asset_enrichment
+                            enrichment_batch_id = enqueue_asset_enrichment(new_assets_data, portfolio_id=portfolio_id)
                 
                 
                 for item in changes:
@@ -395,13 +362,18 @@ def sync_transactions():
                         
                         # [NEW] Save Transaction Price as Market Data
                         # This ensures we have at least one data point for history/P&L even if no external price source exists yet.
-                        try:
-                            # We use the transaction date. If multiple prices for same day, latest wins (upsert).
-                            # Source = 'Transaction' to distinguish from 'Manual Upload' or 'Yahoo Finance'
-                            from price_manager import save_price_snapshot
-                            save_price_snapshot(isin, float(price), date=date_val, source="Transaction")
-                        except Exception as e_price:
-                            logger.error(f"SYNC: Failed to save transaction price for {isin}: {e_price}")
+                        # Collected here and written in the same bulk upsert as the uploaded prices (step 4);
+                        # same rules as save_price_snapshot. If multiple prices for same day, latest wins.
+                        # Source = 'Transaction' to distinguish from 'Manual Upload' or 'Yahoo Finance'
+                        if float(price) > 0:
+                            transaction_prices.append({
+                                "isin": isin,
+                                "price": float(price),
+                                "date": date_val or datetime.now().strftime("%Y-%m-%d"),
+                                "source": "Transaction"
+                            })
+                        else:
+                            logger.warning(f"SYNC: Skipping transaction price {price} for {isin}")
         
         # --- 4. Process Prices (Now that Assets are ensured to exist) ---
         if prices:
@@ -422,21 +394,20 @@ def sync_transactions():
                          })
                  except ValueError:
                      logger.warning(f"SYNC: Invalid price for {p.get('isin')}: {p.get('price')}")
-            
-            count_prices = 0
-            if valid_prices:
-                # Batch upsert
-                if upsert_table('asset_prices', valid_prices, on_conflict='isin, date, source'):
-                     count_prices = len(valid_prices)
-                else:
-                     logger.error(f"SYNC: Failed to batch save {len(valid_prices)} prices")
 
-            if debug_mode: logger.debug(f"SYNC: Saved {count_prices} price snapshots (Batch).")
+        # Prezzi caricati + prezzi delle transazioni in un solo upsert bulk (a chunk, in parallelo)
+        price_rows = transaction_prices + valid_prices
+        if price_rows:
+            failed_prices = bulk_failed_rows(bulk_upsert('asset_prices', price_rows, on_conflict='isin, date, source'))
+            if failed_prices:
+                logger.error(f"SYNC: Failed to save {failed_prices} of {len(price_rows)} price snapshots")
+            if debug_mode: logger.debug(f"SYNC: Saved {len(price_rows) - failed_prices} price snapshots "
+                                        f"({len(transaction_prices)} from transactions, bulk).")
 
         # 3. Process Referentials/Trends (if any)
         # Invece di usare il valore provvisorio dalla UI (che mischia update per la stessa data), 
         # ricalcoliamo il trend reale utilizzando la storia consolidata a DB.
-        from price_manager import update_asset_trend
+        from price_manager import update_asset_trends_batch
         
         isins_to_update = set()
         if valid_prices:
@@ -450,42 +421,60 @@ def sync_transactions():
         if isins_to_update:
             try:
                 logger.info(f"SYNC: Recalculating absolute trends for {len(isins_to_update)} assets...")
-                for isin in isins_to_update:
-                    update_asset_trend(isin)
+                update_asset_trends_batch(isins_to_update)
             except Exception as e:
                 logger.error(f"SYNC: Error recalculating trends: {e}")
                 errors.append(f"Trend Update Error: {str(e)}")
 
         # 4. Finalize
+        failed_tx = 0
+        if valid_transactions and not errors:
+            # Insert senza chiave di conflitto: una sola richiesta (tutto o niente), così un
+            # errore non lascia metà delle transazioni scritte e il ricaricamento non le duplica
+            failed_tx = bulk_failed_rows(bulk_upsert('transactions', valid_transactions, atomic=True))
+
+        # Invalida i risultati in cache dopo l'ultima scrittura: un sommario calcolato prima
+        # resterebbe in cache sotto la nuova versione. Prezzi e trend sono condivisi tra portafogli
+        bump_data_version(portfolio_id)
+        if valid_prices or valid_transactions or isins_to_update:
+            bump_data_version()
+
         if len(errors) > 0:
             return jsonify(error="Sync completed with errors", details=errors), 500
         
         if valid_transactions:
-            # res = supabase.table('transactions').insert(valid_transactions).execute()
-            upsert_table('transactions', valid_transactions) # Insert is effectively upsert without conflict key usually, or just POST
-            
+            if failed_tx:
+                logger.error(f"SYNC: Failed to save {len(valid_transactions)} transactions")
+                errors.append(f"Transactions: {len(valid_transactions)} not saved")
+                return jsonify(error="Sync completed with errors", details=errors), 500
+
             log_audit("SYNC_SUCCESS", f"Portfolio {portfolio_id}: {len(valid_transactions)} transactions, {len(prices)} prices, {len(valid_dividends)} dividends.")
             
-            # [NEW] Refresh Materialized Views
+            # Refresh Materialized Views: debounced, off the request path (see mv_refresh)
+            request_refresh('transactions', 'dividends')
+
+            # Ricalcolo incrementale della serie giornaliera (dalla prima data toccata)
             try:
-                execute_request('rpc/refresh_materialized_views', 'POST')
-                if debug_mode: logger.debug("SYNC: Materialized views refreshed.")
-            except Exception as e_mv:
-                logger.error(f"SYNC: MV Refresh failed: {e_mv}")
+                invalidate_valuations_after_sync(portfolio_id, valid_transactions, valid_dividends, valid_prices)
+            except Exception as e_val:
+                logger.error(f"SYNC: Daily valuations refresh failed: {e_val}")
 
-            return jsonify(message=f"Successfully synced. Prices: {len(prices)}. Trans: {len(valid_transactions)}. Divs: {len(valid_dividends)}"), 200
+            return jsonify(message=f"Successfully synced. Prices: {len(prices)}. Trans: {len(valid_transactions)}. Divs: {len(valid_dividends)}",
+                           assets_updated=count_assets_updated, enrichment_batch_id=enrichment_batch_id), 200
         else:
             log_audit("SYNC_SUCCESS", f"Portfolio {portfolio_id}: {len(prices)} prices, {len(valid_dividends)} dividends. No transactions.")
             
-            # [NEW] Refresh Materialized Views (Prices might affect some logic, but mainly transactions do. 
-            # However, dividends or other changes might have happened too.)
+            # Refresh Materialized Views: prices do not feed any view, only dividends do
+            if valid_dividends:
+                request_refresh('dividends')
+
             try:
-                execute_request('rpc/refresh_materialized_views', 'POST')
-                if debug_mode: logger.debug("SYNC: Materialized views refreshed.")
-            except Exception as e_mv:
-                logger.error(f"SYNC: MV Refresh failed: {e_mv}")
+                invalidate_valuations_after_sync(portfolio_id, [], valid_dividends, valid_prices)
+            except Exception as e_val:
+                logger.error(f"SYNC: Daily valuations refresh failed: {e_val}")
                 
-            return jsonify(message=f"Synced. Prices: {len(prices)}. Divs: {len(valid_dividends)}. No transactions."), 200
+            return jsonify(message=f"Synced. Prices: {len(prices)}. Divs: {len(valid_dividends)}. No transactions.",
+                           assets_updated=count_assets_updated, enrichment_batch_id=enrichment_batch_id), 200
 
     except Exception as e:
         logger.error(f"SYNC FAIL: {e}")
@@ -494,6 +483,16 @@ def sync_transactions():
         traceback.print_exc() # Force stdout
         return jsonify(error=str(e)), 500
 
+@app.route('/api/sync/enrichment-status', methods=['GET'])
+def sync_enrichment_status():
+    """Progress of the background LLM enrichment queued by /api/sync (?batch_id=... or ?portfolio_id=...)."""
+    from llm_enrichment import get_enrichment_status
+    batch_id = request.args.get('batch_id')
+    status = get_enrichment_status(batch_id=batch_id, portfolio_id=request.args.get('portfolio_id'))
+    if batch_id and status is None:
+        return jsonify(error="Batch not found"), 404
+    return jsonify(status), 200
+
 @app.route('/api/reset', methods=['POST', 'OPTIONS'])
 def reset_db_route():
     """
@@ -554,6 +553,7 @@ def reset_db_route():
         
         for pid in target_portfolios:
             logger.info(f"RESET: Cleaning Portfolio {pid}...")
+            bump_data_version(pid)
             
             # Transactions
             delete_table('transactions', {'portfolio_id': pid})
@@ -573,6 +573,7 @@ def reset_db_route():
                 # Abort to be safe
                 raise Exception(f"Failed to delete portfolio {pid}")
                 
+        request_refresh()
         log_audit("RESET_DB", f"USER WIPE COMPLETED. Deleted {len(target_portfolios)} portfolios.")
         return jsonify(status="ok", message="User portfolios deleted. Assets preserved."), 200
 
@@ -611,11 +612,11 @@ def reset_dividends_route():
         if not delete_table('dividends', {'portfolio_id': portfolio_id}):
             raise Exception(f"Failed to delete dividends for portfolio {portfolio_id}")
 
+        bump_data_version(portfolio_id)
+        invalidate_valuations(portfolio_id)
+
         # Refresh Materialized Views (dividend_totals)
-        try:
-            execute_request('rpc/refresh_materialized_views', 'POST')
-        except Exception as e_mv:
-            logger.error(f"RESET DIVIDENDS: MV Refresh failed: {e_mv}")
+        request_refresh('dividends')
 
         log_audit("RESET_DIVIDENDS", f"Deleted {count} dividends for portfolio {portfolio_id}")
         return jsonify(status="ok", message=f"Cancellate {count} cedole/dividendi.", deleted=count), 200
@@ -666,6 +667,8 @@ def system_reset_route():
         logger.info("sys_reset: Portfolios...")
         if not delete_table('portfolios', {'id.gt': nil_uuid}): raise Exception("Failed portfolios")
 
+        bump_data_version()
+        request_refresh()
         log_audit("SYSTEM_RESET", "FULL SYSTEM WIPE COMPLETED")
         return jsonify(status="ok", message="System completely wiped."), 200
         
@@ -756,6 +759,8 @@ def execute_restore():
         # For now, we rely on frontend sending it or fallback if possible (but DB is strict).
         
         result = restore_backup(backup_content, new_name, user_id)
+        # Il restore può reinserire prezzi e asset condivisi
+        bump_data_version()
         
         return jsonify(result)
         
@@ -900,38 +905,14 @@ def ingest_excel():
         debug_mode = check_debug_mode(portfolio_id)
         
         # [NEW] Fetch current holdings for validation (Sales Check)
+        # Net quantities from the portfolio_holdings view (transactions scan only if the view is stale)
         holdings_map = {}
         if portfolio_id:
              try:
-                 from db_helper import execute_request
-                 # Fetch all transactions to calculate current holdings manually (RPC does not exist)
-                 # We need: quantity, type, asset(isin)
-                 res = execute_request('transactions', 'GET', params={
-                     'select': 'quantity,type,assets(isin)',
-                     'portfolio_id': f'eq.{portfolio_id}'
-                 })
-                 
-                 if res and res.status_code == 200:
-                     tx_data = res.json()
-                     # Aggregate
-                     for t in tx_data:
-                         asset = t.get('assets')
-                         if not asset or not asset.get('isin'): continue
-                         
-                         isin = asset['isin']
-                         qty = float(t.get('quantity', 0))
-                         typ = t.get('type') # BUY / SELL
-                         
-                         if typ == 'BUY':
-                             holdings_map[isin] = round(holdings_map.get(isin, 0.0) + qty, 2)
-                         elif typ == 'SELL':
-                             holdings_map[isin] = round(holdings_map.get(isin, 0.0) - qty, 2)
-                     
-                     logger.info(f"INGEST DEBUG: Calculated holdings for {len(holdings_map)} assets from {len(tx_data)} transactions.")
-                     if holdings_map:
-                        logger.info(f"INGEST DEBUG: Sample Holdings: {list(holdings_map.items())[:3]}")
-                 else:
-                    logger.error(f"INGEST DEBUG: Transactions fetch failed. Status: {res.status_code}")
+                 from holdings import get_net_quantities
+                 holdings_map = get_net_quantities(portfolio_id)
+                 if holdings_map:
+                    logger.info(f"INGEST DEBUG: Sample Holdings: {list(holdings_map.items())[:3]}")
              except Exception as e:
                  logger.error(f"INGEST: Failed to fetch holdings/transactions: {e}")
 
@@ -1302,7 +1283,6 @@ def calculate_xirr_route():
 @app.route('/api/portfolios', methods=['GET', 'POST', 'OPTIONS'])
 def manage_portfolios():
     from logger import log_audit
-    import requests
     try:
         if request.method == 'OPTIONS':
              return jsonify(status="ok"), 200
@@ -1365,7 +1345,7 @@ def manage_portfolios():
             "Prefer": "return=representation"
         }
         
-        post_resp = requests.post(
+        post_resp = get_session().post(
              f"{supabase_url}/rest/v1/portfolios",
              headers=headers,
              json={
@@ -1395,7 +1375,6 @@ def manage_portfolios():
 def delete_portfolio(portfolio_id):
     from logger import log_audit
     try:
-        import requests
         
         # Verify existence
         from db_helper import query_table
@@ -1422,7 +1401,7 @@ def delete_portfolio(portfolio_id):
             "Content-Type": "application/json"
         }
         
-        del_resp = requests.delete(
+        del_resp = get_session().delete(
             f"{supabase_url}/rest/v1/portfolios?id=eq.{portfolio_id}",
             headers=headers,
             timeout=10
@@ -1530,7 +1509,7 @@ def list_users_route():
             "Content-Type": "application/json"
         }
         
-        response = requests.get(auth_url, headers=headers, timeout=10)
+        response = get_session().get(auth_url, headers=headers, timeout=10)
         
         if response.status_code != 200:
             logger.error(f"ADMIN LIST USERS FAIL: HTTP {response.status_code} - {response.text}")
@@ -1582,7 +1561,7 @@ def delete_user_route(user_id):
             "Content-Type": "application/json"
         }
         
-        response = requests.delete(auth_url, headers=headers, timeout=10)
+        response = get_session().delete(auth_url, headers=headers, timeout=10)
         
         if response.status_code not in [200, 204]:
             logger.error(f"ADMIN DELETE USER FAIL: HTTP {response.status_code} - {response.text}")
@@ -1624,7 +1603,7 @@ def reset_password_route(user_id):
         
         # 1. Get user email
         user_url = f"{supabase_url}/auth/v1/admin/users/{user_id}"
-        user_res = requests.get(user_url, headers=headers, timeout=10)
+        user_res = get_session().get(user_url, headers=headers, timeout=10)
         
         if user_res.status_code != 200:
             return jsonify(error="User not found"), 404
@@ -1638,7 +1617,7 @@ def reset_password_route(user_id):
         # 2. SECURITY: Immediately invalidate old password by setting a random one
         random_password = secrets.token_urlsafe(32)
         update_url = f"{supabase_url}/auth/v1/admin/users/{user_id}"
-        update_res = requests.put(
+        update_res = get_session().put(
             update_url,
             headers=headers,
             json={"password": random_password},
@@ -1653,7 +1632,7 @@ def reset_password_route(user_id):
         # 3. Send password reset email
         # Note: This uses the public endpoint, not admin (for email sending)
         reset_url = f"{supabase_url}/auth/v1/recover"
-        reset_res = requests.post(
+        reset_res = get_session().post(
             reset_url,
             headers={"apikey": service_key, "Content-Type": "application/json"},
             json={"email": user_email},
@@ -1710,7 +1689,7 @@ def user_change_password_route():
             "Content-Type": "application/json"
         }
         
-        response = requests.put(
+        response = get_session().put(
             update_url,
             headers=headers,
             json={
@@ -1757,7 +1736,6 @@ def get_log_config():
     Get current log configuration for a specific user.
     Uses direct HTTP to bypass RLS with opaque tokens.
     """
-    import requests
     try:
         user_id = request.args.get('user_id')
         if not user_id:
@@ -1779,7 +1757,7 @@ def get_log_config():
         }
         
         # Query for specific key
-        response = requests.get(
+        response = get_session().get(
             f"{rest_url}?key=eq.{config_key}&select=value",
             headers=headers,
             timeout=10
@@ -1829,7 +1807,7 @@ def set_log_config():
         }
         
         # Upsert the config
-        response = requests.post(
+        response = get_session().post(
             rest_url,
             headers=headers,
             json={
@@ -2080,25 +2058,128 @@ def test_llm_endpoint():
 
 # --- ADMIN / MAINTENANCE ROUTES ---
 
+def _compact_prices_job(isin, dry_run):
+    from data_compaction import compact_prices
+    stats = compact_prices(isin=isin, dry_run=dry_run)
+    if not dry_run:
+        bump_data_version()
+    return stats
+
 @app.route('/api/admin/compact-prices', methods=['POST'])
 def run_price_compaction():
     """
     Triggers the data compaction process for asset_prices.
-    Body: { "isin": "Optional ISIN", "dry_run": true/false }
+    Body: { "isin": "Optional ISIN", "dry_run": true/false, "async": true/false }
+    With async the run is queued on job_queue and 202 { job_id } is returned
+    (poll /api/jobs/<job_id>).
     """
     try:
-        from data_compaction import compact_prices
-        
         data = request.json or {}
         dry_run = data.get('dry_run', True)
         isin = data.get('isin')
         
-        stats = compact_prices(isin=isin, dry_run=dry_run)
-        return jsonify(stats)
+        if data.get('async'):
+            from job_queue import submit_job
+            job_id = submit_job('compaction', _compact_prices_job, isin, dry_run,
+                                dedup_key=f"{isin or '*'}:{bool(dry_run)}")
+            return jsonify(job_id=job_id), 202
+        return jsonify(_compact_prices_job(isin, dry_run))
     except Exception as e:
         logger.error(f"ADMIN COMPACTION ERROR: {e}")
         return jsonify(error=str(e)), 500
 
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def get_job_status(job_id):
+    """
+    Returns the state of a background job started through job_queue
+    (LLM report analysis, certificate refresh, compaction, valuation rebuild).
+    """
+    try:
+        from job_queue import get_job
+        job = get_job(job_id)
+        if not job:
+            return jsonify(error="Job not found"), 404
+        return jsonify(job)
+    except Exception as e:
+        logger.error(f"JOB STATUS ERROR: {e}")
+        return jsonify(error=str(e)), 500
+
+@app.route('/api/admin/rebuild-valuations', methods=['POST'])
+def rebuild_valuations_route():
+    """
+    Queues a rebuild of the persisted daily valuation series (portfolio_daily_valuations).
+    Body: { "portfolio_id": "Optional, all portfolios if missing", "from_date": "Optional YYYY-MM-DD" }
+    Goes through daily_valuation.schedule_rebuild, so it is coalesced with the rebuilds
+    queued by sync (one job per portfolio). job_id is null when the request was merged
+    into a rebuild already running; poll /api/jobs/<job_id> for the others.
+    """
+    try:
+        from daily_valuation import schedule_rebuild
+        from db_helper import fetch_all_rows
+
+        data = request.json or {}
+        portfolio_id = data.get('portfolio_id')
+        from_date = data.get('from_date')
+
+        if portfolio_id:
+            portfolio_ids = [portfolio_id]
+        else:
+            portfolio_ids = [r['id'] for r in fetch_all_rows('portfolios', params={'select': 'id'}, keyset=('id',))]
+
+        jobs = [{'portfolio_id': pid, 'job_id': schedule_rebuild(pid, from_date)} for pid in portfolio_ids]
+        return jsonify(jobs=jobs), 202
+    except Exception as e:
+        logger.error(f"ADMIN REBUILD VALUATIONS ERROR: {e}")
+        return jsonify(error=str(e)), 500
+
+@app.route('/api/admin/pool-stats', methods=['GET'])
+def get_pool_stats_route():
+    """
+    Returns HTTP connection pool utilisation (connections opened vs requests served per host).
+    """
+    try:
+        from db_helper import get_pool_stats
+        return jsonify(get_pool_stats())
+    except Exception as e:
+        logger.error(f"ADMIN POOL STATS ERROR: {e}")
+        return jsonify(error=str(e)), 500
+
+@app.route('/api/admin/cache-stats', methods=['GET'])
+def get_cache_stats_route():
+    """
+    Returns hit/miss counters of the in-process result caches
+    and of the LLM asset-info cache (hit ratio, estimated tokens saved).
+    """
+    try:
+        from result_cache import get_cache_stats
+        from llm_asset_info import get_llm_cache_stats
+        from cert_analyzer import quote_cache
+        return jsonify(caches=get_cache_stats() + [quote_cache.stats()], llm_asset_info=get_llm_cache_stats())
+    except Exception as e:
+        logger.error(f"ADMIN CACHE STATS ERROR: {e}")
+        return jsonify(error=str(e)), 500
+
+@app.route('/api/admin/materialized-views', methods=['GET', 'POST'])
+def materialized_views_route():
+    """
+    GET: per-view refresh state (pending/running in this process, last refresh,
+    staleness recorded in the database).
+    POST {"views": [...], "wait": bool}: queues a refresh (all views by default);
+    with wait=true it skips the debounce and waits for it.
+    """
+    try:
+        from mv_refresh import get_refresh_status, request_refresh, flush
+        if request.method == 'POST':
+            data = request.json or {}
+            views = data.get('views')
+            request_refresh(views=views)
+            if data.get('wait'):
+                flush(views)
+        return jsonify(get_refresh_status())
+    except Exception as e:
+        logger.error(f"ADMIN MV STATUS ERROR: {e}")
+        return jsonify(error=str(e)), 500
+
 
 if __name__ == '__main__':
     app.run(port=5328, debug=True)
@@ -6,6 +6,7 @@ Gestisce 3 casi distinti:
 - CASO 3: Aggiornamento Prezzi (default)
 """
 
+import os
 import pandas as pd
 import numpy as np
 from datetime import datetime
@@ -95,6 +96,140 @@ def parse_date(raw_date):
         return None
 
 
+# --- Parser vettoriali (colonna intera) ---
+# Stessi risultati di clean_money_value / parse_date applicati cella per cella, ma con
+# operazioni su stringhe/array di pandas; i pochi valori che il percorso vettoriale non
+# risolve passano comunque dalla funzione per-cella (stesso risultato garantito).
+
+DATE_FORMATS = ('%Y-%m-%d', '%d/%m/%Y', '%d-%m-%Y', '%d/%m/%y', '%d-%m-%y')
+DATE_SAMPLE_SIZE = 200  # Valori usati per riconoscere il formato prevalente della colonna
+
+# Regex equivalenti a quelle di datetime.strptime per i formati sopra (gruppi: anno, mese, giorno)
+_D = r'(3[01]|[12]\d|0[1-9]|[1-9]| [1-9])'
+_M = r'(1[0-2]|0[1-9]|[1-9])'
+_DATE_PATTERNS = {
+    '%Y-%m-%d': (rf'(\d\d\d\d)-{_M}-{_D}', (0, 1, 2)),
+    '%d/%m/%Y': (rf'{_D}/{_M}/(\d\d\d\d)', (2, 1, 0)),
+    '%d-%m-%Y': (rf'{_D}-{_M}-(\d\d\d\d)', (2, 1, 0)),
+    '%d/%m/%y': (rf'{_D}/{_M}/(\d\d)', (2, 1, 0)),
+    '%d-%m-%y': (rf'{_D}-{_M}-(\d\d)', (2, 1, 0)),
+}
+
+
+def _text_values(series):
+    """Valori non nulli della colonna come stringhe strip() (come str(val).strip())."""
+    return series[series.notna()].map(str).str.strip()
+
+
+def clean_money_series(series):
+    """
+    Versione vettoriale di clean_money_value su una colonna intera.
+    Ritorna una Series float con lo stesso indice.
+    """
+    if pd.api.types.is_bool_dtype(series) or pd.api.types.is_numeric_dtype(series):
+        return series.astype(float).fillna(0.0)
+
+    result = pd.Series(0.0, index=series.index)
+    present = series.notna()
+    if series.dtype == object:
+        # Numeri in colonne miste: float(val) diretto
+        is_num = present & series.map(lambda v: isinstance(v, (int, float)))
+        result[is_num] = series[is_num].astype(float)
+        present &= ~is_num
+    if not present.any():
+        return result
+
+    raw = series[present]
+    s = raw.map(str).str.strip().str.replace('€', '', regex=False).str.replace('$', '', regex=False).str.strip()
+
+    # Euristiche per separatori (come clean_money_value)
+    has_comma = s.str.contains(',', regex=False)
+    has_dot = s.str.contains('.', regex=False)
+    it_format = has_comma & has_dot & (s.str.rfind(',') > s.str.rfind('.'))   # 1.200,50
+    us_format = has_comma & has_dot & ~it_format                               # 1,200.50
+    s = s.where(~it_format, s.str.replace('.', '', regex=False))
+    s = s.where(~us_format, s.str.replace(',', '', regex=False))
+    s = s.str.replace(',', '.', regex=False)  # Solo virgola: standard IT, virgola = decimale
+
+    parsed = pd.to_numeric(s, errors='coerce')
+    failed = parsed.isna()
+    if failed.any():
+        parsed[failed] = raw[failed].map(clean_money_value)
+    result[present] = parsed.astype(float)
+    return result
+
+
+def _detect_date_format(text):
+    """Formato (tra DATE_FORMATS) che riconosce più valori di un campione della colonna."""
+    sample = text.head(DATE_SAMPLE_SIZE)
+    best, best_hits = None, 0
+    for fmt in DATE_FORMATS:
+        hits = int(sample.str.fullmatch(_DATE_PATTERNS[fmt][0]).sum())
+        if hits > best_hits:
+            best, best_hits = fmt, hits
+    return best
+
+
+def _parse_date_format(text, fmt):
+    """Date 'YYYY-MM-DD' per i valori che rispettano fmt (e sono date valide), NaN altrimenti."""
+    pattern, (y, m, d) = _DATE_PATTERNS[fmt]
+    parts = text.str.extract(f'^{pattern}$')
+    matched = parts[0].notna()
+    out = pd.Series(np.nan, index=text.index, dtype=object)
+    if not matched.any():
+        return out
+    parts = parts[matched]
+    year = parts[y].astype(int)
+    if fmt.endswith('%y'):
+        # Stessa regola di strptime: 00-68 -> 20xx, 69-99 -> 19xx
+        year = year + np.where(year <= 68, 2000, 1900)
+    dates = pd.to_datetime(pd.DataFrame({
+        'year': year, 'month': parts[m].str.strip().astype(int), 'day': parts[d].str.strip().astype(int)
+    }), errors='coerce')
+    valid = dates.notna()
+    out[dates.index[valid]] = dates[valid].dt.strftime('%Y-%m-%d')
+    return out
+
+
+def parse_date_series(series):
+    """
+    Versione vettoriale di parse_date su una colonna intera.
+    Il formato prevalente viene riconosciuto su un campione e applicato a tutta la
+    colonna; gli altri formati (in ordine di priorità) e infine parse_date per-cella
+    coprono i valori residui. Ritorna una Series di stringhe 'YYYY-MM-DD' o None.
+    """
+    result = pd.Series(None, index=series.index, dtype=object)
+    if pd.api.types.is_datetime64_any_dtype(series):
+        valid = series.notna()
+        result[valid] = series[valid].dt.strftime('%Y-%m-%d')
+        return result.astype(object).where(valid, None)
+
+    present = series.notna()
+    if series.dtype == object:
+        is_dt = present & series.map(lambda v: isinstance(v, datetime))
+        if is_dt.any():
+            result[is_dt] = series[is_dt].map(lambda v: v.strftime('%Y-%m-%d'))
+        present &= ~is_dt
+    if not present.any():
+        return result
+
+    text = _text_values(series[present])
+    detected = _detect_date_format(text)
+    formats = ([detected] if detected else []) + [f for f in DATE_FORMATS if f != detected]
+    for fmt in formats:
+        if text.empty:
+            break
+        parsed = _parse_date_format(text, fmt)
+        ok = parsed.notna()
+        result[parsed.index[ok]] = parsed[ok]
+        text = text[~ok]
+
+    # Residui (formati liberi): fallback per-cella con pd.to_datetime(dayfirst=True)
+    if not text.empty:
+        result[text.index] = series[text.index].map(parse_date)
+    return result.astype(object).where(result.notna(), None)
+
+
 def find_column(df_columns, candidates):
     """
     Trova la prima colonna che matcha uno dei candidati.
@@ -112,56 +247,224 @@ def normalize_columns(df):
     return df
 
 
+class _RowChecks:
+    """
+    Validazione vettoriale per riga: ogni controllo è una maschera sulle righe ancora
+    valide; le righe scartate ricevono lo stesso messaggio del parser per-riga
+    (un solo errore per riga, il primo controllo fallito) e gli errori sono
+    restituiti nell'ordine del file.
+    """
+
+    def __init__(self, df):
+        self.row_num = pd.Series(np.asarray(df.index) + 2)  # +2 per header e 0-index
+        self.data = df.reset_index(drop=True)
+        self.alive = pd.Series(True, index=self.data.index)
+        self._errors = []  # (posizione, messaggio)
+
+    def reject(self, mask, template, **fields):
+        """Scarta le righe valide dove mask è True; template usa {row} e i campi passati."""
+        if isinstance(mask, bool):
+            mask = pd.Series(mask, index=self.data.index)
+        hit = self.alive & mask.reindex(self.data.index, fill_value=False).astype(bool)
+        for pos in np.flatnonzero(hit.to_numpy()):
+            values = {k: v.get(pos) for k, v in fields.items()}
+            self._errors.append((pos, template.format(row=self.row_num[pos], **values)))
+        self.alive &= ~hit
+
+    def positions(self):
+        return np.flatnonzero(self.alive.to_numpy())
+
+    def errors(self):
+        return [msg for _, msg in sorted(self._errors, key=lambda e: e[0])]
+
+    def isin(self, isin_col):
+        """Controlli ISIN comuni ai tre parser; ritorna la colonna ISIN normalizzata."""
+        if not isin_col:
+            self.reject(True, "Riga {row}: ISIN mancante")
+            return pd.Series(dtype=object)
+        self.reject(self.data[isin_col].isna(), "Riga {row}: ISIN mancante")
+        isins = _text_values(self.data[isin_col]).str.upper()
+        self.reject(isins.str.len() < 5, "Riga {row}: ISIN non valido '{isin}'", isin=isins)
+        return isins
+
+
 # =============================================================================
 # MAIN DISPATCHER
 # =============================================================================
 
-def parse_portfolio_excel(file_stream, holdings_map=None):
+def parse_portfolio_excel(file_stream, holdings_map=None, chunk_size=None):
     """
     Dispatcher principale che analizza il file e delega al parser corretto.
     
-    Logica di identificazione:
+    Logica di identificazione (solo dalla riga di intestazione, vedi detect_file_type):
     1. Se presente "valore cedola (eur)" → CASO 2 (Cedole/Dividendi)
     2. Se presente "operazione" → CASO 1 (Acquisti/Vendite)
     3. Altrimenti → CASO 3 (Aggiornamento Prezzi)
     
+    Il file viene letto in streaming (read_file_chunks): le righe arrivano a blocchi di
+    chunk_size ai validatori del tipo rilevato, senza caricare tutto il foglio in memoria.
+    
     holdings_map: dict {isin: quantity} per validazione vendite.
     """
     try:
-        # Lettura file (Excel o CSV)
-        try:
-            df = pd.read_excel(file_stream)
-        except:
-            file_stream.seek(0)
-            df = pd.read_csv(file_stream, sep=None, engine='python')
+        columns, chunks = read_file_chunks(file_stream, chunk_size or INGEST_CHUNK_ROWS)
+        logger.info(f"Colonne rilevate nel file: {columns}")
         
-        df = normalize_columns(df)
-        cols = set(df.columns)
+        file_type = detect_file_type(columns)
+        logger.info(f"Tipo file rilevato: {FILE_TYPE_LABELS[file_type]}")
+        records_fn, finish_fn = _FILE_PARSERS[file_type]
         
-        if df.empty:
-            return {"data": [], "error": "Il file è vuoto o non contiene dati leggibili."}
-        
-        logger.info(f"Colonne rilevate nel file: {list(cols)}")
+        records, errors = [], []
+        total_rows = 0
+        for chunk in chunks:
+            total_rows += len(chunk)
+            chunk_records, chunk_errors = records_fn(chunk)
+            records.extend(chunk_records)
+            errors.extend(chunk_errors)
         
-        # CASO 2: Cedole/Dividendi (trigger: "valore cedola (eur)")
-        if "valore cedola (eur)" in cols:
-            logger.info("Tipo file rilevato: CEDOLE/DIVIDENDI")
-            return parse_dividends_file(df)
-        
-        # CASO 1: Acquisti/Vendite (trigger: "operazione")
-        if "operazione" in cols:
-            logger.info("Tipo file rilevato: ACQUISTI/VENDITE")
-            return parse_transactions_file(df, holdings_map)
+        if not columns or total_rows == 0:
+            return {"data": [], "error": "Il file è vuoto o non contiene dati leggibili."}
+        logger.info(f"INGEST: {total_rows} righe lette in streaming (chunk da {chunk_size or INGEST_CHUNK_ROWS})")
         
-        # CASO 3: Aggiornamento Prezzi (default)
-        logger.info("Tipo file rilevato: AGGIORNAMENTO PREZZI")
-        return parse_prices_file(df)
+        if file_type == 'TRANSACTIONS':
+            return finish_fn(records, errors, holdings_map)
+        return finish_fn(records, errors)
         
     except Exception as e:
         logger.error(f"Errore parsing file: {e}")
         return {"data": [], "error": str(e)}
 
 
+def detect_file_type(columns):
+    """Tipo di file dalla sola intestazione (nomi colonna già normalizzati)."""
+    cols = set(columns)
+    # CASO 2: Cedole/Dividendi (trigger: "valore cedola (eur)")
+    if "valore cedola (eur)" in cols:
+        return 'DIVIDENDS'
+    # CASO 1: Acquisti/Vendite (trigger: "operazione")
+    if "operazione" in cols:
+        return 'TRANSACTIONS'
+    # CASO 3: Aggiornamento Prezzi (default)
+    return 'PRICES'
+
+
+FILE_TYPE_LABELS = {
+    'DIVIDENDS': 'CEDOLE/DIVIDENDI',
+    'TRANSACTIONS': 'ACQUISTI/VENDITE',
+    'PRICES': 'AGGIORNAMENTO PREZZI',
+}
+
+
+# =============================================================================
+# LETTURA IN STREAMING
+# =============================================================================
+
+INGEST_CHUNK_ROWS = int(os.environ.get("INGEST_CHUNK_ROWS", 5000))
+CSV_DELIMITERS = (';', ',', '\t', '|')
+_ZIP_MAGIC = b'PK\x03\x04'          # xlsx (Office Open XML)
+_OLE_MAGIC = b'\xd0\xcf\x11\xe0'   # xls (formato binario legacy)
+
+
+def _normalized_header(values):
+    # Stessa convenzione di pandas per le intestazioni vuote ("Unnamed: n"), poi normalize_columns
+    return [str(v).strip().lower() if v is not None and str(v).strip() else f"unnamed: {i}"
+            for i, v in enumerate(values)]
+
+
+def _xlsx_chunks(file_stream, chunk_size):
+    """Foglio attivo in modalità read-only (openpyxl.iter_rows): memoria costante."""
+    from openpyxl import load_workbook
+    wb = load_workbook(file_stream, read_only=True, data_only=True)
+    rows = wb.active.iter_rows(values_only=True)
+    header = next(rows, None)
+    if header is None:
+        wb.close()
+        return [], iter(())
+    # Colonne vuote in coda all'intestazione ignorate (come pd.read_excel)
+    width = len(header)
+    while width and header[width - 1] is None:
+        width -= 1
+    columns = _normalized_header(header[:width])
+
+    def generate():
+        try:
+            buffer, blanks, offset = [], [], 0
+            for row in rows:
+                row = tuple(row[:width]) + (None,) * (width - len(row))
+                if all(v is None for v in row):
+                    # Righe vuote tenute solo se seguite da dati (pd.read_excel scarta quelle finali)
+                    blanks.append(row)
+                    continue
+                buffer.extend(blanks)
+                blanks = []
+                buffer.append(row)
+                if len(buffer) >= chunk_size:
+                    yield pd.DataFrame(buffer[:chunk_size], columns=columns, index=range(offset, offset + chunk_size))
+                    offset += chunk_size
+                    buffer = buffer[chunk_size:]
+            if buffer:
+                yield pd.DataFrame(buffer, columns=columns, index=range(offset, offset + len(buffer)))
+        finally:
+            wb.close()
+
+    return columns, generate()
+
+
+def _probe_delimiter(file_stream):
+    """Delimitatore CSV dalla riga di intestazione (il più frequente tra CSV_DELIMITERS)."""
+    head = file_stream.read(64 * 1024)
+    file_stream.seek(0)
+    if isinstance(head, bytes):
+        try:
+            head = head.decode('utf-8-sig')
+        except UnicodeDecodeError:
+            head = head.decode('latin-1')
+    first_line = head.splitlines()[0] if head else ''
+    counts = {d: first_line.count(d) for d in CSV_DELIMITERS}
+    best = max(counts, key=counts.get)
+    return best if counts[best] else ','
+
+
+def _csv_chunks(file_stream, chunk_size):
+    """CSV a blocchi con il parser C e delimitatore esplicito (niente sniffer python)."""
+    sep = _probe_delimiter(file_stream)
+    # Valori come testo: tipi coerenti tra chunk, la conversione la fanno i parser vettoriali
+    reader = pd.read_csv(file_stream, sep=sep, engine='c', chunksize=chunk_size, dtype=str)
+    first = next(reader, None)
+    if first is None:
+        return [], iter(())
+    first = normalize_columns(first)
+    columns = list(first.columns)
+
+    def generate():
+        yield first
+        for chunk in reader:
+            chunk.columns = columns
+            yield chunk
+
+    return columns, generate()
+
+
+def read_file_chunks(file_stream, chunk_size=INGEST_CHUNK_ROWS):
+    """
+    Legge un upload (xlsx, xls o CSV) a blocchi.
+    Ritorna (colonne normalizzate, generatore di DataFrame da chunk_size righe);
+    l'indice dei chunk è la posizione della riga nel file (numeri di riga negli errori).
+    """
+    magic = file_stream.read(4)
+    file_stream.seek(0)
+    if magic == _ZIP_MAGIC:
+        return _xlsx_chunks(file_stream, chunk_size)
+    if magic == _OLE_MAGIC:
+        # xls legacy: nessun reader in streaming, lettura completa in un solo chunk
+        df = normalize_columns(pd.read_excel(file_stream))
+        return list(df.columns), iter([df])
+    try:
+        return _csv_chunks(file_stream, chunk_size)
+    except pd.errors.EmptyDataError:
+        return [], iter(())
+
+
 # =============================================================================
 # CASO 1: ACQUISTI E VENDITE
 # =============================================================================
@@ -184,6 +487,12 @@ def parse_transactions_file(df, holdings_map=None):
     - Ordine cronologico per validare che non si vendano asset non posseduti
     - Quantità non può diventare negativa
     """
+    transactions, errors = _transaction_records(df)
+    return _finish_transactions(transactions, errors, holdings_map)
+
+
+def _transaction_records(df):
+    """Righe valide (dict) ed errori per riga di un DataFrame (o chunk) di transazioni."""
     col_map = {
         'isin': ['isin', 'codice isin'],
         'description': ['descrizione asset', 'descrizione', 'titolo', 'descrizione strumento', 'descrizione titolo'],
@@ -194,96 +503,86 @@ def parse_transactions_file(df, holdings_map=None):
         'asset_type': ['tipologia', 'tipo strumento', 'asset class', 'tipo']
     }
     
-    transactions = []
-    errors = []
-    
-    # Risolvi mappa colonne una sola volta (ottimizzazione: evita lookup ripetuto per riga)
+    # Risolvi mappa colonne una sola volta e valida per colonna (niente iterrows)
     resolved = {key: find_column(df.columns, candidates) for key, candidates in col_map.items()}
-    
-    for index, row in df.iterrows():
-        row_num = index + 2  # +2 per header e 0-index
-        
-        try:
-            # 1. ISIN (Obbligatorio)
-            isin_col = resolved['isin']
-            if not isin_col or pd.isna(row[isin_col]):
-                errors.append(f"Riga {row_num}: ISIN mancante")
-                continue
-            isin = str(row[isin_col]).strip().upper()
-            if len(isin) < 5:
-                errors.append(f"Riga {row_num}: ISIN non valido '{isin}'")
-                continue
-            
-            # 2. Descrizione (Obbligatorio)
-            desc_col = resolved['description']
-            if not desc_col or pd.isna(row[desc_col]):
-                errors.append(f"Riga {row_num}: Descrizione mancante per ISIN {isin}")
-                continue
-            description = str(row[desc_col]).strip()
-            
-            # 3. Quantità (Obbligatorio)
-            qty_col = resolved['quantity']
-            if not qty_col:
-                errors.append(f"Riga {row_num}: Colonna Quantità non trovata")
-                continue
-            quantity = clean_money_value(row[qty_col])
-            if quantity <= 0:
-                errors.append(f"Riga {row_num}: Quantità deve essere positiva per ISIN {isin}")
-                continue
-            
-            # 4. Data (Obbligatorio)
-            date_col = resolved['date']
-            if not date_col:
-                errors.append(f"Riga {row_num}: Colonna Data non trovata")
-                continue
-            date = parse_date(row[date_col])
-            if not date:
-                errors.append(f"Riga {row_num}: Data non valida per ISIN {isin}")
-                continue
-            
-            # 5. Prezzo (Obbligatorio)
-            price_col = resolved['price']
-            if not price_col:
-                errors.append(f"Riga {row_num}: Colonna Prezzo Operazione non trovata")
-                continue
-            price = clean_money_value(row[price_col])
-            
-            # 6. Operazione (Obbligatorio: "Acquisto" o "Vendita")
-            op_col = resolved['operation']
-            if not op_col or pd.isna(row[op_col]):
-                errors.append(f"Riga {row_num}: Operazione mancante per ISIN {isin}")
-                continue
-            operation = str(row[op_col]).strip().lower()
-            if operation not in ['acquisto', 'vendita']:
-                errors.append(f"Riga {row_num}: Operazione '{row[op_col]}' non valida. Usare 'Acquisto' o 'Vendita'")
-                continue
-            operation = 'Acquisto' if operation == 'acquisto' else 'Vendita'
-            
-            # 7. Tipologia (Obbligatorio per Acquisto, Opzionale per Vendita)
-            asset_type = None
-            type_col = resolved['asset_type']
-            
-            if type_col and pd.notna(row[type_col]):
-                asset_type = str(row[type_col]).strip()
-            
-            if operation == 'Acquisto' and not asset_type:
-                 errors.append(f"Riga {row_num}: Tipologia obbligatoria per Acquisto (ISIN {isin})")
-                 continue
-            
-            transactions.append({
-                'isin': isin,
-                'description': description,
-                'quantity': quantity,
-                'date': date,
-                'price': price,
-                'operation': operation,
-                'asset_type': asset_type
-            })
-            
-        except Exception as e:
-            errors.append(f"Riga {row_num}: Errore parsing - {str(e)}")
-            continue
-    
+    checks = _RowChecks(df)
+    data = checks.data
+    
+    # 1. ISIN (Obbligatorio)
+    isins = checks.isin(resolved['isin'])
+    
+    # 2. Descrizione (Obbligatorio)
+    desc_col = resolved['description']
+    missing_desc = data[desc_col].isna() if desc_col else True
+    checks.reject(missing_desc, "Riga {row}: Descrizione mancante per ISIN {isin}", isin=isins)
+    descriptions = _text_values(data[desc_col]) if desc_col else None
+    
+    # 3. Quantità (Obbligatorio)
+    qty_col = resolved['quantity']
+    if not qty_col:
+        checks.reject(True, "Riga {row}: Colonna Quantità non trovata")
+    else:
+        quantities = clean_money_series(data[qty_col])
+        checks.reject(quantities <= 0, "Riga {row}: Quantità deve essere positiva per ISIN {isin}", isin=isins)
+    
+    # 4. Data (Obbligatorio)
+    date_col = resolved['date']
+    if not date_col:
+        checks.reject(True, "Riga {row}: Colonna Data non trovata")
+    else:
+        dates = parse_date_series(data[date_col])
+        checks.reject(dates.isna(), "Riga {row}: Data non valida per ISIN {isin}", isin=isins)
+    
+    # 5. Prezzo (Obbligatorio)
+    price_col = resolved['price']
+    if not price_col:
+        checks.reject(True, "Riga {row}: Colonna Prezzo Operazione non trovata")
+    else:
+        prices = clean_money_series(data[price_col])
+    
+    # 6. Operazione (Obbligatorio: "Acquisto" o "Vendita")
+    op_col = resolved['operation']
+    if not op_col:
+        checks.reject(True, "Riga {row}: Operazione mancante per ISIN {isin}", isin=isins)
+    else:
+        checks.reject(data[op_col].isna(), "Riga {row}: Operazione mancante per ISIN {isin}", isin=isins)
+        raw_ops = data[op_col][data[op_col].notna()].map(str)
+        operations = raw_ops.str.strip().str.lower()
+        checks.reject(~operations.isin(['acquisto', 'vendita']),
+                      "Riga {row}: Operazione '{op}' non valida. Usare 'Acquisto' o 'Vendita'", op=raw_ops)
+        operations = operations.map({'acquisto': 'Acquisto', 'vendita': 'Vendita'})
+    
+    # 7. Tipologia (Obbligatoria per Acquisto, Opzionale per Vendita)
+    type_col = resolved['asset_type']
+    asset_types = _text_values(data[type_col]) if type_col else pd.Series(dtype=object)
+    has_type = (asset_types.str.len() > 0).reindex(data.index, fill_value=False)
+    if op_col:
+        checks.reject((operations == 'Acquisto').reindex(data.index, fill_value=False) & ~has_type,
+                      "Riga {row}: Tipologia obbligatoria per Acquisto (ISIN {isin})", isin=isins)
+    
+    errors = checks.errors()
+    valid = checks.positions()
+    asset_types = asset_types.reindex(data.index)
+    transactions = [
+        {
+            'isin': isin,
+            'description': description,
+            'quantity': quantity,
+            'date': date,
+            'price': price,
+            'operation': operation,
+            'asset_type': asset_type if isinstance(asset_type, str) else None
+        }
+        for isin, description, quantity, date, price, operation, asset_type in zip(
+            isins.loc[valid].tolist(), descriptions.loc[valid].tolist(), quantities.loc[valid].tolist(), dates.loc[valid].tolist(),
+            prices.loc[valid].tolist(), operations.loc[valid].tolist(), asset_types.loc[valid].tolist()
+        )
+    ] if len(valid) else []
+    return transactions, errors
+
+
+def _finish_transactions(transactions, errors, holdings_map=None):
+    """Validazione cronologica e risultato finale sulle transazioni di tutto il file."""
     if not transactions:
         return {
             "type": "TRANSACTIONS",
@@ -395,60 +694,53 @@ def parse_dividends_file(df):
     
     Nota: L'ISIN deve esistere in portafoglio (validato a livello API)
     """
+    dividends, errors = _dividend_records(df)
+    return _finish_dividends(dividends, errors)
+
+
+def _dividend_records(df):
+    """Righe valide (dict) ed errori per riga di un DataFrame (o chunk) di cedole."""
     col_map = {
         'isin': ['isin', 'codice isin'],
         'amount': ['valore cedola (eur)'],
         'date': ['data flusso', 'data stacco', 'data']
     }
     
-    dividends = []
-    errors = []
-    
-    # Risolvi mappa colonne una sola volta
+    # Risolvi mappa colonne una sola volta e valida per colonna (niente iterrows)
     resolved = {key: find_column(df.columns, candidates) for key, candidates in col_map.items()}
-    
-    for index, row in df.iterrows():
-        row_num = index + 2
-        
-        try:
-            # 1. ISIN (Obbligatorio)
-            isin_col = resolved['isin']
-            if not isin_col or pd.isna(row[isin_col]):
-                errors.append(f"Riga {row_num}: ISIN mancante")
-                continue
-            isin = str(row[isin_col]).strip().upper()
-            if len(isin) < 5:
-                errors.append(f"Riga {row_num}: ISIN non valido '{isin}'")
-                continue
-            
-            # 2. Valore Cedola (Obbligatorio - può essere negativo)
-            amount_col = resolved['amount']
-            if not amount_col:
-                errors.append(f"Riga {row_num}: Colonna 'Valore Cedola (EUR)' non trovata")
-                continue
-            # NON usiamo abs() - ammessi valori negativi per spese
-            amount = clean_money_value(row[amount_col])
-            
-            # 3. Data Flusso (Obbligatorio)
-            date_col = resolved['date']
-            if not date_col:
-                errors.append(f"Riga {row_num}: Colonna Data Flusso non trovata")
-                continue
-            date = parse_date(row[date_col])
-            if not date:
-                errors.append(f"Riga {row_num}: Data non valida per ISIN {isin}")
-                continue
-            
-            dividends.append({
-                'isin': isin,
-                'amount': amount,
-                'date': date
-            })
-            
-        except Exception as e:
-            errors.append(f"Riga {row_num}: Errore parsing - {str(e)}")
-            continue
-    
+    checks = _RowChecks(df)
+    data = checks.data
+    
+    # 1. ISIN (Obbligatorio)
+    isins = checks.isin(resolved['isin'])
+    
+    # 2. Valore Cedola (Obbligatorio - può essere negativo)
+    amount_col = resolved['amount']
+    if not amount_col:
+        checks.reject(True, "Riga {row}: Colonna 'Valore Cedola (EUR)' non trovata")
+    else:
+        # NON usiamo abs() - ammessi valori negativi per spese
+        amounts = clean_money_series(data[amount_col])
+    
+    # 3. Data Flusso (Obbligatorio)
+    date_col = resolved['date']
+    if not date_col:
+        checks.reject(True, "Riga {row}: Colonna Data Flusso non trovata")
+    else:
+        dates = parse_date_series(data[date_col])
+        checks.reject(dates.isna(), "Riga {row}: Data non valida per ISIN {isin}", isin=isins)
+    
+    errors = checks.errors()
+    valid = checks.positions()
+    dividends = [
+        {'isin': isin, 'amount': amount, 'date': date}
+        for isin, amount, date in zip(isins.loc[valid].tolist(), amounts.loc[valid].tolist(), dates.loc[valid].tolist())
+    ] if len(valid) else []
+    return dividends, errors
+
+
+def _finish_dividends(dividends, errors):
+    """Aggregazione e risultato finale sulle cedole di tutto il file."""
     # [NEW] Aggregazione: Somma valori per stesso ISIN, Data e Tipo nel file
     # Type is determined by sign: positive = DIVIDEND, negative = EXPENSE
     if dividends:
@@ -497,97 +789,87 @@ def parse_prices_file(df):
     - Solo asset in portafoglio vengono salvati (validato a livello API)
     - Stesso ISIN+data con prezzi diversi = warning
     """
+    rows, errors = _price_records(df)
+    return _finish_prices(rows, errors)
+
+
+def _price_records(df):
+    """Righe valide (isin, data, prezzo, descrizione) ed errori per riga di un DataFrame (o chunk) di prezzi."""
     col_map = {
         'isin': ['isin', 'codice isin'],
         'date': ['data', 'date'],
         'price': ['prezzo corrente (eur)', 'prezzo', 'chiusura', 'last', 'quotazione', 'ultimo']
     }
     
-    prices = []
-    errors = []
-    warnings = []
-    
-    # Traccia duplicati ISIN+data
-    seen_prices = {}  # (isin, date) -> price
-    
     # Campo Opzionale: Descrizione
     desc_keys = ['descrizione', 'titolo', 'descrizione asset', 'nome', 'descrizione titolo']
     
-    # Risolvi mappa colonne una sola volta
+    # Risolvi mappa colonne una sola volta e valida per colonna (niente iterrows)
     resolved = {key: find_column(df.columns, candidates) for key, candidates in col_map.items()}
     resolved_desc = find_column(df.columns, desc_keys)
+    checks = _RowChecks(df)
+    data = checks.data
+    
+    # 1. ISIN (Obbligatorio)
+    isins = checks.isin(resolved['isin'])
+    
+    # 2. Data (Obbligatorio)
+    date_col = resolved['date']
+    if not date_col:
+        checks.reject(True, "Riga {row}: Colonna Data non trovata")
+    else:
+        dates = parse_date_series(data[date_col])
+        checks.reject(dates.isna(), "Riga {row}: Data non valida per ISIN {isin}", isin=isins)
+    
+    # 3. Prezzo (Obbligatorio)
+    price_col = resolved['price']
+    if not price_col:
+        checks.reject(True, "Riga {row}: Colonna Prezzo non trovata")
+    else:
+        prices_col = clean_money_series(data[price_col])
+        checks.reject(prices_col <= 0, "Riga {row}: Prezzo deve essere positivo per ISIN {isin}", isin=isins)
+    
+    # 4. Descrizione (Opzionale)
+    descriptions = _text_values(data[resolved_desc]).reindex(data.index) if resolved_desc else pd.Series(None, index=data.index, dtype=object)
+    
+    errors = checks.errors()
+    valid = checks.positions()
+    rows = list(zip(isins.loc[valid].tolist(), dates.loc[valid].tolist(), prices_col.loc[valid].tolist(), descriptions.loc[valid].tolist())) if len(valid) else []
+    return rows, errors
+
+
+def _finish_prices(rows, errors):
+    """Deduplica ISIN+data e risultato finale sui prezzi di tutto il file."""
+    prices = []
+    warnings = []
     
-    for index, row in df.iterrows():
-        row_num = index + 2
+    # Traccia duplicati ISIN+data
+    seen_prices = {}  # (isin, date) -> price
+    
+    for isin, date, price, description in rows:
+        # Check duplicati ISIN+data con prezzi diversi
+        key = (isin, date)
+        if key in seen_prices:
+            if abs(seen_prices[key] - price) > 0.0001:
+                warnings.append(
+                    f"ISIN {isin} data {date}: prezzi multipli rilevati "
+                    f"({seen_prices[key]} vs {price}). Usato ultimo valore."
+                )
+                seen_prices[key] = price  # Usa ultimo
+            continue  # Skip duplicato
         
-        try:
-            # 1. ISIN (Obbligatorio)
-            isin_col = resolved['isin']
-            if not isin_col or pd.isna(row[isin_col]):
-                errors.append(f"Riga {row_num}: ISIN mancante")
-                continue
-            isin = str(row[isin_col]).strip().upper()
-            if len(isin) < 5:
-                errors.append(f"Riga {row_num}: ISIN non valido '{isin}'")
-                continue
-            
-            # 2. Data (Obbligatorio)
-            date_col = resolved['date']
-            if not date_col:
-                errors.append(f"Riga {row_num}: Colonna Data non trovata")
-                continue
-            date = parse_date(row[date_col])
-            if not date:
-                errors.append(f"Riga {row_num}: Data non valida per ISIN {isin}")
-                continue
-            
-            # 3. Prezzo (Obbligatorio)
-            price_col = resolved['price']
-            if not price_col:
-                errors.append(f"Riga {row_num}: Colonna Prezzo non trovata")
-                continue
-            price = clean_money_value(row[price_col])
-            
-            # [DEBUG] Log raw vs clean
-            # logger.debug(f"Row {row_num} ISIN {isin}: Raw price '{row[price_col]}' -> Clean {price}")
-
-            if price <= 0:
-                errors.append(f"Riga {row_num}: Prezzo deve essere positivo per ISIN {isin}")
-                continue
-            
-            # 4. Descrizione (Opzionale)
-            description = None
-            desc_col = resolved_desc
-            if desc_col and pd.notna(row[desc_col]):
-                description = str(row[desc_col]).strip()
-
-            # Check duplicati ISIN+data con prezzi diversi
-            key = (isin, date)
-            if key in seen_prices:
-                if abs(seen_prices[key] - price) > 0.0001:
-                    warnings.append(
-                        f"ISIN {isin} data {date}: prezzi multipli rilevati "
-                        f"({seen_prices[key]} vs {price}). Usato ultimo valore."
-                    )
-                    seen_prices[key] = price  # Usa ultimo
-                continue  # Skip duplicato
-            
-            seen_prices[key] = price
-            
-            item = {
-                'isin': isin,
-                'date': date,
-                'price': price,
-                'source': 'Manual Upload'
-            }
-            if description:
-                item['description'] = description
-                
-            prices.append(item)
+        seen_prices[key] = price
+        
+        item = {
+            'isin': isin,
+            'date': date,
+            'price': price,
+            'source': 'Manual Upload'
+        }
+        if isinstance(description, str) and description:
+            item['description'] = description
             
-        except Exception as e:
-            errors.append(f"Riga {row_num}: Errore parsing - {str(e)}")
-            continue
+        prices.append(item)
     
     logger.info(f"[DEBUG_PRICES] Found {len(prices)} valid price entries.")
     if prices:
@@ -609,3 +891,11 @@ def parse_prices_file(df):
         "warnings": warnings if warnings else None,
         "error": None
     }
+
+
+# Parser per tipo file: (righe + errori di un chunk, risultato finale su tutto il file)
+_FILE_PARSERS = {
+    'TRANSACTIONS': (_transaction_records, _finish_transactions),
+    'DIVIDENDS': (_dividend_records, _finish_dividends),
+    'PRICES': (_price_records, _finish_prices),
+}
@@ -0,0 +1,298 @@
+"""
+Background Job Queue
+
+Bounded worker pool plus pluggable job store for slow work started by an
+HTTP request and polled afterwards (LLM report analysis, certificate
+refresh, price compaction).
+
+- Bounded executor (JOB_WORKERS) instead of one raw thread per request.
+- Store selected by JOB_STORE:
+    * "memory" (default): process-local, finished jobs evicted after JOB_TTL_SECONDS.
+    * "db": table background_jobs, so status polling works from any worker
+      process and survives restarts. Expired rows are purged opportunistically.
+- Dedup: a job submitted with a dedup_key while an identical one (same kind
+  and key) is still active (pending or running) returns the existing job_id.
+  With the memory store the check and the creation run under one lock; with
+  the db store a partial unique index on active (kind, dedup_key) rejects the
+  second insert and the existing job_id is returned instead, so no lock is
+  held across the database round trips.
+- Heartbeat (db store): every JOB_HEARTBEAT_SECONDS a background thread
+  refreshes updated_at of the jobs queued or running in this process. An
+  active job whose updated_at is older than JOB_STALE_SECONDS belongs to a
+  process that stopped: get_job reports it failed and a new job with the same
+  dedup_key may replace it.
+
+Job states: "pending" (queued), "running", "completed", "failed".
+Results must be JSON-serializable (they are stored as JSONB with the db store).
+"""
+
+import contextlib
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from logger import logger
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", 4))
+JOB_STORE = os.environ.get("JOB_STORE", "memory").lower()
+JOB_TTL_SECONDS = int(os.environ.get("JOB_TTL_SECONDS", 3600))       # Job conclusi visibili per un'ora
+JOB_STALE_SECONDS = int(os.environ.get("JOB_STALE_SECONDS", 1800))   # Job attivi senza heartbeat oltre questa soglia = interrotti (es. restart)
+JOB_HEARTBEAT_SECONDS = int(os.environ.get("JOB_HEARTBEAT_SECONDS", 60))  # Deve restare ben sotto JOB_STALE_SECONDS
+JOBS_TABLE = 'background_jobs'
+
+PENDING, RUNNING, COMPLETED, FAILED = 'pending', 'running', 'completed', 'failed'
+ACTIVE = (PENDING, RUNNING)
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+class MemoryJobStore:
+    """Process-local store with TTL eviction of finished jobs."""
+
+    def __init__(self, ttl=JOB_TTL_SECONDS):
+        self.ttl = ttl
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def _evict(self):
+        cutoff = time.time() - self.ttl
+        for job_id in [j for j, v in self._jobs.items() if v['_finished'] and v['_finished'] < cutoff]:
+            del self._jobs[job_id]
+
+    def create(self, job):
+        with self._lock:
+            self._evict()
+            self._jobs[job['job_id']] = dict(job, _finished=None)
+        return True
+
+    def update(self, job_id, **fields):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(fields)
+            if fields.get('status') in (COMPLETED, FAILED):
+                job['_finished'] = time.time()
+
+    def get(self, job_id):
+        with self._lock:
+            self._evict()
+            job = self._jobs.get(job_id)
+            return {k: v for k, v in job.items() if not k.startswith('_')} if job else None
+
+    def find_pending(self, kind, dedup_key):
+        with self._lock:
+            for job in self._jobs.values():
+                if job['kind'] == kind and job['dedup_key'] == dedup_key and job['status'] in ACTIVE:
+                    return job['job_id']
+        return None
+
+    def touch(self, job_ids):
+        pass    # Nessuna soglia di staleness per i job in memoria
+
+
+class DbJobStore:
+    """Store on the background_jobs table, shared by every worker process."""
+
+    def _insert(self, row):
+        from db_helper import execute_request
+        res = execute_request(JOBS_TABLE, 'POST', body=row, headers={"Prefer": "return=minimal"})
+        if res is not None and res.status_code == 409:
+            return False
+        if res is None or res.status_code not in (200, 201, 204):
+            raise RuntimeError(f"Impossibile salvare il job {row['job_id']}: "
+                               f"HTTP {res.status_code if res is not None else 'n/a'}")
+        return True
+
+    def _expire_stale(self, kind, dedup_key):
+        """Marks as failed the active rows whose heartbeat stopped (process interrupted, see get_job)."""
+        from db_helper import execute_request
+        stale_before = (_now() - timedelta(seconds=JOB_STALE_SECONDS)).isoformat()
+        execute_request(JOBS_TABLE, 'PATCH', params={
+            'kind': f'eq.{kind}',
+            'dedup_key': f'eq.{dedup_key}',
+            'status': f'in.({",".join(ACTIVE)})',
+            'updated_at': f'lt.{stale_before}'
+        }, body={'status': FAILED, 'error': "Job interrotto (riavvio del server)", 'updated_at': _now().isoformat()})
+
+    def create(self, job):
+        """
+        Inserts the job. Returns False when an identical job (same kind and
+        dedup_key) is already active: the unique index rejects the insert.
+        """
+        from db_helper import delete_table
+        # Pulizia opportunistica dei job scaduti
+        delete_table(JOBS_TABLE, {'expires_at.lt': _now().isoformat()})
+        row = dict(job, expires_at=(_now() + timedelta(seconds=JOB_STALE_SECONDS + JOB_TTL_SECONDS)).isoformat())
+        if self._insert(row):
+            return True
+        if not job.get('dedup_key'):
+            raise RuntimeError(f"Impossibile salvare il job {job['job_id']}: conflitto")
+        # Il job attivo in conflitto può essere quello di un processo interrotto: lo chiude e riprova
+        self._expire_stale(job['kind'], job['dedup_key'])
+        return self._insert(row)
+
+    def update(self, job_id, **fields):
+        from db_helper import update_table
+        fields['updated_at'] = _now().isoformat()
+        if fields.get('status') in (COMPLETED, FAILED):
+            fields['expires_at'] = (_now() + timedelta(seconds=JOB_TTL_SECONDS)).isoformat()
+        if not update_table(JOBS_TABLE, fields, {'job_id': job_id}):
+            logger.error(f"JOBS: Failed to update job {job_id}")
+
+    def get(self, job_id):
+        from db_helper import execute_request
+        res = execute_request(JOBS_TABLE, 'GET', params={
+            'select': 'job_id,kind,status,result,error,dedup_key,created_at,updated_at',
+            'job_id': f'eq.{job_id}'
+        })
+        rows = res.json() if (res and res.status_code == 200) else []
+        return rows[0] if rows else None
+
+    def find_pending(self, kind, dedup_key):
+        from db_helper import execute_request
+        fresh_since = (_now() - timedelta(seconds=JOB_STALE_SECONDS)).isoformat()
+        res = execute_request(JOBS_TABLE, 'GET', params={
+            'select': 'job_id',
+            'kind': f'eq.{kind}',
+            'dedup_key': f'eq.{dedup_key}',
+            'status': f'in.({",".join(ACTIVE)})',
+            'updated_at': f'gt.{fresh_since}',
+            'limit': 1
+        })
+        rows = res.json() if (res and res.status_code == 200) else []
+        return rows[0]['job_id'] if rows else None
+
+    def touch(self, job_ids):
+        """Heartbeat: one PATCH refreshing updated_at of the given active jobs."""
+        from db_helper import execute_request
+        res = execute_request(JOBS_TABLE, 'PATCH', params={
+            'job_id': f'in.({",".join(job_ids)})',
+            'status': f'in.({",".join(ACTIVE)})'
+        }, body={'updated_at': _now().isoformat()}, headers={"Prefer": "return=minimal"})
+        if res is None or res.status_code not in (200, 204):
+            logger.error(f"JOBS: Heartbeat failed for {len(job_ids)} jobs: "
+                         f"HTTP {res.status_code if res is not None else 'n/a'}")
+
+
+_executor = None
+_store = None
+_lock = threading.Lock()
+_submit_lock = threading.Lock()     # Dedup atomica per MemoryJobStore
+_active = set()                     # job_id in coda o in esecuzione in questo processo
+_heartbeat = None
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+        return _executor
+
+
+def get_store():
+    global _store
+    with _lock:
+        if _store is None:
+            _store = DbJobStore() if JOB_STORE == 'db' else MemoryJobStore()
+        return _store
+
+
+def _heartbeat_loop():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        with _lock:
+            job_ids = list(_active)
+        if not job_ids:
+            continue
+        try:
+            get_store().touch(job_ids)
+        except Exception as e:
+            logger.error(f"JOBS: Heartbeat error: {e}")
+
+
+def _ensure_heartbeat():
+    global _heartbeat
+    with _lock:
+        if _heartbeat is None or not _heartbeat.is_alive():
+            _heartbeat = threading.Thread(target=_heartbeat_loop, name="job-heartbeat", daemon=True)
+            _heartbeat.start()
+
+
+def _run_job(job_id, kind, fn, args, kwargs):
+    store = get_store()
+    logger.info(f"JOBS: Start {kind} job {job_id}")
+    t0 = time.time()
+    try:
+        store.update(job_id, status=RUNNING)
+        result = fn(*args, **kwargs)
+        store.update(job_id, status=COMPLETED, result=result)
+        logger.info(f"JOBS: {kind} job {job_id} completed in {time.time() - t0:.2f}s")
+    except Exception as e:
+        logger.error(f"JOBS: {kind} job {job_id} failed: {e}")
+        store.update(job_id, status=FAILED, error=str(e))
+    finally:
+        with _lock:
+            _active.discard(job_id)
+
+
+def submit_job(kind, fn, *args, dedup_key=None, **kwargs):
+    """
+    Runs fn(*args, **kwargs) on the worker pool and returns its job_id.
+    If dedup_key is given and an identical job is still active, its job_id
+    is returned instead and fn is not run again.
+    """
+    store = get_store()
+    # MemoryJobStore: il lock rende atomico controllo+creazione. DbJobStore: decide
+    # l'indice unico sui job attivi (create() ritorna False al perdente), nessun lock
+    # tenuto durante le chiamate al database
+    with _submit_lock if isinstance(store, MemoryJobStore) else contextlib.nullcontext():
+        if dedup_key:
+            existing = store.find_pending(kind, dedup_key)
+            if existing:
+                logger.info(f"JOBS: Reusing active {kind} job {existing}")
+                return existing
+        job_id = str(uuid.uuid4())
+        now = _now().isoformat()
+        created = store.create({
+            'job_id': job_id,
+            'kind': kind,
+            'status': PENDING,
+            'result': None,
+            'error': None,
+            'dedup_key': dedup_key,
+            'created_at': now,
+            'updated_at': now
+        })
+        if not created:
+            existing = store.find_pending(kind, dedup_key)
+            if not existing:
+                raise RuntimeError(f"Job {kind} '{dedup_key}' in conflitto ma non trovato")
+            logger.info(f"JOBS: Reusing active {kind} job {existing} (created by another process)")
+            return existing
+    if isinstance(store, DbJobStore):
+        with _lock:
+            _active.add(job_id)
+        _ensure_heartbeat()
+    _get_executor().submit(_run_job, job_id, kind, fn, args, kwargs)
+    return job_id
+
+
+def get_job(job_id):
+    """Job state ({'job_id', 'kind', 'status', 'result', 'error', ...}) or None if unknown/expired."""
+    job = get_store().get(job_id)
+    if job and JOB_STORE == 'db' and job['status'] in ACTIVE and isinstance(job.get('updated_at'), str):
+        # Heartbeat fermo oltre la soglia: il processo che lo eseguiva è stato riavviato
+        try:
+            updated = datetime.fromisoformat(job['updated_at'].replace('Z', '+00:00'))
+            if _now() - updated > timedelta(seconds=JOB_STALE_SECONDS):
+                job = dict(job, status=FAILED, error="Job interrotto (riavvio del server)")
+        except ValueError:
+            pass
+    return job
@@ -7,9 +7,13 @@ during the ingestion phase when new assets are discovered.
 
 import os
 import json
+import hashlib
+import threading
+from datetime import datetime, timedelta, timezone
 import openai
 from logger import logger
 from llm_utils import call_llm
+from result_cache import TTLCache
 
 # Path to the DescrAsset.json template
 DESCR_ASSET_TEMPLATE_PATH = os.path.join(
@@ -19,6 +23,105 @@ DESCR_ASSET_TEMPLATE_PATH = os.path.join(
     'DescrAsset.json'
 )
 
+# --- Cache risposte LLM ---
+# Chiave (isin, model, template_hash): tabella DB condivisa con TTL + LRU di processo davanti.
+LLM_ASSET_CACHE_TTL_DAYS = int(os.environ.get("LLM_ASSET_CACHE_TTL_DAYS", 30))
+LLM_ASSET_CACHE_TABLE = 'llm_asset_info_cache'
+
+_lru = TTLCache(
+    "llm_asset_info",
+    maxsize=int(os.environ.get("LLM_ASSET_CACHE_MAXSIZE", 512)),
+    ttl=LLM_ASSET_CACHE_TTL_DAYS * 86400
+)
+_stats_lock = threading.Lock()
+_stats = {"memory_hits": 0, "db_hits": 0, "misses": 0, "tokens_saved": 0, "tokens_spent": 0}
+
+
+def _estimate_tokens(*texts) -> int:
+    # Stima ~4 caratteri per token: basta per le statistiche di risparmio
+    return sum(len(t or '') for t in texts) // 4
+
+
+def _template_hash(prompt_template: str, template: str, asset_name: str = None) -> str:
+    """Hash of everything in the prompt besides the ISIN (configured prompt, DescrAsset template, asset name)."""
+    parts = [prompt_template, template]
+    if '{nome_asset}' in prompt_template:
+        parts.append(asset_name or '')
+    return hashlib.sha256('\x00'.join(parts).encode('utf-8')).hexdigest()[:16]
+
+
+def _record(stat: str, tokens: int = 0):
+    with _stats_lock:
+        _stats[stat] += 1
+        if stat in ('memory_hits', 'db_hits'):
+            _stats['tokens_saved'] += tokens
+        elif stat == 'misses':
+            _stats['tokens_spent'] += tokens
+
+
+def _cache_get(key):
+    entry = _lru.get(key)
+    if entry is not None:
+        _record('memory_hits', entry['tokens_estimate'])
+        return entry['result']
+
+    isin, model, template_hash = key
+    try:
+        from db_helper import execute_request
+        res = execute_request(LLM_ASSET_CACHE_TABLE, 'GET', params={
+            'select': 'response_type,data,tokens_estimate',
+            'isin': f'eq.{isin}',
+            'model': f'eq.{model}',
+            'template_hash': f'eq.{template_hash}',
+            'expires_at': f"gt.{datetime.now(timezone.utc).isoformat()}"
+        })
+        rows = res.json() if (res and res.status_code == 200) else []
+    except Exception as e:
+        logger.warning(f"LLM ASSET INFO: Cache lookup failed for {isin}: {e}")
+        rows = []
+    if not rows:
+        return None
+
+    entry = {
+        "result": {"response_type": rows[0]['response_type'], "data": rows[0]['data']},
+        "tokens_estimate": rows[0].get('tokens_estimate') or 0
+    }
+    _lru.set(key, entry)
+    _record('db_hits', entry['tokens_estimate'])
+    return entry['result']
+
+
+def _cache_put(key, result: dict, tokens_estimate: int):
+    _lru.set(key, {"result": result, "tokens_estimate": tokens_estimate})
+    isin, model, template_hash = key
+    try:
+        from db_helper import upsert_table
+        now = datetime.now(timezone.utc)
+        upsert_table(LLM_ASSET_CACHE_TABLE, {
+            'isin': isin,
+            'model': model,
+            'template_hash': template_hash,
+            'response_type': result['response_type'],
+            'data': result['data'],
+            'tokens_estimate': tokens_estimate,
+            'created_at': now.isoformat(),
+            'expires_at': (now + timedelta(days=LLM_ASSET_CACHE_TTL_DAYS)).isoformat()
+        }, on_conflict='isin,model,template_hash')
+    except Exception as e:
+        logger.warning(f"LLM ASSET INFO: Cache write failed for {isin}: {e}")
+
+
+def get_llm_cache_stats() -> dict:
+    """Hit ratio and estimated token savings of the LLM asset-info cache."""
+    with _stats_lock:
+        stats = dict(_stats)
+    lookups = stats['memory_hits'] + stats['db_hits'] + stats['misses']
+    stats['hit_ratio'] = round((stats['memory_hits'] + stats['db_hits']) / lookups, 4) if lookups else 0.0
+    stats['lru'] = _lru.stats()
+    stats['ttl_days'] = LLM_ASSET_CACHE_TTL_DAYS
+    return stats
+
+
 def load_descr_asset_template() -> str:
     """Load the DescrAsset.json template file."""
     try:
@@ -29,14 +132,19 @@ def load_descr_asset_template() -> str:
         return None
 
 
-def fetch_asset_info_from_llm(isin: str, model: str = None, asset_name: str = None) -> dict:
+def fetch_asset_info_from_llm(isin: str, model: str = None, asset_name: str = None, raise_rate_limit: bool = False) -> dict:
     """
     Fetch asset information from LLM for a given ISIN.
     
+    Results are cached by (ISIN, model, template hash): in-process LRU first,
+    then the llm_asset_info_cache table, and only then the model is called.
+    
     Args:
         isin: The ISIN code of the asset
         model: Optional model override. If None, uses gpt-4o-mini as default.
         asset_name: Optional asset name for {nome_asset} placeholder
+        raise_rate_limit: If True, openai.RateLimitError is re-raised so the caller
+                          can retry (used by the llm_enrichment queue)
         
     Returns:
         dict: Parsed JSON with asset metadata, or None if failed
@@ -47,12 +155,6 @@ def fetch_asset_info_from_llm(isin: str, model: str = None, asset_name: str = No
         if not template:
             return None
         
-        # Get API key from environment
-        api_key = os.getenv('OPENAI_API_KEY')
-        if not api_key:
-            logger.error("LLM ASSET INFO: No OPENAI_API_KEY configured")
-            return None
-        
         # Try to fetch global config (model, prompt, reasoning_effort) from DB
         prompt_template = "Analizza questo asset finanziario: {isin}" # Default fallback
         reasoning_effort = 'medium' # Default for GPT-5 Mini
@@ -94,11 +196,26 @@ def fetch_asset_info_from_llm(isin: str, model: str = None, asset_name: str = No
             name_to_use = asset_name or isin  # Fallback to ISIN if no name provided
             final_prompt = final_prompt.replace('{nome_asset}', name_to_use)
 
+        # Cache: stesso ISIN, modello e prompt -> nessuna chiamata al modello
+        cache_key = (isin, model_to_use, _template_hash(prompt_template, template, asset_name or isin))
+        cached = _cache_get(cache_key)
+        if cached is not None:
+            logger.info(f"LLM ASSET INFO: Cache hit for {isin} ({model_to_use})")
+            return cached
+        
+        # Get API key from environment
+        api_key = os.getenv('OPENAI_API_KEY')
+        if not api_key:
+            logger.error("LLM ASSET INFO: No OPENAI_API_KEY configured")
+            return None
+
         # Chiamata centralizzata
         response_text = call_llm(final_prompt, temperature_override=0.1)
         
         if not response_text:
             return None
+        tokens_estimate = _estimate_tokens(final_prompt, response_text)
+        _record('misses', tokens_estimate)
             
         original_response = response_text
         
@@ -118,26 +235,30 @@ def fetch_asset_info_from_llm(isin: str, model: str = None, asset_name: str = No
             parsed_type = metadata.get('assetType', 'N/A')
             logger.info(f"LLM RESPONSE [ISIN: {isin}] - Parsed Valid JSON. AssetType: {parsed_type}, MatchISIN: {parsed_isin == isin}")
             
-            return {
+            result = {
                 "response_type": "json",
                 "data": metadata
             }
         except json.JSONDecodeError:
             logger.warning(f"LLM RESPONSE [ISIN: {isin}] - Failed to parse JSON. Returning raw text.")
-            return {
+            result = {
                 "response_type": "text",
                 "data": original_response
             }
-                
         except openai.APIStatusError as e:
             logger.error(f"LLM API ERROR [ISIN: {isin}] - Status: {e.status_code}")
             logger.error(f"  > Message: {e.message}")
             return None
 
+        _cache_put(cache_key, result, tokens_estimate)
+        return result
+
     except openai.AuthenticationError:
         logger.error("LLM ASSET INFO: OpenAI authentication failed - invalid API key")
         return None
     except openai.RateLimitError:
+        if raise_rate_limit:
+            raise
         logger.error(f"LLM ASSET INFO: Rate limit exceeded for {isin}")
         return None
     except Exception as e:
@@ -147,7 +268,8 @@ def fetch_asset_info_from_llm(isin: str, model: str = None, asset_name: str = No
 
 def fetch_asset_info_batch(isins: list, model: str = None) -> dict:
     """
-    Fetch asset information for multiple ISINs.
+    Fetch asset information for multiple ISINs in parallel, on the enrichment
+    worker pool (per-model concurrency limits, retry on rate limits).
     
     Args:
         isins: List of ISIN codes
@@ -156,9 +278,6 @@ def fetch_asset_info_batch(isins: list, model: str = None) -> dict:
     Returns:
         dict: Mapping of ISIN -> metadata dict
     """
-    results = {}
-    for isin in isins:
-        metadata = fetch_asset_info_from_llm(isin, model)
-        if metadata:
-            results[isin] = metadata
-    return results
+    from llm_enrichment import fetch_many
+
+    return {isin: metadata for isin, metadata in fetch_many(isins, model).items() if metadata}
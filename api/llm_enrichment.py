@@ -0,0 +1,240 @@
+"""
+LLM Asset Enrichment Queue
+
+Background queue that fetches LLM asset information for newly created assets
+(see llm_asset_info.fetch_asset_info_from_llm) and persists each result as
+soon as it completes, so /api/sync no longer waits for sequential LLM calls.
+
+- Bounded worker pool (LLM_ENRICH_WORKERS).
+- Per-model concurrency limits (LLM_MODEL_CONCURRENCY, default for every model,
+  overridable per model with LLM_MODEL_CONCURRENCY_OVERRIDES="gpt-5=1,gpt-4o-mini=4").
+- Retry with exponential backoff (and Retry-After when provided) on openai.RateLimitError.
+- Progress per batch exposed by get_enrichment_status() for the status endpoint.
+
+NOTE: the queue is process-local, like result_cache: the status endpoint
+reports the batches of the worker that served the sync.
+"""
+
+import os
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import openai
+from logger import logger
+
+LLM_ENRICH_WORKERS = int(os.environ.get("LLM_ENRICH_WORKERS", 4))
+LLM_MODEL_CONCURRENCY = int(os.environ.get("LLM_MODEL_CONCURRENCY", 2))
+LLM_MAX_RETRIES = int(os.environ.get("LLM_MAX_RETRIES", 5))
+LLM_BACKOFF_BASE = float(os.environ.get("LLM_BACKOFF_BASE", 2.0))   # Secondi, raddoppia a ogni tentativo
+LLM_BACKOFF_MAX = float(os.environ.get("LLM_BACKOFF_MAX", 60.0))
+BATCH_RETENTION_SECONDS = 3600  # Batch completati visibili nello status per un'ora
+
+
+def _parse_overrides(raw):
+    overrides = {}
+    for item in (raw or '').split(','):
+        if '=' in item:
+            name, limit = item.split('=', 1)
+            try:
+                overrides[name.strip()] = max(1, int(limit))
+            except ValueError:
+                logger.warning(f"LLM ENRICH: Invalid concurrency override '{item}'")
+    return overrides
+
+MODEL_CONCURRENCY_OVERRIDES = _parse_overrides(os.environ.get("LLM_MODEL_CONCURRENCY_OVERRIDES"))
+
+_executor = None
+_lock = threading.Lock()
+_model_semaphores = {}   # model -> BoundedSemaphore
+_batches = {}            # batch_id -> stato del batch
+_in_flight = {}          # isin -> batch_id (dedup: un ISIN già in coda non viene riaccodato)
+
+
+def _get_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=LLM_ENRICH_WORKERS, thread_name_prefix="llm-enrich")
+        return _executor
+
+
+def _get_model_semaphore(model):
+    with _lock:
+        sem = _model_semaphores.get(model)
+        if sem is None:
+            sem = threading.BoundedSemaphore(MODEL_CONCURRENCY_OVERRIDES.get(model, LLM_MODEL_CONCURRENCY))
+            _model_semaphores[model] = sem
+        return sem
+
+
+def _resolve_model(model=None):
+    """Model used by call_llm: explicit override or the global openai_config model."""
+    if model:
+        return model
+    try:
+        from db_helper import get_config
+        cfg = get_config('openai_config') or {}
+        return cfg.get('model') or 'gpt-4o-mini'
+    except Exception:
+        return 'gpt-4o-mini'
+
+
+def _retry_delay(error, attempt):
+    """Backoff esponenziale con jitter; usa Retry-After se l'API lo fornisce."""
+    try:
+        retry_after = error.response.headers.get('retry-after')
+        if retry_after:
+            return min(float(retry_after), LLM_BACKOFF_MAX)
+    except Exception:
+        pass
+    return min(LLM_BACKOFF_BASE * (2 ** attempt), LLM_BACKOFF_MAX) * random.uniform(0.8, 1.2)
+
+
+def fetch_with_limits(isin, model=None, asset_name=None):
+    """
+    Calls fetch_asset_info_from_llm under the model concurrency limit,
+    retrying with backoff on rate limits. Returns the LLM result or None.
+    """
+    from llm_asset_info import fetch_asset_info_from_llm
+
+    model = _resolve_model(model)
+    semaphore = _get_model_semaphore(model)
+    for attempt in range(LLM_MAX_RETRIES + 1):
+        with semaphore:
+            try:
+                return fetch_asset_info_from_llm(isin, model, asset_name=asset_name, raise_rate_limit=True)
+            except openai.RateLimitError as e:
+                if attempt == LLM_MAX_RETRIES:
+                    logger.error(f"LLM ENRICH: Rate limit for {isin}, giving up after {attempt + 1} attempts")
+                    return None
+                delay = _retry_delay(e, attempt)
+        # Attesa fuori dal semaforo: gli altri ISIN dello stesso modello possono procedere
+        logger.warning(f"LLM ENRICH: Rate limit for {isin} ({model}), retry {attempt + 1}/{LLM_MAX_RETRIES} in {delay:.1f}s")
+        time.sleep(delay)
+    return None
+
+
+def fetch_many(isins, model=None):
+    """Runs fetch_with_limits for several ISINs on the worker pool and waits for all results."""
+    futures = {isin: _get_executor().submit(fetch_with_limits, isin, model) for isin in dict.fromkeys(isins)}
+    return {isin: future.result() for isin, future in futures.items()}
+
+
+def _persist_result(asset, llm_result):
+    """Saves the LLM result on the asset (same format previously written by /api/sync)."""
+    from db_helper import execute_request, update_table
+
+    if llm_result.get('response_type') == 'json':
+        # Merge con i metadata correnti (es. assetType), riletti perché nel frattempo possono cambiare
+        current_meta = asset.get('metadata') or {}
+        res = execute_request('assets', 'GET', params={'select': 'metadata', 'id': f"eq.{asset['id']}"})
+        if res and res.status_code == 200 and res.json():
+            current_meta = res.json()[0].get('metadata') or {}
+        if not isinstance(current_meta, dict):
+            current_meta = {}
+        return update_table('assets', {
+            "metadata": {**current_meta, **llm_result['data']},
+            "metadata_text": None
+        }, {'id': asset['id']})
+
+    if llm_result.get('response_type') == 'text':
+        return update_table('assets', {
+            "metadata": None,
+            "metadata_text": llm_result['data']
+        }, {'id': asset['id']})
+    return False
+
+
+def _enrich_one(batch_id, asset):
+    isin = asset['isin']
+    _set_item_status(batch_id, isin, 'running')
+    status = 'failed'
+    try:
+        llm_result = fetch_with_limits(isin, asset_name=asset.get('name'))
+        if llm_result and _persist_result(asset, llm_result):
+            status = 'done'
+            logger.info(f"LLM ENRICH: Saved {llm_result.get('response_type')} metadata for {isin}")
+            try:
+                from result_cache import bump_data_version
+                bump_data_version()
+            except Exception:
+                pass
+    except Exception as e:
+        logger.error(f"LLM ENRICH: Failed for {isin}: {e}")
+    finally:
+        _set_item_status(batch_id, isin, status)
+        with _lock:
+            if _in_flight.get(isin) == batch_id:
+                del _in_flight[isin]
+
+
+def _set_item_status(batch_id, isin, status):
+    with _lock:
+        batch = _batches.get(batch_id)
+        if batch is None:
+            return
+        batch['items'][isin] = status
+        if status in ('done', 'failed'):
+            batch[status] += 1
+            if batch['done'] + batch['failed'] == batch['total']:
+                batch['status'] = 'completed'
+                batch['finished_at'] = time.time()
+
+
+def _prune_batches():
+    cutoff = time.time() - BATCH_RETENTION_SECONDS
+    for batch_id in [b for b, v in _batches.items() if v.get('finished_at') and v['finished_at'] < cutoff]:
+        del _batches[batch_id]
+
+
+def enqueue_asset_enrichment(assets, portfolio_id=None):
+    """
+    Queues LLM enrichment for the given asset rows ({'id', 'isin', 'name', 'metadata'}).
+    ISINs already queued or running are skipped.
+
+    Returns:
+        str|None: batch id to poll with get_enrichment_status, or None if nothing was queued.
+    """
+    batch_id = uuid.uuid4().hex
+    with _lock:
+        _prune_batches()
+        to_queue = [a for a in assets if a.get('isin') and a['isin'] not in _in_flight]
+        if not to_queue:
+            return None
+        for a in to_queue:
+            _in_flight[a['isin']] = batch_id
+        _batches[batch_id] = {
+            'batch_id': batch_id,
+            'portfolio_id': portfolio_id,
+            'status': 'running',
+            'total': len(to_queue),
+            'done': 0,
+            'failed': 0,
+            'items': {a['isin']: 'queued' for a in to_queue},
+            'created_at': time.time(),
+            'finished_at': None
+        }
+
+    executor = _get_executor()
+    for a in to_queue:
+        executor.submit(_enrich_one, batch_id, a)
+    logger.info(f"LLM ENRICH: Queued {len(to_queue)} assets (batch {batch_id})")
+    return batch_id
+
+
+def get_enrichment_status(batch_id=None, portfolio_id=None):
+    """Progress of one batch, or of all retained batches (optionally for one portfolio)."""
+    with _lock:
+        if batch_id:
+            batch = _batches.get(batch_id)
+            return dict(batch, items=dict(batch['items'])) if batch else None
+        batches = [dict(b, items=dict(b['items'])) for b in _batches.values()
+                   if portfolio_id is None or b['portfolio_id'] == portfolio_id]
+    return {
+        'batches': batches,
+        'queued_or_running': sum(b['total'] - b['done'] - b['failed'] for b in batches),
+        'workers': LLM_ENRICH_WORKERS
+    }
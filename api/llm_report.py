@@ -1,6 +1,4 @@
-import threading
-import uuid
-import time
+import hashlib
 from flask import Blueprint, jsonify, request
 from logger import logger
 import os
@@ -8,33 +6,19 @@ import openai
 import traceback
 import json
 from llm_utils import call_llm
+from job_queue import submit_job, get_job
 
 llm_report_bp = Blueprint('llm_report', __name__)
 
-# Store globale per i Job LLM (in-memory)
-# Struttura: { job_id: { "status": "pending|completed|failed", "result": "...", "error": "..." } }
-llm_jobs = {}
-llm_jobs_lock = threading.Lock()
+# I job girano sul pool di job_queue (store in-memory o tabella background_jobs)
+LLM_JOB_KIND = 'llm_report'
 
-def _run_llm_task(job_id, prompt, system_prompt):
+def _run_llm_task(prompt, system_prompt):
     """Esegue la chiamata LLM in background."""
-    try:
-        logger.info(f"[LLM_JOB] Inizio Task {job_id}")
-        analysis_text = call_llm(prompt, system_prompt=system_prompt)
-        
-        with llm_jobs_lock:
-            if analysis_text:
-                llm_jobs[job_id]["status"] = "completed"
-                llm_jobs[job_id]["result"] = analysis_text
-            else:
-                llm_jobs[job_id]["status"] = "failed"
-                llm_jobs[job_id]["error"] = "L'LLM non ha restituito alcun contenuto"
-        logger.info(f"[LLM_JOB] Task {job_id} completato con successo.")
-    except Exception as e:
-        logger.error(f"[LLM_JOB] Errore nel Task {job_id}: {e}")
-        with llm_jobs_lock:
-            llm_jobs[job_id]["status"] = "failed"
-            llm_jobs[job_id]["error"] = str(e)
+    analysis_text = call_llm(prompt, system_prompt=system_prompt)
+    if not analysis_text:
+        raise ValueError("L'LLM non ha restituito alcun contenuto")
+    return analysis_text
 
 @llm_report_bp.route('/api/report/llm-analysis/start', methods=['POST'])
 def start_llm_analysis():
@@ -88,13 +72,9 @@ def start_llm_analysis():
         
         system_prompt = "Sei un analista finanziario senior di alto livello, esperto in sintesi macroeconomiche."
         
-        job_id = str(uuid.uuid4())
-        with llm_jobs_lock:
-            llm_jobs[job_id] = {"status": "pending", "result": None, "error": None}
-        
-        # Avvio thread
-        thread = threading.Thread(target=_run_llm_task, args=(job_id, prompt, system_prompt))
-        thread.start()
+        # Prompt identico già in corso -> stesso job
+        dedup_key = hashlib.sha256(f"{system_prompt}\x00{prompt}".encode('utf-8')).hexdigest()
+        job_id = submit_job(LLM_JOB_KIND, _run_llm_task, prompt, system_prompt, dedup_key=dedup_key)
         
         return jsonify({"job_id": job_id}), 202
 
@@ -105,11 +85,10 @@ def start_llm_analysis():
 @llm_report_bp.route('/api/report/llm-analysis/status/<job_id>', methods=['GET'])
 def get_llm_analysis_status(job_id):
     """Ritorna lo stato di un job LLM."""
-    with llm_jobs_lock:
-        job = llm_jobs.get(job_id)
-        if not job:
-            return jsonify(error="Job non trovato"), 404
-        return jsonify(job), 200
+    job = get_job(job_id)
+    if not job or job.get('kind') != LLM_JOB_KIND:
+        return jsonify(error="Job non trovato"), 404
+    return jsonify(status=job['status'], result=job.get('result'), error=job.get('error')), 200
 
 # Mantengo la rotta originale ma la trasformo in un alias del flusso asincrono 
 # se possibile, oppure la lascio per ora finché non aggiorno il frontend.
@@ -1,7 +1,8 @@
 
 from flask import Blueprint, request, jsonify
-from db_helper import execute_request, upsert_table
+from db_helper import upsert_table, fetch_all_rows, execute_batch
 from logger import logger
+from price_manager import get_latest_prices_batch
 from finance import get_tiered_mwr
 import pandas as pd
 import numpy as np
@@ -13,27 +14,23 @@ def compute_memory_data(portfolio_id, mwr_t1=30, mwr_t2=365):
     """
     Core calculation logic for the memory page table data.
     """
-    # 1. Fetch Transactions (Optimized: Single Query)
-    res_trans = execute_request('transactions', 'GET', params={
-        'select': 'quantity,price_eur,type,date,asset_id,assets(isin,name,asset_class,metadata,last_trend_variation)',
-        'portfolio_id': f'eq.{portfolio_id}'
-    })
-    
-    transactions = res_trans.json() if (res_trans and res_trans.status_code == 200) else []
-    logger.info(f"MEMORY DEBUG: Portfolio {portfolio_id} - Fetched {len(transactions)} transactions. Status: {res_trans.status_code if res_trans else 'None'}")
-    
-    # 2. Fetch Dividends
-    res_divs = execute_request('dividends', 'GET', params={
-        'select': 'amount_eur,date,asset_id',
-        'portfolio_id': f'eq.{portfolio_id}'
-    })
-    dividends = res_divs.json() if (res_divs and res_divs.status_code == 200) else []
-    
-    # 3. Fetch Asset Notes
-    res_notes = execute_request('asset_notes', 'GET', params={
-        'select': 'asset_id,note',
-        'portfolio_id': f'eq.{portfolio_id}'
-    })
+    # 1-3. Transazioni, Dividendi e Note: query indipendenti eseguite in parallelo.
+    # [PERF] fetch_all pagina oltre il max-rows di PostgREST (risultati completi)
+    transactions, dividends, res_notes = execute_batch([
+        lambda: fetch_all_rows('transactions', params={
+            'select': 'quantity,price_eur,type,date,asset_id,assets(isin,name,asset_class,metadata,last_trend_variation)',
+            'portfolio_id': f'eq.{portfolio_id}'
+        }, keyset=('date', 'id')),
+        lambda: fetch_all_rows('dividends', params={
+            'select': 'amount_eur,date,asset_id',
+            'portfolio_id': f'eq.{portfolio_id}'
+        }, keyset=('date', 'id')),
+        {'endpoint': 'asset_notes', 'params': {
+            'select': 'asset_id,note',
+            'portfolio_id': f'eq.{portfolio_id}'
+        }}
+    ])
+    logger.info(f"MEMORY DEBUG: Portfolio {portfolio_id} - Fetched {len(transactions)} transactions.")
     
     rows_notes = res_notes.json() if (res_notes and res_notes.status_code == 200) else []
     notes_map = {n['asset_id']: n['note'] for n in rows_notes}
@@ -44,23 +41,8 @@ def compute_memory_data(portfolio_id, mwr_t1=30, mwr_t2=365):
         if t.get('assets') and t['assets'].get('isin'):
             all_isins.add(t['assets']['isin'])
     
-    price_map = {}
-    if all_isins:
-        in_filter = f"in.({','.join(list(all_isins))})"
-        res_prices = execute_request('asset_prices', 'GET', params={
-            'select': 'isin,price,date',
-            'isin': in_filter,
-            'order': 'date.desc'
-        })
-        
-        rows_prices = res_prices.json() if (res_prices and res_prices.status_code == 200) else []
-        
-        # Keep only the first (latest) price for each ISIN
-        seen_isins = set()
-        for p in rows_prices:
-            if p['isin'] not in seen_isins:
-                price_map[p['isin']] = {'price': float(p['price']), 'date': p['date']}
-                seen_isins.add(p['isin'])
+    # Solo prezzi espliciti (asset_prices): una riga per ISIN calcolata dal database
+    price_map = get_latest_prices_batch(list(all_isins), include_transactions=False)
 
     # --- Aggregation / Calculation in Python ---
     assets_stats = {}
@@ -0,0 +1,198 @@
+"""
+Materialized View Refresh Service
+
+Debounced, off-request refresh of the materialized views
+(portfolio_holdings, dividend_totals, portfolio_stats).
+
+- Writers call request_refresh(<changed tables>) instead of refreshing inline:
+  requests arriving within MV_REFRESH_DEBOUNCE seconds of each other are
+  coalesced into one refresh per view (at most MV_REFRESH_MAX_DELAY after the
+  first one), run by a background worker.
+- Each view is refreshed on its own (RPC refresh_materialized_view, REFRESH ...
+  CONCURRENTLY, so readers are never blocked), and only the views depending
+  on the changed tables.
+- Staleness is tracked per view: in process (pending since / last refresh /
+  last error, get_refresh_status) and in the database (materialized_view_status,
+  shared by every worker process).
+- Request-path readers never wait for a refresh: a stale view is detected in
+  the database (e.g. portfolio_holdings_snapshot) and they fall back to the
+  source tables. flush(views) starts the pending refreshes immediately and
+  waits for them (up to MV_FRESH_WAIT seconds), for maintenance callers such
+  as the admin endpoint.
+
+NOTE: the queue is process-local, like job_queue's memory store: a refresh
+still pending when the process stops is lost. Readers that detect a stale view
+(see holdings.get_holdings_snapshot) request it again.
+"""
+
+import os
+import threading
+import time
+
+from logger import logger
+
+MV_REFRESH_DEBOUNCE = float(os.environ.get("MV_REFRESH_DEBOUNCE", 2.0))     # Secondi di quiete prima del refresh
+MV_REFRESH_MAX_DELAY = float(os.environ.get("MV_REFRESH_MAX_DELAY", 15.0))  # Ritardo massimo con richieste continue
+MV_FRESH_WAIT = float(os.environ.get("MV_FRESH_WAIT", 10.0))                # Attesa massima in flush()
+
+# Ordine di refresh e viste dipendenti da ciascuna tabella sorgente
+VIEWS = ('portfolio_holdings', 'portfolio_stats', 'dividend_totals')
+VIEWS_BY_TABLE = {
+    'transactions': ('portfolio_holdings', 'portfolio_stats'),
+    'dividends': ('dividend_totals',),
+}
+
+_cond = threading.Condition()
+_pending = {}          # view -> istante della prima richiesta non ancora servita
+_running = set()
+_last_request = 0.0
+_flush_requested = False
+_worker = None
+_state = {view: {
+    'last_refresh_at': None,
+    'last_duration_s': None,
+    'last_error': None,
+    'refreshes': 0,
+    'failures': 0,
+    'coalesced_requests': 0,
+} for view in VIEWS}
+
+
+def _views_for(tables):
+    if not tables:
+        return set(VIEWS)
+    views = set()
+    for table in tables:
+        views.update(VIEWS_BY_TABLE.get(table, ()))
+    return views
+
+
+def _refresh_view(view):
+    """Runs the refresh RPC for one view. Raises on failure."""
+    from db_helper import execute_request
+    res = execute_request('rpc/refresh_materialized_view', 'POST', body={'p_view': view})
+    if res is None or res.status_code not in (200, 204):
+        raise RuntimeError(f"HTTP {res.status_code if res is not None else 'n/a'} - {res.text if res is not None else ''}")
+
+
+def _next_batch():
+    """Blocks until a batch of views is due (debounce elapsed or flush requested)."""
+    global _flush_requested
+    with _cond:
+        while not _pending:
+            _cond.wait()
+        while not _flush_requested:
+            deadline = min(_last_request + MV_REFRESH_DEBOUNCE, min(_pending.values()) + MV_REFRESH_MAX_DELAY)
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                break
+            _cond.wait(remaining)
+        _flush_requested = False
+        batch = [view for view in VIEWS if view in _pending]
+        _pending.clear()
+        _running.update(batch)
+        return batch
+
+
+def _worker_loop():
+    while True:
+        try:
+            for view in _next_batch():
+                t0 = time.time()
+                error = None
+                try:
+                    _refresh_view(view)
+                except Exception as e:
+                    error = str(e)
+                    logger.error(f"MV REFRESH: {view} failed: {e}")
+                with _cond:
+                    state = _state[view]
+                    state['last_duration_s'] = round(time.time() - t0, 3)
+                    if error:
+                        state['failures'] += 1
+                        state['last_error'] = error
+                    else:
+                        state['refreshes'] += 1
+                        state['last_refresh_at'] = t0
+                        state['last_error'] = None
+                    _running.discard(view)
+                    _cond.notify_all()
+                if not error:
+                    logger.info(f"MV REFRESH: {view} refreshed in {time.time() - t0:.2f}s")
+        except Exception as e:
+            logger.error(f"MV REFRESH: worker error: {e}")
+            time.sleep(1)
+
+
+def _ensure_worker():
+    global _worker
+    if _worker is None or not _worker.is_alive():
+        _worker = threading.Thread(target=_worker_loop, name="mv-refresh", daemon=True)
+        _worker.start()
+
+
+def request_refresh(*tables, views=None):
+    """
+    Schedules a debounced refresh of the views depending on the given tables
+    ('transactions', 'dividends'), or of the given views; no argument = every view.
+    Returns immediately.
+    """
+    global _last_request
+    views = {v for v in views if v in VIEWS} if views else _views_for(tables)
+    if not views:
+        return
+    now = time.time()
+    with _cond:
+        for view in views:
+            if view in _pending:
+                _state[view]['coalesced_requests'] += 1
+            else:
+                _pending[view] = now
+        _last_request = now
+        _ensure_worker()
+        _cond.notify_all()
+
+
+def flush(views=None, timeout=None):
+    """
+    Starts the pending refreshes of the given views now (skipping the debounce)
+    and waits for them. Returns True when none is pending or running any more,
+    False on timeout. Nothing to wait for when no refresh is queued in this process.
+    """
+    global _flush_requested
+    views = set(views or VIEWS)
+    deadline = time.time() + (MV_FRESH_WAIT if timeout is None else timeout)
+    with _cond:
+        while views & (set(_pending) | _running):
+            if views & set(_pending):
+                _flush_requested = True
+                _cond.notify_all()
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return False
+            _cond.wait(remaining)
+        return True
+
+
+def get_refresh_status():
+    """Per-view refresh state: process-local queue plus staleness recorded in the database."""
+    with _cond:
+        status = {view: dict(state,
+                             pending_since=_pending.get(view),
+                             running=view in _running) for view, state in _state.items()}
+    try:
+        from db_helper import execute_request
+        res = execute_request('rpc/materialized_view_status', 'POST', body={})
+        for row in (res.json() if (res and res.status_code == 200) else []):
+            if row.get('view_name') in status:
+                status[row['view_name']].update(
+                    refreshed_at=row.get('refreshed_at'),
+                    last_change_at=row.get('last_change_at'),
+                    stale=row.get('stale'))
+    except Exception as e:
+        logger.error(f"MV REFRESH: status read failed: {e}")
+    return {
+        'views': status,
+        'debounce_s': MV_REFRESH_DEBOUNCE,
+        'max_delay_s': MV_REFRESH_MAX_DELAY
+    }
@@ -0,0 +1,337 @@
+"""
+Direct PostgreSQL Backend for db_helper.
+
+Alternative to the PostgREST HTTP hop for heavy analytical reads (full
+transaction and price history). Talks to Postgres through a psycopg2
+connection pool and exposes the same contract used by db_helper callers:
+responses with `status_code`, `json()` and `text`, rows as JSON-compatible
+dicts (numbers as float, dates as ISO strings, UUIDs as str).
+
+Enabled with DB_BACKEND=postgres and DATABASE_URL. psycopg2 is optional:
+without it (or without DATABASE_URL) db_helper keeps using PostgREST.
+
+Supported PostgREST syntax: plain column select, filters eq/neq/gt/gte/lt/lte/
+like/ilike/in/is, order, limit/offset, Range headers, upsert with on_conflict,
+PATCH/DELETE with filters and rpc/<function> without arguments.
+Anything else (embedded resources like `assets(isin)`, `or=` filters, ...)
+raises UnsupportedQuery and db_helper falls back to the REST path.
+"""
+
+import os
+import re
+import json
+import uuid
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+
+try:
+    import psycopg2
+    import psycopg2.pool
+    from psycopg2 import sql
+except ImportError:  # Dipendenza opzionale
+    psycopg2 = None
+
+try:
+    from api.logger import logger
+except ImportError:
+    from logger import logger
+
+PG_POOL_MIN = int(os.environ.get("PG_POOL_MIN", 1))
+PG_POOL_MAX = int(os.environ.get("PG_POOL_MAX", 10))
+PG_CURSOR_ITERSIZE = int(os.environ.get("PG_CURSOR_ITERSIZE", 2000))
+
+_IDENTIFIER = re.compile(r'^[A-Za-z_][A-Za-z0-9_]*$')
+_OPERATORS = {'eq': '=', 'neq': '<>', 'gt': '>', 'gte': '>=', 'lt': '<', 'lte': '<=', 'like': 'LIKE', 'ilike': 'ILIKE'}
+_RESERVED_PARAMS = {'select', 'order', 'limit', 'offset', 'on_conflict'}
+
+_pool = None
+_pool_lock = threading.Lock()
+_column_types = {}   # tabella -> {colonna: tipo Postgres}
+
+
+class UnsupportedQuery(Exception):
+    """The request uses PostgREST features this backend does not translate."""
+
+
+class PgResponse:
+    """Minimal requests.Response look-alike returned by execute_request."""
+    def __init__(self, status_code, data=None, error=None):
+        self.status_code = status_code
+        self._data = data
+        self.text = error if error is not None else json.dumps(data)
+        self.ok = 200 <= status_code < 300
+
+    def json(self):
+        return self._data
+
+
+def is_available():
+    return psycopg2 is not None and bool(os.environ.get("DATABASE_URL"))
+
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = psycopg2.pool.ThreadedConnectionPool(PG_POOL_MIN, PG_POOL_MAX, dsn=os.environ["DATABASE_URL"])
+            logger.info(f"PG_BACKEND: Pool creato (min={PG_POOL_MIN}, max={PG_POOL_MAX})")
+        return _pool
+
+
+def _to_json_value(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, uuid.UUID):
+        return str(value)
+    return value
+
+
+def _rows_to_dicts(cursor, rows):
+    cols = [d[0] for d in cursor.description]
+    return [{c: _to_json_value(v) for c, v in zip(cols, row)} for row in rows]
+
+
+def _ident(name):
+    if not _IDENTIFIER.match(name or ''):
+        raise UnsupportedQuery(f"Identificatore non supportato: {name!r}")
+    return sql.Identifier(name)
+
+
+def _parse_value(raw):
+    # Valori tra virgolette PostgREST: "a,b" -> a,b
+    raw = raw.strip()
+    if len(raw) >= 2 and raw[0] == raw[-1] == '"':
+        return raw[1:-1]
+    return raw
+
+
+def _table_columns(table):
+    """Postgres type of each column of a table/view ({column: type}), catalog read cached per table."""
+    with _pool_lock:
+        types = _column_types.get(table)
+    if types is None:
+        rows = _run(sql.SQL(
+            "SELECT attname, format_type(atttypid, NULL) AS type FROM pg_attribute "
+            "WHERE attrelid = to_regclass(%s) AND attnum > 0 AND NOT attisdropped"
+        ), [f"public.{table}"])
+        types = {r['attname']: r['type'] for r in rows}
+        if types:
+            with _pool_lock:
+                _column_types[table] = types
+    return types
+
+
+def _column_type(table, column):
+    """
+    Type used to bind `in` lists as typed arrays: `uuid_col = ANY(%s::uuid[])` can use
+    the index, `uuid_col::text = ANY(...)` can't.
+    """
+    types = _table_columns(table)
+    if column not in types:
+        raise UnsupportedQuery(f"Colonna sconosciuta per il filtro in: {table}.{column}")
+    return types[column]
+
+
+def _write_value(table, column, value):
+    """
+    Value bound for a write. JSON/JSONB columns get JSON text, scalars included
+    (PostgREST accepts e.g. a string result for a JSONB column; a plain text
+    parameter would not be valid JSON).
+    """
+    if isinstance(value, (dict, list)):
+        return json.dumps(value)
+    if value is not None and _table_columns(table).get(column) in ('json', 'jsonb'):
+        return json.dumps(value)
+    return value
+
+
+def _build_where(params, table):
+    """Traduce i filtri PostgREST (col=op.val) in una clausola WHERE parametrica."""
+    clauses, values = [], []
+    for key, raw in (params or {}).items():
+        if key in _RESERVED_PARAMS:
+            continue
+        col = _ident(key)  # 'assets.isin', 'or', 'and' -> UnsupportedQuery
+        raw = str(raw)
+        op, _, val = raw.partition('.')
+        if op in _OPERATORS:
+            clauses.append(sql.SQL("{} {} %s").format(col, sql.SQL(_OPERATORS[op])))
+            values.append(val.replace('*', '%') if op in ('like', 'ilike') else val)
+        elif op == 'in':
+            if not (val.startswith('(') and val.endswith(')')):
+                raise UnsupportedQuery(f"Filtro in non valido: {raw}")
+            items = [_parse_value(v) for v in val[1:-1].split(',')] if val[1:-1] else []
+            # Array tipizzato come la colonna (il tipo viene dal catalogo, non dall'input)
+            clauses.append(sql.SQL("{} = ANY(%s::{}[])").format(col, sql.SQL(_column_type(table, key))))
+            values.append(items)
+        elif op == 'is' and val in ('null', 'true', 'false'):
+            clauses.append(sql.SQL("{} IS {}").format(col, sql.SQL(val.upper())))
+        else:
+            raise UnsupportedQuery(f"Operatore non supportato: {raw}")
+    if not clauses:
+        return sql.SQL(""), values
+    return sql.SQL(" WHERE ") + sql.SQL(" AND ").join(clauses), values
+
+
+def _build_select(table, params, headers=None):
+    params = params or {}
+    select = params.get('select', '*')
+    if select.strip() == '*':
+        columns = sql.SQL('*')
+    else:
+        columns = sql.SQL(', ').join(_ident(c.strip()) for c in select.split(','))
+
+    where, values = _build_where(params, table)
+    query = sql.SQL("SELECT {} FROM {}").format(columns, _ident(table)) + where
+
+    if params.get('order'):
+        parts = []
+        for item in params['order'].split(','):
+            bits = item.strip().split('.')
+            col = _ident(bits[0])
+            direction = 'DESC' if 'desc' in bits[1:] else 'ASC'
+            nulls = ' NULLS FIRST' if 'nullsfirst' in bits[1:] else (' NULLS LAST' if 'nullslast' in bits[1:] else '')
+            parts.append(col + sql.SQL(f" {direction}{nulls}"))
+        query += sql.SQL(" ORDER BY ") + sql.SQL(', ').join(parts)
+
+    limit, offset = params.get('limit'), params.get('offset')
+    range_header = (headers or {}).get('Range')
+    if range_header:
+        start, _, end = range_header.partition('-')
+        offset = int(start)
+        if end:
+            limit = int(end) - int(start) + 1
+    if limit is not None:
+        query += sql.SQL(" LIMIT %s")
+        values.append(int(limit))
+    if offset is not None:
+        query += sql.SQL(" OFFSET %s")
+        values.append(int(offset))
+    return query, values
+
+
+def _run(query, values=(), fetch=True):
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor() as cur:
+            cur.execute(query, values)
+            rows = _rows_to_dicts(cur, cur.fetchall()) if (fetch and cur.description) else []
+        conn.commit()
+        return rows
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        pool.putconn(conn)
+
+
+def _upsert(table, data, on_conflict=None, merge=True):
+    rows = data if isinstance(data, list) else [data]
+    if not rows:
+        return []
+    cols = list(rows[0].keys())
+    col_idents = [_ident(c) for c in cols]
+    query = sql.SQL("INSERT INTO {} ({}) VALUES ").format(_ident(table), sql.SQL(', ').join(col_idents))
+    query += sql.SQL(', ').join(sql.SQL("({})").format(sql.SQL(', ').join(sql.Placeholder() * len(cols))) for _ in rows)
+    values = [_write_value(table, c, r.get(c)) for r in rows for c in cols]
+
+    if merge and not on_conflict:
+        # PostgREST usa la primary key: senza on_conflict esplicito lasciamo a lui
+        raise UnsupportedQuery("Upsert senza on_conflict")
+    if on_conflict and merge:
+        conflict_cols = [_ident(c.strip()) for c in on_conflict.split(',')]
+        updates = [sql.SQL("{0} = EXCLUDED.{0}").format(_ident(c)) for c in cols if c.strip() not in {x.strip() for x in on_conflict.split(',')}]
+        query += sql.SQL(" ON CONFLICT ({}) DO ").format(sql.SQL(', ').join(conflict_cols))
+        query += (sql.SQL("UPDATE SET ") + sql.SQL(', ').join(updates)) if updates else sql.SQL("NOTHING")
+    query += sql.SQL(" RETURNING *")
+    return _run(query, values)
+
+
+def execute_request(endpoint, method='GET', params=None, body=None, headers=None):
+    """
+    Same contract as db_helper.execute_request for the supported subset.
+    Raises UnsupportedQuery when the request must go through PostgREST.
+    """
+    method = (method or 'GET').upper()
+    params = dict(params or {}) if not isinstance(params, str) else None
+    if params is None:
+        raise UnsupportedQuery("Parametri in forma di stringa")
+
+    try:
+        if endpoint.startswith('rpc/'):
+            if body or params:
+                raise UnsupportedQuery("RPC con argomenti o paginazione")
+            fn = _ident(endpoint[4:])
+            return PgResponse(200, _run(sql.SQL("SELECT * FROM {}()").format(fn)))
+
+        if method == 'GET':
+            query, values = _build_select(endpoint, params, headers)
+            return PgResponse(200, _run(query, values))
+
+        if method == 'POST':
+            prefer = (headers or {}).get('Prefer', '')
+            merge = 'merge-duplicates' in prefer or bool(params.get('on_conflict'))
+            rows = _upsert(endpoint, body, on_conflict=params.get('on_conflict'), merge=merge)
+            return PgResponse(201, rows)
+
+        if method == 'PATCH':
+            if not body:
+                raise UnsupportedQuery("PATCH senza body")
+            where, values = _build_where(params, endpoint)
+            sets = sql.SQL(', ').join(sql.SQL("{} = %s").format(_ident(c)) for c in body.keys())
+            set_values = [_write_value(endpoint, c, v) for c, v in body.items()]
+            query = sql.SQL("UPDATE {} SET ").format(_ident(endpoint)) + sets + where + sql.SQL(" RETURNING *")
+            return PgResponse(200, _run(query, set_values + values))
+
+        if method == 'DELETE':
+            if not any(k not in _RESERVED_PARAMS for k in params):
+                raise UnsupportedQuery("DELETE senza filtri")
+            where, values = _build_where(params, endpoint)
+            query = sql.SQL("DELETE FROM {}").format(_ident(endpoint)) + where
+            _run(query, values, fetch=False)
+            return PgResponse(204, [])
+
+        raise UnsupportedQuery(f"Metodo non supportato: {method}")
+
+    except UnsupportedQuery:
+        raise
+    except Exception as e:
+        # Violazione di vincolo unico: 409 come PostgREST
+        status = 409 if getattr(e, 'pgcode', None) == '23505' else 400
+        (logger.warning if status == 409 else logger.error)(f"PG_BACKEND error [{method} {endpoint}]: {e}")
+        return PgResponse(status, None, error=str(e))
+
+
+def stream_query(table, params=None, page_size=PG_CURSOR_ITERSIZE):
+    """
+    Streams a large result set with a server-side (named) cursor, yielding pages
+    of rows without materialising the whole result client-side.
+    Raises UnsupportedQuery before the first page if the query can't be translated.
+    """
+    params = dict(params or {})
+    params.pop('limit', None)
+    params.pop('offset', None)
+    query, values = _build_select(table, params)
+
+    pool = _get_pool()
+    conn = pool.getconn()
+    try:
+        with conn.cursor(name=f"perix_stream_{uuid.uuid4().hex[:12]}") as cur:
+            cur.itersize = page_size
+            cur.execute(query, values)
+            while True:
+                rows = cur.fetchmany(page_size)
+                if not rows:
+                    break
+                yield _rows_to_dicts(cur, rows)
+        conn.commit()
+    except Exception as e:
+        conn.rollback()
+        logger.error(f"PG_BACKEND stream error for '{table}': {e}")
+        raise RuntimeError(f"stream_query failed for '{table}' ({e})")
+    finally:
+        pool.putconn(conn)
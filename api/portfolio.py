@@ -1,34 +1,66 @@
 from flask import jsonify, request
-from db_helper import execute_request, update_table
+from db_helper import execute_request, execute_batch, update_table, fetch_all_rows
 from logger import logger
 from price_manager import get_latest_price, get_latest_prices_batch
 from finance import xirr
 from datetime import datetime
 from asset_classification import get_component_from_asset_type
+from holdings import get_holdings_snapshot
 import traceback
 
 
-def compute_active_holdings(portfolio_id):
-    """Ricostruisce le SOLE holding attive (qty>0) con flussi di cassa, valore corrente,
-    P&L e metadati. Unica fonte di verità condivisa da /api/portfolio/<id>/aggregate e
-    /api/analysis/allocation (oltre a essere coerente con /api/portfolio/assets).
-    Convenzione flussi: buy negativo, sell/dividendi positivi.
-    Ritorna (out, settings) con out[isin] = {pnl_value, current_value, cashflows, end_date,
-    component, name, net_invested, total_dividends, last_trend_variation, qty}."""
-    res_trans = execute_request('transactions', 'GET', params={
+def _parse_date(s):
+    try:
+        return datetime.fromisoformat(str(s).replace('Z', '+00:00')).replace(tzinfo=None)
+    except Exception:
+        return datetime.now()
+
+
+def _holdings_from_snapshot(portfolio_id, snapshot):
+    """Holding attive dalla vista portfolio_holdings (qty e capitale netto); transazioni e
+    dividendi letti solo per gli asset attivi, per i flussi di cassa."""
+    active = {row['asset_id']: row for row in snapshot.values() if row['qty'] > 0.0001}
+    holdings = {row['isin']: {
+        "qty": row['qty'], "total_cost": row['net_invested'], "total_dividends": 0.0, "cashflows": [],
+        "name": row.get('name') or row['isin'],
+        "component": get_component_from_asset_type(row.get('asset_class')),
+        "last_trend_variation": row.get('last_trend_variation'),
+    } for row in active.values()}
+    if not active:
+        return holdings
+
+    ids_filter = f"in.({','.join(str(aid) for aid in active)})"
+    trans_data, div_data = execute_batch([
+        lambda: fetch_all_rows('transactions', params={
+            'select': 'asset_id,quantity,type,price_eur,date',
+            'portfolio_id': f'eq.{portfolio_id}',
+            'asset_id': ids_filter
+        }, keyset=('date', 'id')),
+        lambda: fetch_all_rows('dividends', params={'portfolio_id': f'eq.{portfolio_id}', 'asset_id': ids_filter},
+                               keyset=('date', 'id'))
+    ])
+    for t in trans_data:
+        amount = float(t['quantity']) * float(t['price_eur'])
+        holdings[active[t['asset_id']]['isin']]['cashflows'].append(
+            {"date": _parse_date(t['date']), "amount": -amount if t['type'] == 'BUY' else amount})
+
+    for d in div_data:
+        row = active.get(d['asset_id'])
+        if row:
+            amount = float(d['amount_eur'])
+            holdings[row['isin']]['cashflows'].append({"date": _parse_date(d['date']), "amount": amount})
+            holdings[row['isin']]['total_dividends'] += amount
+    return holdings
+
+
+def _holdings_from_transactions(portfolio_id):
+    """Ricostruzione completa dalle transazioni (vista non allineata). None se non ci sono transazioni."""
+    trans_data = fetch_all_rows('transactions', params={
         'select': 'quantity,type,price_eur,date,assets(id,isin,name,asset_class,last_trend_variation)',
-        'portfolio_id': f'eq.{portfolio_id}',
-        'order': 'date.asc'
-    })
-    trans_data = res_trans.json() if (res_trans and res_trans.status_code == 200) else []
+        'portfolio_id': f'eq.{portfolio_id}'
+    }, keyset=('date', 'id'))
     if not trans_data:
-        return {}, {}
-
-    def _parse_date(s):
-        try:
-            return datetime.fromisoformat(str(s).replace('Z', '+00:00')).replace(tzinfo=None)
-        except Exception:
-            return datetime.now()
+        return None
 
     holdings = {}
     for t in trans_data:
@@ -54,8 +86,7 @@ def compute_active_holdings(portfolio_id):
             h['cashflows'].append({"date": cf_date, "amount": (qty * price)})
 
     # Dividendi (flussi positivi + accumulo per P&L)
-    res_div = execute_request('dividends', 'GET', params={'portfolio_id': f'eq.{portfolio_id}'})
-    div_data = res_div.json() if (res_div and res_div.status_code == 200) else []
+    div_data = fetch_all_rows('dividends', params={'portfolio_id': f'eq.{portfolio_id}'}, keyset=('date', 'id'))
     aid_to_isin = {t['assets']['id']: t['assets']['isin'] for t in trans_data}
     for d in div_data:
         isin = aid_to_isin.get(d['asset_id'])
@@ -63,6 +94,26 @@ def compute_active_holdings(portfolio_id):
             amount = float(d['amount_eur'])
             holdings[isin]['cashflows'].append({"date": _parse_date(d['date']), "amount": amount})
             holdings[isin]['total_dividends'] += amount
+    return holdings
+
+
+def compute_active_holdings(portfolio_id):
+    """Ricostruisce le SOLE holding attive (qty>0) con flussi di cassa, valore corrente,
+    P&L e metadati. Unica fonte di verità condivisa da /api/portfolio/<id>/aggregate e
+    /api/analysis/allocation (oltre a essere coerente con /api/portfolio/assets).
+    Quantità e capitale netto dalla vista portfolio_holdings (get_holdings_snapshot),
+    con ripiego sulle transazioni se la vista non è allineata.
+    Convenzione flussi: buy negativo, sell/dividendi positivi.
+    Ritorna (out, settings) con out[isin] = {pnl_value, current_value, cashflows, end_date,
+    component, name, net_invested, total_dividends, last_trend_variation, qty}."""
+    snapshot = get_holdings_snapshot(portfolio_id)
+    if snapshot is not None and not snapshot:
+        return {}, {}
+    holdings = _holdings_from_snapshot(portfolio_id, snapshot) if snapshot else None
+    if holdings is None:
+        holdings = _holdings_from_transactions(portfolio_id)
+        if holdings is None:
+            return {}, {}
 
     active = [i for i, h in holdings.items() if h['qty'] > 0.0001]
     prices = get_latest_prices_batch(active, portfolio_id=portfolio_id)
@@ -199,13 +250,10 @@ def register_portfolio_routes(app):
             
             # Fetch all transactions with asset data for this portfolio
             # res_trans = supabase.table('transactions').select(...).eq(...).order(...).execute()
-            res_trans = execute_request('transactions', 'GET', params={
+            trans_data = fetch_all_rows('transactions', params={
                 'select': 'quantity,type,price_eur,date,assets(id,isin,name,ticker,asset_class,country,sector,rating,issuer,currency,metadata,last_trend_variation,last_trend_days)',
-                'portfolio_id': f'eq.{portfolio_id}',
-                'order': 'date.asc'
-            })
-            
-            trans_data = res_trans.json() if (res_trans and res_trans.status_code == 200) else []
+                'portfolio_id': f'eq.{portfolio_id}'
+            }, keyset=('date', 'id'))
             
             if not trans_data:
                 return jsonify(assets=[])
@@ -255,10 +303,9 @@ def register_portfolio_routes(app):
                     })
 
             # Fetch all dividends for this portfolio
-            res_div = execute_request('dividends', 'GET', params={
+            div_data = fetch_all_rows('dividends', params={
                 'portfolio_id': f'eq.{portfolio_id}'
-            })
-            div_data = res_div.json() if (res_div and res_div.status_code == 200) else []
+            }, keyset=('date', 'id'))
             
             # Map dividends to holdings
             # We need asset_id -> isin map from previous transactions or fetch it
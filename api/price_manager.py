@@ -1,7 +1,8 @@
 import logging
 from datetime import datetime, timedelta
+import numpy as np
 import pandas as pd
-from db_helper import execute_request, upsert_table, update_table
+from db_helper import execute_request, execute_batch, upsert_table, fetch_all
 
 logger = logging.getLogger("perix_monitor")
 
@@ -35,142 +36,41 @@ def save_price_snapshot(isin, price, date=None, source="Manual Upload"):
         logger.error(f"SALVATAGGIO PREZZO FALLITO: {isin} -> {e}")
         return False
 
-def get_price_history(isin, days=None, portfolio_id=None):
+def get_price_history(isin, days=None, portfolio_id=None, limit=None):
     """
     Recupera la storia prezzi per un ISIN, unendo:
     1. 'asset_prices' (Dati Manuali/Mercato)
     2. 'transactions' (Prezzi impliciti da Acquisti/Vendite)
+    Merge, priorità delle fonti e deduplicazione avvengono nella funzione SQL
+    unified_price_history (una sola chiamata).
     
     Parametro 'days': se fornito, limita il recupero agli ultimi N giorni.
-    Parametro 'portfolio_id': se fornito, limita le transazioni al portafoglio specificato.
+    Parametro 'portfolio_id': se fornito, le transazioni del portafoglio sono 'Transaction (BUY/SELL)'
+                              e quelle degli altri portafogli 'Transaction' generico (sola lettura).
+    Parametro 'limit': se fornito, restituisce solo le N righe più recenti.
     
     Restituisce lista di dict: [{'date': 'YYYY-MM-DD', 'price': float, 'source': str}, ...]
-    ordinata per data crescente.
+    ordinata per data decrescente.
     """
     try:
-        cutoff_date = None
+        since = None
         if days:
-            cutoff_date = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
-
-        # 1. Recupera Prezzi Espliciti
-        params = {
-            'select': 'price,date,source',
-            'isin': f'eq.{isin}',
-            'order': 'date.asc'
-        }
-        if cutoff_date:
-            params['date'] = f'gte.{cutoff_date}'
-
-        res_prices = execute_request(
-            'asset_prices', 
-            'GET', 
-            params=params
-        )
-        prices_list = res_prices.json() if res_prices and res_prices.status_code == 200 else []
-        
-        # 2. Recupera Prezzi Transazioni (Impliciti)
-        trans_params = {
-            'select': 'price_eur,date,type,assets!inner(isin)',
-            'assets.isin': f'eq.{isin}',
-            'price_eur': 'neq.0',
-            'order': 'date.asc'
-        }
-        if portfolio_id:
-            trans_params['portfolio_id'] = f'eq.{portfolio_id}'
-        if cutoff_date:
-            trans_params['date'] = f'gte.{cutoff_date}'
-
-        res_trans = execute_request(
-            'transactions',
-            'GET',
-            params=trans_params
-        )
-        trans_data = res_trans.json() if res_trans and res_trans.status_code == 200 else []
-
-        if trans_data:
-            for t in trans_data:
-                # Add transaction prices as 'Transaction (BUY/SELL)' source
-                d_str = t['date']
-                if 'T' in d_str: d_str = d_str.split('T')[0]
-                
-                prices_list.append({
-                    "price": float(t['price_eur']),
-                    "date": d_str,
-                    "source": f"Transaction ({t['type']})"
-                })
-
-        # 2b. Se portfolio_id fornito, recupera anche transazioni da ALTRI portafogli
-        #     marcate come "Transaction" generico (sola lettura, non cancellabili)
-        if portfolio_id:
-            other_trans_params = {
-                'select': 'price_eur,date,type,assets!inner(isin)',
-                'assets.isin': f'eq.{isin}',
-                'price_eur': 'neq.0',
-                'portfolio_id': f'neq.{portfolio_id}',
-                'order': 'date.asc'
-            }
-            if cutoff_date:
-                other_trans_params['date'] = f'gte.{cutoff_date}'
-
-            res_other_trans = execute_request(
-                'transactions',
-                'GET',
-                params=other_trans_params
-            )
-            other_trans_data = res_other_trans.json() if res_other_trans and res_other_trans.status_code == 200 else []
-
-            if other_trans_data:
-                for t in other_trans_data:
-                    d_str = t['date']
-                    if 'T' in d_str: d_str = d_str.split('T')[0]
-                    
-                    prices_list.append({
-                        "price": float(t['price_eur']),
-                        "date": d_str,
-                        "source": "Transaction"
-                    })
-        
-        if not prices_list:
-            return []
-
-        # 3. Unione e Deduplicazione
-        if not prices_list:
+            since = (datetime.now() - timedelta(days=days)).strftime('%Y-%m-%d')
+
+        res = execute_request('rpc/unified_price_history', 'POST', body={
+            'p_isin': isin,
+            'p_portfolio_id': portfolio_id,
+            'p_since': since,
+            'p_limit': limit
+        })
+        if not res or res.status_code != 200:
+            logger.error(f"Errore recupero storia unificata per {isin}: {res.status_code if res is not None else 'no response'} - {res.text if res is not None else ''}")
             return []
 
-        df = pd.DataFrame(prices_list)
-        df['date'] = pd.to_datetime(df['date'], format='mixed', dayfirst=False)
-        
-        # Deduplicazione logica: se abbiamo la stessa data e lo stesso prezzo,
-        # preferiamo la fonte più specifica "Transaction (BUY)" rispetto a "Transaction"
-        # e "Transaction" rispetto a "Manual Upload".
-        
-        # Priorità esplicita: Transaction (BUY/SELL) > Transaction generico > altre fonti
-        def source_priority(s):
-            s_lower = s.lower()
-            if s_lower.startswith('transaction ('):
-                return 3  # Massima priorità: transazione del portafoglio corrente
-            if s_lower == 'transaction':
-                return 2  # Transazione da altro portafoglio
-            return 1      # Manual Upload, Yahoo Finance, etc.
-        
-        df['source_prio'] = df['source'].apply(source_priority)
-        df = df.sort_values(by=['date', 'source_prio'], ascending=[True, False])
-        
-        # Drop duplicates where date, price are identical (keep the first which has highest priority)
-        df = df.drop_duplicates(subset=['date', 'price'], keep='first')
-        
-        # Final sort by date descending (per il frontend)
-        df = df.sort_values(by='date', ascending=False)
-        
-        result = []
-        for _, row in df.iterrows():
-            result.append({
-                "date": row['date'].strftime('%Y-%m-%d'),
-                "price": row['price'],
-                "source": row.get('source', 'Unknown')
-            })
-            
-        return result
+        return [
+            {"date": row['date'], "price": float(row['price']), "source": row.get('source') or 'Unknown'}
+            for row in res.json()
+        ]
 
     except Exception as e:
         logger.error(f"Errore recupero storia unificata per {isin}: {e}")
@@ -180,45 +80,72 @@ def update_asset_trend(isin):
     """
     Ricalcola e salva il trend dell'asset basandosi sugli ultimi due prezzi disponibili.
     """
-    try:
-        history = get_price_history(isin) # Già ordinata DESC dalla mia modifica precedente
-        if len(history) < 2:
-            # Non ci sono abbastanza dati per un trend
-            update_table('assets', {
-                'last_trend_variation': None,
-                'last_trend_days': None,
-                'last_trend_ts': datetime.now().isoformat()
-            }, {'isin': isin})
-            return
-
-        latest = history[0]
-        penultimate = history[1]
-        
-        p1 = float(latest['price'])
-        p2 = float(penultimate['price'])
-        
-        logger.info(f"[TREND DEBUG] ISIN={isin} | Latest: data={latest['date']}, prezzo={p1} | Penultimate: data={penultimate['date']}, prezzo={p2}")
-        
-        if p2 == 0:
-            return
+    update_asset_trends_batch([isin])
 
-        variation = ((p1 - p2) / p2) * 100
-        
-        # Calcola i giorni di differenza
-        d1 = datetime.strptime(latest['date'], '%Y-%m-%d')
-        d2 = datetime.strptime(penultimate['date'], '%Y-%m-%d')
-        days = (d1 - d2).days
-
-        update_table('assets', {
-            'last_trend_variation': variation,
-            'last_trend_days': days,
-            'last_trend_ts': datetime.now().isoformat()
-        }, {'isin': isin})
-        
-        logger.info(f"TREND AGGIORNATO per {isin}: {variation:.2f}% ({days} giorni)")
+def update_asset_trends_batch(isins):
+    """
+    Ricalcola il trend (variazione % e giorni tra le ultime due righe della storia unificata)
+    per più ISIN: una query per gli ultimi due prezzi di tutti gli ISIN, calcolo vettoriale
+    e un solo upsert bulk su assets.
+
+    Returns:
+        int: numero di asset aggiornati.
+    """
+    unique_isins = sorted({i for i in isins if i})
+    if not unique_isins:
+        return 0
+
+    t0 = datetime.now()
+    try:
+        res_prices, res_assets = execute_batch([
+            {'endpoint': 'rpc/recent_prices_batch', 'method': 'POST', 'body': {'p_isins': unique_isins, 'p_limit': 2}},
+            {'endpoint': 'assets', 'params': {'select': 'id,isin,name', 'isin': f"in.({','.join(unique_isins)})"}}
+        ])
+        if not res_prices or res_prices.status_code != 200 or not res_assets or res_assets.status_code != 200:
+            logger.error(f"Errore ricalcolo trend batch: prezzi {res_prices.status_code if res_prices is not None else 'no response'}, "
+                         f"asset {res_assets.status_code if res_assets is not None else 'no response'}")
+            return 0
+
+        # Righe già ordinate per data DESC all'interno di ogni ISIN: [0] = ultimo, [1] = penultimo
+        recent = {}
+        for row in res_prices.json():
+            recent.setdefault(row['isin'], []).append(row)
+
+        assets = res_assets.json()
+        with_trend = [a for a in assets if len(recent.get(a['isin'], [])) >= 2]
+        without_trend = [a for a in assets if len(recent.get(a['isin'], [])) < 2]
+
+        # Calcolo vettoriale di variazione e giorni
+        p1 = np.array([float(recent[a['isin']][0]['price']) for a in with_trend])
+        p2 = np.array([float(recent[a['isin']][1]['price']) for a in with_trend])
+        d1 = np.array([recent[a['isin']][0]['date'] for a in with_trend], dtype='datetime64[D]')
+        d2 = np.array([recent[a['isin']][1]['date'] for a in with_trend], dtype='datetime64[D]')
+        valid = p2 != 0  # Prezzo precedente nullo: trend non calcolabile, asset lasciato invariato
+        with np.errstate(divide='ignore', invalid='ignore'):
+            variations = (p1 - p2) / p2 * 100
+        days = (d1 - d2).astype(np.int64)
+
+        now_iso = datetime.now().isoformat()
+        rows = [
+            {'id': a['id'], 'isin': a['isin'], 'name': a['name'],
+             'last_trend_variation': float(var), 'last_trend_days': int(d), 'last_trend_ts': now_iso}
+            for a, var, d, ok in zip(with_trend, variations, days, valid) if ok
+        ]
+        # Non ci sono abbastanza dati per un trend
+        rows.extend({'id': a['id'], 'isin': a['isin'], 'name': a['name'],
+                     'last_trend_variation': None, 'last_trend_days': None, 'last_trend_ts': now_iso}
+                    for a in without_trend)
+
+        if rows and not upsert_table('assets', rows, on_conflict='id'):
+            logger.error(f"Errore ricalcolo trend batch: upsert di {len(rows)} asset fallito")
+            return 0
+
+        logger.info(f"TREND BATCH: {len(rows)} asset aggiornati in {(datetime.now() - t0).total_seconds():.2f}s")
+        return len(rows)
 
     except Exception as e:
-        logger.error(f"Errore ricalcolo trend per {isin}: {e}")
+        logger.error(f"Errore ricalcolo trend batch: {e}")
+        return 0
 
 def get_latest_price(isin, portfolio_id=None):
     """
@@ -226,7 +153,7 @@ def get_latest_price(isin, portfolio_id=None):
     Usa la storia unificata (Prezzi + Transazioni).
     """
     try:
-        history = get_price_history(isin, portfolio_id=portfolio_id)
+        history = get_price_history(isin, portfolio_id=portfolio_id, limit=1)
         if history:
             return history[0]  # history è ordinata per data DESC → [0] = più recente
         return None
@@ -234,79 +161,34 @@ def get_latest_price(isin, portfolio_id=None):
         logger.error(f"Errore recupero ultimo prezzo per {isin}: {e}")
         return None
 
-def get_latest_prices_batch(isins, portfolio_id=None):
+def get_latest_prices_batch(isins, portfolio_id=None, include_transactions=True):
     """
-    OTTIMIZZAZIONE: Recupera l'ultimo prezzo per una lista di ISIN in un'unica (doppia) chiamata.
+    OTTIMIZZAZIONE: Recupera l'ultimo prezzo per una lista di ISIN con una sola chiamata
+    alla funzione SQL get_latest_prices (una riga per ISIN, calcolata lato database).
+    Con include_transactions=False considera solo i prezzi espliciti di asset_prices.
     Restituisce un dizionario {isin: {'price': float, 'date': str, 'source': str}}
     """
     if not isins:
         return {}
     
     try:
-        unique_isins = list(set(isins))
-        # Supabase filter syntax for IN: column=in.(val1,val2,...)
-        in_filter = f"in.({','.join(unique_isins)})"
-        
-        prices_map = {} 
-
-        # Fetch Asset Prices
-        res_prices = execute_request(
-            'asset_prices',
-            'GET',
-            params={
-                'select': 'isin,price,date,source',
-                'isin': in_filter
-            }
-        )
-        
-        # Fetch Transaction Prices
-        # Note: filtering inner join with dot notation
-        trans_params = {
-                 'select': 'price_eur,date,type,assets!inner(isin)',
-                 'assets.isin': in_filter,
-                 'price_eur': 'neq.0'
-             }
-        if portfolio_id:
-            trans_params['portfolio_id'] = f'eq.{portfolio_id}'
-            
-        res_trans = execute_request(
-             'transactions',
-             'GET',
-             params=trans_params
-        )
-
-        all_data = []
-        if res_prices and res_prices.status_code == 200:
-            all_data.extend(res_prices.json())
-        
-        if res_trans and res_trans.status_code == 200:
-            for t in res_trans.json():
-                d_str = t['date']
-                if 'T' in d_str: d_str = d_str.split('T')[0]
-                all_data.append({
-                    "isin": t['assets']['isin'],
-                    "price": float(t['price_eur']),
-                    "date": d_str,
-                    "source": f"Transaction ({t['type']})"
-                })
-
-        if not all_data:
+        res = execute_request('rpc/get_latest_prices', 'POST', body={
+            'p_isins': list(set(isins)),
+            'p_portfolio_id': portfolio_id,
+            'p_include_transactions': include_transactions
+        })
+        if not res or res.status_code != 200:
+            logger.error(f"Errore recupero prezzi batch: {res.status_code if res is not None else 'no response'} - {res.text if res is not None else ''}")
             return {}
 
-        df = pd.DataFrame(all_data)
-        df['date'] = pd.to_datetime(df['date'], format='mixed', dayfirst=False)
-        df = df.sort_values(by='date')
-        
-        latest_df = df.groupby('isin').tail(1)
-        
-        for _, row in latest_df.iterrows():
-            prices_map[row['isin']] = {
+        return {
+            row['isin']: {
                 "price": float(row['price']),
-                "date": row['date'].strftime('%Y-%m-%d'),
-                "source": row.get('source', 'Calculated')
+                "date": row['date'],
+                "source": row.get('source') or 'Calculated'
             }
-            
-        return prices_map
+            for row in res.json()
+        }
 
     except Exception as e:
         logger.error(f"Errore recupero prezzi batch: {e}")
@@ -444,15 +326,139 @@ def get_interpolated_price_history(isin, min_date=None, max_date=None, portfolio
         logger.error(f"Errore interpolazione per {isin}: {e}")
         return {}
 
-def get_interpolated_price_history_batch(isins, min_date=None, max_date=None, portfolio_id=None):
+class PriceMatrix:
     """
-    OTTIMIZZAZIONE: Versione batch di get_interpolated_price_history.
+    Storico prezzi colonnare: array float64 denso (asset x giorni di calendario)
+    con LOCF già applicato. La colonna j corrisponde al giorno `start + j`;
+    0.0 indica nessun prezzo disponibile (prima della prima quotazione o fuori range),
+    come il default `.get(day, 0)` delle vecchie mappe {isin: {'YYYY-MM-DD': price}}.
+    """
+
+    def __init__(self, isins, start, values):
+        self.isins = list(isins)
+        self.row_index = {isin: i for i, isin in enumerate(self.isins)}
+        self.start = np.datetime64(start, 'D')
+        self.values = values
+
+    @property
+    def n_days(self):
+        return self.values.shape[1]
+
+    @classmethod
+    def empty(cls, isins=()):
+        return cls(isins, '1970-01-01', np.zeros((len(isins), 0)))
+
+    @classmethod
+    def from_observations(cls, obs_isins, obs_dates, obs_prices, start=None, end=None, isins=None, locf=True):
+        """
+        Costruisce la matrice da osservazioni sparse (isin, data, prezzo).
+        A parità di (isin, giorno) vince l'ultima osservazione in input.
+
+        Args:
+            obs_isins, obs_dates, obs_prices: sequenze parallele delle osservazioni.
+            start, end: range di giorni (default: prima osservazione / oggi).
+            isins: righe della matrice (default: ISIN osservati, in ordine di apparizione).
+            locf (bool): se False i giorni senza osservazione restano a 0.
+        """
+        days = _to_days(obs_dates)
+        if isins is None:
+            isins = list(dict.fromkeys(obs_isins))
+        if start is None:
+            if not len(days):
+                return cls.empty(isins)
+            start = days.min()
+        start = _to_days([start])[0]
+        end = _to_days([end if end is not None else datetime.now()])[0]
+        n_days = int((end - start).astype(int)) + 1
+        if n_days <= 0:
+            return cls(isins, start, np.zeros((len(isins), 0)))
+
+        matrix = cls(isins, start, None)
+        rows = np.array([matrix.row_index.get(i, -1) for i in obs_isins], dtype=np.int64)
+        cols = (days - start).astype(np.int64)
+        prices = np.asarray(obs_prices, dtype=np.float64)
+
+        valid = (rows >= 0) & (cols >= 0) & (cols < n_days)
+        rows, cols, prices = rows[valid], cols[valid], prices[valid]
+        # Ordinamento stabile per (riga, giorno): tra i duplicati resta l'ultimo in input
+        order = np.lexsort((cols, rows))
+        rows, cols, prices = rows[order], cols[order], prices[order]
+        last = np.ones(len(rows), dtype=bool)
+        last[:-1] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+
+        grid = np.full((len(isins), n_days), np.nan)
+        grid[rows[last], cols[last]] = prices[last]
+
+        if locf:
+            # LOCF vettoriale: per ogni cella l'indice dell'ultima colonna valorizzata
+            filled_idx = np.where(np.isnan(grid), 0, np.arange(n_days))
+            np.maximum.accumulate(filled_idx, axis=1, out=filled_idx)
+            grid = grid[np.arange(len(isins))[:, None], filled_idx]
+
+        matrix.values = np.nan_to_num(grid, nan=0.0)
+        return matrix
+
+    def day_offsets(self, dates):
+        """Offset di colonna per le date indicate (datetime, date, 'YYYY-MM-DD' o datetime64)."""
+        return (_to_days(dates) - self.start).astype(np.int64)
+
+    def lookup(self, isins, dates):
+        """Prezzi per ISIN x date (fancy indexing); 0 per ISIN sconosciuti o date fuori range."""
+        offsets = self.day_offsets(dates)
+        rows = np.array([self.row_index.get(i, -1) for i in isins], dtype=np.int64)
+        out = np.zeros((len(rows), len(offsets)))
+        row_ok = rows >= 0
+        col_ok = (offsets >= 0) & (offsets < self.n_days)
+        if row_ok.any() and col_ok.any():
+            out[np.ix_(row_ok, col_ok)] = self.values[np.ix_(rows[row_ok], offsets[col_ok])]
+        return out
+
+    def series(self, isin, dates):
+        """Prezzi di un singolo ISIN alle date indicate (array 1-D)."""
+        return self.lookup([isin], dates)[0]
+
+    def prices_on(self, day):
+        """Prezzi di tutti gli asset (in ordine di self.isins) a una data."""
+        offset = int(self.day_offsets([day])[0])
+        if offset < 0 or offset >= self.n_days:
+            return np.zeros(len(self.isins))
+        return self.values[:, offset]
+
+    def price(self, isin, day):
+        row = self.row_index.get(isin)
+        if row is None:
+            return 0.0
+        offset = int(self.day_offsets([day])[0])
+        if offset < 0 or offset >= self.n_days:
+            return 0.0
+        return float(self.values[row, offset])
+
+    def to_dict(self):
+        """Formato legacy {isin: {'YYYY-MM-DD': price}} (solo per compatibilità/debug)."""
+        labels = np.datetime_as_string(self.start + np.arange(self.n_days))
+        return {isin: dict(zip(labels, self.values[i].tolist())) for i, isin in enumerate(self.isins)}
+
+def _to_days(dates):
+    """Converte date eterogenee in un array datetime64[D]."""
+    out = []
+    for d in dates:
+        if isinstance(d, np.datetime64):
+            out.append(d.astype('datetime64[D]'))
+        elif hasattr(d, 'strftime'):
+            out.append(np.datetime64(d.strftime('%Y-%m-%d'), 'D'))
+        else:
+            out.append(np.datetime64(str(d)[:10], 'D'))
+    return np.array(out, dtype='datetime64[D]')
+
+def get_price_matrix(isins, min_date=None, max_date=None, portfolio_id=None):
+    """
+    Storico prezzi interpolato (LOCF) di più ISIN come PriceMatrix.
+    Fonti: asset_prices + prezzi delle transazioni (a parità di giorno vince la transazione).
     """
     if not isins:
-        return {}
+        return PriceMatrix.empty()
 
     unique_isins = list(set(isins))
-    result_map = {}
 
     try:
         in_filter = f"in.({','.join(unique_isins)})"
@@ -472,52 +478,35 @@ def get_interpolated_price_history_batch(isins, min_date=None, max_date=None, po
             prices_params['date'] = f'gte.{date_str}'
             trans_params['date'] = f'gte.{date_str}'
         
-        # 1. Fetch BULK (now with optional date filter)
-        res_prices = execute_request('asset_prices', 'GET', params=prices_params)
-        res_trans = execute_request('transactions', 'GET', params=trans_params)
-        
-        all_data = []
-        if res_prices and res_prices.status_code == 200: all_data.extend(res_prices.json())
-        if res_trans and res_trans.status_code == 200:
-            for t in res_trans.json():
-                 d_str = t['date']
-                 if 'T' in d_str: d_str = d_str.split('T')[0]
-                 all_data.append({
-                     'isin': t['assets']['isin'],
-                     'price': float(t['price_eur']),
-                     'date': d_str
-                 })
-        
-        if not all_data:
-            return {}
-
-        # 2. Elaborazione in Pandas
-        df_all = pd.DataFrame(all_data)
-        df_all['date'] = pd.to_datetime(df_all['date'], format='mixed', dayfirst=False)
-        
-        if not max_date: max_date = datetime.now()
-        
-        for isin, group in df_all.groupby('isin'):
-            group = group.sort_values('date').set_index('date')
-            group = group[~group.index.duplicated(keep='last')]
-            
-            asset_start = min_date if min_date else group.index.min()
-            
-            if asset_start > max_date:
-                result_map[isin] = {}
-                continue
-                
-            idx = pd.date_range(start=asset_start, end=max_date, freq='D')
-            
-            interp = group.reindex(idx)
-            interp['price'] = interp['price'].ffill().fillna(0)
-            
-            res_dict = interp['price'].to_dict()
-            result_map[isin] = {k.strftime('%Y-%m-%d'): v for k, v in res_dict.items()}
-
-        return result_map
+        # 1. Fetch BULK (now with optional date filter), paginato per non troncare al max-rows.
+        # Il prefetch sovrappone la richiesta della pagina successiva all'elaborazione corrente.
+        # Le osservazioni vanno in colonne parallele: niente dict per riga.
+        obs_isins, obs_dates, obs_prices = [], [], []
+        for page in fetch_all('asset_prices', params=prices_params, keyset=('date', 'id'), prefetch=True):
+            for p in page:
+                obs_isins.append(p['isin'])
+                obs_dates.append(p['date'][:10])
+                obs_prices.append(float(p['price']))
+        for page in fetch_all('transactions', params=trans_params, keyset=('date', 'id'), prefetch=True):
+            for t in page:
+                obs_isins.append(t['assets']['isin'])
+                obs_dates.append(t['date'][:10])
+                obs_prices.append(float(t['price_eur']))
+
+        if not obs_isins:
+            return PriceMatrix.empty()
+
+        # 2. Matrice densa con LOCF vettoriale
+        return PriceMatrix.from_observations(obs_isins, obs_dates, obs_prices,
+                                             start=min_date, end=max_date or datetime.now())
 
     except Exception as e:
         logger.error(f"Errore interpolazione batch: {e}")
-        return {}
+        return PriceMatrix.empty()
 
+def get_interpolated_price_history_batch(isins, min_date=None, max_date=None, portfolio_id=None):
+    """
+    OTTIMIZZAZIONE: Versione batch di get_interpolated_price_history.
+    Formato legacy {isin: {'YYYY-MM-DD': price}}: i nuovi consumer usano get_price_matrix.
+    """
+    return get_price_matrix(isins, min_date=min_date, max_date=max_date, portfolio_id=portfolio_id).to_dict()
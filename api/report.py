@@ -1,6 +1,7 @@
 from flask import Blueprint, jsonify, request
-from db_helper import execute_request
-from price_manager import get_interpolated_price_history_batch
+from db_helper import execute_batch, fetch_all_rows
+from price_manager import get_price_matrix
+from daily_valuation import get_valuations
 from finance import get_tiered_mwr
 from logger import logger
 from datetime import datetime
@@ -29,20 +30,16 @@ def generate_report():
 
         logger.info(f"[REPORT] Generazione report per {portfolio_id} dal {start_date_str} al {end_date_str}")
 
-        # 1. Recupera Transazioni
-        res_trans = execute_request('transactions', 'GET', params={
-            'select': '*,assets(id,isin,name,asset_class)',
-            'portfolio_id': f'eq.{portfolio_id}',
-            'order': 'date.asc'
-        })
-        transactions = res_trans.json() if (res_trans and res_trans.status_code == 200) else []
-
-        # 2. Recupera Dividendi
-        res_div = execute_request('dividends', 'GET', params={
-            'portfolio_id': f'eq.{portfolio_id}',
-            'order': 'date.asc'
-        })
-        dividends = res_div.json() if (res_div and res_div.status_code == 200) else []
+        # 1-2. Recupera Transazioni e Dividendi (query indipendenti, in parallelo)
+        transactions, dividends = execute_batch([
+            lambda: fetch_all_rows('transactions', params={
+                'select': '*,assets(id,isin,name,asset_class)',
+                'portfolio_id': f'eq.{portfolio_id}'
+            }, keyset=('date', 'id')),
+            lambda: fetch_all_rows('dividends', params={
+                'portfolio_id': f'eq.{portfolio_id}'
+            }, keyset=('date', 'id'))
+        ])
 
         if not transactions and not dividends:
             return jsonify(error="Nessun dato trovato per questo portafoglio."), 404
@@ -58,9 +55,13 @@ def generate_report():
         # Assumiamo che la prima transazione ci dia l'inizio assoluto se necessario per il PMC storicizzato
         first_t_date = min([datetime.fromisoformat(t['date'].replace('Z', '+00:00')).replace(tzinfo=None) for t in transactions]) if transactions else start_date
         
-        # O recuperiamo i prezzi batch
+        # Servono solo le valutazioni a inizio e fine periodo: le leggiamo dalla serie giornaliera
+        # persistita, altrimenti recuperiamo i prezzi batch interpolati e ricostruiamo le quantità
         t2_pre_batch = datetime.now()
-        global_price_map = get_interpolated_price_history_batch(all_isins, min_date=first_t_date, max_date=end_date, portfolio_id=portfolio_id)
+        valuations = get_valuations(portfolio_id, all_isins, [start_date, end_date])
+        global_price_map = None
+        if valuations is None:
+            global_price_map = get_price_matrix(all_isins, min_date=first_t_date, max_date=end_date, portfolio_id=portfolio_id)
         logger.info(f"[REPORT] Batch Price Fetch completato in {(datetime.now() - t2_pre_batch).total_seconds():.2f}s")
 
         # Variabili di stato globale
@@ -190,6 +191,20 @@ def generate_report():
         
         # Helper: Valore Portafoglio a una certa data (basato sui flussi passati fino a quella data)
         def calc_portfolio_at_date(target_date):
+            if valuations is not None:
+                # Quantità e valori persistiti (righe solo per le posizioni aperte)
+                day = target_date.strftime('%Y-%m-%d')
+                temp_holdings = {isin: 0.0 for isin in all_isins}
+                asset_performances = {}
+                port_val = 0.0
+                for isin in all_isins:
+                    v = valuations.get(isin, {}).get(day)
+                    if v:
+                        temp_holdings[isin] = v['quantity']
+                        port_val += v['market_value']
+                        asset_performances[isin] = {'value': v['market_value'], 'qty': v['quantity'], 'price': v['price']}
+                return port_val, temp_holdings, asset_performances
+
             temp_holdings = {isin: 0.0 for isin in all_isins}
             for t in transactions:
                 t_date = datetime.fromisoformat(t['date'].replace('Z', '+00:00')).replace(tzinfo=None)
@@ -199,14 +214,15 @@ def generate_report():
                     if is_buy: temp_holdings[t['assets']['isin']] += qty
                     else: temp_holdings[t['assets']['isin']] -= qty
             
-            target_str = target_date.strftime('%Y-%m-%d')
+            # Prezzi di tutti gli asset alla data in un solo lookup sulla PriceMatrix
+            target_prices = dict(zip(all_isins, global_price_map.lookup(all_isins, [target_date])[:, 0].tolist()))
             port_val = 0.0
             
             asset_performances = {} # Per worst/best nel periodo
             
             for isin, qty in temp_holdings.items():
                 if qty > 0.0001:
-                    price = global_price_map.get(isin, {}).get(target_str, 0)
+                    price = target_prices[isin]
                     val = qty * price
                     port_val += val
                     asset_performances[isin] = {'value': val, 'qty': qty, 'price': price}
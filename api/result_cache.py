@@ -0,0 +1,120 @@
+"""
+In-Process Result Cache.
+
+Cache LRU con scadenza (TTL) per i risultati calcolati dal backend
+(es. il sommario della dashboard), più un registro di "versioni dati"
+per portafoglio usato per l'invalidazione.
+
+Le chiavi di cache includono la versione dati corrente: quando un endpoint
+di scrittura (sync, modifica prezzi, restore, reset) chiama bump_data_version(),
+le voci precedenti non vengono più trovate e scadono naturalmente (LRU/TTL).
+
+NOTA: la cache è locale al processo. Con più worker ognuno ha la propria
+cache; il TTL limita la finestra di dati non aggiornati tra worker diversi.
+"""
+
+import os
+import copy
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """
+    Cache LRU thread-safe con scadenza per voce e contatori hit/miss.
+    """
+    def __init__(self, name, maxsize=128, ttl=300):
+        self.name = name
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()  # key -> (expires_at, value)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key, default=None):
+        """Ritorna una copia del valore in cache, o default se assente/scaduto."""
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                self.misses += 1
+                return default
+
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.misses += 1
+                return default
+
+            self._data.move_to_end(key)
+            self.hits += 1
+        # Copia: i chiamanti possono modificare il risultato senza sporcare la cache
+        return copy.deepcopy(value)
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl, copy.deepcopy(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "name": self.name,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0
+            }
+
+
+# --- Versioni Dati (Invalidazione) ---
+# Versione globale: cambia quando variano dati condivisi tra portafogli (prezzi, asset).
+# Versione per portafoglio: cambia con transazioni/dividendi del singolo portafoglio.
+_versions_lock = threading.Lock()
+_global_version = 0
+_portfolio_versions = {}
+
+
+def get_data_version(portfolio_id):
+    """Ritorna la versione dati corrente (globale, portafoglio) da includere nelle chiavi di cache."""
+    with _versions_lock:
+        return (_global_version, _portfolio_versions.get(portfolio_id, 0))
+
+
+def bump_data_version(portfolio_id=None):
+    """
+    Invalida i risultati in cache di un portafoglio.
+    Senza portfolio_id invalida tutti i portafogli (es. prezzi o asset modificati).
+    """
+    global _global_version
+    with _versions_lock:
+        if portfolio_id is None:
+            _global_version += 1
+        else:
+            _portfolio_versions[portfolio_id] = _portfolio_versions.get(portfolio_id, 0) + 1
+
+
+# Cache del sommario dashboard (/api/dashboard/summary)
+summary_cache = TTLCache(
+    "dashboard_summary",
+    maxsize=int(os.environ.get("SUMMARY_CACHE_MAXSIZE", 256)),
+    ttl=int(os.environ.get("SUMMARY_CACHE_TTL", 300))
+)
+
+
+def get_cache_stats():
+    """Statistiche di tutte le cache di processo (per endpoint admin)."""
+    return [summary_cache.stats()]
@@ -4,6 +4,7 @@ from logger import logger
 import traceback
 import os
 import requests
+from db_helper import get_session
 
 def register_settings_routes(app):
 
@@ -35,7 +36,7 @@ def register_settings_routes(app):
                 "Content-Type": "application/json"
             }
             
-            response = requests.get(
+            response = get_session().get(
                 f"{rest_url}?key=eq.openai_config&select=value",
                 headers=headers,
                 timeout=10
@@ -86,7 +87,7 @@ def register_settings_routes(app):
             }
             
             # Upsert
-            response = requests.post(
+            response = get_session().post(
                 rest_url,
                 headers=headers,
                 json={
@@ -71,7 +71,8 @@ export function useAssetPrices(
             await axios.post('/api/asset-prices/sync', {
                 isin,
                 updates,
-                deletions
+                deletions,
+                portfolio_id: portfolioId
             });
             await fetchPrices(); // Refresh data after sync
             return { success: true };
@@ -79,7 +80,7 @@ export function useAssetPrices(
             const message = err?.response?.data?.error || err?.message || "Errore durante il salvataggio dei prezzi";
             return { success: false, error: message };
         }
-    }, [fetchPrices]);
+    }, [fetchPrices, portfolioId]);
 
     return { prices, isLoading, error, refetch: fetchPrices, syncPrices };
 }
@@ -99,7 +99,8 @@ export function useReport(portfolioId: string | null) {
             let attempts = 0;
             const maxAttempts = 120; // limite di sicurezza (6 minuti con attesa 3s)
 
-            while (status === "pending" && attempts < maxAttempts) {
+            // "pending" = in coda, "running" = in esecuzione
+            while ((status === "pending" || status === "running") && attempts < maxAttempts) {
                 attempts++;
                 // Attesa 3 secondi tra i tentativi
                 await new Promise(resolve => setTimeout(resolve, 3000));
@@ -119,7 +120,7 @@ export function useReport(portfolioId: string | null) {
                 }
             }
 
-            if (status === "pending") {
+            if (status === "pending" || status === "running") {
                 throw new Error("Timeout: l'analisi sta richiedendo troppo tempo.");
             }
 
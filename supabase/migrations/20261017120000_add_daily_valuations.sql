@@ -0,0 +1,76 @@
+-- Migration: add_daily_valuations
+-- Serie storica giornaliera persistita delle valutazioni per (portafoglio, asset),
+-- popolata dal job backend api/daily_valuation.py. Sostituisce la ricostruzione
+-- dello storico (transazioni + prezzi interpolati) ad ogni richiesta di
+-- /api/dashboard/history e /api/report/generate.
+-- Una riga esiste solo nei giorni in cui la posizione è aperta (quantity > 0).
+
+-- ============================================================================
+-- 1. Tabelle
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS public.portfolio_daily_valuations (
+    portfolio_id UUID REFERENCES public.portfolios(id) ON DELETE CASCADE NOT NULL,
+    isin TEXT NOT NULL,
+    date DATE NOT NULL,
+    quantity DOUBLE PRECISION NOT NULL,
+    -- Prezzo interpolato (LOCF) usato per la valutazione: DOUBLE PRECISION per
+    -- restituire esattamente gli stessi valori del calcolo al volo
+    price DOUBLE PRECISION NOT NULL,
+    market_value DOUBLE PRECISION NOT NULL,
+    net_invested DOUBLE PRECISION NOT NULL,
+    cumulative_dividends DOUBLE PRECISION NOT NULL DEFAULT 0,
+    PRIMARY KEY (portfolio_id, isin, date)
+);
+
+-- Letture per intervallo di date su tutto il portafoglio (grafici e report)
+CREATE INDEX IF NOT EXISTS idx_daily_valuations_portfolio_date
+    ON public.portfolio_daily_valuations(portfolio_id, date);
+
+-- Stato del job per portafoglio: le righe sono valide fino a valid_through.
+-- Durante un ricalcolo valid_through viene arretrato, così i lettori
+-- ripiegano sul calcolo al volo invece di leggere dati parziali.
+CREATE TABLE IF NOT EXISTS public.portfolio_valuation_state (
+    portfolio_id UUID PRIMARY KEY REFERENCES public.portfolios(id) ON DELETE CASCADE,
+    valid_through DATE,
+    updated_at TIMESTAMPTZ DEFAULT NOW()
+);
+
+-- ============================================================================
+-- 2. Funzioni (RPC)
+-- ============================================================================
+
+-- Portafogli con transazioni sugli ISIN indicati, usata per invalidare le valutazioni
+-- dopo una modifica dei prezzi: { portfolio_id: [isin, ...] }.
+-- Un solo valore JSONB: non soggetto al limite max_rows di PostgREST.
+CREATE OR REPLACE FUNCTION public.portfolios_holding_isins(p_isins TEXT[])
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT COALESCE(jsonb_object_agg(x.portfolio_id, x.isins), '{}'::jsonb)
+    FROM (
+        SELECT t.portfolio_id, jsonb_agg(DISTINCT a.isin) AS isins
+        FROM public.assets a
+        JOIN public.transactions t ON t.asset_id = a.id
+        WHERE a.isin = ANY(p_isins)
+        GROUP BY t.portfolio_id
+    ) x;
+$$;
+
+-- ============================================================================
+-- 3. Row Level Security
+-- Accesso esclusivo dal backend Python via SERVICE_ROLE (default-deny),
+-- coerente con 20260202090000_secure_rls.sql.
+-- ============================================================================
+
+ALTER TABLE public.portfolio_daily_valuations ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.portfolio_valuation_state ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================================
+-- 4. Grants (vedi 20260527152000_grant_api_access.sql)
+-- ============================================================================
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE public.portfolio_daily_valuations TO authenticated, service_role;
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE public.portfolio_valuation_state TO authenticated, service_role;
+GRANT EXECUTE ON FUNCTION public.portfolios_holding_isins(TEXT[]) TO authenticated, service_role;
@@ -0,0 +1,76 @@
+-- Migration: add_latest_prices_function
+-- Ultimo prezzo per ISIN calcolato lato database, chiamato da
+-- price_manager.get_latest_prices_batch via rpc/get_latest_prices.
+-- Prima il backend scaricava tutta la storia (asset_prices + transazioni)
+-- degli ISIN richiesti solo per tenerne una riga per asset.
+--
+-- Regole (le stesse della storia unificata di get_price_history):
+--   * fonti: prezzi espliciti (asset_prices) e prezzi delle transazioni (price_eur <> 0)
+--   * vince la data più recente; a parità di data la transazione prevale sul prezzo esplicito
+--   * p_portfolio_id limita le transazioni a quel portafoglio (NULL = tutti)
+
+-- ============================================================================
+-- 1. Indici
+-- ============================================================================
+
+-- Lookup "ultima riga per ISIN" su asset_prices (già presente dalla migration
+-- 20260117193000_add_asset_prices.sql, ripetuto per idempotenza)
+CREATE INDEX IF NOT EXISTS idx_asset_prices_isin_date
+    ON public.asset_prices(isin, date DESC);
+
+-- Lookup "ultima transazione per asset"
+CREATE INDEX IF NOT EXISTS idx_transactions_asset_date
+    ON public.transactions(asset_id, date DESC);
+
+-- ============================================================================
+-- 2. Funzione (RPC)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION public.get_latest_prices(
+    p_isins TEXT[],
+    p_portfolio_id UUID DEFAULT NULL,
+    p_include_transactions BOOLEAN DEFAULT TRUE
+)
+RETURNS TABLE (isin TEXT, price DOUBLE PRECISION, date DATE, source TEXT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT DISTINCT ON (candidates.isin)
+        candidates.isin, candidates.price, candidates.date, candidates.source
+    FROM (
+        -- Ultimo prezzo esplicito: un index scan (isin, date DESC) LIMIT 1 per ISIN
+        SELECT req.isin, ap.price::DOUBLE PRECISION AS price, ap.date, ap.source, 1 AS priority
+        FROM unnest(p_isins) AS req(isin)
+        CROSS JOIN LATERAL (
+            SELECT p.price, p.date, p.source
+            FROM public.asset_prices p
+            WHERE p.isin = req.isin
+            ORDER BY p.date DESC, p.created_at DESC
+            LIMIT 1
+        ) ap
+
+        UNION ALL
+
+        -- Ultimo prezzo da transazione: index scan (asset_id, date DESC) LIMIT 1 per asset
+        SELECT a.isin, tx.price_eur::DOUBLE PRECISION, tx.date, 'Transaction (' || tx.type || ')', 2
+        FROM public.assets a
+        CROSS JOIN LATERAL (
+            SELECT t.price_eur, t.date, t.type
+            FROM public.transactions t
+            WHERE t.asset_id = a.id
+              AND t.price_eur <> 0
+              AND (p_portfolio_id IS NULL OR t.portfolio_id = p_portfolio_id)
+            ORDER BY t.date DESC, t.created_at DESC
+            LIMIT 1
+        ) tx
+        WHERE p_include_transactions
+          AND a.isin = ANY(p_isins)
+    ) candidates
+    ORDER BY candidates.isin, candidates.date DESC, candidates.priority DESC;
+$$;
+
+-- ============================================================================
+-- 3. Grants (vedi 20260527152000_grant_api_access.sql)
+-- ============================================================================
+
+GRANT EXECUTE ON FUNCTION public.get_latest_prices(TEXT[], UUID, BOOLEAN) TO authenticated, service_role;
@@ -0,0 +1,82 @@
+-- Migration: add_unified_price_history
+-- Storia prezzi unificata di un ISIN calcolata lato database, chiamata da
+-- price_manager.get_price_history via rpc/unified_price_history.
+-- Sostituisce tre chiamate REST (prezzi, transazioni del portafoglio, transazioni
+-- degli altri portafogli) più merge/deduplica in pandas.
+--
+-- Regole (invariate rispetto alla versione Python):
+--   * fonti: asset_prices, transazioni del portafoglio ('Transaction (BUY/SELL)'),
+--     transazioni degli altri portafogli ('Transaction'); con p_portfolio_id NULL
+--     tutte le transazioni sono 'Transaction (BUY/SELL)'
+--   * righe con stessa data e stesso prezzo collassano sulla fonte più specifica:
+--     Transaction (BUY/SELL) > Transaction > prezzi espliciti
+--   * ordine per data decrescente; p_since filtra date >= p_since, p_limit le prime N righe
+
+-- ============================================================================
+-- 1. Funzione (RPC)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION public.unified_price_history(
+    p_isin TEXT,
+    p_portfolio_id UUID DEFAULT NULL,
+    p_since DATE DEFAULT NULL,
+    p_limit INTEGER DEFAULT NULL
+)
+RETURNS TABLE (date DATE, price DOUBLE PRECISION, source TEXT)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH asset AS (
+        SELECT id FROM public.assets WHERE isin = p_isin
+    ),
+    -- Con p_limit bastano le ultime N date distinte: ogni data produce almeno una riga,
+    -- quindi le prime N righe deduplicate cadono tutte in quelle date (index scan, niente storia completa)
+    recent_dates AS (
+        SELECT d FROM (
+            (SELECT DISTINCT ap.date AS d FROM public.asset_prices ap
+             WHERE ap.isin = p_isin AND (p_since IS NULL OR ap.date >= p_since)
+             ORDER BY ap.date DESC LIMIT p_limit)
+            UNION
+            (SELECT DISTINCT t.date FROM public.transactions t
+             WHERE t.asset_id IN (SELECT id FROM asset) AND t.price_eur <> 0
+               AND (p_since IS NULL OR t.date >= p_since)
+             ORDER BY t.date DESC LIMIT p_limit)
+        ) dates
+        ORDER BY d DESC
+        LIMIT p_limit
+    ),
+    bounds AS (
+        SELECT CASE WHEN p_limit IS NULL THEN p_since
+                    ELSE GREATEST(p_since, (SELECT MIN(d) FROM recent_dates)) END AS since
+    ),
+    candidates AS (
+        SELECT ap.date, ap.price::DOUBLE PRECISION AS price, ap.source, 1 AS priority
+        FROM public.asset_prices ap, bounds
+        WHERE ap.isin = p_isin AND (bounds.since IS NULL OR ap.date >= bounds.since)
+
+        UNION ALL
+
+        SELECT t.date, t.price_eur::DOUBLE PRECISION,
+               CASE WHEN p_portfolio_id IS NULL OR t.portfolio_id = p_portfolio_id
+                    THEN 'Transaction (' || t.type || ')' ELSE 'Transaction' END,
+               CASE WHEN p_portfolio_id IS NULL OR t.portfolio_id = p_portfolio_id THEN 3 ELSE 2 END
+        FROM public.transactions t, bounds
+        WHERE t.asset_id IN (SELECT id FROM asset) AND t.price_eur <> 0
+          AND (bounds.since IS NULL OR t.date >= bounds.since)
+    ),
+    deduped AS (
+        SELECT DISTINCT ON (c.date, c.price) c.date, c.price, c.source, c.priority
+        FROM candidates c
+        ORDER BY c.date, c.price, c.priority DESC
+    )
+    SELECT deduped.date, deduped.price, deduped.source
+    FROM deduped
+    ORDER BY deduped.date DESC, deduped.priority DESC
+    LIMIT p_limit;
+$$;
+
+-- ============================================================================
+-- 2. Grants (vedi 20260527152000_grant_api_access.sql)
+-- ============================================================================
+
+GRANT EXECUTE ON FUNCTION public.unified_price_history(TEXT, UUID, DATE, INTEGER) TO authenticated, service_role;
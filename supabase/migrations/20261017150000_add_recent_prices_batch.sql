@@ -0,0 +1,27 @@
+-- Migration: add_recent_prices_batch
+-- Ultime N righe della storia prezzi unificata per più ISIN in una sola chiamata,
+-- usata da price_manager.update_asset_trends_batch (trend = ultime 2 righe) dopo /api/sync.
+-- Stesse regole di fonte/deduplica di unified_price_history (20261017140000).
+
+-- ============================================================================
+-- 1. Funzione (RPC)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION public.recent_prices_batch(
+    p_isins TEXT[],
+    p_limit INTEGER DEFAULT 2
+)
+RETURNS TABLE (isin TEXT, date DATE, price DOUBLE PRECISION, source TEXT)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT req.isin, h.date, h.price, h.source
+    FROM unnest(p_isins) AS req(isin)
+    CROSS JOIN LATERAL public.unified_price_history(req.isin, NULL, NULL, p_limit) h;
+$$;
+
+-- ============================================================================
+-- 2. Grants (vedi 20260527152000_grant_api_access.sql)
+-- ============================================================================
+
+GRANT EXECUTE ON FUNCTION public.recent_prices_batch(TEXT[], INTEGER) TO authenticated, service_role;
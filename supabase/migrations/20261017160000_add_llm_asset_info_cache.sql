@@ -0,0 +1,42 @@
+-- Migration: add_llm_asset_info_cache
+-- Cache persistente delle risposte LLM sulle informazioni asset
+-- (api/llm_asset_info.py), condivisa tra portafogli e processi.
+-- Chiave: (isin, model, template_hash). template_hash cambia quando cambiano
+-- il prompt configurato (llm_asset_prompt) o il template DescrAsset.json,
+-- così una modifica del prompt non serve risposte vecchie.
+-- Le righe scadono dopo il TTL (expires_at): i lettori ignorano le righe scadute.
+
+-- ============================================================================
+-- 1. Tabelle
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS public.llm_asset_info_cache (
+    isin TEXT NOT NULL,
+    model TEXT NOT NULL,
+    template_hash TEXT NOT NULL,
+    response_type TEXT NOT NULL CHECK (response_type IN ('json', 'text')),
+    data JSONB NOT NULL,
+    -- Stima dei token della chiamata (prompt + risposta) per le statistiche di risparmio
+    tokens_estimate INTEGER NOT NULL DEFAULT 0,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (isin, model, template_hash)
+);
+
+-- Pulizia delle righe scadute
+CREATE INDEX IF NOT EXISTS idx_llm_asset_info_cache_expires
+    ON public.llm_asset_info_cache(expires_at);
+
+-- ============================================================================
+-- 2. Row Level Security
+-- Accesso esclusivo dal backend Python via SERVICE_ROLE (default-deny),
+-- coerente con 20260202090000_secure_rls.sql.
+-- ============================================================================
+
+ALTER TABLE public.llm_asset_info_cache ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================================
+-- 3. Grants (vedi 20260527152000_grant_api_access.sql)
+-- ============================================================================
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE public.llm_asset_info_cache TO authenticated, service_role;
@@ -0,0 +1,49 @@
+-- Migration: add_background_jobs
+-- Stato dei job in background (api/job_queue.py con JOB_STORE=db): analisi LLM
+-- del report, refresh certificati, compaction prezzi.
+-- Condiviso tra i processi worker, così il polling dello stato funziona
+-- indipendentemente dal processo che ha avviato il job e sopravvive ai riavvii.
+-- Le righe scadono dopo il TTL (expires_at) e vengono cancellate dal backend.
+-- I job attivi (pending = in coda, running = in esecuzione) ricevono un heartbeat
+-- periodico su updated_at: un job attivo senza heartbeat è di un processo interrotto.
+
+-- ============================================================================
+-- 1. Tabelle
+-- ============================================================================
+
+CREATE TABLE IF NOT EXISTS public.background_jobs (
+    job_id UUID PRIMARY KEY,
+    kind TEXT NOT NULL,
+    status TEXT NOT NULL CHECK (status IN ('pending', 'running', 'completed', 'failed')),
+    result JSONB,
+    error TEXT,
+    -- Chiave di deduplica: job identici ancora attivi riusano lo stesso job_id
+    dedup_key TEXT,
+    created_at TIMESTAMPTZ DEFAULT NOW(),
+    updated_at TIMESTAMPTZ DEFAULT NOW(),
+    expires_at TIMESTAMPTZ NOT NULL
+);
+
+-- Un solo job attivo per chiave (deduplica anche tra processi: il secondo insert
+-- fallisce con 23505 e il backend riusa il job esistente); usato anche per la ricerca
+CREATE UNIQUE INDEX IF NOT EXISTS idx_background_jobs_dedup
+    ON public.background_jobs(kind, dedup_key)
+    WHERE status IN ('pending', 'running');
+
+-- Pulizia delle righe scadute
+CREATE INDEX IF NOT EXISTS idx_background_jobs_expires
+    ON public.background_jobs(expires_at);
+
+-- ============================================================================
+-- 2. Row Level Security
+-- Accesso esclusivo dal backend Python via SERVICE_ROLE (default-deny),
+-- coerente con 20260202090000_secure_rls.sql.
+-- ============================================================================
+
+ALTER TABLE public.background_jobs ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================================
+-- 3. Grants (vedi 20260527152000_grant_api_access.sql)
+-- ============================================================================
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE public.background_jobs TO authenticated, service_role;
@@ -0,0 +1,42 @@
+-- Migration: add_certificates_with_underlyings
+-- Certificati con i relativi sottostanti in una sola chiamata (cert_db.get_all_certificates
+-- e cert_db.get_certificates_page), al posto di due GET (certificates + underlyings) e join in Python.
+-- Stessa forma già usata dal backend: { certificate: {...}, underlyings: [...] },
+-- con l'alias 'barrier' (= barrier_abs) sui sottostanti per compatibilità frontend.
+--
+-- p_portfolio_id: se valorizzato, solo i certificati con transazioni nel portafoglio.
+-- Ordine stabile (last_updated desc, isin) per la paginazione con limit/offset.
+
+-- ============================================================================
+-- 1. Funzione (RPC)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION public.certificates_with_underlyings(
+    p_portfolio_id UUID DEFAULT NULL
+)
+RETURNS TABLE (certificate JSONB, underlyings JSONB)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT to_jsonb(c),
+           COALESCE((
+               SELECT jsonb_agg(to_jsonb(u) || jsonb_build_object('barrier', u.barrier_abs) ORDER BY u.id)
+               FROM public.underlyings u
+               WHERE u.isin = c.isin
+           ), '[]'::jsonb)
+    FROM public.certificates c
+    WHERE p_portfolio_id IS NULL
+       OR EXISTS (
+           SELECT 1
+           FROM public.transactions t
+           JOIN public.assets a ON a.id = t.asset_id
+           WHERE t.portfolio_id = p_portfolio_id AND a.isin = c.isin
+       )
+    ORDER BY c.last_updated DESC, c.isin;
+$$;
+
+-- ============================================================================
+-- 2. Grants (vedi 20260527152000_grant_api_access.sql)
+-- ============================================================================
+
+GRANT EXECUTE ON FUNCTION public.certificates_with_underlyings(UUID) TO authenticated, service_role;
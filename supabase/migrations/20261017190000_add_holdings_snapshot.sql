@@ -0,0 +1,170 @@
+-- Migration: add_holdings_snapshot
+-- Quantità nette e capitale netto investito per asset letti dalla vista materializzata
+-- portfolio_holdings (20260212220000) invece di scaricare tutte le transazioni
+-- (validazione ingest, compute_active_holdings, calculate_portfolio_summary).
+--
+-- Controllo di coerenza: un trigger su transactions incrementa un contatore di modifiche
+-- per portafoglio (portfolio_data_changes.change_seq) e refresh_materialized_views registra,
+-- per ogni vista, il contatore di ciascun portafoglio visto dal refresh
+-- (materialized_view_refresh_seqs). Se il contatore attuale è maggiore di quello registrato
+-- la vista è vecchia: portfolio_holdings_snapshot restituisce fresh=false e il backend
+-- ricalcola dalle transazioni.
+--
+-- Contatore e non timestamp: NOW() è l'inizio della transazione, quindi una scrittura
+-- iniziata prima di un refresh e confermata dopo avrebbe changed_at < refreshed_at pur non
+-- essendo nella vista. L'incremento invece blocca la riga del portafoglio fino al commit:
+-- il refresh legge sempre l'ultimo valore confermato, e ogni scrittura non ancora confermata
+-- lo supererà.
+
+-- ============================================================================
+-- 1. Tabelle
+-- ============================================================================
+
+-- Contatore e ultima modifica per (portafoglio, tabella sorgente). Senza FK su portfolios:
+-- la cancellazione a cascata di un portafoglio attiva il trigger sulle sue transazioni.
+-- changed_at è solo informativo (materialized_view_status), la coerenza usa change_seq.
+CREATE TABLE IF NOT EXISTS public.portfolio_data_changes (
+    portfolio_id UUID NOT NULL,
+    source_table TEXT NOT NULL,
+    change_seq BIGINT NOT NULL DEFAULT 1,
+    changed_at TIMESTAMPTZ NOT NULL DEFAULT NOW(),
+    PRIMARY KEY (portfolio_id, source_table)
+);
+
+-- Ultimo refresh di ogni vista (informativo)
+CREATE TABLE IF NOT EXISTS public.materialized_view_refreshes (
+    view_name TEXT PRIMARY KEY,
+    refreshed_at TIMESTAMPTZ NOT NULL
+);
+
+-- Contatore di modifiche di ogni portafoglio già incluso nella vista
+CREATE TABLE IF NOT EXISTS public.materialized_view_refresh_seqs (
+    view_name TEXT NOT NULL,
+    portfolio_id UUID NOT NULL,
+    change_seq BIGINT NOT NULL,
+    PRIMARY KEY (view_name, portfolio_id)
+);
+
+-- ============================================================================
+-- 2. Trigger (marcatura delle modifiche)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION public.mark_portfolio_data_changed()
+RETURNS trigger
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        INSERT INTO public.portfolio_data_changes (portfolio_id, source_table, changed_at)
+        VALUES (OLD.portfolio_id, TG_TABLE_NAME, NOW())
+        ON CONFLICT (portfolio_id, source_table) DO UPDATE
+        SET change_seq = portfolio_data_changes.change_seq + 1, changed_at = EXCLUDED.changed_at;
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        INSERT INTO public.portfolio_data_changes (portfolio_id, source_table, changed_at)
+        VALUES (NEW.portfolio_id, TG_TABLE_NAME, NOW())
+        ON CONFLICT (portfolio_id, source_table) DO UPDATE
+        SET change_seq = portfolio_data_changes.change_seq + 1, changed_at = EXCLUDED.changed_at;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_transactions_mark_changed ON public.transactions;
+CREATE TRIGGER trg_transactions_mark_changed
+    AFTER INSERT OR UPDATE OR DELETE ON public.transactions
+    FOR EACH ROW EXECUTE FUNCTION public.mark_portfolio_data_changed();
+
+-- ============================================================================
+-- 3. Funzioni (RPC)
+-- ============================================================================
+
+-- Stesso refresh di 20260212220000, con registrazione dei contatori visti.
+-- I contatori sono letti prima del refresh: ogni modifica che conta è già confermata e
+-- quindi nella vista; una modifica confermata nel frattempo rende la vista vecchia (al più
+-- un falso "stale"). GREATEST: un refresh che ha letto contatori più vecchi ma è terminato
+-- dopo non fa regredire quelli registrati.
+CREATE OR REPLACE FUNCTION public.refresh_materialized_views()
+RETURNS void AS $$
+DECLARE
+  v_seen public.portfolio_data_changes[];
+BEGIN
+  v_seen := ARRAY(SELECT c FROM public.portfolio_data_changes c);
+
+  REFRESH MATERIALIZED VIEW CONCURRENTLY portfolio_holdings;
+  REFRESH MATERIALIZED VIEW CONCURRENTLY dividend_totals;
+  REFRESH MATERIALIZED VIEW CONCURRENTLY portfolio_stats;
+
+  INSERT INTO public.materialized_view_refresh_seqs (view_name, portfolio_id, change_seq)
+  SELECT v.view_name, s.portfolio_id, s.change_seq
+  FROM unnest(v_seen) s
+  JOIN (VALUES
+      ('portfolio_holdings', 'transactions'),
+      ('portfolio_stats', 'transactions'),
+      ('dividend_totals', 'dividends')
+  ) AS v(view_name, source_table) ON v.source_table = s.source_table
+  ON CONFLICT (view_name, portfolio_id) DO UPDATE
+  SET change_seq = GREATEST(materialized_view_refresh_seqs.change_seq, EXCLUDED.change_seq);
+
+  INSERT INTO public.materialized_view_refreshes (view_name, refreshed_at)
+  VALUES ('portfolio_holdings', NOW()), ('dividend_totals', NOW()), ('portfolio_stats', NOW())
+  ON CONFLICT (view_name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Holdings del portafoglio dalla vista + flag di coerenza.
+-- I metadati asset (nome, classe, trend) sono letti da assets: nella vista sono
+-- fotografati all'ultimo refresh, mentre il trend cambia a ogni sync prezzi.
+CREATE OR REPLACE FUNCTION public.portfolio_holdings_snapshot(p_portfolio_id UUID)
+RETURNS JSONB
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT jsonb_build_object(
+        'fresh', NOT EXISTS (
+            SELECT 1
+            FROM public.portfolio_data_changes c
+            LEFT JOIN public.materialized_view_refresh_seqs r
+                   ON r.view_name = 'portfolio_holdings' AND r.portfolio_id = c.portfolio_id
+            WHERE c.portfolio_id = p_portfolio_id
+              AND c.source_table = 'transactions'
+              AND c.change_seq > COALESCE(r.change_seq, 0)
+        ),
+        'rows', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object(
+                'asset_id', h.asset_id,
+                'isin', a.isin,
+                'name', a.name,
+                'asset_class', a.asset_class,
+                'last_trend_variation', a.last_trend_variation,
+                'qty', h.qty,
+                'net_invested', h.net_invested,
+                'num_transactions', h.num_transactions,
+                'last_transaction_date', h.last_transaction_date
+            ))
+            FROM public.portfolio_holdings h
+            JOIN public.assets a ON a.id = h.asset_id
+            WHERE h.portfolio_id = p_portfolio_id
+        ), '[]'::jsonb)
+    );
+$$;
+
+-- ============================================================================
+-- 4. Row Level Security
+-- Accesso esclusivo dal backend Python via SERVICE_ROLE (default-deny),
+-- coerente con 20260202090000_secure_rls.sql.
+-- ============================================================================
+
+ALTER TABLE public.portfolio_data_changes ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.materialized_view_refreshes ENABLE ROW LEVEL SECURITY;
+ALTER TABLE public.materialized_view_refresh_seqs ENABLE ROW LEVEL SECURITY;
+
+-- ============================================================================
+-- 5. Grants (vedi 20260527152000_grant_api_access.sql)
+-- ============================================================================
+
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE public.portfolio_data_changes TO authenticated, service_role;
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE public.materialized_view_refreshes TO authenticated, service_role;
+GRANT SELECT, INSERT, UPDATE, DELETE ON TABLE public.materialized_view_refresh_seqs TO authenticated, service_role;
+GRANT EXECUTE ON FUNCTION public.refresh_materialized_views() TO authenticated, service_role;
+GRANT EXECUTE ON FUNCTION public.portfolio_holdings_snapshot(UUID) TO authenticated, service_role;
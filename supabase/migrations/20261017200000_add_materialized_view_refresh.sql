@@ -0,0 +1,94 @@
+-- Migration: add_materialized_view_refresh
+-- Refresh delle viste materializzate per singola vista, usato dal servizio di refresh
+-- con debounce del backend (api/mv_refresh.py) al posto del refresh completo e sincrono
+-- di refresh_materialized_views a ogni /api/sync.
+--
+-- - refresh_materialized_view(p_view): REFRESH ... CONCURRENTLY di una sola vista
+--   (indici unici già presenti, 20260212220000) + registrazione dei contatori di modifica
+--   visti dal refresh, come refresh_materialized_views (20261017190000).
+-- - Trigger su dividends: stessa marcatura delle modifiche di transactions
+--   (20261017190000), così anche dividend_totals ha il suo stato di aggiornamento.
+-- - materialized_view_status(): per ogni vista ultimo refresh, ultima modifica
+--   delle tabelle sorgente e flag stale (contatori, non timestamp).
+
+-- ============================================================================
+-- 1. Trigger (marcatura delle modifiche ai dividendi)
+-- ============================================================================
+
+DROP TRIGGER IF EXISTS trg_dividends_mark_changed ON public.dividends;
+CREATE TRIGGER trg_dividends_mark_changed
+    AFTER INSERT OR UPDATE OR DELETE ON public.dividends
+    FOR EACH ROW EXECUTE FUNCTION public.mark_portfolio_data_changed();
+
+-- ============================================================================
+-- 2. Funzioni (RPC)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION public.refresh_materialized_view(p_view TEXT)
+RETURNS TIMESTAMPTZ
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_source TEXT;
+    v_seen public.portfolio_data_changes[];
+BEGIN
+    -- Solo le viste note: il nome finisce in SQL dinamico
+    IF p_view NOT IN ('portfolio_holdings', 'dividend_totals', 'portfolio_stats') THEN
+        RAISE EXCEPTION 'Vista materializzata non gestita: %', p_view;
+    END IF;
+    v_source := CASE p_view WHEN 'dividend_totals' THEN 'dividends' ELSE 'transactions' END;
+
+    -- Contatori letti prima del refresh (vedi refresh_materialized_views)
+    v_seen := ARRAY(SELECT c FROM public.portfolio_data_changes c WHERE c.source_table = v_source);
+
+    EXECUTE format('REFRESH MATERIALIZED VIEW CONCURRENTLY public.%I', p_view);
+
+    INSERT INTO public.materialized_view_refresh_seqs (view_name, portfolio_id, change_seq)
+    SELECT p_view, s.portfolio_id, s.change_seq
+    FROM unnest(v_seen) s
+    ON CONFLICT (view_name, portfolio_id) DO UPDATE
+    SET change_seq = GREATEST(materialized_view_refresh_seqs.change_seq, EXCLUDED.change_seq);
+
+    INSERT INTO public.materialized_view_refreshes (view_name, refreshed_at)
+    VALUES (p_view, NOW())
+    ON CONFLICT (view_name) DO UPDATE SET refreshed_at = EXCLUDED.refreshed_at;
+    RETURN NOW();
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION public.materialized_view_status()
+RETURNS TABLE (view_name TEXT, refreshed_at TIMESTAMPTZ, last_change_at TIMESTAMPTZ, stale BOOLEAN)
+LANGUAGE sql
+STABLE
+AS $$
+    SELECT v.view_name,
+           r.refreshed_at,
+           c.last_change_at,
+           EXISTS (
+               SELECT 1
+               FROM public.portfolio_data_changes d
+               LEFT JOIN public.materialized_view_refresh_seqs s
+                      ON s.view_name = v.view_name AND s.portfolio_id = d.portfolio_id
+               WHERE d.source_table = v.source_table
+                 AND d.change_seq > COALESCE(s.change_seq, 0)
+           )
+    FROM (VALUES
+        ('portfolio_holdings', 'transactions'),
+        ('portfolio_stats', 'transactions'),
+        ('dividend_totals', 'dividends')
+    ) AS v(view_name, source_table)
+    LEFT JOIN public.materialized_view_refreshes r ON r.view_name = v.view_name
+    LEFT JOIN LATERAL (
+        SELECT MAX(d.changed_at) AS last_change_at
+        FROM public.portfolio_data_changes d
+        WHERE d.source_table = v.source_table
+    ) c ON TRUE
+    ORDER BY v.view_name;
+$$;
+
+-- ============================================================================
+-- 3. Grants (vedi 20260527152000_grant_api_access.sql)
+-- ============================================================================
+
+GRANT EXECUTE ON FUNCTION public.refresh_materialized_view(TEXT) TO authenticated, service_role;
+GRANT EXECUTE ON FUNCTION public.materialized_view_status() TO authenticated, service_role;
@@ -0,0 +1,95 @@
+-- Migration: add_apply_price_edits
+-- Applica in una sola chiamata (e in una sola transazione) l'insieme di modifiche ai
+-- prezzi di un ISIN fatte dall'editor prezzi (/api/asset-prices/sync), al posto di un
+-- DELETE e/o un upsert per riga seguiti dal ricalcolo del trend in Python.
+--
+-- p_deletions: [{date, source}]        righe da eliminare (incluse le vecchie chiavi
+--                                       delle righe a cui sono cambiate data o fonte)
+-- p_upserts:   [{date, source, price}] righe da inserire/aggiornare; a parità di chiave
+--                                       vale l'ultima dell'elenco
+-- Le eliminazioni precedono gli upsert. Il trend dell'asset è ricalcolato con le stesse
+-- regole di price_manager.update_asset_trends_batch (ultime 2 righe della storia unificata;
+-- prezzo precedente nullo = trend invariato; meno di 2 righe = trend azzerato).
+-- Ritorna { deleted, upserted, trend: {variation, days}, head: [{date, price, source}] }
+-- con head = prime p_head_limit righe della storia unificata (vista di p_portfolio_id).
+
+-- ============================================================================
+-- 1. Funzione (RPC)
+-- ============================================================================
+
+CREATE OR REPLACE FUNCTION public.apply_price_edits(
+    p_isin TEXT,
+    p_deletions JSONB DEFAULT '[]'::jsonb,
+    p_upserts JSONB DEFAULT '[]'::jsonb,
+    p_portfolio_id UUID DEFAULT NULL,
+    p_head_limit INTEGER DEFAULT 2
+)
+RETURNS JSONB
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_deleted INTEGER := 0;
+    v_upserted INTEGER := 0;
+    v_prices DOUBLE PRECISION[];
+    v_dates DATE[];
+    v_variation DOUBLE PRECISION;
+    v_days INTEGER;
+BEGIN
+    DELETE FROM public.asset_prices ap
+    USING jsonb_to_recordset(COALESCE(p_deletions, '[]'::jsonb)) AS d(date DATE, source TEXT)
+    WHERE ap.isin = p_isin AND ap.date = d.date AND ap.source = d.source;
+    GET DIAGNOSTICS v_deleted = ROW_COUNT;
+
+    -- DISTINCT ON: un upsert non può toccare due volte la stessa riga
+    INSERT INTO public.asset_prices (isin, date, source, price)
+    SELECT p_isin, u.date, u.source, u.price
+    FROM (
+        SELECT DISTINCT ON (r.date, r.source) r.date, r.source, r.price
+        FROM (
+            SELECT (e.item->>'date')::DATE AS date, e.item->>'source' AS source,
+                   (e.item->>'price')::NUMERIC AS price, e.n
+            FROM jsonb_array_elements(COALESCE(p_upserts, '[]'::jsonb)) WITH ORDINALITY AS e(item, n)
+        ) r
+        WHERE r.date IS NOT NULL AND r.source IS NOT NULL AND r.price IS NOT NULL
+        ORDER BY r.date, r.source, r.n DESC
+    ) u
+    ON CONFLICT (isin, date, source) DO UPDATE SET price = EXCLUDED.price;
+    GET DIAGNOSTICS v_upserted = ROW_COUNT;
+
+    -- Trend: ultime 2 righe della storia unificata (come recent_prices_batch)
+    SELECT array_agg(h.price ORDER BY h.n), array_agg(h.date ORDER BY h.n)
+    INTO v_prices, v_dates
+    FROM public.unified_price_history(p_isin, NULL, NULL, 2) WITH ORDINALITY AS h(date, price, source, n);
+
+    IF COALESCE(array_length(v_prices, 1), 0) >= 2 THEN
+        IF v_prices[2] <> 0 THEN
+            v_variation := (v_prices[1] - v_prices[2]) / v_prices[2] * 100;
+            v_days := v_dates[1] - v_dates[2];
+            UPDATE public.assets
+            SET last_trend_variation = v_variation, last_trend_days = v_days, last_trend_ts = NOW()
+            WHERE isin = p_isin;
+        END IF;
+    ELSE
+        UPDATE public.assets
+        SET last_trend_variation = NULL, last_trend_days = NULL, last_trend_ts = NOW()
+        WHERE isin = p_isin;
+    END IF;
+
+    RETURN jsonb_build_object(
+        'deleted', v_deleted,
+        'upserted', v_upserted,
+        'trend', jsonb_build_object('variation', v_variation, 'days', v_days),
+        'head', COALESCE((
+            SELECT jsonb_agg(jsonb_build_object('date', h.date, 'price', h.price, 'source', h.source) ORDER BY h.n)
+            FROM public.unified_price_history(p_isin, p_portfolio_id, NULL, p_head_limit)
+                 WITH ORDINALITY AS h(date, price, source, n)
+        ), '[]'::jsonb)
+    );
+END;
+$$;
+
+-- ============================================================================
+-- 2. Grants (vedi 20260527152000_grant_api_access.sql)
+-- ============================================================================
+
+GRANT EXECUTE ON FUNCTION public.apply_price_edits(TEXT, JSONB, JSONB, UUID, INTEGER) TO authenticated, service_role;
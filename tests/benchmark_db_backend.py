@@ -0,0 +1,65 @@
+import sys
+import os
+import time
+from datetime import date, timedelta
+
+# Aggiungi la directory api al path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import db_helper
+import pg_backend
+
+# Benchmark letture massive: PostgREST (fetch_all a pagine HTTP) contro connessione
+# diretta a Postgres (cursore lato server) sullo storico prezzi.
+# Richiede il DB locale di docker-compose (DATABASE_URL), le credenziali Supabase
+# e psycopg2 (pip install psycopg2-binary).
+# Uso: python tests/benchmark_db_backend.py [n_isin] [n_giorni]
+
+SOURCE = 'Benchmark'
+
+def seed(n_isins, n_days):
+    isins = [f"BENCH{i:07d}" for i in range(n_isins)]
+    start = date(2020, 1, 1)
+    rows = [
+        {'isin': isin, 'date': (start + timedelta(days=d)).isoformat(), 'price': 100 + (i + d) % 37, 'source': SOURCE}
+        for i, isin in enumerate(isins) for d in range(n_days)
+    ]
+    for i in range(0, len(rows), 5000):
+        resp = pg_backend.execute_request('asset_prices', 'POST', params={'on_conflict': 'isin,date,source'},
+                                          body=rows[i:i + 5000])
+        if resp.status_code != 201:
+            raise SystemExit(f"Seed fallito: {resp.text}")
+    return isins
+
+def cleanup():
+    pg_backend.execute_request('asset_prices', 'DELETE', params={'source': f'eq.{SOURCE}'})
+
+def timed_read(backend, isins, runs=3):
+    db_helper.DB_BACKEND = backend
+    params = {'select': 'isin,date,price', 'isin': f"in.({','.join(isins)})", 'source': f'eq.{SOURCE}', 'order': 'isin.asc,date.asc'}
+    best, count = None, 0
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        count = len(db_helper.fetch_all_rows('asset_prices', params=params))
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+    return best, count
+
+if __name__ == '__main__':
+    if not pg_backend.is_available():
+        raise SystemExit("psycopg2 o DATABASE_URL non disponibili")
+
+    n_isins = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    n_days = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+
+    isins = seed(n_isins, n_days)
+    try:
+        rest_time, rest_rows = timed_read('rest', isins)
+        pg_time, pg_rows = timed_read('postgres', isins)
+    finally:
+        cleanup()
+
+    print(f"Righe: REST {rest_rows}, Postgres {pg_rows}")
+    print(f"REST (PostgREST, pagine da {db_helper.DEFAULT_PAGE_SIZE}): {rest_time * 1000:.1f} ms")
+    print(f"Postgres diretto (cursore lato server):  {pg_time * 1000:.1f} ms")
+    print(f"Speedup: {rest_time / pg_time:.2f}x")
@@ -0,0 +1,72 @@
+import sys
+import os
+import time
+import warnings
+
+import pandas as pd
+
+# Aggiungi la directory api al path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import ingest
+from ingest import clean_money_value, parse_date, normalize_columns
+
+# Benchmark parsing upload Excel: percorso per-riga (iterrows + clean_money_value/parse_date
+# per cella, come i parser precedenti) contro i parser vettoriali di ingest.py, sui
+# template in Templates/ replicati fino a n righe. Verifica anche che i risultati coincidano.
+# Uso: python tests/benchmark_ingest.py [n_righe]
+
+TEMPLATES = os.path.join(os.path.dirname(__file__), '..', 'Templates')
+CASES = [
+    # (file, parser, colonne denaro, colonne data)
+    ('PortfolioMP_Prezzi_Templates.xlsx', ingest.parse_prices_file, ['prezzo corrente (eur)'], ['data']),
+    ('Portfolio_AcquistiVendite_Template.xlsx', ingest.parse_transactions_file,
+     ['quantità', 'prezzo operazione (eur)'], ['data (acquisto/vendita)']),
+    ('Portfolio_Cedole_Template.xlsx', ingest.parse_dividends_file, ['valore cedola (eur)'], ['data flusso']),
+]
+
+def load(name, n_rows, as_text):
+    df = normalize_columns(pd.read_excel(os.path.join(TEMPLATES, name)))
+    df = pd.concat([df] * (n_rows // len(df) + 1), ignore_index=True).head(n_rows)
+    if as_text:
+        # Come un CSV esportato dalla banca: date e importi come testo in formato IT
+        for col in df.columns:
+            if pd.api.types.is_datetime64_any_dtype(df[col]):
+                df[col] = df[col].dt.strftime('%d/%m/%Y')
+            elif pd.api.types.is_float_dtype(df[col]):
+                df[col] = df[col].map(lambda v: f"{v:,.2f}".replace(',', 'X').replace('.', ',').replace('X', '.'))
+    return df
+
+def row_path(df, money_cols, date_cols):
+    out = []
+    for _, row in df.iterrows():
+        out.append([clean_money_value(row[c]) for c in money_cols] + [parse_date(row[c]) for c in date_cols])
+    return out
+
+def column_path(df, money_cols, date_cols):
+    cols = [ingest.clean_money_series(df[c]) for c in money_cols] + [ingest.parse_date_series(df[c]) for c in date_cols]
+    return [list(r) for r in zip(*(c.tolist() for c in cols))]
+
+def timed(fn, *args):
+    t0 = time.perf_counter()
+    result = fn(*args)
+    return time.perf_counter() - t0, result
+
+def main():
+    n_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 50000
+    warnings.simplefilter('ignore')
+    ingest.logger.disabled = True
+    print(f"{'file':45} {'input':6} {'per riga':>12} {'per colonna':>12} {'speedup':>8} {'parser':>9}")
+    for name, parser, money_cols, date_cols in CASES:
+        for as_text in (False, True):
+            df = load(name, n_rows, as_text)
+            t_row, rows = timed(row_path, df, money_cols, date_cols)
+            t_col, cols = timed(column_path, df, money_cols, date_cols)
+            if rows != cols:
+                raise SystemExit(f"Risultati diversi per {name} (testo={as_text})")
+            t_parser, _ = timed(parser, df)
+            print(f"{name:45} {'testo' if as_text else 'excel':6} {t_row:11.3f}s {t_col:11.3f}s "
+                  f"{t_row / t_col:7.1f}x {t_parser:8.3f}s")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,96 @@
+import random
+import sys
+import os
+import time
+from datetime import datetime, timedelta
+
+# Aggiungi la directory api al path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import numpy as np
+import finance
+from finance import xirr, xirr_multi_guess, xirr_bracketed
+
+# Micro-benchmark XIRR: confronta 'multi_guess' (fino a 9 Newton-Raphson) con il solver
+# bracketed a passata singola, sulle forme di cash flow prodotte dalla dashboard.
+# Uso: python tests/benchmark_xirr.py
+
+class _CountingNumpy:
+    """Proxy di numpy che conta le chiamate a np.sum (2 per ogni valutazione NPV + derivata)."""
+    def __init__(self):
+        self.sum_calls = 0
+
+    def __getattr__(self, name):
+        return getattr(np, name)
+
+    def sum(self, *args, **kwargs):
+        self.sum_calls += 1
+        return np.sum(*args, **kwargs)
+
+def build_flow_shapes(seed=42):
+    """Serie tipiche: PAC mensile, acquisti sparsi con vendite e cedole, portafoglio in perdita."""
+    rnd = random.Random(seed)
+    shapes = {"pac_mensile": [], "misto_con_cedole": [], "in_perdita": []}
+    base = datetime(2016, 1, 4)
+
+    for _ in range(100):
+        # PAC: un acquisto al mese per 2-8 anni
+        months = rnd.randint(24, 96)
+        flows = [{"date": base + timedelta(days=30 * m), "amount": -rnd.uniform(200, 500)} for m in range(months)]
+        end = flows[-1]['date'] + timedelta(days=15)
+        flows.append({"date": end, "amount": -sum(f['amount'] for f in flows) * rnd.uniform(1.0, 1.6)})
+        shapes["pac_mensile"].append(flows)
+
+        # Misto: acquisti, vendite parziali e cedole
+        flows, d = [], base
+        for _ in range(rnd.randint(5, 40)):
+            kind = rnd.random()
+            amount = -rnd.uniform(500, 5000) if kind < 0.6 else (rnd.uniform(200, 2000) if kind < 0.8 else rnd.uniform(5, 80))
+            flows.append({"date": d, "amount": amount})
+            d += timedelta(days=rnd.randint(10, 120))
+        flows.append({"date": d, "amount": max(1.0, -sum(f['amount'] for f in flows)) * rnd.uniform(0.8, 1.4)})
+        shapes["misto_con_cedole"].append(flows)
+
+        # In perdita: valore finale molto sotto l'investito (Newton spesso instabile)
+        flows = [{"date": base + timedelta(days=rnd.randint(0, 900)), "amount": -rnd.uniform(1000, 3000)} for _ in range(rnd.randint(2, 10))]
+        end = max(f['date'] for f in flows) + timedelta(days=rnd.randint(5, 400))
+        flows.append({"date": end, "amount": -sum(f['amount'] for f in flows) * rnd.uniform(0.05, 0.6)})
+        shapes["in_perdita"].append(flows)
+
+    return shapes
+
+def run(solver, series):
+    counter = _CountingNumpy()
+    finance.np = counter
+    try:
+        t0 = time.perf_counter()
+        results = [solver(s) for s in series]
+        elapsed = time.perf_counter() - t0
+    finally:
+        finance.np = np
+    return results, elapsed, counter.sum_calls / 2.0
+
+def standard_with_fallback(flows):
+    """Vecchio percorso 'standard' di get_tiered_mwr: xirr e, se fallisce, xirr_multi_guess."""
+    val = xirr(flows)
+    if val is None or abs(val) > 10.0:
+        val = xirr_multi_guess(flows)
+    return val
+
+if __name__ == "__main__":
+    solvers = [
+        ("multi_guess", xirr_multi_guess),
+        ("standard+fallback", standard_with_fallback),
+        ("bracketed", xirr_bracketed),
+    ]
+
+    print(f"{'forma':<18} {'solver':<18} {'ms/solve':>9} {'NPV eval/solve':>15} {'risolti':>8}")
+    for shape, series in build_flow_shapes().items():
+        for name, solver in solvers:
+            results, elapsed, evals = run(solver, series)
+            solved = sum(1 for r in results if r is not None and abs(r) <= 10.0)
+            print(f"{shape:<18} {name:<18} {elapsed / len(series) * 1000:>9.3f} {evals / len(series):>15.1f} {solved:>5}/{len(series)}")
+
+        # Iterazioni riportate dal solver bracketed
+        iterations = [xirr_bracketed(s, return_iterations=True)[1] for s in series]
+        print(f"{'':<18} {'bracketed iter':<18} media={np.mean(iterations):.1f} max={max(iterations)}")
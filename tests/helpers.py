@@ -0,0 +1,11 @@
+"""Helper condivisi dai test."""
+
+from unittest.mock import MagicMock
+
+
+def response(data, status=200):
+    """Risposta HTTP finta (come quelle di db_helper.execute_request): status_code e json()."""
+    r = MagicMock()
+    r.status_code = status
+    r.json.return_value = data
+    return r
@@ -0,0 +1,64 @@
+
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+from flask import Flask
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import asset_prices
+from helpers import response
+
+class TestAssetPricesSync(unittest.TestCase):
+
+    def setUp(self):
+        app = Flask(__name__)
+        app.register_blueprint(asset_prices.prices_bp)
+        self.client = app.test_client()
+        for name in ('bump_data_version', 'invalidate_valuations_for_prices'):
+            patcher = patch.object(asset_prices, name)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_edit_set_is_applied_with_one_rpc_call(self):
+        head = [{'date': '2024-03-02', 'price': 11.0, 'source': 'Manual Upload'}]
+        rpc_result = {'deleted': 2, 'upserted': 2, 'trend': {'variation': 10.0, 'days': 1}, 'head': head}
+        with patch.object(asset_prices, 'execute_request', return_value=response(rpc_result)) as rpc:
+            res = self.client.post('/api/asset-prices/sync', json={
+                'isin': 'IT0000000001',
+                'portfolio_id': 'p1',
+                'deletions': [{'date': '2024-01-01', 'source': 'Manual Upload'}, {'date': None, 'source': 'X'}],
+                'updates': [
+                    {'old_date': '2024-03-01', 'old_source': 'Manual Upload', 'new_date': '2024-03-02',
+                     'new_source': 'Manual Upload', 'new_price': '11'},
+                    {'old_date': '2024-02-01', 'old_source': 'Yahoo Finance', 'new_date': '2024-02-01',
+                     'new_source': 'Yahoo Finance', 'new_price': 9.5},
+                    {'old_date': '2024-02-02', 'old_source': 'Yahoo Finance', 'new_date': None,
+                     'new_source': 'Yahoo Finance', 'new_price': 9.5},
+                ]
+            })
+
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.get_json()['head'], head)
+        rpc.assert_called_once()
+        self.assertEqual(rpc.call_args.args[0], 'rpc/apply_price_edits')
+        body = rpc.call_args.kwargs['body']
+        # Vecchia chiave eliminata solo per la riga a cui è cambiata la data
+        self.assertEqual(body['p_deletions'], [{'date': '2024-01-01', 'source': 'Manual Upload'},
+                                               {'date': '2024-03-01', 'source': 'Manual Upload'}])
+        self.assertEqual(body['p_upserts'], [{'date': '2024-03-02', 'source': 'Manual Upload', 'price': 11.0},
+                                             {'date': '2024-02-01', 'source': 'Yahoo Finance', 'price': 9.5}])
+        self.assertEqual(body['p_portfolio_id'], 'p1')
+        asset_prices.invalidate_valuations_for_prices.assert_called_once_with({'IT0000000001': '2024-01-01'})
+
+    def test_rpc_failure_returns_error(self):
+        with patch.object(asset_prices, 'execute_request', return_value=response({}, 404)):
+            res = self.client.post('/api/asset-prices/sync', json={'isin': 'IT0000000001', 'deletions': [], 'updates': []})
+        self.assertEqual(res.status_code, 500)
+        asset_prices.bump_data_version.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,59 @@
+
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import cert_db
+from helpers import response
+
+class TestCertificatesBulkLoad(unittest.TestCase):
+
+    def test_single_rpc_call_with_portfolio_filter(self):
+        rows = [{'certificate': {'isin': 'XS1'}, 'underlyings': [{'isin': 'XS1', 'barrier_abs': 10, 'barrier': 10}]}]
+        with patch.object(cert_db, 'execute_request', return_value=response(rows)) as req:
+            result = cert_db.get_all_certificates(portfolio_id='p1')
+
+        self.assertEqual(result, rows)
+        req.assert_called_once()
+        self.assertEqual(req.call_args.args[0], 'rpc/certificates_with_underlyings')
+        self.assertEqual(req.call_args.kwargs['body'], {'p_portfolio_id': 'p1'})
+
+    def test_page_reports_next_offset(self):
+        rows = [{'certificate': {'isin': f'XS{i}'}, 'underlyings': []} for i in range(3)]
+        with patch.object(cert_db, 'execute_request', side_effect=[response(rows), response(rows[:1])]) as req:
+            first, next_offset = cert_db.get_certificates_page(limit=2)
+            last, end = cert_db.get_certificates_page(limit=2, offset=next_offset)
+
+        self.assertEqual((len(first), next_offset), (2, 2))
+        self.assertEqual((len(last), end), (1, None))
+        self.assertEqual([c.kwargs['params'] for c in req.call_args_list],
+                         [{'limit': 3, 'offset': 0}, {'limit': 3, 'offset': 2}])
+
+    def test_list_route_paginates_behind_query_params(self):
+        from flask import Flask
+        import cert_routes
+        app = Flask(__name__)
+        app.register_blueprint(cert_routes.certificates_bp)
+        page = [{'certificate': {'isin': 'XS1'}, 'underlyings': []}]
+        with patch.object(cert_db, 'get_certificates_page', return_value=(page, 1)) as get_page, \
+             patch.object(cert_db, 'get_all_certificates') as get_all:
+            res = app.test_client().get('/api/certificates?live=false&limit=1&offset=0&portfolio_id=p1')
+            bad = app.test_client().get('/api/certificates?limit=abc')
+
+        self.assertEqual(res.get_json()['next_offset'], 1)
+        self.assertEqual([c['isin'] for c in res.get_json()['certificates']], ['XS1'])
+        get_page.assert_called_once_with('p1', limit=1, offset=0)
+        get_all.assert_not_called()
+        self.assertEqual(bad.status_code, 400)
+
+    def test_failure_raises(self):
+        with patch.object(cert_db, 'execute_request', return_value=response(None, 500)):
+            with self.assertRaises(cert_db.CertDatabaseError):
+                cert_db.get_all_certificates()
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+
+import unittest
+import sys
+import os
+import threading
+import time
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import cert_analyzer
+
+class TestCertQuoteService(unittest.TestCase):
+
+    def setUp(self):
+        self.provider = cert_analyzer.StubQuoteProvider({'ENI.MI': 14.2, 'ISP.MI': 3.1, 'UCG.MI': 35.0})
+        previous = cert_analyzer.set_quote_provider(self.provider)
+        self.addCleanup(cert_analyzer.set_quote_provider, previous)
+
+    def test_dedup_and_cache(self):
+        prices = cert_analyzer.get_live_prices(['ENI.MI', 'ISP.MI', 'ENI.MI', None, 'BAD.MI'])
+        self.assertEqual(prices, {'ENI.MI': 14.2, 'ISP.MI': 3.1, 'BAD.MI': None})
+        self.assertEqual(sorted(self.provider.calls), ['BAD.MI', 'ENI.MI', 'ISP.MI'])
+
+        # Entro il TTL nessuna nuova chiamata, nemmeno per il ticker senza prezzo
+        self.assertEqual(cert_analyzer.get_live_price('ENI.MI'), 14.2)
+        self.assertIsNone(cert_analyzer.get_live_price('BAD.MI'))
+        self.assertEqual(len(self.provider.calls), 3)
+
+    def test_missing_tickers_fetched_concurrently(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def slow_provider(ticker):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return 1.0
+
+        cert_analyzer.set_quote_provider(slow_provider)
+        prices = cert_analyzer.get_live_prices([f'T{i}' for i in range(6)])
+
+        self.assertEqual(len(prices), 6)
+        self.assertGreater(peak[0], 1)
+        self.assertLessEqual(peak[0], cert_analyzer.QUOTE_WORKERS)
+
+if __name__ == '__main__':
+    unittest.main()
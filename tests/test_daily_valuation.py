@@ -0,0 +1,127 @@
+
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import daily_valuation
+from price_manager import PriceMatrix
+from helpers import response
+
+TRANSACTIONS = [
+    {'date': '2024-01-02', 'quantity': 10, 'price_eur': 100.0, 'type': 'BUY', 'assets': {'id': 'a1', 'isin': 'IT0000000001'}},
+    {'date': '2024-01-04', 'quantity': 4, 'price_eur': 110.0, 'type': 'SELL', 'assets': {'id': 'a1', 'isin': 'IT0000000001'}},
+    {'date': '2024-01-05', 'quantity': 6, 'price_eur': 105.0, 'type': 'SELL', 'assets': {'id': 'a1', 'isin': 'IT0000000001'}},
+]
+DIVIDENDS = [{'asset_id': 'a1', 'amount_eur': 5.0, 'date': '2024-01-03'}]
+PRICES = PriceMatrix.from_observations(
+    ['IT0000000001'] * 4, ['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-05'], [100.0, 102.0, 110.0, 105.0],
+    end='2024-01-05')
+
+class TestRebuildDailyValuations(unittest.TestCase):
+
+    def setUp(self):
+        self.written = []
+
+        def fake_fetch_all(table, params=None, page_size=1000, keyset=None, prefetch=False):
+            data = {'transactions': TRANSACTIONS, 'dividends': DIVIDENDS}.get(table, [])
+            if data:
+                yield data
+
+        def fake_upsert(table, data, on_conflict=None):
+            if table == daily_valuation.VALUATION_TABLE:
+                self.written.extend(data)
+            return True
+
+        patches = [
+            patch.object(daily_valuation, 'fetch_all', side_effect=fake_fetch_all),
+            patch.object(daily_valuation, 'execute_request', return_value=response([])),
+            patch.object(daily_valuation, 'upsert_table', side_effect=fake_upsert),
+            patch.object(daily_valuation, 'delete_table', return_value=True),
+            patch.object(daily_valuation, 'get_price_matrix', return_value=PRICES),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_rows_only_while_position_is_open(self):
+        stats = daily_valuation.rebuild_daily_valuations('p1')
+
+        self.assertEqual(stats['from_date'], '2024-01-02')
+        self.assertEqual([r['date'] for r in self.written], ['2024-01-02', '2024-01-03', '2024-01-04'])
+
+        last = self.written[-1]
+        self.assertAlmostEqual(last['quantity'], 6.0)
+        self.assertAlmostEqual(last['market_value'], 660.0)
+        self.assertAlmostEqual(last['net_invested'], 1000.0 - 440.0)
+        self.assertAlmostEqual(last['cumulative_dividends'], 5.0)
+
+    def test_incremental_rebuild_writes_only_from_date(self):
+        daily_valuation.rebuild_daily_valuations('p1', from_date='2024-01-04')
+
+        self.assertEqual([r['date'] for r in self.written], ['2024-01-04'])
+        # Lo stato accumulato prima della finestra (acquisto + dividendo) viene comunque ricostruito
+        self.assertAlmostEqual(self.written[0]['cumulative_dividends'], 5.0)
+
+    def test_price_changes_invalidate_every_holding_portfolio(self):
+        holders = {'p1': ['IT0000000001'], 'p2': ['IT0000000001', 'IT0000000002'], 'p3': ['IT0000000002']}
+        changes = {'IT0000000001': '2024-01-04', 'IT0000000002': '2024-01-02'}
+        with patch.object(daily_valuation, 'execute_request', return_value=response(holders)) as rpc, \
+             patch.object(daily_valuation, 'invalidate_valuations') as invalidate:
+            daily_valuation.invalidate_valuations_for_prices(changes, skip_portfolios={'p3'})
+
+        rpc.assert_called_once_with('rpc/portfolios_holding_isins', 'POST', body={'p_isins': list(changes)})
+        # Per portafoglio la prima data modificata tra gli ISIN detenuti
+        self.assertEqual(sorted((c.args[0], c.args[1].strftime('%Y-%m-%d')) for c in invalidate.call_args_list),
+                         [('p1', '2024-01-04'), ('p2', '2024-01-02')])
+
+class TestValuationReaders(unittest.TestCase):
+    """Storico dashboard e report: stessi risultati dalla serie persistita e dal calcolo al volo."""
+
+    def setUp(self):
+        TestRebuildDailyValuations.setUp(self)
+        daily_valuation.rebuild_daily_valuations('p1')
+        self.valuations = {}
+        for r in self.written:
+            self.valuations.setdefault(r['isin'], {})[r['date']] = {c: r[c] for c in daily_valuation.VALUATION_COLUMNS}
+
+    def _client(self, register):
+        from flask import Flask
+        app = Flask(__name__)
+        register(app)
+        return app.test_client()
+
+    def _rows(self, table, params=None, page_size=1000, keyset=None):
+        return {'transactions': TRANSACTIONS, 'dividends': DIVIDENDS}.get(table, [])
+
+    def test_history_same_from_table_and_fallback(self):
+        import dashboard
+        client = self._client(dashboard.register_dashboard_routes)
+        results = []
+        for valuations in (self.valuations, None):
+            with patch.object(dashboard, 'fetch_all_rows', side_effect=self._rows), \
+                 patch.object(dashboard, 'execute_request', return_value=response([])), \
+                 patch.object(dashboard, 'get_valuations', return_value=valuations), \
+                 patch.object(dashboard, 'get_price_matrix', return_value=PRICES):
+                results.append(client.get('/api/dashboard/history?portfolio_id=p1').get_json())
+        self.assertTrue(results[0]['portfolio'])
+        self.assertEqual(results[0], results[1])
+
+    def test_report_same_from_table_and_fallback(self):
+        import report
+        client = self._client(lambda app: app.register_blueprint(report.report_bp))
+        results = []
+        for valuations in (self.valuations, None):
+            with patch.object(report, 'fetch_all_rows', side_effect=self._rows), \
+                 patch.object(report, 'get_valuations', return_value=valuations), \
+                 patch.object(report, 'get_price_matrix', return_value=PRICES):
+                results.append(client.get('/api/report/generate?portfolio_id=p1'
+                                          '&start_date=2024-01-03&end_date=2024-01-04').get_json())
+        self.assertEqual(results[0]['summary']['start_value'], 1020.0)
+        self.assertEqual(results[0], results[1])
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,177 @@
+
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import db_helper
+import time
+from db_helper import fetch_all, execute_batch
+from helpers import response
+
+ROWS = [{'id': f'{i:03d}', 'date': f'2024-01-{1 + i // 3:02d}', 'price': float(i)} for i in range(25)]
+
+def fake_execute(endpoint, method='GET', params=None, body=None, headers=None):
+    """Simula PostgREST: Range header oppure limit + filtro keyset su (date, id)."""
+    rows = ROWS
+    if headers and 'Range' in headers:
+        start, end = (int(x) for x in headers['Range'].split('-'))
+        return response(rows[start:end + 1], 206)
+    if params and 'or' in params:
+        last = params['or']
+        d = last.split('date.gt.')[1].split(',')[0]
+        i = last.split('id.gt.')[1].rstrip(')')
+        rows = [r for r in rows if (r['date'], r['id']) > (d, i)]
+    return response(rows[:params['limit']])
+
+class TestFetchAll(unittest.TestCase):
+
+    @patch.object(db_helper, 'execute_request', side_effect=fake_execute)
+    def test_range_pagination_returns_all_rows(self, _):
+        pages = list(fetch_all('asset_prices', params={'order': 'date.asc,id.asc'}, page_size=10))
+        self.assertEqual([len(p) for p in pages], [10, 10, 5])
+        self.assertEqual([r for p in pages for r in p], ROWS)
+
+    @patch.object(db_helper, 'execute_request', side_effect=fake_execute)
+    def test_keyset_pagination_with_prefetch(self, mock_exec):
+        pages = list(fetch_all('asset_prices', params={'select': 'price'}, page_size=5, keyset=('date', 'id'), prefetch=True))
+        self.assertEqual([r for p in pages for r in p], ROWS)
+        # Colonne del keyset aggiunte alla select e ordinamento imposto
+        first_params = mock_exec.call_args_list[0].kwargs['params']
+        self.assertEqual(first_params['select'], 'price,date,id')
+        self.assertEqual(first_params['order'], 'date.asc,id.asc')
+
+    def test_keyset_filter(self):
+        self.assertEqual(
+            db_helper._keyset_filter(('date', 'id'), {'date': '2024-01-01', 'id': 7}),
+            '(date.gt.2024-01-01,and(date.eq.2024-01-01,id.gt.7))'
+        )
+
+    @patch.object(db_helper, 'execute_request', return_value=response([], 500))
+    def test_failed_page_raises(self, _):
+        with self.assertRaises(RuntimeError):
+            list(fetch_all('asset_prices'))
+
+class TestExecuteBatch(unittest.TestCase):
+
+    def test_results_in_input_order_and_concurrent(self):
+        def slow(value, delay):
+            def run():
+                time.sleep(delay)
+                return value
+            return run
+
+        t0 = time.perf_counter()
+        results = execute_batch([slow('a', 0.2), slow('b', 0.05), slow('c', 0.1)])
+        elapsed = time.perf_counter() - t0
+
+        self.assertEqual(results, ['a', 'b', 'c'])
+        self.assertLess(elapsed, 0.3)  # Latenza della query più lenta, non la somma (0.35s)
+
+    @patch.object(db_helper, 'execute_request', side_effect=lambda **kw: kw['endpoint'])
+    def test_dict_queries_use_execute_request(self, _):
+        self.assertEqual(execute_batch([{'endpoint': 'transactions'}, {'endpoint': 'dividends'}]), ['transactions', 'dividends'])
+
+    def test_exceptions_propagate_and_nested_calls_run(self):
+        def boom():
+            raise ValueError("x")
+
+        with self.assertRaises(ValueError):
+            execute_batch([lambda: 1, boom])
+
+        nested = execute_batch([lambda: execute_batch([lambda: 1, lambda: 2]), lambda: 3])
+        self.assertEqual(nested, [[1, 2], 3])
+
+class TestConnectionPool(unittest.TestCase):
+
+    def test_session_pool_config_and_stats(self):
+        session = db_helper.get_session()
+        adapter = session.get_adapter("https://example.supabase.co")
+        self.assertEqual(adapter._pool_maxsize, db_helper.POOL_MAXSIZE)
+        self.assertIn("gzip", session.headers["Accept-Encoding"])
+
+        stats = db_helper.get_pool_stats()
+        self.assertEqual(stats["pool_maxsize"], db_helper.POOL_MAXSIZE)
+        self.assertGreaterEqual(stats["sessions"], 1)
+
+class TestPgBackendSelection(unittest.TestCase):
+
+    def setUp(self):
+        patches = [
+            patch.object(db_helper, 'DB_BACKEND', 'postgres'),
+            patch.object(db_helper.pg_backend, 'is_available', return_value=True),
+            patch.object(db_helper, 'get_supabase_credentials', return_value=('https://example.supabase.co', 'key')),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_supported_query_uses_postgres(self):
+        with patch.object(db_helper.pg_backend, 'execute_request', return_value=response([{'id': 1}])) as pg, \
+             patch.object(db_helper, 'get_session') as session:
+            resp = db_helper.execute_request('assets', 'GET', params={'isin': 'eq.X'})
+        self.assertEqual(resp.json(), [{'id': 1}])
+        pg.assert_called_once()
+        session.assert_not_called()
+
+    def test_unsupported_query_falls_back_to_rest(self):
+        unsupported = db_helper.pg_backend.UnsupportedQuery("embedded")
+        with patch.object(db_helper.pg_backend, 'execute_request', side_effect=unsupported), \
+             patch.object(db_helper, 'get_session') as session:
+            session.return_value.request.return_value = response([{'id': 2}])
+            resp = db_helper.execute_request('transactions', 'GET', params={'select': '*,assets(isin)'})
+        self.assertEqual(resp.json(), [{'id': 2}])
+
+class TestBulkUpsert(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(db_helper, 'BULK_BACKOFF', 0)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_chunks_dedup_and_retry(self):
+        rows = [{'isin': f'IT{i % 30:04d}', 'date': '2024-01-01', 'source': 'Transaction', 'price': float(i)} for i in range(40)]
+        written, calls = [], {}
+
+        def fake_write(table, chunk, on_conflict=None):
+            key = chunk[0]['isin']
+            calls[key] = calls.get(key, 0) + 1
+            if key == 'IT0010' and calls[key] == 1:
+                return 503, "Service Unavailable"   # Primo tentativo fallito, ritentato
+            written.extend(chunk)
+            return 201, None
+
+        with patch.object(db_helper, '_write_chunk', side_effect=fake_write):
+            results = db_helper.bulk_upsert('asset_prices', rows, on_conflict='isin, date, source', chunk_size=10)
+
+        # 40 righe su 30 chiavi: vince l'ultima, 3 chunk da 10
+        self.assertEqual([r['rows'] for r in results], [10, 10, 10])
+        self.assertTrue(all(r['ok'] for r in results))
+        self.assertEqual(results[1]['attempts'], 2)
+        self.assertEqual(len(written), 30)
+        self.assertEqual(next(r for r in written if r['isin'] == 'IT0005')['price'], 35.0)
+
+    def test_failed_chunk_reported_without_retry_on_client_error(self):
+        with patch.object(db_helper, '_write_chunk', return_value=(400, "bad row")) as write:
+            results = db_helper.bulk_upsert('transactions', [{'id': i} for i in range(5)], chunk_size=2)
+        self.assertEqual(write.call_count, 3)
+        self.assertEqual(db_helper.bulk_failed_rows(results), 5)
+        self.assertEqual(results[0]['error'], "bad row")
+
+    def test_insert_without_conflict_key_not_replayed(self):
+        # Un 502 può arrivare dopo il commit: un insert semplice non va ritentato
+        with patch.object(db_helper, '_write_chunk', return_value=(502, "Bad Gateway")) as write:
+            results = db_helper.bulk_upsert('transactions', [{'id': i} for i in range(1200)], atomic=True)
+        self.assertEqual(write.call_count, 1)
+        self.assertEqual(len(write.call_args[0][1]), 1200)
+        self.assertEqual(db_helper.bulk_failed_rows(results), 1200)
+
+    def test_chunk_by_size(self):
+        rows = [{'text': 'x' * 100} for _ in range(10)]
+        self.assertEqual([len(c) for c in db_helper._chunk_rows(rows, 100, 350)], [3, 3, 3, 1])
+
+if __name__ == '__main__':
+    unittest.main()
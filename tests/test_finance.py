@@ -0,0 +1,114 @@
+
+import unittest
+import sys
+import os
+import numpy as np
+from datetime import datetime, timedelta
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+from finance import xirr, xirr_batch, xirr_bracketed, pack_cash_flows, CashFlowAccumulator
+
+class TestXirrBatch(unittest.TestCase):
+
+    def make_series(self):
+        """Serie di cash flow crescenti, come i checkpoint dello storico MWR."""
+        base = datetime(2020, 1, 1)
+        flows = [
+            {"date": base, "amount": -1000.0},
+            {"date": base + timedelta(days=120), "amount": -500.0},
+            {"date": base + timedelta(days=300), "amount": 40.0},
+            {"date": base + timedelta(days=500), "amount": 300.0},
+            {"date": base + timedelta(days=800), "amount": -250.0},
+        ]
+        series = []
+        for n in range(1, len(flows) + 1):
+            end = flows[n - 1]['date'] + timedelta(days=45)
+            value = sum(-f['amount'] for f in flows[:n]) * 1.08
+            series.append(flows[:n] + [{"date": end, "amount": value}])
+        return series
+
+    def test_matches_scalar_xirr(self):
+        series = self.make_series()
+        flows_m, dates_m = pack_cash_flows(series)
+        batch = xirr_batch(flows_m, dates_m)
+
+        self.assertEqual(len(batch), len(series))
+        for s, b in zip(series, batch):
+            self.assertAlmostEqual(xirr(s), b, places=5)
+
+    def test_no_sign_change_returns_zero(self):
+        flows_m = np.array([[100.0, 110.0], [-100.0, -5.0]])
+        dates_m = np.array([[0, 365], [0, 365]])
+        np.testing.assert_array_equal(xirr_batch(flows_m, dates_m), [0.0, 0.0])
+
+    def test_bracketed_fallback_for_bad_guess(self):
+        # Con un guess lontano Newton diverge: il fallback bracketed trova comunque la radice (+10%)
+        flows_m = np.array([[-100.0, 110.0, np.nan]])
+        dates_m = np.array([[0, 365, np.nan]])
+        result = xirr_batch(flows_m, dates_m, guesses=[-0.999999])
+        self.assertAlmostEqual(result[0], 0.1, places=5)
+
+    def test_no_root_returns_nan(self):
+        # NPV sempre positivo: nessuna radice reale
+        flows_m = np.array([[-100.0, 500.0, -100.0]])
+        dates_m = np.array([[0, 1, 2]])
+        self.assertTrue(np.isnan(xirr_batch(flows_m, dates_m)[0]))
+
+class TestXirrBracketed(unittest.TestCase):
+
+    def test_matches_newton_and_reports_iterations(self):
+        series = TestXirrBatch().make_series()
+        for flows in series:
+            rate, iterations = xirr_bracketed(flows, return_iterations=True)
+            self.assertAlmostEqual(rate, xirr(flows), places=5)
+            self.assertLessEqual(iterations, 20)
+
+    def test_heavy_loss_converges(self):
+        base = datetime(2022, 1, 1)
+        flows = [
+            {"date": base, "amount": -5000.0},
+            {"date": base + timedelta(days=40), "amount": -3000.0},
+            {"date": base + timedelta(days=400), "amount": 600.0},
+        ]
+        rate = xirr_bracketed(flows)
+        self.assertIsNotNone(rate)
+        self.assertLess(rate, -0.8)
+
+    def test_no_root_returns_none(self):
+        base = datetime(2022, 1, 1)
+        flows = [
+            {"date": base, "amount": -100.0},
+            {"date": base + timedelta(days=1), "amount": 500.0},
+            {"date": base + timedelta(days=2), "amount": -100.0},
+        ]
+        self.assertIsNone(xirr_bracketed(flows))
+
+class TestCashFlowAccumulator(unittest.TestCase):
+
+    def test_checkpoints_match_list_based_flows(self):
+        base = datetime(2021, 3, 1)
+        acc = CashFlowAccumulator(capacity=2)  # Forza il resize degli array
+        flows = []
+        expected = []
+
+        for i, amount in enumerate([-1000.0, -200.0, 15.0, 400.0, -300.0]):
+            date = base + timedelta(days=90 * i)
+            acc.add(date, amount, is_dividend=(amount == 15.0))
+            flows.append({"date": date, "amount": amount})
+
+            cp = date + timedelta(days=30)
+            value = sum(-f['amount'] for f in flows) * 1.05
+            acc.checkpoint(cp, value)
+            expected.append(xirr(flows + [{"date": cp, "amount": value}]))
+
+        self.assertAlmostEqual(acc.net_invested, sum(-f['amount'] for f in flows))
+        self.assertAlmostEqual(acc.total_buys, 1500.0)
+        self.assertAlmostEqual(acc.total_dividends, 15.0)
+
+        for exp, got in zip(expected, acc.solve_checkpoints()):
+            self.assertAlmostEqual(exp, got, places=5)
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,114 @@
+
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import db_helper
+import holdings
+import dashboard
+import portfolio
+from helpers import response
+
+ASSETS = {
+    'a1': {'id': 'a1', 'isin': 'IT0000000001', 'name': 'Alpha', 'asset_class': 'ETF', 'last_trend_variation': 1.5},
+    'a2': {'id': 'a2', 'isin': 'IT0000000002', 'name': 'Beta', 'asset_class': 'Azioni', 'last_trend_variation': None},
+    'a3': {'id': 'a3', 'isin': 'IT0000000003', 'name': 'Chiuso', 'asset_class': 'ETF', 'last_trend_variation': None},
+}
+TRANSACTIONS = [
+    {'asset_id': 'a1', 'type': 'BUY', 'quantity': 10, 'price_eur': 100.0, 'date': '2023-01-10'},
+    {'asset_id': 'a2', 'type': 'BUY', 'quantity': 5, 'price_eur': 40.0, 'date': '2023-02-01'},
+    {'asset_id': 'a1', 'type': 'SELL', 'quantity': 4, 'price_eur': 120.0, 'date': '2023-06-01'},
+    {'asset_id': 'a3', 'type': 'BUY', 'quantity': 2, 'price_eur': 50.0, 'date': '2023-03-01'},
+    {'asset_id': 'a3', 'type': 'SELL', 'quantity': 2, 'price_eur': 55.0, 'date': '2023-09-01'},
+]
+DIVIDENDS = [
+    {'asset_id': 'a1', 'amount_eur': 12.0, 'date': '2023-12-01', 'type': 'DIVIDEND'},
+    {'asset_id': 'a3', 'amount_eur': 3.0, 'date': '2023-08-01', 'type': 'DIVIDEND'},
+]
+PRICES = {'IT0000000001': {'price': 130.0, 'date': '2024-01-05'}, 'IT0000000002': {'price': 38.0, 'date': '2024-01-05'}}
+
+
+def _view_rows():
+    rows = {}
+    for t in TRANSACTIONS:
+        sign = 1 if t['type'] == 'BUY' else -1
+        a = ASSETS[t['asset_id']]
+        row = rows.setdefault(a['isin'], dict(asset_id=a['id'], isin=a['isin'], name=a['name'], asset_class=a['asset_class'],
+                                              last_trend_variation=a['last_trend_variation'], qty=0, net_invested=0))
+        row['qty'] += sign * t['quantity']
+        row['net_invested'] += sign * t['quantity'] * t['price_eur']
+    return list(rows.values())
+
+
+def fake_db(fresh):
+    calls = []
+
+    def execute(endpoint, method='GET', params=None, body=None, headers=None):
+        calls.append((endpoint, params))
+        params = params or {}
+        if endpoint == 'rpc/portfolio_holdings_snapshot':
+            return response({'fresh': fresh, 'rows': _view_rows()})
+        if endpoint in ('transactions', 'dividends'):
+            rows = TRANSACTIONS if endpoint == 'transactions' else DIVIDENDS
+            if 'asset_id' in params:
+                ids = params['asset_id'][4:-1].split(',')
+                rows = [r for r in rows if r['asset_id'] in ids]
+            if 'assets(' in params.get('select', ''):
+                rows = [dict(r, assets=ASSETS[r['asset_id']]) for r in rows]
+            return response(rows)
+        return response([])
+
+    return execute, calls
+
+
+class TestHoldingsSnapshot(unittest.TestCase):
+
+    def _run(self, fresh, fn):
+        execute, calls = fake_db(fresh)
+        with patch.object(holdings, 'request_refresh') as refresh, \
+             patch.object(db_helper, 'execute_request', side_effect=execute), \
+             patch.object(holdings, 'execute_request', side_effect=execute), \
+             patch.object(dashboard, 'execute_request', side_effect=execute), \
+             patch.object(portfolio, 'execute_request', side_effect=execute), \
+             patch.object(dashboard, 'get_latest_prices_batch', side_effect=lambda isins, **kw: {i: PRICES[i] for i in isins}), \
+             patch.object(portfolio, 'get_latest_prices_batch', side_effect=lambda isins, **kw: {i: PRICES[i] for i in isins}):
+            result = fn()
+            # Vista vecchia: rimessa in coda per il worker, senza attenderla
+            self.assertEqual(refresh.called, not fresh)
+            return result, calls
+
+    def test_net_quantities_from_view_without_transaction_scan(self):
+        result, calls = self._run(True, lambda: holdings.get_net_quantities('p1'))
+        self.assertEqual(result, {'IT0000000001': 6, 'IT0000000002': 5, 'IT0000000003': 0})
+        self.assertNotIn('transactions', [c[0] for c in calls])
+
+        stale, calls = self._run(False, lambda: holdings.get_net_quantities('p1'))
+        self.assertEqual(stale, result)
+        self.assertIn('transactions', [c[0] for c in calls])
+
+    def test_summary_same_from_view_and_fallback(self):
+        for assets_filter in (None, 'IT0000000001,IT0000000003'):
+            from_view, _ = self._run(True, lambda: dashboard.calculate_portfolio_summary('p1', assets_filter=assets_filter))
+            fallback, _ = self._run(False, lambda: dashboard.calculate_portfolio_summary('p1', assets_filter=assets_filter))
+            self.assertEqual(from_view, fallback)
+        self.assertEqual(from_view['total_invested'], 510.0)
+
+    def test_active_holdings_same_from_view_and_fallback(self):
+        (from_view, _), calls = self._run(True, lambda: portfolio.compute_active_holdings('p1'))
+        (fallback, _), _ = self._run(False, lambda: portfolio.compute_active_holdings('p1'))
+        self.assertEqual(sorted(from_view), ['IT0000000001', 'IT0000000002'])
+        for isin, h in from_view.items():
+            self.assertEqual({k: v for k, v in h.items() if k != 'cashflows'},
+                             {k: v for k, v in fallback[isin].items() if k != 'cashflows'})
+            self.assertEqual(sorted(f['amount'] for f in h['cashflows']),
+                             sorted(f['amount'] for f in fallback[isin]['cashflows']))
+        # Solo le transazioni degli asset attivi
+        tx_params = [p for e, p in calls if e == 'transactions']
+        self.assertEqual(tx_params[0]['asset_id'], 'in.(a1,a2)')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,50 @@
+import unittest
+import sys
+import os
+import io
+from datetime import datetime
+
+import openpyxl
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+from ingest import parse_portfolio_excel, read_file_chunks, detect_file_type
+
+def _xlsx(rows):
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    for row in rows:
+        ws.append(row)
+    buf = io.BytesIO()
+    wb.save(buf)
+    buf.seek(0)
+    return buf
+
+class TestStreamingIngestion(unittest.TestCase):
+
+    def test_xlsx_chunks_keep_row_numbers(self):
+        rows = [['ISIN', 'Data', 'Prezzo Corrente (EUR)']]
+        rows += [['IT0000000001', datetime(2024, 1, d), 10.0 + d] for d in range(1, 6)]
+        rows += [[None, None, None], ['IT0000000002', 'non una data', 5.0], [None, None, None]]
+        result = parse_portfolio_excel(_xlsx(rows), chunk_size=2)
+
+        self.assertEqual(result['type'], 'PRICES')
+        self.assertEqual(len(result['data']), 5)
+        self.assertEqual(result['data'][0], {'isin': 'IT0000000001', 'date': '2024-01-01', 'price': 11.0, 'source': 'Manual Upload'})
+
+        # Riga vuota interna conservata (errore), riga vuota finale scartata
+        columns, chunks = read_file_chunks(_xlsx(rows), chunk_size=2)
+        self.assertEqual(columns, ['isin', 'data', 'prezzo corrente (eur)'])
+        self.assertEqual(sum(len(c) for c in chunks), 7)
+
+    def test_csv_delimiter_probe_and_type_detection(self):
+        csv = "ISIN;Valore Cedola (EUR);Data Flusso\nIT0000000001;1,50;01/03/2024\nIT0000000001;2,50;01/03/2024\n"
+        result = parse_portfolio_excel(io.BytesIO(csv.encode('utf-8')), chunk_size=1)
+
+        self.assertEqual(result['type'], 'DIVIDENDS')
+        self.assertEqual(result['data'], [{'isin': 'IT0000000001', 'date': '2024-03-01', 'type': 'DIVIDEND', 'amount': 4.0}])
+        self.assertEqual(detect_file_type(['isin', 'operazione']), 'TRANSACTIONS')
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,131 @@
+
+import unittest
+import sys
+import os
+import threading
+import time
+from unittest.mock import patch
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import job_queue
+from helpers import response
+
+def _wait(job_id, timeout=2.0):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = job_queue.get_job(job_id)
+        if job['status'] not in job_queue.ACTIVE:
+            return job
+        time.sleep(0.01)
+    return job_queue.get_job(job_id)
+
+class TestJobQueue(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(job_queue, '_store', job_queue.MemoryJobStore())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_completed_and_failed_jobs(self):
+        ok = job_queue.submit_job('test', lambda x: x * 2, 21)
+        ko = job_queue.submit_job('test', lambda: 1 / 0)
+
+        self.assertEqual(_wait(ok)['result'], 42)
+        failed = _wait(ko)
+        self.assertEqual(failed['status'], job_queue.FAILED)
+        self.assertIn('division', failed['error'])
+
+    def test_identical_pending_jobs_are_deduplicated(self):
+        release = threading.Event()
+        calls = []
+
+        def slow(prompt):
+            calls.append(prompt)
+            release.wait(2)
+            return prompt
+
+        first = job_queue.submit_job('test', slow, 'p', dedup_key='k')
+        second = job_queue.submit_job('test', slow, 'p', dedup_key='k')
+        while not calls:
+            time.sleep(0.01)
+
+        self.assertEqual(first, second)
+        self.assertEqual(job_queue.get_job(first)['status'], job_queue.RUNNING)
+        # Anche in esecuzione (non solo in coda) la stessa chiave riusa il job
+        self.assertEqual(job_queue.submit_job('test', slow, 'p', dedup_key='k'), first)
+        release.set()
+        self.assertEqual(_wait(first)['status'], job_queue.COMPLETED)
+        self.assertEqual(len(calls), 1)
+
+        # Concluso il primo, la stessa chiave avvia un nuovo job
+        third = job_queue.submit_job('test', slow, 'p', dedup_key='k')
+        self.assertNotEqual(first, third)
+        _wait(third)
+
+    def test_finished_jobs_are_evicted_after_ttl(self):
+        store = job_queue.MemoryJobStore(ttl=0)
+        store.create({'job_id': 'j1', 'kind': 'test', 'status': job_queue.PENDING, 'dedup_key': None})
+        store.update('j1', status=job_queue.COMPLETED, result=1)
+        time.sleep(0.01)
+        self.assertIsNone(store.get('j1'))
+
+    def test_db_store_reuses_job_created_by_another_process(self):
+        import db_helper
+        store = job_queue.DbJobStore()
+        calls = []
+
+        def execute(endpoint, method='GET', params=None, body=None, headers=None):
+            calls.append(method)
+            if method == 'POST':
+                return response(None, 409)      # Indice unico: job pending già creato altrove
+            if method == 'GET':
+                # Il primo controllo non lo vede ancora, dopo il conflitto sì
+                return response([{'job_id': 'other'}] if 'POST' in calls else [])
+            return response(None, 204)
+
+        with patch.object(job_queue, '_store', store), \
+             patch.object(db_helper, 'execute_request', side_effect=execute), \
+             patch.object(db_helper, 'delete_table', return_value=True), \
+             patch.object(job_queue, '_get_executor') as executor:
+            job_id = job_queue.submit_job('test', lambda: 1, dedup_key='k')
+
+        self.assertEqual(job_id, 'other')
+        executor.return_value.submit.assert_not_called()
+        # Secondo insert dopo la chiusura dei pending interrotti
+        self.assertEqual(calls, ['GET', 'POST', 'PATCH', 'POST', 'GET'])
+
+    def test_db_store_heartbeat_keeps_running_job_alive(self):
+        import db_helper
+        store = job_queue.DbJobStore()
+        release = threading.Event()
+        patches = []
+
+        def execute(endpoint, method='GET', params=None, body=None, headers=None):
+            if method == 'PATCH' and 'job_id' in params and set(body) == {'updated_at'}:
+                patches.append(params)
+            return response([] if method == 'GET' else None, 200 if method == 'GET' else 204)
+
+        with patch.object(job_queue, '_store', store), \
+             patch.object(job_queue, 'JOB_HEARTBEAT_SECONDS', 0.05), \
+             patch.object(job_queue, '_heartbeat', None), \
+             patch.object(db_helper, 'execute_request', side_effect=execute), \
+             patch.object(db_helper, 'delete_table', return_value=True), \
+             patch.object(db_helper, 'update_table', return_value=True) as update:
+            job_id = job_queue.submit_job('test', release.wait, 2)
+            time.sleep(0.3)
+            release.set()
+            deadline = time.time() + 2
+            while job_id in job_queue._active and time.time() < deadline:
+                time.sleep(0.01)
+
+        # Stato running all'avvio, poi heartbeat solo sui job attivi di questo processo
+        self.assertEqual(update.call_args_list[0].args[1]['status'], job_queue.RUNNING)
+        self.assertTrue(patches)
+        self.assertEqual(patches[0]['job_id'], f'in.({job_id})')
+        self.assertEqual(patches[0]['status'], 'in.(pending,running)')
+        self.assertNotIn(job_id, job_queue._active)
+
+if __name__ == '__main__':
+    unittest.main()
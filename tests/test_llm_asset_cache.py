@@ -0,0 +1,63 @@
+
+import unittest
+import sys
+import os
+from unittest.mock import patch, MagicMock
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import llm_asset_info
+
+class TestLlmAssetInfoCache(unittest.TestCase):
+
+    def setUp(self):
+        llm_asset_info._lru.clear()
+        patches = [
+            patch.object(llm_asset_info, 'load_descr_asset_template', return_value='{"assetType": ""}'),
+            patch('db_helper.get_config', return_value={'prompt': 'Info {isin} {template}', 'model': 'test-model'}),
+            patch.dict(os.environ, {'OPENAI_API_KEY': 'test'}),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def _db_miss(self):
+        res = MagicMock(status_code=200)
+        res.json.return_value = []
+        return res
+
+    def test_second_call_is_served_from_memory(self):
+        with patch('db_helper.execute_request', return_value=self._db_miss()), \
+             patch('db_helper.upsert_table', return_value=True) as upsert, \
+             patch.object(llm_asset_info, 'call_llm', return_value='{"assetType": "ETF"}') as llm:
+            before = llm_asset_info.get_llm_cache_stats()
+            first = llm_asset_info.fetch_asset_info_from_llm('IT0000000001')
+            second = llm_asset_info.fetch_asset_info_from_llm('IT0000000001')
+            after = llm_asset_info.get_llm_cache_stats()
+
+        self.assertEqual(first, second)
+        self.assertEqual(first['data']['assetType'], 'ETF')
+        llm.assert_called_once()
+        upsert.assert_called_once()
+        self.assertEqual(upsert.call_args.kwargs['on_conflict'], 'isin,model,template_hash')
+        self.assertEqual(after['memory_hits'] - before['memory_hits'], 1)
+        self.assertGreater(after['tokens_saved'], before['tokens_saved'])
+
+    def test_db_hit_skips_llm(self):
+        res = MagicMock(status_code=200)
+        res.json.return_value = [{'response_type': 'text', 'data': 'cached', 'tokens_estimate': 50}]
+        with patch('db_helper.execute_request', return_value=res), \
+             patch.object(llm_asset_info, 'call_llm') as llm:
+            result = llm_asset_info.fetch_asset_info_from_llm('IT0000000002')
+
+        self.assertEqual(result, {'response_type': 'text', 'data': 'cached'})
+        llm.assert_not_called()
+
+    def test_prompt_change_changes_key(self):
+        h1 = llm_asset_info._template_hash('Info {isin}', 'T')
+        h2 = llm_asset_info._template_hash('Details {isin}', 'T')
+        self.assertNotEqual(h1, h2)
+
+if __name__ == '__main__':
+    unittest.main()
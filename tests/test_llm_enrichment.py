@@ -0,0 +1,81 @@
+
+import unittest
+import sys
+import os
+import threading
+import time
+from unittest.mock import patch
+
+import httpx
+import openai
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import llm_enrichment
+import llm_asset_info
+
+def _rate_limit_error():
+    response = httpx.Response(429, headers={'retry-after': '0'}, request=httpx.Request('POST', 'https://api.openai.com/v1'))
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+class TestEnrichmentQueue(unittest.TestCase):
+
+    def setUp(self):
+        patcher = patch.object(llm_enrichment, '_resolve_model', return_value='test-model')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retry_on_rate_limit(self):
+        calls = []
+
+        def fake_fetch(isin, model=None, asset_name=None, raise_rate_limit=False):
+            calls.append(isin)
+            if len(calls) < 3:
+                raise _rate_limit_error()
+            return {'response_type': 'json', 'data': {'assetType': 'ETF'}}
+
+        with patch.object(llm_asset_info, 'fetch_asset_info_from_llm', side_effect=fake_fetch):
+            result = llm_enrichment.fetch_with_limits('IT0000000001')
+
+        self.assertEqual(len(calls), 3)
+        self.assertEqual(result['data']['assetType'], 'ETF')
+
+    def test_batch_runs_in_parallel_within_model_limit(self):
+        active, peak = [0], [0]
+        lock = threading.Lock()
+
+        def fake_fetch(isin, model=None, asset_name=None, raise_rate_limit=False):
+            with lock:
+                active[0] += 1
+                peak[0] = max(peak[0], active[0])
+            time.sleep(0.05)
+            with lock:
+                active[0] -= 1
+            return {'response_type': 'text', 'data': isin}
+
+        isins = [f'IT{i:010d}' for i in range(6)]
+        with patch.object(llm_asset_info, 'fetch_asset_info_from_llm', side_effect=fake_fetch):
+            results = llm_asset_info.fetch_asset_info_batch(isins)
+
+        self.assertEqual(sorted(results), isins)
+        self.assertGreater(peak[0], 1)
+        self.assertLessEqual(peak[0], llm_enrichment.LLM_MODEL_CONCURRENCY)
+
+    def test_enqueue_persists_and_reports_progress(self):
+        assets = [{'id': 'a1', 'isin': 'IT0000000001', 'name': 'A', 'metadata': None}]
+        with patch.object(llm_asset_info, 'fetch_asset_info_from_llm', return_value={'response_type': 'text', 'data': 'info'}), \
+             patch.object(llm_enrichment, '_persist_result', return_value=True) as persist:
+            batch_id = llm_enrichment.enqueue_asset_enrichment(assets, portfolio_id='p1')
+            for _ in range(100):
+                status = llm_enrichment.get_enrichment_status(batch_id)
+                if status['status'] == 'completed':
+                    break
+                time.sleep(0.01)
+
+        self.assertEqual(status['done'], 1)
+        self.assertEqual(status['items'], {'IT0000000001': 'done'})
+        persist.assert_called_once()
+
+if __name__ == '__main__':
+    unittest.main()
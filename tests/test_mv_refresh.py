@@ -0,0 +1,51 @@
+
+import unittest
+import sys
+import os
+import threading
+import time
+from unittest.mock import patch
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import mv_refresh
+
+class TestMaterializedViewRefresh(unittest.TestCase):
+
+    def setUp(self):
+        self.refreshed = []
+        self.lock = threading.Lock()
+
+        def fake_refresh(view):
+            with self.lock:
+                self.refreshed.append(view)
+
+        patcher = patch.object(mv_refresh, '_refresh_view', side_effect=fake_refresh)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_is_coalesced_into_one_refresh_per_view(self):
+        with patch.object(mv_refresh, 'MV_REFRESH_DEBOUNCE', 0.2):
+            for _ in range(5):
+                mv_refresh.request_refresh('transactions')
+                time.sleep(0.02)
+            time.sleep(0.05)
+            self.assertEqual(self.refreshed, [])   # Ancora nella finestra di debounce
+            self.assertTrue(mv_refresh.flush(timeout=2))
+        # Solo le viste che dipendono da transactions, una volta ciascuna
+        self.assertEqual(sorted(self.refreshed), ['portfolio_holdings', 'portfolio_stats'])
+        status = mv_refresh.get_refresh_status()['views']
+        self.assertGreaterEqual(status['portfolio_holdings']['coalesced_requests'], 4)
+        self.assertIsNone(status['portfolio_holdings']['pending_since'])
+
+    def test_flush_skips_debounce(self):
+        with patch.object(mv_refresh, 'MV_REFRESH_DEBOUNCE', 60), patch.object(mv_refresh, 'MV_REFRESH_MAX_DELAY', 60):
+            mv_refresh.request_refresh('dividends')
+            t0 = time.time()
+            self.assertTrue(mv_refresh.flush(['dividend_totals'], timeout=2))
+        self.assertLess(time.time() - t0, 1)
+        self.assertEqual(self.refreshed, ['dividend_totals'])
+
+if __name__ == '__main__':
+    unittest.main()
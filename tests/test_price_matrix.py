@@ -0,0 +1,41 @@
+
+import unittest
+import sys
+import os
+from datetime import datetime
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+from price_manager import PriceMatrix
+
+class TestPriceMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.matrix = PriceMatrix.from_observations(
+            ['A', 'B', 'A', 'A'],
+            ['2024-01-02', '2024-01-03', '2024-01-04', '2024-01-04'],
+            [10.0, 20.0, 11.0, 12.0],
+            start='2024-01-01', end='2024-01-06')
+
+    def test_locf_and_duplicates(self):
+        # Prima della prima quotazione 0, poi LOCF; a parità di giorno vince l'ultima osservazione
+        self.assertEqual(self.matrix.values[0].tolist(), [0.0, 10.0, 10.0, 12.0, 12.0, 12.0])
+        self.assertEqual(self.matrix.values[1].tolist(), [0.0, 0.0, 20.0, 20.0, 20.0, 20.0])
+
+    def test_lookup_out_of_range_and_unknown_isin(self):
+        days = [datetime(2023, 12, 31), '2024-01-03', datetime(2024, 1, 5, 15, 30), '2024-02-01']
+        result = self.matrix.lookup(['B', 'X', 'A'], days)
+        self.assertEqual(result.tolist(), [
+            [0.0, 20.0, 20.0, 0.0],
+            [0.0, 0.0, 0.0, 0.0],
+            [0.0, 10.0, 12.0, 0.0],
+        ])
+        self.assertEqual(self.matrix.price('A', '2024-01-06'), 12.0)
+
+    def test_without_locf(self):
+        matrix = PriceMatrix.from_observations(['A', 'A'], ['2024-01-01', '2024-01-03'], [1.0, 3.0], locf=False, end='2024-01-03')
+        self.assertEqual(matrix.series('A', ['2024-01-01', '2024-01-02', '2024-01-03']).tolist(), [1.0, 0.0, 3.0])
+
+if __name__ == '__main__':
+    unittest.main()
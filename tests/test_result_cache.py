@@ -0,0 +1,51 @@
+
+import unittest
+import sys
+import os
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+from result_cache import TTLCache, get_data_version, bump_data_version
+
+class TestTTLCache(unittest.TestCase):
+
+    def test_lru_eviction_and_stats(self):
+        cache = TTLCache("test", maxsize=2, ttl=60)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        self.assertEqual(cache.get("a"), 1)  # "a" diventa la più recente
+        cache.set("c", 3)                    # esce "b"
+
+        self.assertIsNone(cache.get("b"))
+        stats = cache.stats()
+        self.assertEqual(stats["hits"], 1)
+        self.assertEqual(stats["misses"], 1)
+        self.assertEqual(stats["evictions"], 1)
+
+    def test_expired_entry_is_miss(self):
+        cache = TTLCache("test", maxsize=2, ttl=-1)
+        cache.set("a", 1)
+        self.assertIsNone(cache.get("a"))
+
+    def test_returns_copy(self):
+        cache = TTLCache("test")
+        cache.set("a", {"assets": [1]})
+        cache.get("a")["assets"].append(2)
+        self.assertEqual(cache.get("a"), {"assets": [1]})
+
+class TestDataVersion(unittest.TestCase):
+
+    def test_bump_changes_version(self):
+        v0 = get_data_version("p1")
+        bump_data_version("p1")
+        v1 = get_data_version("p1")
+        self.assertNotEqual(v0, v1)
+
+        other = get_data_version("p2")
+        bump_data_version()
+        self.assertNotEqual(get_data_version("p1"), v1)
+        self.assertNotEqual(get_data_version("p2"), other)
+
+if __name__ == '__main__':
+    unittest.main()
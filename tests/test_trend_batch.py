@@ -0,0 +1,58 @@
+
+import unittest
+import sys
+import os
+from unittest.mock import patch
+
+# Add api to path
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'api')))
+
+import price_manager
+from helpers import response
+
+ASSETS = [
+    {'id': 'a1', 'isin': 'IT0000000001', 'name': 'Alpha'},
+    {'id': 'a2', 'isin': 'IT0000000002', 'name': 'Beta'},
+    {'id': 'a3', 'isin': 'IT0000000003', 'name': 'Gamma'},
+]
+# Ultime 2 righe per ISIN, per data DESC (come recent_prices_batch)
+RECENT = [
+    {'isin': 'IT0000000001', 'date': '2024-01-10', 'price': 110.0, 'source': 'Manual'},
+    {'isin': 'IT0000000001', 'date': '2024-01-03', 'price': 100.0, 'source': 'Transaction'},
+    {'isin': 'IT0000000002', 'date': '2024-01-10', 'price': 50.0, 'source': 'Manual'},
+    {'isin': 'IT0000000002', 'date': '2024-01-05', 'price': 0.0, 'source': 'Manual'},
+    {'isin': 'IT0000000003', 'date': '2024-01-10', 'price': 7.0, 'source': 'Manual'},
+]
+
+class TestUpdateAssetTrendsBatch(unittest.TestCase):
+
+    def test_variation_zero_price_skip_and_reset(self):
+        with patch.object(price_manager, 'execute_batch', return_value=[response(RECENT), response(ASSETS)]) as batch, \
+             patch.object(price_manager, 'upsert_table', return_value=True) as upsert:
+            updated = price_manager.update_asset_trends_batch(['IT0000000003', 'IT0000000001', 'IT0000000002', 'IT0000000001'])
+
+        # Una sola RPC per tutti gli ISIN (deduplicati) e un solo upsert
+        self.assertEqual(batch.call_args[0][0][0]['body'], {'p_isins': ['IT0000000001', 'IT0000000002', 'IT0000000003'], 'p_limit': 2})
+        upsert.assert_called_once()
+        table, rows = upsert.call_args[0][:2]
+        self.assertEqual(table, 'assets')
+        by_isin = {r['isin']: r for r in rows}
+        self.assertEqual(updated, 2)
+
+        # Variazione e giorni tra le ultime due righe
+        self.assertAlmostEqual(by_isin['IT0000000001']['last_trend_variation'], 10.0)
+        self.assertEqual(by_isin['IT0000000001']['last_trend_days'], 7)
+        # Prezzo precedente nullo: asset lasciato invariato
+        self.assertNotIn('IT0000000002', by_isin)
+        # Meno di 2 righe: trend azzerato
+        self.assertIsNone(by_isin['IT0000000003']['last_trend_variation'])
+        self.assertIsNone(by_isin['IT0000000003']['last_trend_days'])
+
+    def test_failed_read_updates_nothing(self):
+        with patch.object(price_manager, 'execute_batch', return_value=[response(None, 500), response(ASSETS)]), \
+             patch.object(price_manager, 'upsert_table') as upsert:
+            self.assertEqual(price_manager.update_asset_trends_batch(['IT0000000001']), 0)
+        upsert.assert_not_called()
+
+if __name__ == '__main__':
+    unittest.main()